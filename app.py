@@ -1,11 +1,48 @@
-from fastapi import FastAPI, Request, HTTPException, UploadFile, File
-from fastapi.responses import JSONResponse
+from fastapi import Depends, FastAPI, Header, Query, Request, HTTPException, UploadFile, File
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import AsyncIterator, BinaryIO, List, Optional, Tuple, Union
+import asyncio
+import json
 import logging
+import math
 import os
-import threading
-from utils import convert_image_to_base64_and_test, test_with_base64_data
-from chatbot import PlantDiseaseChatbot
+import time
+import uuid
+import weakref
+from core import get_async_detector, reset_async_detectors, summarize_batch
+import groq
+from chatbot import AsyncPlantDiseaseChatbot
+from cache import get_default_cache
+from clients import close_async_http_client, connection_stats
+from jsonparse import parse_stats
+from preprocess import prepare_image
+from payload import ImagePayload
+from records import (
+    MAX_PAGE_SIZE, close_default_analysis_store, get_default_analysis_store,
+    image_digest
+)
+from prompts import default_variant, registry as prompt_registry
+from ratelimit import SchedulerRejected, get_default_scheduler
+from singleflight import get_default_flights
+from triage import get_default_triage
+from budget import get_default_token_budget
+from cassette import cassette_mode, get_default_cassette
+from telemetry import (
+    CONTENT_TYPE_LATEST, IMAGE_PREPARE_SECONDS, MetricsMiddleware,
+    configure_tracing, render_metrics
+)
+from resilience import CircuitOpenError, get_default_caller, retry_after_seconds
+from uploads import (
+    MULTIPART_OVERHEAD, REQUEST_MAX_BYTES, UPLOAD_MAX_BYTES,
+    BodySizeLimitMiddleware, UploadRejected, check_upload_size,
+    extract_zip_images, sniff_upload, validate_upload
+)
+from sessions import (
+    get_default_session_store, is_valid_session_id, session_history_limit
+)
 
 # Định cấu hình ghi nhật ký
 logging.basicConfig(level=logging.INFO)
@@ -13,6 +50,26 @@ logger = logging.getLogger(__name__)
 
 app = FastAPI(title="API Phát Hiện Bệnh Lá", version="1.0.0")
 
+# Stop oversized uploads while they are received, before they are spooled
+app.add_middleware(
+    BodySizeLimitMiddleware,
+    max_bytes=REQUEST_MAX_BYTES,
+    limits={"/disease-detection-file": UPLOAD_MAX_BYTES + MULTIPART_OVERHEAD}
+)
+
+# Request latency, status and upload time per route (outermost, so
+# rejected uploads are counted too), and spans exported if PLANT_TRACING
+# is set
+app.add_middleware(MetricsMiddleware)
+configure_tracing()
+
+# Decode, resize and re-encode an upload, timed
+prepare_upload = IMAGE_PREPARE_SECONDS.time()(prepare_image)
+
+# Batch detection limits
+BATCH_MAX_FILES = int(os.environ.get("PLANT_BATCH_MAX_FILES", 500))
+BATCH_MAX_CONCURRENCY = int(os.environ.get("PLANT_BATCH_MAX_CONCURRENCY", 8))
+
 # Pydantic models for request validation
 class ChatRequest(BaseModel):
     message: str
@@ -22,19 +79,97 @@ class ChatRequest(BaseModel):
 class SetContextRequest(BaseModel):
     disease_analysis: dict
 
-# Initialize chatbot (singleton pattern with thread safety)
-chatbot_instance = None
-chatbot_lock = threading.Lock()
+# Chatbot conversations are kept per session, keyed by this header
+SESSION_HEADER = "X-Session-ID"
+
+# One lock per active session serializes its requests within this worker
+session_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = (
+    weakref.WeakValueDictionary()
+)
+
+def get_session_id(
+    x_session_id: Optional[str] = Header(None, alias=SESSION_HEADER)
+) -> str:
+    """Return the client's session id, or a new one if none was sent"""
+    if x_session_id is None:
+        return uuid.uuid4().hex
+    if not is_valid_session_id(x_session_id):
+        raise HTTPException(
+            status_code=400,
+            detail=f"{SESSION_HEADER} phải gồm 8-128 ký tự A-Z, a-z, 0-9, _ hoặc -"
+        )
+    return x_session_id
+
+@asynccontextmanager
+async def chat_session(
+    session_id: str, save: bool = True
+) -> AsyncIterator[AsyncPlantDiseaseChatbot]:
+    """
+    Load the session's chatbot, hold the session lock while it is used and
+    store its state afterwards (not if the request failed)
+    """
+    lock = session_locks.get(session_id)
+    if lock is None:
+        lock = session_locks[session_id] = asyncio.Lock()
+    async with lock:
+        store = get_default_session_store()
+        chatbot = AsyncPlantDiseaseChatbot()
+        state = await asyncio.to_thread(store.get, session_id)
+        if state is not None:
+            chatbot.load_state(state)
+        yield chatbot
+        if save:
+            await asyncio.to_thread(
+                store.set, session_id,
+                chatbot.export_state(session_history_limit())
+            )
+
+def get_detector():
+    """Get the process-wide detector shared by all requests"""
+    return get_async_detector()
+
+def record_analysis(
+    result: dict, source: str, filename: Optional[str], image: ImagePayload
+) -> None:
+    """Queue a result for the analysis store; written off the request path"""
+    store = get_default_analysis_store()
+    if store is not None:
+        store.record(result, source, filename, image_digest(image.data))
+
+def upstream_error(e: Exception) -> Optional[HTTPException]:
+    """Map a Groq failure left after retries to a 429/502/503/504 response"""
+    retry_after = (
+        e.retry_after if isinstance(e, (CircuitOpenError, SchedulerRejected))
+        else retry_after_seconds(e)
+    )
+    headers = (
+        {"Retry-After": str(math.ceil(retry_after))}
+        if retry_after is not None else None
+    )
+    if isinstance(e, CircuitOpenError):
+        return HTTPException(status_code=503, detail=str(e), headers=headers)
+    if isinstance(e, SchedulerRejected):
+        return HTTPException(status_code=429, detail=str(e), headers=headers)
+    if isinstance(e, groq.RateLimitError):
+        return HTTPException(
+            status_code=429, detail="Vượt quá giới hạn yêu cầu của dịch vụ mô hình",
+            headers=headers
+        )
+    if isinstance(e, groq.APITimeoutError):
+        return HTTPException(status_code=504, detail="Dịch vụ mô hình phản hồi quá chậm")
+    if isinstance(e, (groq.APIConnectionError, groq.InternalServerError)):
+        return HTTPException(status_code=502, detail="Dịch vụ mô hình đang gặp lỗi")
+    return None
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    """Đóng nhóm kết nối HTTP dùng chung và ghi nốt các kết quả đang chờ khi tắt máy chủ."""
+    # Bộ phát hiện dùng chung giữ AsyncGroq gắn với nhóm kết nối sắp đóng
+    reset_async_detectors()
+    await close_async_http_client()
+    await asyncio.to_thread(close_default_analysis_store)
 
-def get_chatbot():
-    """Get or create chatbot instance in a thread-safe manner"""
-    global chatbot_instance
-    if chatbot_instance is None:
-        with chatbot_lock:
-            # Double-check locking pattern
-            if chatbot_instance is None:
-                chatbot_instance = PlantDiseaseChatbot()
-    return chatbot_instance
 
 @app.post('/disease-detection-file')
 async def disease_detection_file(file: UploadFile = File(...)):
@@ -45,25 +180,200 @@ async def disease_detection_file(file: UploadFile = File(...)):
     try:
         logger.info("Đã nhận được file hình ảnh để phát hiện bệnh")
         
-        # Đọc tập tin đã tải lên vào bộ nhớ
-        contents = await file.read()
+        # Kiểm tra kích thước và định dạng thật (magic bytes) của tệp, không
+        # đọc toàn bộ tệp vào bộ nhớ
+        await validate_upload(file)
         
-    # Xử lý tập tin trực tiếp từ bộ nhớ
-        result = convert_image_to_base64_and_test(contents)
+        # Thu nhỏ và mã hóa lại ảnh trong luồng riêng (tác vụ CPU), đọc
+        # trực tiếp từ tệp tạm
+        prepared = await asyncio.to_thread(prepare_upload, file.file)
         
-    # Không cần dọn dẹp vì tệp không được lưu cục bộ
+        # Ảnh được mã hóa base64 một lần, thẳng vào thân yêu cầu tới mô hình
+        image = ImagePayload(prepared.data, prepared.mime_type)
+        result = await get_detector().analyze_plant_image(image)
+        record_analysis(result, "file", file.filename, image)
         
-        if result is None:
-            raise HTTPException(status_code=500, detail="Không thể xử lý tệp hình ảnh")
         logger.info("Phát hiện bệnh từ tệp đã hoàn tất thành công")
         return JSONResponse(content=result)
     except HTTPException:
         raise
+    except UploadRejected as e:
+        logger.error(f"Từ chối tệp tải lên: {str(e)}")
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except ValueError as e:
+        logger.error(f"Lỗi validation: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Lỗi phát hiện bệnh (file): {str(e)}")
+        raise upstream_error(e) or HTTPException(
+            status_code=500, detail=f"Lỗi máy chủ nội bộ: {str(e)}"
+        )
+
+
+async def _expand_uploads(
+    files: List[UploadFile]
+) -> List[Tuple[str, Union[bytes, BinaryIO]]]:
+    """
+    Kiểm tra các tệp tải lên, giải nén tệp zip thành các ảnh bên trong.
+
+    Returns:
+        List[Tuple[str, Union[bytes, BinaryIO]]]: Danh sách (tên tệp, dữ liệu
+            ảnh); ảnh tải lên trực tiếp được giữ ở tệp tạm, không sao chép
+
+    Raises:
+        HTTPException: Nếu số ảnh vượt quá BATCH_MAX_FILES, hoặc một tệp
+                       quá lớn hay là tệp zip bị lỗi
+    """
+    images = []
+    try:
+        for upload in files:
+            if await sniff_upload(upload) == "ZIP":
+                check_upload_size(upload, REQUEST_MAX_BYTES)
+                images.extend(await asyncio.to_thread(
+                    extract_zip_images, upload.file, upload.filename,
+                    BATCH_MAX_FILES + 1 - len(images)
+                ))
+            else:
+                # Định dạng ảnh được kiểm tra riêng từng ảnh khi tiền xử lý
+                check_upload_size(upload)
+                images.append((upload.filename, upload.file))
+            if len(images) > BATCH_MAX_FILES:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Tối đa {BATCH_MAX_FILES} ảnh mỗi lô"
+                )
+    except UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    return images
+
+
+async def _prepare_batch(
+    files: List[UploadFile]
+) -> Tuple[
+    List[Tuple[str, Union[bytes, BinaryIO]]], List[Optional[dict]],
+    List[Tuple[int, ImagePayload]]
+]:
+    """
+    Đọc, giải nén và tiền xử lý các ảnh của một lô.
+
+    Returns:
+        Tuple: (danh sách ảnh (tên, dữ liệu), các mục lỗi tiền xử lý theo chỉ
+               số (None nếu thành công), các ảnh chờ phân tích (chỉ số,
+               ảnh))
+    """
+    images = await _expand_uploads(files)
+    logger.info(f"Đã nhận được {len(images)} hình ảnh để phát hiện bệnh")
+    if not images:
+        raise HTTPException(status_code=400, detail="Không có ảnh hợp lệ")
+
+    # Thu nhỏ và mã hóa lại ảnh trong luồng riêng (tác vụ CPU)
+    prepared = await asyncio.gather(
+        *(asyncio.to_thread(prepare_upload, data) for _, data in images),
+        return_exceptions=True
+    )
+
+    items = [None] * len(images)
+    pending = []
+    for index, image in enumerate(prepared):
+        if isinstance(image, Exception):
+            items[index] = {
+                "index": index,
+                "filename": images[index][0],
+                "status": "error",
+                "result": None,
+                "error": str(image),
+                "elapsed_seconds": 0.0,
+            }
+        else:
+            pending.append((index, ImagePayload(image.data, image.mime_type)))
+    return images, items, pending
+
+
+@app.post('/disease-detection-batch')
+async def disease_detection_batch(
+    files: List[UploadFile] = File(...),
+    max_concurrency: int = 4,
+    requests_per_minute: Optional[float] = None
+):
+    """
+    Điểm cuối phát hiện bệnh cho nhiều ảnh trong một yêu cầu.
+    Chấp nhận nhiều tệp ảnh và/hoặc tệp zip chứa ảnh. Trả về kết quả
+    theo từng ảnh (kể cả lỗi riêng lẻ) và thời gian tổng hợp.
+    """
+    try:
+        start = time.perf_counter()
+        images, items, pending = await _prepare_batch(files)
+
+        batch = await get_detector().analyze_many(
+            [image for _, image in pending],
+            max_concurrency=min(max(1, max_concurrency), BATCH_MAX_CONCURRENCY),
+            requests_per_minute=requests_per_minute
+        )
+        for (index, image), item in zip(pending, batch["results"]):
+            item["index"] = index
+            item["filename"] = images[index][0]
+            items[index] = item
+            if item["status"] == "success":
+                record_analysis(item["result"], "batch", item["filename"], image)
+
+        summary = summarize_batch(items, time.perf_counter() - start)
+        logger.info(
+            f"Phát hiện bệnh theo lô hoàn tất: {summary['succeeded']} thành "
+            f"công, {summary['failed']} thất bại"
+        )
+        return JSONResponse(content=summary)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Lỗi phát hiện bệnh (batch): {str(e)}")
         raise HTTPException(status_code=500, detail=f"Lỗi máy chủ nội bộ: {str(e)}")
 
 
+@app.post('/disease-detection-batch/stream')
+async def disease_detection_batch_stream(
+    files: List[UploadFile] = File(...),
+    max_concurrency: int = 4,
+    requests_per_minute: Optional[float] = None
+):
+    """
+    Giống /disease-detection-batch nhưng trả về NDJSON: mỗi dòng là kết quả
+    của một ảnh ngay khi ảnh đó hoàn tất, dòng cuối cùng là bản tổng hợp
+    (có trường "done": true, không có "results").
+    """
+    start = time.perf_counter()
+    images, items, pending = await _prepare_batch(files)
+
+    async def lines():
+        for item in items:
+            if item is not None:
+                yield json.dumps(item, ensure_ascii=False) + "\n"
+        try:
+            async for item in get_detector().analyze_many_stream(
+                [image for _, image in pending],
+                max_concurrency=min(max(1, max_concurrency), BATCH_MAX_CONCURRENCY),
+                requests_per_minute=requests_per_minute
+            ):
+                index, image = pending[item["index"]]
+                item["index"] = index
+                item["filename"] = images[index][0]
+                items[index] = item
+                if item["status"] == "success":
+                    record_analysis(
+                        item["result"], "batch", item["filename"], image
+                    )
+                yield json.dumps(item, ensure_ascii=False) + "\n"
+        except Exception as e:
+            logger.error(f"Lỗi phát hiện bệnh (batch stream): {str(e)}")
+            yield json.dumps({"done": True, "error": str(e)}) + "\n"
+            return
+
+        summary = summarize_batch(items, time.perf_counter() - start)
+        del summary["results"]
+        yield json.dumps({"done": True, **summary}) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
 @app.get("/")
 async def root():
     """Điểm cuối gốc cung cấp thông tin API"""
@@ -72,64 +382,328 @@ async def root():
         "version": "1.0.0",
         "endpoints": {
             "disease_detection_file": "/disease-detection-file (POST, file upload)",
-            "chatbot": "/chatbot (POST, JSON with message field)",
+            "disease_detection_batch": "/disease-detection-batch (POST, multiple files or zip)",
+            "disease_detection_batch_stream": "/disease-detection-batch/stream (POST, NDJSON per finished image)",
+            "chatbot": "/chatbot (POST, JSON with message field; X-Session-ID header selects the conversation)",
+            "chatbot_stream": "/chatbot/stream (POST, Server-Sent Events)",
             "chatbot_set_context": "/chatbot/set-context (POST, set disease analysis context)",
             "chatbot_clear_context": "/chatbot/clear-context (POST, clear disease context)",
-            "chatbot_clear": "/chatbot/clear (POST, clear chat history)"
+            "chatbot_clear": "/chatbot/clear (POST, clear chat history)",
+            "metrics": "/metrics (GET, Prometheus metrics: latency histograms, tokens, cache hits, errors)",
+            "cache_stats": "/cache/stats (GET, result cache hit/miss counters)",
+            "connection_stats": "/connections/stats (GET, Groq connection reuse counters)",
+            "parsing_stats": "/parsing/stats (GET, model responses parsed, repaired or failed)",
+            "resilience_stats": "/resilience/stats (GET, Groq retry and circuit breaker metrics)",
+            "scheduler_stats": "/scheduler/stats (GET, RPM/TPM quota queue depth and wait times)",
+            "coalescing_stats": "/coalescing/stats (GET, identical in-flight analyses sharing one call)",
+            "backend": "/backend (GET, inference backend and model version)",
+            "triage_stats": "/triage/stats (GET, local image triage escalation rate and latency saved)",
+            "tokens_stats": "/tokens/stats (GET, adaptive max_tokens budget, completion tokens per outcome and truncations)",
+            "cassette_stats": "/cassette/stats (GET, recorded model API responses and replay hits)",
+            "prompts": "/prompts (GET, prompt versions and token counts)",
+            "chatbot_memory": "/chatbot/memory (GET, prompt tokens per chat turn)",
+            "chatbot_sessions": "/chatbot/sessions (GET, stored chatbot sessions)",
+            "analyses": "/analyses (GET, stored analysis results by disease, severity and time; paginated)",
+            "analysis": "/analyses/{id} (GET, one stored analysis result)",
+            "analyses_stats": "/analyses/stats (GET, stored results per type and write queue counters)"
         }
     }
 
 
+@app.get('/metrics')
+async def metrics():
+    """
+    Trả về các chỉ số Prometheus: độ trễ theo từng bước, số token, lượt trúng bộ nhớ đệm và lỗi.
+    """
+    return Response(render_metrics(), media_type=CONTENT_TYPE_LATEST)
+
+
+@app.get('/cache/stats')
+async def cache_stats():
+    """
+    Trả về bộ đếm hit/miss của bộ nhớ đệm kết quả phân tích.
+    """
+    cache = get_default_cache()
+    if cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **cache.stats()}
+
+
+@app.get('/connections/stats')
+async def connections_stats():
+    """
+    Trả về số lần tái sử dụng kết nối tới Groq và thời gian thiết lập đã tiết kiệm.
+    """
+    return connection_stats.snapshot()
+
+
+@app.get('/parsing/stats')
+async def parsing_stats():
+    """
+    Trả về số phản hồi của mô hình đã đọc được ngay, phải sửa hoặc không đọc được (tỉ lệ lỗi).
+    """
+    return parse_stats.snapshot()
+
+
+@app.get('/resilience/stats')
+async def resilience_stats():
+    """
+    Trả về số lần thử lại, số lỗi và trạng thái circuit breaker của lệnh gọi Groq.
+    """
+    return get_default_caller().stats()
+
+
+@app.get('/scheduler/stats')
+async def scheduler_stats():
+    """
+    Trả về hạn mức RPM/TPM còn lại, độ sâu hàng đợi và thời gian chờ theo mức ưu tiên.
+    """
+    return get_default_scheduler().stats()
+
+
+@app.get('/backend')
+async def backend_info():
+    """
+    Trả về backend suy luận đang dùng (Groq hoặc mô hình cục bộ) và phiên bản mô hình.
+    """
+    detector = get_detector()
+    if detector.backend is not None:
+        return detector.backend.stats()
+    return {
+        "backend": "groq",
+        "model": detector.model_name,
+        "version": detector.result_version,
+    }
+
+
+@app.get('/triage/stats')
+async def triage_stats():
+    """
+    Trả về tỉ lệ ảnh được chuyển tới mô hình, số ảnh bị loại theo lý do và thời gian đã tiết kiệm.
+    """
+    triage = get_default_triage()
+    if triage is None:
+        return {"enabled": False}
+    return {"enabled": True, **triage.stats()}
+
+
+@app.get('/tokens/stats')
+async def tokens_stats():
+    """
+    Trả về ngân sách max_tokens hiện tại, số token phản hồi theo kết quả và số phản hồi bị cắt ngắn.
+    """
+    budget = get_default_token_budget()
+    if budget is None:
+        return {"enabled": False}
+    return {"enabled": True, **budget.stats()}
+
+
+@app.get('/cassette/stats')
+async def cassette_stats():
+    """
+    Trả về chế độ ghi/phát lại phản hồi API mô hình, số phản hồi đã ghi và số lượt phát lại.
+    """
+    cassette = get_default_cassette()
+    if cassette is None:
+        return {"enabled": False}
+    return {"enabled": True, "mode": cassette_mode(), **cassette.stats()}
+
+
+@app.get('/coalescing/stats')
+async def coalescing_stats():
+    """
+    Trả về số lệnh gọi API và số yêu cầu giống hệt đã được gộp vào lệnh gọi đang chạy.
+    """
+    flights = get_default_flights()
+    if flights is None:
+        return {"enabled": False}
+    return {"enabled": True, **flights.stats()}
+
+
+def analysis_store():
+    """Return the analysis store, 404 if storing results is disabled"""
+    store = get_default_analysis_store()
+    if store is None:
+        raise HTTPException(
+            status_code=404, detail="Lưu kết quả phân tích đang tắt"
+        )
+    return store
+
+
+@app.get('/analyses')
+async def list_analyses(
+    disease_name: Optional[str] = None,
+    disease_type: Optional[str] = None,
+    severity: Optional[str] = None,
+    source: Optional[str] = None,
+    image_hash: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    before: Optional[int] = None,
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE)
+):
+    """
+    Trả về các kết quả phân tích đã lưu, mới nhất trước, lọc theo tên bệnh,
+    loại bệnh, mức độ nghiêm trọng, nguồn, mã băm ảnh và thời gian. Trang
+    tiếp theo: truyền next_cursor của trang trước vào tham số before.
+    """
+    store = analysis_store()
+    return await asyncio.to_thread(
+        store.query,
+        disease_name=disease_name,
+        disease_type=disease_type,
+        severity=severity,
+        source=source,
+        image_hash=image_hash,
+        since=since.timestamp() if since is not None else None,
+        until=until.timestamp() if until is not None else None,
+        before=before,
+        limit=limit
+    )
+
+
+@app.get('/analyses/stats')
+async def analyses_stats():
+    """
+    Trả về số kết quả đã lưu theo loại bệnh và mức độ, cùng bộ đếm hàng đợi ghi.
+    """
+    store = get_default_analysis_store()
+    if store is None:
+        return {"enabled": False}
+    return {"enabled": True, **(await asyncio.to_thread(store.stats))}
+
+
+@app.get('/analyses/{analysis_id}')
+async def get_analysis(analysis_id: int):
+    """
+    Trả về một kết quả phân tích đã lưu.
+    """
+    record = await asyncio.to_thread(analysis_store().get, analysis_id)
+    if record is None:
+        raise HTTPException(
+            status_code=404, detail="Không tìm thấy kết quả phân tích"
+        )
+    return record
+
+
+@app.get('/prompts')
+async def prompts_info():
+    """
+    Trả về phiên bản và số token của từng lời nhắc (bản đầy đủ và rút gọn).
+    """
+    return {
+        "default_variant": default_variant(),
+        "prompts": prompt_registry.report(),
+    }
+
+
 @app.post('/chatbot')
-async def chatbot_endpoint(request: ChatRequest):
+async def chatbot_endpoint(
+    request: ChatRequest, session_id: str = Depends(get_session_id)
+):
     """
     Điểm cuối chatbot để trò chuyện với AI về bệnh cây.
-    Chấp nhận JSON với trường 'message'.
+    Chấp nhận JSON với trường 'message'. Cuộc trò chuyện được giữ theo
+    header X-Session-ID (được tạo mới và trả về nếu không gửi).
     """
     try:
         logger.info(f"Nhận tin nhắn chatbot: {request.message[:50]}...")
         
-        # Get chatbot instance
-        chatbot = get_chatbot()
-        
-        # Get response
-        response = chatbot.chat(
-            request.message,
-            temperature=request.temperature,
-            max_tokens=request.max_tokens
-        )
+        # Load the session's chatbot and get response
+        async with chat_session(session_id) as chatbot:
+            response = await chatbot.chat(
+                request.message,
+                temperature=request.temperature,
+                max_tokens=request.max_tokens
+            )
         
         logger.info("Chatbot đã trả lời thành công")
         return JSONResponse(content={
             "response": response,
+            "session_id": session_id,
+            "memory": chatbot.memory.last_turn,
             "status": "success"
-        })
+        }, headers={SESSION_HEADER: session_id})
         
     except ValueError as e:
         logger.error(f"Lỗi validation: {str(e)}")
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Lỗi chatbot: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Lỗi máy chủ nội bộ: {str(e)}")
+        raise upstream_error(e) or HTTPException(
+            status_code=500, detail=f"Lỗi máy chủ nội bộ: {str(e)}"
+        )
+
+
+@app.post('/chatbot/stream')
+async def chatbot_stream_endpoint(
+    request: ChatRequest, session_id: str = Depends(get_session_id)
+):
+    """
+    Điểm cuối chatbot trả lời dạng Server-Sent Events: mỗi sự kiện "data"
+    chứa một đoạn {"delta": ...} của câu trả lời, kết thúc bằng sự kiện
+    "done" (hoặc "error" nếu lệnh gọi mô hình thất bại).
+    """
+    if not request.message or not request.message.strip():
+        raise HTTPException(status_code=400, detail="Tin nhắn không thể để trống")
+    logger.info(f"Nhận tin nhắn chatbot (stream): {request.message[:50]}...")
+
+    async def events():
+        try:
+            async with chat_session(session_id) as chatbot:
+                async for delta in chatbot.chat_stream(
+                    request.message,
+                    temperature=request.temperature,
+                    max_tokens=request.max_tokens
+                ):
+                    data = json.dumps({"delta": delta}, ensure_ascii=False)
+                    yield f"data: {data}\n\n"
+            yield "event: done\ndata: {}\n\n"
+        except Exception as e:
+            logger.error(f"Lỗi chatbot (stream): {str(e)}")
+            data = json.dumps({"detail": str(e)}, ensure_ascii=False)
+            yield f"event: error\ndata: {data}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={SESSION_HEADER: session_id})
+
+
+@app.get('/chatbot/memory')
+async def chatbot_memory(session_id: str = Depends(get_session_id)):
+    """
+    Trả về số token lời nhắc đã gửi theo từng lượt và số lượt đã tóm tắt/bỏ
+    của phiên hiện tại.
+    """
+    async with chat_session(session_id, save=False) as chatbot:
+        return chatbot.memory.stats()
+
+
+@app.get('/chatbot/sessions')
+async def chatbot_sessions():
+    """
+    Trả về số phiên chatbot đang lưu và số phiên đã bị loại bỏ.
+    """
+    return get_default_session_store().stats()
 
 
 @app.post('/chatbot/clear')
-async def chatbot_clear():
+async def chatbot_clear(session_id: str = Depends(get_session_id)):
     """
-    Xóa lịch sử chat của chatbot.
+    Xóa lịch sử chat của phiên chatbot hiện tại.
     """
     try:
         logger.info("Yêu cầu xóa lịch sử chat")
         
-        # Get chatbot instance and clear history
-        chatbot = get_chatbot()
-        chatbot.clear_history()
+        # Load the session's chatbot and clear history
+        async with chat_session(session_id) as chatbot:
+            chatbot.clear_history()
         
         logger.info("Đã xóa lịch sử chat thành công")
         return JSONResponse(content={
             "message": "Đã xóa lịch sử chat",
+            "session_id": session_id,
             "status": "success"
-        })
+        }, headers={SESSION_HEADER: session_id})
         
     except Exception as e:
         logger.error(f"Lỗi khi xóa lịch sử: {str(e)}")
@@ -137,7 +711,9 @@ async def chatbot_clear():
 
 
 @app.post('/chatbot/set-context')
-async def chatbot_set_context(request: SetContextRequest):
+async def chatbot_set_context(
+    request: SetContextRequest, session_id: str = Depends(get_session_id)
+):
     """
     Thiết lập context phân tích bệnh cho chatbot.
     Cho phép chatbot trả lời câu hỏi dựa trên kết quả phân tích cụ thể.
@@ -145,15 +721,16 @@ async def chatbot_set_context(request: SetContextRequest):
     try:
         logger.info("Yêu cầu thiết lập context phân tích bệnh")
         
-        # Get chatbot instance and set context
-        chatbot = get_chatbot()
-        chatbot.set_disease_context(request.disease_analysis)
+        # Load the session's chatbot and set context
+        async with chat_session(session_id) as chatbot:
+            chatbot.set_disease_context(request.disease_analysis)
         
         logger.info("Đã thiết lập context thành công")
         return JSONResponse(content={
             "message": "Đã thiết lập context phân tích bệnh",
+            "session_id": session_id,
             "status": "success"
-        })
+        }, headers={SESSION_HEADER: session_id})
         
     except Exception as e:
         logger.error(f"Lỗi khi thiết lập context: {str(e)}")
@@ -161,22 +738,23 @@ async def chatbot_set_context(request: SetContextRequest):
 
 
 @app.post('/chatbot/clear-context')
-async def chatbot_clear_context():
+async def chatbot_clear_context(session_id: str = Depends(get_session_id)):
     """
     Xóa context phân tích bệnh của chatbot.
     """
     try:
         logger.info("Yêu cầu xóa context phân tích bệnh")
         
-        # Get chatbot instance and clear context
-        chatbot = get_chatbot()
-        chatbot.clear_disease_context()
+        # Load the session's chatbot and clear context
+        async with chat_session(session_id) as chatbot:
+            chatbot.clear_disease_context()
         
         logger.info("Đã xóa context thành công")
         return JSONResponse(content={
             "message": "Đã xóa context phân tích bệnh",
+            "session_id": session_id,
             "status": "success"
-        })
+        }, headers={SESSION_HEADER: session_id})
         
     except Exception as e:
         logger.error(f"Lỗi khi xóa context: {str(e)}")
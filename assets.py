@@ -0,0 +1,99 @@
+"""
+Cached Static Assets for the Streamlit App
+==========================================
+
+Streamlit runs main.py from the top on every interaction. The logos used to
+be re-read from disk on each rerun: the header logo was base64-encoded into
+a 61 KB data URL, and the 499 px sidebar logo was decoded, resized to its
+100 px display width and re-encoded by st.image.
+
+The helpers below do that work once per process (st.cache_data) and return
+images already at their display size, so a rerun only hands the cached
+bytes to Streamlit. Entries are keyed on the modification time of the file:
+replacing an asset on disk invalidates it on the next rerun, and
+clear_asset_cache() drops everything explicitly.
+
+Example:
+    >>> st.image(load_image("black-tree-logo.png", width=100))
+    >>> st.markdown(f'<img src="{image_data_url("agriculture.png", 210)}">',
+    ...             unsafe_allow_html=True)
+"""
+
+import base64
+import io
+import os
+from typing import Optional
+
+import streamlit as st
+from PIL import Image
+
+
+ASSET_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Assets are few; bound the cache in case files keep changing on disk
+MAX_CACHED_ASSETS = 16
+
+
+def _asset_path(name: str) -> str:
+    return os.path.join(ASSET_DIR, name)
+
+
+def _resize(data: bytes, width: Optional[int]) -> bytes:
+    """Downscale a PNG to width pixels (as st.image would), if it is wider."""
+    with Image.open(io.BytesIO(data)) as image:
+        if width is None or image.width <= width:
+            return data
+        height = int(1.0 * image.height * width / image.width)
+        resized = image.resize((width, height), resample=Image.BILINEAR)
+    buffer = io.BytesIO()
+    resized.save(buffer, format="PNG", optimize=True)
+    return buffer.getvalue()
+
+
+@st.cache_data(show_spinner=False, max_entries=MAX_CACHED_ASSETS)
+def _load_image(path: str, mtime_ns: int, width: Optional[int]) -> bytes:
+    # mtime_ns is only part of the cache key
+    with open(path, "rb") as f:
+        return _resize(f.read(), width)
+
+
+@st.cache_data(show_spinner=False, max_entries=MAX_CACHED_ASSETS)
+def _image_data_url(path: str, mtime_ns: int, width: Optional[int]) -> str:
+    data = _load_image(path, mtime_ns, width)
+    return f"data:image/png;base64,{base64.b64encode(data).decode('ascii')}"
+
+
+def load_image(name: str, width: Optional[int] = None) -> bytes:
+    """
+    Read a PNG asset, downscaled to width, cached across reruns.
+
+    Args:
+        name (str): File name relative to the app directory
+        width (Optional[int]): Display width in pixels, None for full size
+
+    Returns:
+        bytes: PNG image
+    """
+    path = _asset_path(name)
+    return _load_image(path, os.stat(path).st_mtime_ns, width)
+
+
+def image_data_url(name: str, width: Optional[int] = None) -> str:
+    """
+    Get a PNG asset as a data URL for inline HTML, cached across reruns.
+
+    Args:
+        name (str): File name relative to the app directory
+        width (Optional[int]): Width in pixels, None for full size
+
+    Returns:
+        str: data:image/png;base64,... URL
+    """
+    path = _asset_path(name)
+    return _image_data_url(path, os.stat(path).st_mtime_ns, width)
+
+
+def clear_asset_cache() -> None:
+    """Drop every cached asset; they are read again on next use."""
+    _load_image.clear()
+    _image_data_url.clear()
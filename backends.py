@@ -0,0 +1,334 @@
+"""
+Inference Backends for Plant Disease Detection
+==============================================
+
+PlantDiseaseDetector sends images to the Groq vision model by default. This
+module defines the interface of the alternative, local backends and an
+ONNX Runtime implementation that runs a small image classifier on the CPU,
+without network round trips, API quota or cost.
+
+A local backend maps each image to the fields of DiseaseAnalysisResult.
+The classifier is described by a JSON metadata file next to the model
+(model.onnx -> model.json):
+
+    {
+        "input_size": 224,
+        "mean": [0.485, 0.456, 0.406],
+        "std": [0.229, 0.224, 0.225],
+        "classes": [
+            "Tomato___healthy",
+            {"label": "Tomato___Early_blight", "disease_detected": true,
+             "disease_name": "Bệnh đốm vòng", "disease_type": "nấm",
+             "severity": "trung bình", "symptoms": ["..."],
+             "possible_causes": ["..."], "treatment": ["..."]}
+        ]
+    }
+
+A class given as a plain label is reported as healthy if the label contains
+"healthy" and as a disease named after the label otherwise.
+
+Configuration (environment variables used by get_default_backend):
+    PLANT_BACKEND: "groq" (default) or "local"
+    PLANT_LOCAL_MODEL: Path of the ONNX model (default: models/plant.onnx)
+    PLANT_LOCAL_METADATA: Path of the metadata file (default: the model
+                          path with a .json extension)
+    PLANT_LOCAL_THREADS: ONNX Runtime intra-op threads, 0 for all cores
+                         (default: 0)
+    PLANT_LOCAL_BATCH_SIZE: Max images per inference call (default: 32)
+"""
+
+import asyncio
+import hashlib
+import io
+import json
+import logging
+import os
+import threading
+from typing import Dict, List, Optional, Union
+
+from PIL import Image
+
+try:
+    import numpy as np
+    import onnxruntime
+except ImportError:  # Optional, only needed by the local backend
+    np = onnxruntime = None
+
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("groq", "local")
+
+
+class AnalysisBackend:
+    """
+    Interface of local inference backends.
+
+    Subclasses must implement analyze_images. model_name and version
+    identify the results in cache keys and result metadata.
+    """
+
+    name = "base"
+    model_name = "base"
+    version = "0"
+    batch_size = 1
+
+    def analyze_images(
+        self, images: List[bytes]
+    ) -> List[Union[Dict, Exception]]:
+        """
+        Analyze encoded images.
+
+        An image that cannot be decoded does not fail the others: its entry
+        is the exception it raised.
+
+        Args:
+            images (List[bytes]): Encoded image files (JPEG, PNG, ...)
+
+        Returns:
+            List[Union[Dict, Exception]]: DiseaseAnalysisResult fields per
+                                          image, or its error, in order
+        """
+        raise NotImplementedError
+
+    async def analyze_images_async(
+        self, images: List[bytes]
+    ) -> List[Union[Dict, Exception]]:
+        """Run analyze_images in a worker thread."""
+        return await asyncio.to_thread(self.analyze_images, images)
+
+    def analyze_image(self, image: bytes) -> Dict:
+        """Analyze one encoded image; raise its error."""
+        fields = self.analyze_images([image])[0]
+        if isinstance(fields, Exception):
+            raise fields
+        return fields
+
+    async def analyze_image_async(self, image: bytes) -> Dict:
+        """Analyze one encoded image in a worker thread; raise its error."""
+        fields = (await self.analyze_images_async([image]))[0]
+        if isinstance(fields, Exception):
+            raise fields
+        return fields
+
+    def stats(self) -> Dict:
+        """Return the backend name, model and version."""
+        return {
+            "backend": self.name,
+            "model": self.model_name,
+            "version": self.version,
+        }
+
+
+def _class_fields(entry: Union[str, Dict]) -> Dict:
+    """Expand a metadata class entry to DiseaseAnalysisResult fields."""
+    if isinstance(entry, str):
+        entry = {"label": entry}
+    label = entry["label"]
+    healthy = "healthy" in label.lower()
+    return {
+        "disease_detected": entry.get("disease_detected", not healthy),
+        "disease_name": entry.get("disease_name", None if healthy else label),
+        "disease_type": entry.get("disease_type", "unknown"),
+        "severity": entry.get("severity", "none" if healthy else "unknown"),
+        "symptoms": list(entry.get("symptoms", [])),
+        "possible_causes": list(entry.get("possible_causes", [])),
+        "treatment": list(entry.get("treatment", [])),
+    }
+
+
+class OnnxClassifierBackend(AnalysisBackend):
+    """
+    Image classifier run on the CPU with ONNX Runtime.
+
+    The session is created once and shared by all threads (ONNX Runtime
+    sessions are thread-safe). Images are decoded, resized and normalized
+    into one NCHW float32 tensor, so a batch costs a single inference call.
+
+    Args:
+        model_path (str): Path of the ONNX model
+        metadata_path (Optional[str]): Path of the metadata file, None for
+                                       the model path with .json extension
+        threads (int): Intra-op threads, 0 to let ONNX Runtime decide
+        batch_size (int): Max images per inference call
+
+    Raises:
+        ImportError: If onnxruntime is not installed
+        FileNotFoundError: If the model or metadata file is missing
+
+    Example:
+        >>> backend = OnnxClassifierBackend("models/plant.onnx")
+        >>> detector = PlantDiseaseDetector(backend=backend)
+    """
+
+    name = "local"
+
+    def __init__(
+        self,
+        model_path: str,
+        metadata_path: Optional[str] = None,
+        threads: int = 0,
+        batch_size: int = 32
+    ):
+        if onnxruntime is None:
+            raise ImportError(
+                "Backend cục bộ cần onnxruntime: pip install onnxruntime"
+            )
+        metadata_path = metadata_path or os.path.splitext(model_path)[0] + ".json"
+        with open(metadata_path, "r", encoding="utf-8") as f:
+            metadata = json.load(f)
+        with open(model_path, "rb") as f:
+            model = f.read()
+
+        self.model_name = os.path.basename(model_path)
+        self.version = hashlib.sha256(
+            model + json.dumps(metadata, sort_keys=True).encode("utf-8")
+        ).hexdigest()[:12]
+        self.batch_size = max(1, batch_size)
+        self.classes = [_class_fields(entry) for entry in metadata["classes"]]
+        self.input_size = int(metadata.get("input_size", 224))
+        self.mean = np.array(
+            metadata.get("mean", [0.485, 0.456, 0.406]), dtype=np.float32
+        ).reshape(1, 3, 1, 1)
+        self.std = np.array(
+            metadata.get("std", [0.229, 0.224, 0.225]), dtype=np.float32
+        ).reshape(1, 3, 1, 1)
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = (
+            onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        )
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(
+            model, options, providers=["CPUExecutionProvider"]
+        )
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        # Models exported with a fixed batch dimension run one image a time
+        if isinstance(model_input.shape[0], int):
+            self.batch_size = min(self.batch_size, model_input.shape[0])
+        logger.info(
+            f"Tải mô hình cục bộ {self.model_name} ({self.version}, "
+            f"{len(self.classes)} lớp, lô tối đa {self.batch_size})"
+        )
+
+    def _decode(self, data: bytes) -> "np.ndarray":
+        """Decode and resize one image into a (size, size, 3) uint8 array."""
+        size = self.input_size
+        with Image.open(io.BytesIO(data)) as image:
+            # JPEG draft mode decodes at a reduced scale directly
+            image.draft("RGB", (size, size))
+            return np.asarray(
+                image.convert("RGB").resize((size, size), Image.BILINEAR)
+            )
+
+    def _normalize(self, batch: "np.ndarray") -> "np.ndarray":
+        """Turn NHWC uint8 pixels into a normalized NCHW float32 tensor."""
+        tensor = batch.transpose(0, 3, 1, 2).astype(np.float32)
+        tensor *= 1.0 / 255.0
+        tensor -= self.mean
+        tensor /= self.std
+        return tensor
+
+    def preprocess(self, images: List[bytes]) -> "np.ndarray":
+        """
+        Decode, resize and normalize images into one NCHW float32 tensor.
+
+        Args:
+            images (List[bytes]): Encoded image files
+
+        Returns:
+            np.ndarray: Tensor of shape (len(images), 3, size, size)
+        """
+        size = self.input_size
+        batch = np.empty((len(images), size, size, 3), dtype=np.uint8)
+        for i, data in enumerate(images):
+            batch[i] = self._decode(data)
+        return self._normalize(batch)
+
+    def analyze_images(
+        self, images: List[bytes]
+    ) -> List[Union[Dict, Exception]]:
+        size = self.input_size
+        results = []
+        for offset in range(0, len(images), self.batch_size):
+            chunk = images[offset:offset + self.batch_size]
+            entries: List[Union[Dict, Exception, None]] = [None] * len(chunk)
+            # Each image is decoded on its own, so an undecodable one only
+            # fails its own entry; the others share one inference call
+            batch = np.empty((len(chunk), size, size, 3), dtype=np.uint8)
+            decoded = []
+            for i, data in enumerate(chunk):
+                try:
+                    batch[len(decoded)] = self._decode(data)
+                except (OSError, ValueError, Image.DecompressionBombError) as e:
+                    entries[i] = e
+                    continue
+                decoded.append(i)
+            if decoded:
+                tensor = self._normalize(batch[:len(decoded)])
+                logits = self.session.run(None, {self.input_name: tensor})[0]
+                logits = logits - logits.max(axis=1, keepdims=True)
+                probabilities = np.exp(logits)
+                probabilities /= probabilities.sum(axis=1, keepdims=True)
+                for i, row in zip(decoded, probabilities):
+                    best = int(row.argmax())
+                    entries[i] = {
+                        **self.classes[best],
+                        "confidence": round(float(row[best]) * 100, 1),
+                    }
+            results.extend(entries)
+        return results
+
+    def stats(self) -> Dict:
+        return {
+            **super().stats(),
+            "classes": len(self.classes),
+            "input_size": self.input_size,
+            "batch_size": self.batch_size,
+        }
+
+
+_default_backend: Optional[AnalysisBackend] = None
+_default_backend_lock = threading.Lock()
+
+
+def backend_name() -> str:
+    """Return the backend configured from environment."""
+    name = os.environ.get("PLANT_BACKEND", "groq").lower()
+    if name not in BACKENDS:
+        raise ValueError(
+            f"PLANT_BACKEND must be one of {BACKENDS}, got {name!r}"
+        )
+    return name
+
+
+def get_default_backend() -> Optional[AnalysisBackend]:
+    """
+    Get the process-wide local backend configured from environment.
+
+    The model is loaded once, on first use.
+
+    Returns:
+        Optional[AnalysisBackend]: Shared local backend, or None if
+                                   PLANT_BACKEND is "groq"
+    """
+    global _default_backend
+    if backend_name() == "groq":
+        return None
+    if _default_backend is None:
+        with _default_backend_lock:
+            if _default_backend is None:
+                model_path = os.environ.get(
+                    "PLANT_LOCAL_MODEL", "models/plant.onnx"
+                )
+                _default_backend = OnnxClassifierBackend(
+                    model_path,
+                    metadata_path=os.environ.get("PLANT_LOCAL_METADATA"),
+                    threads=int(os.environ.get("PLANT_LOCAL_THREADS", 0)),
+                    batch_size=int(
+                        os.environ.get("PLANT_LOCAL_BATCH_SIZE", 32)
+                    ),
+                )
+    return _default_backend
@@ -0,0 +1,186 @@
+"""
+Analysis Store Benchmark
+========================
+
+Measures what persisting analysis results costs the request path and how
+queries scale with the size of the store:
+
+    record      latency of AnalysisStore.record (queued, written by the
+                background thread) against inserting and committing the row
+                on the request thread
+    throughput  rows per second written by the background thread
+    query       latency of one page filtered by disease name or time, with
+                the indexes against a full table scan, and of a deep page
+                with the keyset cursor against LIMIT/OFFSET
+
+Usage:
+    python benchmarks/bench_analysis_store.py --records 100000
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from records import _INSERT, AnalysisStore  # noqa: E402
+
+DISEASE_TYPES = ["nấm", "vi khuẩn", "virus", "sâu bệnh", "healthy",
+                 "invalid_image", "thiếu dinh dưỡng"]
+SEVERITIES = ["nhẹ", "trung bình", "nặng", "không"]
+
+
+def make_result(rng: random.Random) -> dict:
+    return {
+        "disease_detected": True,
+        "disease_name": f"Bệnh {rng.randrange(200)}",
+        "disease_type": rng.choice(DISEASE_TYPES),
+        "severity": rng.choice(SEVERITIES),
+        "confidence": rng.uniform(50, 100),
+        "symptoms": ["Đốm nâu trên lá", "Lá vàng"],
+        "possible_causes": ["Độ ẩm cao"],
+        "treatment": ["Cắt bỏ lá bệnh", "Phun thuốc trừ nấm"],
+        "prompt_version": "analysis-full-1",
+        "triage": None,
+    }
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    return (statistics.median(samples) * 1e3,
+            samples[int(len(samples) * 0.99)] * 1e3)
+
+
+def bench_record(directory: str, count: int, rng: random.Random) -> None:
+    results = [make_result(rng) for _ in range(count)]
+
+    store = AnalysisStore(os.path.join(directory, "queued.sqlite3"))
+    latencies = []
+    for result in results:
+        start = time.perf_counter()
+        store.record(result, "file", "leaf.jpg", "0" * 64)
+        latencies.append(time.perf_counter() - start)
+    start = time.perf_counter()
+    store.flush()
+    drain = time.perf_counter() - start
+    queued = percentiles(latencies)
+    store.close()
+
+    # Baseline: one INSERT and COMMIT on the request thread
+    sync = AnalysisStore(os.path.join(directory, "sync.sqlite3"))
+    conn = sync._connect()
+    latencies = []
+    for result in results:
+        start = time.perf_counter()
+        with conn:
+            conn.execute(_INSERT, (time.time(), "file", "leaf.jpg", "0" * 64,
+                                   1, result["disease_name"],
+                                   result["disease_type"], result["severity"],
+                                   result["confidence"], None, "{}"))
+        latencies.append(time.perf_counter() - start)
+    conn.close()
+    sync.close()
+    inline = percentiles(latencies)
+
+    print(f"record ({count} results)      p50 ms   p99 ms")
+    print(f"  insert + commit inline   {inline[0]:>8.3f} {inline[1]:>8.3f}")
+    print(f"  AnalysisStore.record     {queued[0]:>8.3f} {queued[1]:>8.3f}"
+          f"   (queue drained {drain * 1e3:.0f} ms after the last record)")
+
+
+def populate(path: str, count: int, rng: random.Random) -> float:
+    store = AnalysisStore(path, queue_size=count)
+    now = time.time()
+    start = time.perf_counter()
+    for i in range(count):
+        store.record(make_result(rng), rng.choice(["file", "batch"]),
+                     f"{i}.jpg", f"{rng.getrandbits(256):064x}",
+                     created_at=now - (count - i))
+    store.flush()
+    elapsed = time.perf_counter() - start
+    store.close()
+    return count / elapsed
+
+
+def timed(conn: sqlite3.Connection, sql: str, params=(), repeat: int = 20):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        conn.execute(sql, params).fetchall()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1e3
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--records", type=int, default=100000)
+    parser.add_argument("--record-latency", type=int, default=2000)
+    args = parser.parse_args()
+    rng = random.Random(0)
+
+    with tempfile.TemporaryDirectory() as directory:
+        bench_record(directory, args.record_latency, rng)
+
+        path = os.path.join(directory, "analyses.sqlite3")
+        rate = populate(path, args.records, rng)
+        print(f"\nthroughput: {rate:,.0f} records/s written in the background")
+
+        store = AnalysisStore(path)
+        conn = store._conn
+        columns = "SELECT id, created_at, source, filename, image_hash, result"
+        page = 50
+        depth = args.records // len(DISEASE_TYPES) // 2
+        cursor = conn.execute(
+            "SELECT created_at, id FROM analyses WHERE disease_type = ? "
+            "ORDER BY created_at DESC, id DESC LIMIT 1 OFFSET ?",
+            ("virus", depth)
+        ).fetchone()
+        # A window in the older half of the store
+        now = time.time()
+        since, until = now - args.records * 0.6, now - args.records * 0.5
+
+        print(f"\nquery ({args.records:,} records, {page} per page)     ms")
+        for name, sql, params in (
+            ("disease_name, full scan",
+             f"{columns} FROM analyses NOT INDEXED WHERE disease_name = ? "
+             "ORDER BY created_at DESC, id DESC LIMIT ?", ("Bệnh 7", page)),
+            ("disease_name, index",
+             f"{columns} FROM analyses WHERE disease_name = ? "
+             "ORDER BY created_at DESC, id DESC LIMIT ?", ("Bệnh 7", page)),
+            ("time window, full scan",
+             f"{columns} FROM analyses NOT INDEXED WHERE created_at >= ? "
+             "AND created_at < ? ORDER BY created_at DESC, id DESC LIMIT ?",
+             (since, until, page)),
+            ("time window, index",
+             f"{columns} FROM analyses WHERE created_at >= ? "
+             "AND created_at < ? ORDER BY created_at DESC, id DESC LIMIT ?",
+             (since, until, page)),
+            (f"page at row {depth:,}, OFFSET",
+             f"{columns} FROM analyses WHERE disease_type = ? "
+             "ORDER BY created_at DESC, id DESC LIMIT ? OFFSET ?",
+             ("virus", page, depth)),
+            (f"page at row {depth:,}, cursor",
+             f"{columns} FROM analyses WHERE disease_type = ? "
+             "AND (created_at, id) < (?, ?) "
+             "ORDER BY created_at DESC, id DESC LIMIT ?",
+             ("virus", *cursor, page)),
+        ):
+            print(f"  {name:<32}{timed(conn, sql, params):>8.2f}")
+        samples = []
+        for _ in range(20):
+            start = time.perf_counter()
+            store.query(disease_type="virus", severity="nặng", limit=page)
+            samples.append(time.perf_counter() - start)
+        print(f"  {'AnalysisStore.query, 2 filters':<32}"
+              f"{statistics.median(samples) * 1e3:>8.2f}")
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Chat Memory Benchmark
+=====================
+
+Replays a synthetic 100-turn conversation through ChatMemory and reports
+the estimated prompt tokens sent per turn with the unbounded history the
+chatbot used to send, with older turns dropped, and with older turns
+summarized. Runs offline; no model calls are made.
+
+Usage:
+    python benchmarks/bench_chat_memory.py --turns 100 --budget 6000
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_groq import CANNED_ANALYSIS, CANNED_CHAT_REPLY  # noqa: E402
+from memory import ChatMemory  # noqa: E402
+from prompts import get_prompt  # noqa: E402
+
+
+QUESTIONS = [
+    "Bệnh đốm lá nâu là gì?",
+    "Tại sao lá cây bị vàng từ mép vào trong?",
+    "Tôi nên phun thuốc gì và liều lượng bao nhiêu?",
+    "Bao lâu thì cần phun nhắc lại một lần?",
+    "Có biện pháp sinh học nào thay cho thuốc hóa học không?",
+    "Làm sao để phòng bệnh tái phát vào mùa mưa?",
+]
+
+
+def system_prompt() -> str:
+    """Build the full chatbot system prompt with a disease context."""
+    context = get_prompt("chat_context", "full").text.format(
+        context=str(CANNED_ANALYSIS)
+    )
+    return get_prompt("chat_system", "full").text + "\n\n" + context
+
+
+def replay(memory: ChatMemory, turns: int, reply: str, system: str) -> dict:
+    """Run a conversation and collect prompt tokens and build time per turn."""
+    tokens, build_us = [], []
+    for turn in range(turns):
+        memory.add("user", f"{QUESTIONS[turn % len(QUESTIONS)]} (lượt {turn})")
+        start = time.perf_counter()
+        memory.build_messages(system)
+        build_us.append((time.perf_counter() - start) * 1e6)
+        tokens.append(memory.last_turn["prompt_tokens"])
+        memory.add("assistant", reply)
+    return {
+        "last": tokens[-1],
+        "max": max(tokens),
+        "total": sum(tokens),
+        "build_us": statistics.fmean(build_us),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--turns", type=int, default=100)
+    parser.add_argument("--budget", type=int, default=6000)
+    parser.add_argument("--keep-turns", type=int, default=8)
+    parser.add_argument("--summary-tokens", type=int, default=400)
+    parser.add_argument("--reply-repeat", type=int, default=4,
+                        help="Canned replies concatenated per answer")
+    args = parser.parse_args()
+
+    reply = " ".join([CANNED_CHAT_REPLY] * args.reply_repeat)
+    system = system_prompt()
+    cases = [
+        ("unbounded", ChatMemory(token_budget=None, keep_turns=None)),
+        ("window, drop", ChatMemory(args.budget, args.keep_turns, 0)),
+        ("window, summarize", ChatMemory(args.budget, args.keep_turns,
+                                         args.summary_tokens)),
+    ]
+
+    print(f"{args.turns} turns, budget {args.budget} tokens, "
+          f"last {args.keep_turns} turns verbatim")
+    print(f"{'mode':<20}{'last turn':>11}{'max':>9}{'total':>11}"
+          f"{'build us':>10}")
+    for label, memory in cases:
+        r = replay(memory, args.turns, reply, system)
+        print(f"{label:<20}{r['last']:>11}{r['max']:>9}{r['total']:>11}"
+              f"{r['build_us']:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Client Reuse Benchmark
+======================
+
+Compares analysis latency when a new detector (and so a new Groq client and
+connection pool) is built for every image against the shared detector from
+core.get_detector(), whose keep-alive pool is reused across calls. Runs
+fully offline against the fake Groq server; pass --tls-delay to emulate the
+extra round trips of a TLS handshake on every new connection.
+
+Usage:
+    python benchmarks/bench_client_reuse.py --requests 50 --tls-delay 0.05
+"""
+
+import argparse
+import base64
+import os
+import socket
+import statistics
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+os.environ.setdefault("PLANT_CACHE_BACKEND", "none")
+
+from fake_groq import start_server  # noqa: E402
+
+
+def start_delay_proxy(target_port: int, delay: float) -> int:
+    """Forward TCP to target_port, sleeping `delay` on every new connection."""
+    listener = socket.socket()
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind(("127.0.0.1", 0))
+    listener.listen(128)
+
+    def pipe(src, dst):
+        try:
+            while True:
+                data = src.recv(65536)
+                if not data:
+                    break
+                dst.sendall(data)
+        except OSError:
+            pass
+        finally:
+            for s in (src, dst):
+                try:
+                    s.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
+    def accept():
+        while True:
+            client, _ = listener.accept()
+            time.sleep(delay)
+            upstream = socket.create_connection(("127.0.0.1", target_port))
+            for a, b in ((client, upstream), (upstream, client)):
+                threading.Thread(target=pipe, args=(a, b), daemon=True).start()
+
+    threading.Thread(target=accept, daemon=True).start()
+    return listener.getsockname()[1]
+
+
+def fresh_detector():
+    """Build a detector with its own client, as the code did before reuse."""
+    from groq import DefaultHttpxClient, Groq
+
+    import clients
+    from core import PlantDiseaseDetector
+
+    class FreshClientDetector(PlantDiseaseDetector):
+        def _create_client(self):
+            http_client = DefaultHttpxClient(
+                event_hooks={"request": [clients._trace_request]}
+            )
+            return Groq(api_key=self.api_key, http_client=http_client)
+
+    return FreshClientDetector()
+
+
+def run(make_detector, image: str, total: int) -> list:
+    latencies = []
+    for _ in range(total):
+        start = time.perf_counter()
+        detector = make_detector()
+        detector.analyze_plant_image_base64(image)
+        latencies.append(time.perf_counter() - start)
+        if make_detector is fresh_detector:
+            detector.client.close()
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--tls-delay", type=float, default=0.05,
+                        help="Seconds added to every new connection")
+    parser.add_argument("--port", type=int, default=9011)
+    args = parser.parse_args()
+
+    start_server(args.port, args.latency)
+    port = start_delay_proxy(args.port, args.tls_delay)
+    os.environ["GROQ_BASE_URL"] = f"http://127.0.0.1:{port}"
+
+    from clients import connection_stats
+    from core import get_detector
+
+    with open(os.path.join(ROOT, "Media", "brown-spot.jpg"), "rb") as f:
+        image = base64.b64encode(f.read()).decode("utf-8")
+
+    cases = [
+        ("new client per call", fresh_detector),
+        ("shared detector", get_detector),
+    ]
+    print(f"{'mode':<22}{'mean ms':>10}{'p95 ms':>10}"
+          f"{'new conns':>11}{'reuse':>8}")
+    for label, factory in cases:
+        connection_stats.reset()
+        latencies = sorted(run(factory, image, args.requests))
+        stats = connection_stats.snapshot()
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        print(f"{label:<22}{statistics.fmean(latencies) * 1e3:>10.1f}"
+              f"{p95 * 1e3:>10.1f}{stats['new_connections']:>11}"
+              f"{stats['reuse_rate']:>8.0%}")
+    print(f"estimated setup time saved by reuse: "
+          f"{stats['estimated_seconds_saved']:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
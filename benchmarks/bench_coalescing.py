@@ -0,0 +1,93 @@
+"""
+Request Coalescing Benchmark
+============================
+
+Sends bursts of identical analyses through the fake Groq server, with and
+without the single-flight layer in singleflight.py, from threads (as the
+Streamlit app and batch workers do) and from asyncio tasks (as the API
+does), and reports how many requests reached the upstream.
+
+Exits with status 1 if coalescing does not reduce a burst of identical
+requests to a single upstream call.
+
+Usage:
+    python benchmarks/bench_coalescing.py --burst 16 --latency 0.3
+"""
+
+import argparse
+import asyncio
+import base64
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_groq import start_server  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--port", type=int, default=9043)
+    parser.add_argument("--burst", type=int, default=16)
+    parser.add_argument("--latency", type=float, default=0.3)
+    args = parser.parse_args()
+
+    server = start_server(args.port, latency=args.latency)
+    handler = server.RequestHandlerClass
+    os.environ["GROQ_BASE_URL"] = f"http://127.0.0.1:{args.port}"
+
+    from core import AsyncPlantDiseaseDetector, PlantDiseaseDetector
+    from singleflight import SingleFlight
+
+    with open(os.path.join(ROOT, "Media", "brown-spot.jpg"), "rb") as f:
+        image = base64.b64encode(f.read()).decode("utf-8")
+
+    def threads(detector) -> None:
+        with ThreadPoolExecutor(args.burst) as pool:
+            list(pool.map(
+                lambda _: detector.analyze_plant_image_base64(image),
+                range(args.burst)
+            ))
+
+    # One loop for every async case: the shared HTTP pool is bound to it
+    loop = asyncio.new_event_loop()
+
+    def tasks(detector) -> None:
+        async def burst():
+            await asyncio.gather(*[
+                detector.analyze_plant_image_base64(image)
+                for _ in range(args.burst)
+            ])
+        loop.run_until_complete(burst())
+
+    failures = []
+    print(f"burst of {args.burst} identical requests, "
+          f"upstream latency {args.latency * 1e3:.0f} ms")
+    print(f"{'case':<28}{'upstream':>9}{'coalesced':>11}{'wall ms':>9}")
+    for mode, detector_class, run in (
+        ("threads", PlantDiseaseDetector, threads),
+        ("asyncio", AsyncPlantDiseaseDetector, tasks),
+    ):
+        for flights in (None, SingleFlight()):
+            detector = detector_class(flights=flights)
+            before = handler.requests_received
+            start = time.perf_counter()
+            run(detector)
+            wall = time.perf_counter() - start
+            upstream = handler.requests_received - before
+            coalesced = flights.stats()["coalesced"] if flights else 0
+            label = f"{mode}, {'single-flight' if flights else 'no coalescing'}"
+            print(f"{label:<28}{upstream:>9}{coalesced:>11}{wall * 1e3:>9.0f}")
+            if flights is not None and upstream != 1:
+                failures.append(label)
+
+    server.shutdown()
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Image History Benchmark
+=======================
+
+Compares the old Streamlit image history (a base64 string per image in the
+session, every image decoded and rendered on each rerun) with ImageHistory
+(thumbnails in memory, images on disk, records rendered only while their
+expander is open): session memory per image and rerun time as the history
+grows. Reruns are executed with Streamlit's AppTest, one record open.
+
+Usage:
+    python benchmarks/bench_history.py --records 10,50 --reruns 5
+"""
+
+import argparse
+import base64
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+import warnings
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def render_base64_history():
+    """History section as rendered before ImageHistory."""
+    import base64
+    import streamlit as st
+
+    for idx, record in enumerate(reversed(st.session_state.uploaded_images)):
+        with st.expander(f"{record['filename']} - {idx}", expanded=idx == 0):
+            st.image(base64.b64decode(record["image_base64"]),
+                     caption=record["filename"])
+            st.json(record["result"])
+
+
+def render_image_history():
+    """History section as rendered with ImageHistory."""
+    import streamlit as st
+
+    for record in st.session_state.history.records():
+        with st.expander(
+            record.filename, key=f"history_{record.id}", on_change="rerun"
+        ) as expander:
+            if not expander.open:
+                continue
+            st.image(record.thumbnail, caption=record.filename)
+            st.json(record.result)
+
+
+def rerun_ms(app, reruns: int) -> float:
+    """Median time of a rerun in milliseconds."""
+    app.run()  # warm up
+    times = []
+    for _ in range(reruns):
+        start = time.perf_counter()
+        app.run()
+        times.append(time.perf_counter() - start)
+        assert not app.exception, app.exception
+    return statistics.median(times) * 1e3
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--records", default="10,50")
+    parser.add_argument("--reruns", type=int, default=5)
+    args = parser.parse_args()
+    warnings.filterwarnings("ignore")
+
+    from streamlit.testing.v1 import AppTest
+
+    from history import ImageHistory, get_default_blob_store
+    from preprocess import prepare_image
+
+    media = os.path.join(ROOT, "Media")
+    photos = [
+        prepare_image(open(os.path.join(media, name), "rb").read())
+        for name in sorted(os.listdir(media))
+    ]
+    result = {"disease_detected": True, "disease_name": "Bệnh đốm nâu",
+              "symptoms": ["Đốm nâu trên lá"] * 3, "treatment": ["..."] * 3}
+    mean_size = statistics.mean(len(photo.data) for photo in photos)
+    print(f"{len(photos)} sample photos, {mean_size / 1024:.0f} KB on "
+          f"average after preprocessing")
+    print(f"{'records':>8}{'history':>14}{'session KB/img':>16}"
+          f"{'rerun ms':>10}")
+
+    for count in map(int, args.records.split(",")):
+        for name in ("base64", "ImageHistory"):
+            tracemalloc.start()
+            if name == "base64":
+                state = [
+                    {"filename": f"{i}.jpg", "result": result,
+                     "image_base64": base64.b64encode(
+                         photos[i % len(photos)].data).decode("utf-8")}
+                    for i in range(count)
+                ]
+            else:
+                state = ImageHistory(max_items=count)
+                for i in range(count):
+                    photo = photos[i % len(photos)]
+                    state.add(f"{i}.jpg", photo.data, photo.mime_type, result)
+            session = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+
+            if name == "base64":
+                app = AppTest.from_function(render_base64_history)
+                app.session_state["uploaded_images"] = state
+            else:
+                app = AppTest.from_function(render_image_history)
+                app.session_state["history"] = state
+                app.session_state[f"history_{state.records()[0].id}"] = True
+            elapsed = rerun_ms(app, args.reruns)
+            print(f"{count:>8}{name:>14}{session / count / 1024:>16.1f}"
+                  f"{elapsed:>10.0f}")
+    print(f"blob store: {get_default_blob_store().stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""
+Local Backend Benchmark
+=======================
+
+Measures CPU latency and throughput of the ONNX Runtime backend in
+backends.py through PlantDiseaseDetector: single-image latency, and batch
+throughput with one inference call per batch compared with one call per
+image.
+
+Without --model, a small synthetic convolutional classifier is generated
+(requires the onnx package), so the numbers show the per-call overhead and
+the batching gain rather than the accuracy or cost of a real model.
+
+Usage:
+    python benchmarks/bench_local_backend.py --images 64 --batch-sizes 1,8,32
+    python benchmarks/bench_local_backend.py --model models/plant.onnx
+"""
+
+import argparse
+import base64
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+CLASSES = [
+    "Tomato___healthy",
+    {"label": "Tomato___Early_blight", "disease_detected": True,
+     "disease_name": "Bệnh đốm vòng", "disease_type": "nấm",
+     "severity": "trung bình"},
+    {"label": "Rice___Brown_spot", "disease_detected": True,
+     "disease_name": "Bệnh đốm nâu", "disease_type": "nấm",
+     "severity": "trung bình"},
+    "Corn___healthy",
+]
+
+
+def build_synthetic_model(directory: str, size: int) -> str:
+    """Write a small random-weight CNN classifier and its metadata."""
+    import onnx
+    from onnx import TensorProto, helper, numpy_helper
+
+    rng = np.random.default_rng(0)
+
+    def weight(name, *shape):
+        return numpy_helper.from_array(
+            (rng.standard_normal(shape) * 0.1).astype(np.float32), name
+        )
+
+    nodes, weights, channels, previous = [], [], 3, "input"
+    for i, out in enumerate((16, 32, 64)):
+        weights.append(weight(f"w{i}", out, channels, 3, 3))
+        nodes.append(helper.make_node(
+            "Conv", [previous, f"w{i}"], [f"c{i}"],
+            strides=[2, 2], pads=[1, 1, 1, 1]
+        ))
+        nodes.append(helper.make_node("Relu", [f"c{i}"], [f"r{i}"]))
+        channels, previous = out, f"r{i}"
+    weights += [weight("fc", channels, len(CLASSES)),
+                weight("bias", len(CLASSES))]
+    nodes += [
+        helper.make_node("GlobalAveragePool", [previous], ["pool"]),
+        helper.make_node("Flatten", ["pool"], ["flat"]),
+        helper.make_node("Gemm", ["flat", "fc", "bias"], ["logits"]),
+    ]
+    graph = helper.make_graph(
+        nodes, "plant_classifier",
+        [helper.make_tensor_value_info(
+            "input", TensorProto.FLOAT, ["batch", 3, size, size]
+        )],
+        [helper.make_tensor_value_info(
+            "logits", TensorProto.FLOAT, ["batch", len(CLASSES)]
+        )],
+        weights
+    )
+    model = helper.make_model(
+        graph, opset_imports=[helper.make_opsetid("", 17)], ir_version=8
+    )
+    path = os.path.join(directory, "synthetic.onnx")
+    onnx.save(model, path)
+    with open(os.path.join(directory, "synthetic.json"), "w",
+              encoding="utf-8") as f:
+        json.dump({"input_size": size, "classes": CLASSES}, f,
+                  ensure_ascii=False)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--model", default=None,
+                        help="ONNX model; synthetic if omitted")
+    parser.add_argument("--input-size", type=int, default=224)
+    parser.add_argument("--images", type=int, default=64)
+    parser.add_argument("--batch-sizes", default="1,8,32")
+    parser.add_argument("--threads", type=int, default=0)
+    args = parser.parse_args()
+
+    from backends import OnnxClassifierBackend
+    from core import PlantDiseaseDetector
+
+    model_path = args.model or build_synthetic_model(
+        tempfile.mkdtemp(), args.input_size
+    )
+    media = os.path.join(ROOT, "Media")
+    photos = [
+        base64.b64encode(open(os.path.join(media, name), "rb").read()).decode()
+        for name in sorted(os.listdir(media))
+    ]
+    images = [photos[i % len(photos)] for i in range(args.images)]
+
+    load_start = time.perf_counter()
+    backend = OnnxClassifierBackend(model_path, threads=args.threads)
+    load = time.perf_counter() - load_start
+    detector = PlantDiseaseDetector(backend=backend)
+    print(f"model {backend.model_name} ({backend.version}), loaded in "
+          f"{load * 1e3:.0f} ms, {os.cpu_count()} CPUs")
+
+    # Single image latency, split into preprocessing and inference
+    for photo in photos:
+        detector.analyze_plant_image_base64(photo)  # warm up
+    latencies, inference = [], []
+    for image in images:
+        start = time.perf_counter()
+        detector.analyze_plant_image_base64(image)
+        latencies.append(time.perf_counter() - start)
+        tensor = backend.preprocess([base64.b64decode(image)])
+        start = time.perf_counter()
+        backend.session.run(None, {backend.input_name: tensor})
+        inference.append(time.perf_counter() - start)
+    latencies.sort()
+    print(f"single image: p50 {statistics.median(latencies) * 1e3:.1f} ms, "
+          f"p95 {latencies[int(len(latencies) * 0.95)] * 1e3:.1f} ms "
+          f"(inference p50 {statistics.median(inference) * 1e3:.2f} ms)")
+
+    # End to end (decode + resize + inference) and inference alone
+    tensor = backend.preprocess([base64.b64decode(image) for image in images])
+    print(f"{'batch size':<12}{'images/s':>10}{'ms/image':>10}"
+          f"{'infer ms/image':>16}")
+    for batch_size in map(int, args.batch_sizes.split(",")):
+        backend.batch_size = batch_size
+        start = time.perf_counter()
+        batch = detector.analyze_many(images)
+        elapsed = time.perf_counter() - start
+        assert batch["succeeded"] == len(images), batch["failed"]
+        start = time.perf_counter()
+        for offset in range(0, len(images), batch_size):
+            backend.session.run(None, {
+                backend.input_name: tensor[offset:offset + batch_size]
+            })
+        infer = time.perf_counter() - start
+        print(f"{batch_size:<12}{len(images) / elapsed:>10.1f}"
+              f"{elapsed / len(images) * 1e3:>10.2f}"
+              f"{infer / len(images) * 1e3:>16.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Request Path Microbenchmarks
+============================
+
+Times the CPU steps of an analysis and a chat turn in-process, without any
+network:
+
+    base64/*     base64 of a prepared upload and of a 1 MB image, and the
+                 whole JSON request body with the image (payload.py)
+    prompt/*     analysis prompt and request parameters (_prepare_request,
+                 no cache), chatbot system prompt with a disease context,
+                 and the messages of a 20-turn conversation (memory.py)
+    parse/*      _parse_response on a clean reply, a fenced reply with prose
+                 around it and a reply that needs repair
+
+Each benchmark reports the median time per call over 5 runs and the calls
+per second; results can be saved as JSON and compared with results.py.
+
+Usage:
+    python benchmarks/bench_micro.py
+    python benchmarks/bench_micro.py --output micro.json
+"""
+
+import argparse
+import base64
+import json
+import logging
+import os
+import random
+import re
+import statistics
+import sys
+import timeit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_response_parser import make_analysis  # noqa: E402
+from results import save_results  # noqa: E402
+
+
+def measure(fn, repeat: int = 5, min_time: float = 0.2) -> dict:
+    """Median and best time per call of fn, in microseconds."""
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    number = max(1, int(number * min_time / 0.2))
+    runs = [elapsed / number * 1e6 for elapsed in timer.repeat(repeat, number)]
+    median = statistics.median(runs)
+    return {
+        "per_call_us": round(median, 3),
+        "best_us": round(min(runs), 3),
+        "calls_per_s": round(1e6 / median, 1),
+    }
+
+
+def run_micro(image_path: str, min_time: float = 0.2) -> dict:
+    """Run every microbenchmark; return metrics by benchmark name."""
+    logging.disable(logging.WARNING)
+    from core import PlantDiseaseDetector
+    from memory import ChatMemory
+    from payload import ImagePayload
+    from preprocess import prepare_image
+    from prompts import get_prompt
+
+    with open(image_path, "rb") as f:
+        prepared = prepare_image(f.read())
+    upload = ImagePayload(prepared.data, prepared.mime_type)
+    rng = random.Random(0)
+    large = ImagePayload(rng.randbytes(1024 * 1024))
+
+    detector = PlantDiseaseDetector(response_format="json_object")
+    request = detector._prepare_request(upload, None, None, upload.mime_type)
+
+    analysis = make_analysis(rng)
+    context_prompt = get_prompt("chat_context")
+    memory = ChatMemory()
+    for turn in range(20):
+        memory.add("user", f"Câu hỏi {turn}: lá cà chua bị đốm nâu thì sao?")
+        memory.add("assistant", " ".join(analysis["treatment"]) * 2)
+
+    clean = json.dumps(analysis, ensure_ascii=False)
+    fenced = (f"Dưới đây là kết quả phân tích:\n```json\n{clean}\n```\n"
+              "Hy vọng thông tin này hữu ích.")
+    repaired = re.sub(r'(["\d\]])(\s*[\]}])', r"\1,\2", clean)
+
+    def chat_system_prompt():
+        text = get_prompt("chat_system").text
+        return text + "\n\n" + context_prompt.text.format(
+            context=json.dumps(analysis, ensure_ascii=False, indent=2)
+        )
+
+    benchmarks = {
+        f"base64/b64encode_{len(upload) // 1024}kb":
+            lambda: base64.b64encode(upload.data),
+        "base64/b64encode_1mb": lambda: base64.b64encode(large.data),
+        f"base64/request_body_{len(upload) // 1024}kb":
+            lambda: detector._request_body(request.params, upload),
+        "base64/request_body_1mb":
+            lambda: detector._request_body(request.params, large),
+        "prompt/analysis_request": lambda: detector._prepare_request(
+            upload, None, None, upload.mime_type
+        ),
+        "prompt/chat_system_with_context": chat_system_prompt,
+        "prompt/chat_messages_20_turns":
+            lambda: memory.build_messages("Bạn là chuyên gia bệnh cây."),
+        "parse/clean": lambda: detector._parse_response(clean),
+        "parse/fenced_with_prose": lambda: detector._parse_response(fenced),
+        "parse/trailing_commas": lambda: detector._parse_response(repaired),
+    }
+    return {name: measure(fn, min_time=min_time)
+            for name, fn in benchmarks.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--image",
+                        default=os.path.join(ROOT, "Media", "brown-spot.jpg"))
+    parser.add_argument("--min-time", type=float, default=0.2,
+                        help="seconds per run of each benchmark")
+    parser.add_argument("--output", help="save the results as JSON")
+    args = parser.parse_args()
+
+    results = run_micro(args.image, args.min_time)
+    print(f"{'benchmark':<40}{'us/call':>12}{'best us':>12}{'calls/s':>14}")
+    for name, metrics in results.items():
+        print(f"{name:<40}{metrics['per_call_us']:>12.2f}"
+              f"{metrics['best_us']:>12.2f}{metrics['calls_per_s']:>14,.0f}")
+    if args.output:
+        save_results(args.output, "micro", results)
+        print(f"\nSaved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
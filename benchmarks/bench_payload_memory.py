@@ -0,0 +1,133 @@
+"""
+Image Payload Memory Benchmark
+==============================
+
+Measures the peak Python allocation (tracemalloc) per image between the
+prepared image bytes and the request body sent to the model:
+
+    encode only    building the JSON body: base64 bytes -> str -> data URL
+                   f-string -> json.dumps -> UTF-8 bytes (as the SDK did),
+                   against encode_request_body on an ImagePayload
+    end to end     a full analysis through the fake Groq server, with
+                   analyze_plant_image_base64 (the caller's base64 str
+                   already exists and is not counted) against
+                   analyze_plant_image
+
+The fake Groq server runs in a subprocess, so its allocations are not
+counted.
+
+Usage:
+    python benchmarks/bench_payload_memory.py --sizes 0.25,1,4
+"""
+
+import argparse
+import base64
+import io
+import json
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import httpx
+from PIL import Image
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, ROOT)
+
+MB = 1024 * 1024
+
+
+def jpeg_of_size(megabytes: float) -> bytes:
+    """Encode a noisy JPEG of roughly the given size."""
+    edge = int(1100 * megabytes ** 0.5)
+    image = Image.effect_noise((edge, edge), 60).convert("RGB")
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def peak(fn) -> int:
+    """Peak bytes allocated while fn runs."""
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--port", type=int, default=9046)
+    parser.add_argument("--sizes", default="0.25,1,4",
+                        help="image sizes in MB")
+    args = parser.parse_args()
+
+    server = subprocess.Popen(
+        [sys.executable, os.path.join(HERE, "fake_groq.py"),
+         "--port", str(args.port), "--latency", "0.01"],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    os.environ["GROQ_BASE_URL"] = f"http://127.0.0.1:{args.port}"
+    for _ in range(100):
+        try:
+            httpx.get(os.environ["GROQ_BASE_URL"])
+            break
+        except httpx.TransportError:
+            time.sleep(0.1)
+
+    from core import PlantDiseaseDetector
+    from payload import IMAGE_URL_PLACEHOLDER, ImagePayload, encode_request_body
+
+    detector = PlantDiseaseDetector()
+    params = {
+        "model": detector.MODEL_NAME,
+        "messages": [{"role": "user", "content": [
+            {"type": "text", "text": detector.create_analysis_prompt()},
+            {"type": "image_url", "image_url": {"url": IMAGE_URL_PLACEHOLDER}},
+        ]}],
+    }
+
+    def legacy_body(data: bytes) -> bytes:
+        base64_image = base64.b64encode(data).decode("utf-8")
+        url = f"data:image/jpeg;base64,{base64_image}"
+        message = {"role": "user", "content": [
+            params["messages"][0]["content"][0],
+            {"type": "image_url", "image_url": {"url": url}},
+        ]}
+        return json.dumps(
+            {**params, "messages": [message]},
+            ensure_ascii=False, separators=(",", ":")
+        ).encode("utf-8")
+
+    print(f"{'image MB':>9}{'case':>14}{'before MB':>11}{'after MB':>10}"
+          f"{'x image':>9}")
+    for size in map(float, args.sizes.split(",")):
+        data = jpeg_of_size(size)
+        payload = ImagePayload(data)
+        assert legacy_body(data) == encode_request_body(params, payload)
+        base64_image = base64.b64encode(data).decode("utf-8")
+        detector.analyze_plant_image(payload)  # warm up
+
+        for case, before, after in (
+            ("encode only",
+             lambda: legacy_body(data),
+             lambda: encode_request_body(params, payload)),
+            ("end to end",
+             lambda: detector.analyze_plant_image_base64(base64_image),
+             lambda: detector.analyze_plant_image(payload)),
+        ):
+            old, new = peak(before), peak(after)
+            print(f"{len(data) / MB:>9.2f}{case:>14}{old / MB:>11.2f}"
+                  f"{new / MB:>10.2f}{new / len(data):>9.2f}")
+
+    server.terminate()
+    server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Near-Duplicate Index Benchmark
+==============================
+
+Measures NearDuplicateIndex lookup latency at a large number of stored
+hashes. Half of the queries are stored hashes with a few bits flipped
+(near-duplicates), the other half are random hashes (misses).
+
+Usage:
+    python benchmarks/bench_phash.py --size 1000000 --queries 2000
+
+Exits non-zero if the p99 lookup latency is not below one millisecond.
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from phash import HASH_BITS, NearDuplicateIndex, dhash, hamming_distance  # noqa: E402
+
+
+def flip_bits(value: int, count: int, rng: random.Random) -> int:
+    """Return value with `count` distinct random bits flipped."""
+    for bit in rng.sample(range(HASH_BITS), count):
+        value ^= 1 << bit
+    return value
+
+
+def run(size: int, queries: int, max_distance: int, chunks: int,
+        seed: int) -> dict:
+    rng = random.Random(seed)
+    index = NearDuplicateIndex(max_distance=max_distance, chunks=chunks,
+                               max_entries=size)
+
+    start = time.perf_counter()
+    stored = [rng.getrandbits(HASH_BITS) for _ in range(size)]
+    for item_id, value in enumerate(stored):
+        index.add(value, item_id)
+    build_seconds = time.perf_counter() - start
+
+    latencies = []
+    hits = 0
+    correct = 0
+    for i in range(queries):
+        if i % 2 == 0:
+            target = rng.randrange(size)
+            query = flip_bits(
+                stored[target], rng.randint(0, max_distance), rng
+            )
+        else:
+            target = None
+            query = rng.getrandbits(HASH_BITS)
+        t0 = time.perf_counter()
+        match = index.find(query)
+        latencies.append(time.perf_counter() - t0)
+        if match is not None:
+            hits += 1
+            if target is not None and hamming_distance(
+                stored[match[1]], query
+            ) <= max_distance:
+                correct += 1
+
+    latencies.sort()
+    return {
+        "size": size,
+        "queries": queries,
+        "max_distance": max_distance,
+        "chunks": chunks,
+        "build_seconds": round(build_seconds, 2),
+        "hits": hits,
+        "correct_near_duplicates": correct,
+        "mean_us": round(statistics.fmean(latencies) * 1e6, 1),
+        "p50_us": round(latencies[len(latencies) // 2] * 1e6, 1),
+        "p99_us": round(latencies[int(len(latencies) * 0.99)] * 1e6, 1),
+        "max_us": round(latencies[-1] * 1e6, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--size", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--max-distance", type=int, default=6)
+    parser.add_argument("--chunks", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    media = os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Media"
+    )
+    sample = os.path.join(media, "brown-spot.jpg")
+    if os.path.exists(sample):
+        with open(sample, "rb") as f:
+            image_bytes = f.read()
+        t0 = time.perf_counter()
+        dhash(image_bytes)
+        print(f"dhash({os.path.basename(sample)}): "
+              f"{(time.perf_counter() - t0) * 1e3:.2f} ms")
+
+    results = run(
+        args.size, args.queries, args.max_distance, args.chunks, args.seed
+    )
+    for key, value in results.items():
+        print(f"{key:>24}: {value}")
+
+    if results["p99_us"] >= 1000:
+        print("FAIL: p99 lookup latency is not sub-millisecond")
+        sys.exit(1)
+    print("OK: p99 lookup latency is sub-millisecond")
+
+
+if __name__ == "__main__":
+    main()
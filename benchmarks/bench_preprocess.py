@@ -0,0 +1,84 @@
+"""
+Image Preprocessing Benchmark
+=============================
+
+Measures bytes saved and latency of prepare_image() for the sample images in
+Media/ and for upscaled copies of them at typical phone-camera resolutions.
+
+Usage:
+    python benchmarks/bench_preprocess.py --max-edge 1024 --format JPEG
+"""
+
+import argparse
+import base64
+import glob
+import io
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from PIL import Image  # noqa: E402
+
+from preprocess import prepare_image  # noqa: E402
+
+
+def sample_images(edges):
+    """Yield (label, bytes) for Media files and upscaled variants."""
+    for path in sorted(glob.glob(os.path.join(ROOT, "Media", "*"))):
+        with open(path, "rb") as f:
+            data = f.read()
+        yield os.path.basename(path), data
+
+    source = os.path.join(ROOT, "Media", "ua_vang.jpg")
+    with Image.open(source) as image:
+        image = image.convert("RGB")
+        for edge in edges:
+            scale = edge / max(image.size)
+            resized = image.resize(
+                (round(image.width * scale), round(image.height * scale)),
+                Image.Resampling.BICUBIC
+            )
+            for fmt in ("JPEG", "PNG"):
+                buffer = io.BytesIO()
+                resized.save(buffer, format=fmt, quality=95)
+                yield f"ua_vang@{edge}px.{fmt.lower()}", buffer.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--max-edge", type=int, default=1024)
+    parser.add_argument("--format", default="JPEG")
+    parser.add_argument("--quality", type=int, default=85)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    header = (f"{'image':<26}{'raw b64':>12}{'sent b64':>12}"
+              f"{'saved':>9}{'mime':>12}{'ms/img':>9}")
+    print(header)
+    print("-" * len(header))
+    total_raw = total_sent = 0
+    for label, data in sample_images([1280, 2560, 4032]):
+        timings = []
+        for _ in range(args.repeat):
+            t0 = time.perf_counter()
+            prepared = prepare_image(
+                data, args.max_edge, args.format, args.quality
+            )
+            timings.append(time.perf_counter() - t0)
+        raw_b64 = len(base64.b64encode(data))
+        sent_b64 = len(base64.b64encode(prepared.data))
+        total_raw += raw_b64
+        total_sent += sent_b64
+        print(f"{label:<26}{raw_b64:>12,}{sent_b64:>12,}"
+              f"{1 - sent_b64 / raw_b64:>8.0%}{prepared.mime_type:>12}"
+              f"{min(timings) * 1e3:>9.1f}")
+    print("-" * len(header))
+    print(f"{'total':<26}{total_raw:>12,}{total_sent:>12,}"
+          f"{1 - total_sent / total_raw:>8.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""
+Cassette Replay Benchmark
+=========================
+
+Replays recorded model responses (cassette.py) through the detector, with
+no API and no network, to measure the parser and the analysis pipeline in
+isolation:
+
+    parse      every recorded analysis through _parse_response (not the
+               continuations of truncated analyses, which are fragments)
+    pipeline   analyze_plant_image on distinct images with the shared HTTP
+               client replaying the cassette (request encoding, SDK,
+               transport, parsing, token budget and metrics included); run
+               twice to check that the results, and the analyses that
+               failed, are identical
+
+Without --cassette, a cassette is first recorded from the fake Groq server
+(benchmarks/fake_groq.py) answering each image with an analysis of its own
+(the generator of bench_token_budget.py). With --cassette, the recorded
+file is used, e.g. one captured from the real API with
+
+    PLANT_CASSETTE=record PLANT_CASSETTE_PATH=.cache/groq.sqlite3 \\
+        uvicorn app:app
+
+--export writes the recorded answers as JSONL for fake_groq.py --replay.
+
+Usage:
+    python benchmarks/bench_replay.py --record 500 --analyses 5000
+    python benchmarks/bench_replay.py --cassette .cache/groq.sqlite3 \\
+        --export responses.jsonl
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_token_budget import AnswerHandler  # noqa: E402
+from fake_groq import start_server  # noqa: E402
+
+
+def use_cassette(mode: str, strict: bool = True) -> None:
+    """Make the shared HTTP client record or replay the cassette."""
+    import clients
+
+    os.environ["PLANT_CASSETTE"] = mode
+    os.environ["PLANT_CASSETTE_STRICT"] = "1" if strict else "0"
+    clients.get_http_client().close()
+
+
+def record(count: int, port: int) -> None:
+    """Record the analyses of count images from the fake Groq server."""
+    from core import PlantDiseaseDetector
+    from payload import ImagePayload
+
+    os.environ["GROQ_BASE_URL"] = f"http://127.0.0.1:{port}"
+    server = start_server(port, latency=0.0, handler_class=AnswerHandler)
+    use_cassette("record")
+    detector = PlantDiseaseDetector(response_format="json_object")
+    rng = random.Random(1)
+    try:
+        for _ in range(count):
+            detector.analyze_plant_image(ImagePayload(rng.randbytes(256)))
+    finally:
+        server.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--cassette", help="recorded cassette to replay")
+    parser.add_argument("--record", type=int, default=500,
+                        help="analyses to record without --cassette")
+    parser.add_argument("--analyses", type=int, default=5000,
+                        help="analyses replayed through the pipeline")
+    parser.add_argument("--export", help="write the answers as JSONL")
+    parser.add_argument("--port", type=int, default=9053)
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    temporary = None
+    if args.cassette is None:
+        temporary = tempfile.TemporaryDirectory()
+        args.cassette = os.path.join(temporary.name, "cassette.sqlite3")
+    os.environ["PLANT_CASSETTE_PATH"] = args.cassette
+    os.environ["PLANT_CASSETTE"] = "replay"
+    # Not a real key: nothing is sent in replay mode
+    os.environ.setdefault("GROQ_API_KEY", "test")
+
+    from cassette import completion_content, get_default_cassette
+    from core import PlantDiseaseDetector
+    from payload import ImagePayload
+
+    store = get_default_cassette()
+    if temporary is not None:
+        start = time.perf_counter()
+        record(args.record, args.port)
+        print(f"Recorded {args.record} analyses in "
+              f"{time.perf_counter() - start:.1f}s")
+    stats = store.stats()
+    print(f"Cassette {args.cassette}: {stats['responses']} responses, "
+          + ", ".join(f"{kind} {values['responses']} "
+                      f"({values['stored_bytes'] / values['responses']:.0f} "
+                      f"B stored, {values['request_bytes'] / values['responses']:.0f} "
+                      f"B requested)"
+                      for kind, values in stats["by_kind"].items()))
+
+    contents = [completion_content(response)
+                for response in store.responses("analysis")]
+    if args.export:
+        with open(args.export, "w", encoding="utf-8") as f:
+            for response in store.responses():
+                f.write(json.dumps({
+                    "kind": response.kind,
+                    "content": completion_content(response),
+                }, ensure_ascii=False) + "\n")
+        print(f"Exported {len(store)} answers to {args.export}")
+    if not contents:
+        print("No recorded analyses to replay")
+        return
+
+    use_cassette("replay", strict=False)
+    detector = PlantDiseaseDetector(response_format="json_object")
+
+    failed = 0
+    start = time.perf_counter()
+    for content in contents:
+        try:
+            detector._parse_response(content)
+        except ValueError:
+            failed += 1
+    elapsed = time.perf_counter() - start
+    print(f"\n{'':>10}{'analyses':>10}{'per s':>10}{'us each':>10}")
+    print(f"{'parse':>10}{len(contents):>10}{len(contents) / elapsed:>10.0f}"
+          f"{elapsed / len(contents) * 1e6:>10.1f}"
+          f"   ({failed} unparseable)")
+
+    rng = random.Random(2)
+    images = [ImagePayload(rng.randbytes(256)) for _ in range(args.analyses)]
+    runs = []
+    for _ in range(2):
+        outcomes = []
+        failed = 0
+        start = time.perf_counter()
+        for image in images:
+            try:
+                outcomes.append(detector.analyze_plant_image(image))
+            except Exception as e:
+                failed += 1
+                outcomes.append(repr(e))
+        elapsed = time.perf_counter() - start
+        runs.append(outcomes)
+        print(f"{'pipeline':>10}{len(images):>10}"
+              f"{len(images) / elapsed:>10.0f}"
+              f"{elapsed / len(images) * 1e6:>10.1f}"
+              f"   ({failed} failed)")
+    print(f"\nDeterministic replay: {'yes' if runs[0] == runs[1] else 'NO'}; "
+          f"{store.stats()['hits']} exact hits, "
+          f"{store.stats()['misses']} answered by kind")
+    if temporary is not None:
+        store.close()
+        temporary.cleanup()
+
+
+if __name__ == "__main__":
+    main()
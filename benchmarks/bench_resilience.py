@@ -0,0 +1,188 @@
+"""
+Resilience Scenarios
+====================
+
+Drives the detector through the fake Groq server with injected faults and
+checks how the retry/backoff/circuit-breaker layer in resilience.py copes:
+
+    rate limited   30% of requests get 429 with Retry-After; compares a
+                   single attempt with the retry policy
+    stalls         20% of requests stall; every call must end within the
+                   per-call deadline
+    upstream down  every request gets 503; the circuit must open and
+                   reject further calls without touching the upstream,
+                   then close again once the upstream recovers
+    cancelled      the half-open trial call is cancelled (a client
+                   disconnecting from /chatbot/stream); the circuit must
+                   let the next call through instead of staying half-open
+
+Exits with status 1 if an expectation does not hold.
+
+Usage:
+    python benchmarks/bench_resilience.py
+"""
+
+import argparse
+import asyncio
+import base64
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_groq import start_server  # noqa: E402
+
+
+def run_calls(detector, image: str, total: int, concurrency: int) -> dict:
+    """Run total analyses and return success count and latencies."""
+    def one(_):
+        start = time.perf_counter()
+        try:
+            detector.analyze_plant_image_base64(image)
+            ok = True
+        except Exception:
+            ok = False
+        return ok, time.perf_counter() - start
+
+    with ThreadPoolExecutor(concurrency) as pool:
+        results = list(pool.map(one, range(total)))
+    latencies = sorted(latency for _, latency in results)
+    return {
+        "succeeded": sum(ok for ok, _ in results),
+        "total": total,
+        "p50": statistics.median(latencies),
+        "max": latencies[-1],
+    }
+
+
+def report(label: str, result: dict, caller) -> None:
+    stats = caller.stats()
+    print(f"{label:<28}{result['succeeded']:>4}/{result['total']:<4}"
+          f"{result['p50'] * 1e3:>9.0f}{result['max'] * 1e3:>9.0f}"
+          f"{stats['retries']:>9}{stats['deadline_exceeded']:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--port", type=int, default=9041)
+    parser.add_argument("--requests", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    server = start_server(args.port, latency=0.02)
+    handler = server.RequestHandlerClass
+    os.environ["GROQ_BASE_URL"] = f"http://127.0.0.1:{args.port}"
+    os.environ["PLANT_CACHE_BACKEND"] = "none"
+
+    from core import PlantDiseaseDetector
+    from resilience import CircuitBreaker, ResilientCaller, RetryPolicy
+
+    with open(os.path.join(ROOT, "Media", "brown-spot.jpg"), "rb") as f:
+        image = base64.b64encode(f.read()).decode("utf-8")
+
+    def detector(caller):
+        return PlantDiseaseDetector(caller=caller)
+
+    failures = []
+
+    def expect(condition: bool, message: str) -> None:
+        print(f"  {'ok  ' if condition else 'FAIL'} {message}")
+        if not condition:
+            failures.append(message)
+
+    print(f"{'scenario':<28}{'ok/total':<9}{'p50 ms':>8}{'max ms':>9}"
+          f"{'retries':>9}{'deadline':>10}")
+
+    # Rate limited: 30% 429 with Retry-After
+    handler.error_rate, handler.error_status = 0.3, 429
+    handler.retry_after = 0.2
+    single = ResilientCaller(RetryPolicy(max_attempts=1))
+    r_single = run_calls(detector(single), image, args.requests,
+                         args.concurrency)
+    report("429 x30%, single attempt", r_single, single)
+    retrying = ResilientCaller(RetryPolicy(max_attempts=5, base_delay=0.1))
+    r_retry = run_calls(detector(retrying), image, args.requests,
+                        args.concurrency)
+    report("429 x30%, retry policy", r_retry, retrying)
+    expect(r_retry["succeeded"] > r_single["succeeded"],
+           "retries recover rate-limited calls")
+    expect(retrying.stats()["retry_after_honored"] > 0,
+           "Retry-After header is honored")
+
+    # Stalls: 20% of requests hang for 5s, deadline 1s
+    handler.error_rate, handler.retry_after = 0.0, None
+    handler.stall_rate, handler.stall_seconds = 0.2, 5.0
+    deadline = ResilientCaller(RetryPolicy(max_attempts=3, base_delay=0.05,
+                                           deadline=1.0))
+    r_stall = run_calls(detector(deadline), image, args.requests,
+                        args.concurrency)
+    report("stall x20%, deadline 1s", r_stall, deadline)
+    expect(r_stall["max"] < 1.5, "no call outlives its deadline")
+
+    # Upstream down: every request fails with 503
+    handler.stall_rate = 0.0
+    handler.error_rate, handler.error_status = 1.0, 503
+    breaker = CircuitBreaker(failure_threshold=5, reset_timeout=1.0)
+    guarded = ResilientCaller(RetryPolicy(max_attempts=2, base_delay=0.05),
+                              breaker)
+    r_down = run_calls(detector(guarded), image, args.requests,
+                       args.concurrency)
+    report("503 x100%, circuit breaker", r_down, guarded)
+    stats = guarded.stats()
+    expect(stats["circuit"]["state"] == "open", "circuit opens")
+    expect(stats["attempts"] < args.requests,
+           f"open circuit spares the upstream "
+           f"({stats['attempts']} attempts for {args.requests} calls)")
+
+    # Recovery after reset_timeout; sequential, since a half-open circuit
+    # lets a single trial call through and rejects the others meanwhile
+    handler.error_rate = 0.0
+    time.sleep(1.1)
+    r_up = run_calls(detector(guarded), image, args.requests // 4, 1)
+    report("recovered, circuit breaker", r_up, guarded)
+    circuit = guarded.stats()["circuit"]
+    expect(circuit["state"] == "closed", "circuit closes after recovery")
+    expect(r_up["succeeded"] == r_up["total"],
+           "calls succeed again once closed")
+    print(f"  circuit opened {circuit['opened']}x, open for "
+          f"{circuit['open_seconds']:.2f}s, "
+          f"rejected {circuit['rejected_calls']} calls")
+
+    # Cancelled trial: the only call let through by a half-open circuit is
+    # cancelled before it ends
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.2)
+    cancelled = ResilientCaller(RetryPolicy(max_attempts=1), breaker)
+    breaker.record_failure()
+    time.sleep(0.25)
+
+    async def slow_call(timeout=None):
+        await asyncio.sleep(10)
+
+    async def cancel_trial():
+        trial = asyncio.create_task(cancelled.acall(slow_call))
+        await asyncio.sleep(0.05)
+        trial.cancel()
+        try:
+            await trial
+        except asyncio.CancelledError:
+            pass
+
+    asyncio.run(cancel_trial())
+    r_cancel = run_calls(detector(cancelled), image, args.requests // 4, 1)
+    report("cancelled half-open trial", r_cancel, cancelled)
+    expect(r_cancel["succeeded"] == r_cancel["total"],
+           "calls go through after a cancelled trial")
+    expect(cancelled.stats()["circuit"]["state"] == "closed",
+           "circuit closes after a cancelled trial")
+
+    server.shutdown()
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+"""
+Model Response Parser Benchmark
+===============================
+
+Compares the analysis response parser used before jsonparse.py (strip
+markdown fences, json.loads, then a greedy regex over the whole response)
+with jsonparse.parse_json_object (first object in one pass, repaired if
+needed) over a corpus of responses: for each kind of response, the share
+parsed correctly (the others cost a repeated analysis) and the time per
+response. A truncated response counts as parsed if every field it recovers
+has its full value.
+
+The built-in corpus varies realistic analyses with the defects models
+produce. Recorded responses can be used instead: a JSONL file with one
+{"kind": ..., "content": ...} object (or one JSON string) per line.
+
+Usage:
+    python benchmarks/bench_response_parser.py
+    python benchmarks/bench_response_parser.py --corpus responses.jsonl
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import time
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+SYMPTOMS = ["Đốm nâu hình tròn đường kính 3-5mm, viền vàng rõ ràng",
+            "Lá vàng từ mép vào trong", "Mặt dưới lá có lớp mốc xám",
+            "Vết bệnh lan dọc gân lá", "Lá non bị xoăn và biến dạng"]
+CAUSES = ["Nấm Cercospora sp. phát triển khi độ ẩm cao",
+          "Tưới nước lên lá vào buổi tối", "Vườn trồng quá dày, kém thông thoáng"]
+TREATMENTS = ["Cắt bỏ lá bệnh và tiêu hủy", "Phun Mancozeb 80WP 2-3 lần",
+              "Bón phân kali tăng sức đề kháng", "Giữ vườn khô ráo, thoáng khí"]
+
+
+def make_analysis(rng: random.Random) -> dict:
+    return {
+        "disease_detected": True,
+        "disease_name": rng.choice(["Bệnh đốm lá nâu", "Bệnh thán thư",
+                                    "Bệnh sương mai", "Bệnh khảm lá"]),
+        "disease_type": rng.choice(["nấm", "vi khuẩn", "virus"]),
+        "severity": rng.choice(["nhẹ", "trung bình", "nặng"]),
+        "confidence": rng.randint(60, 98),
+        "symptoms": rng.sample(SYMPTOMS, rng.randint(2, 5)),
+        "possible_causes": rng.sample(CAUSES, rng.randint(1, 3)),
+        "treatment": rng.sample(TREATMENTS, rng.randint(2, 4)),
+    }
+
+
+def builtin_corpus(count: int, seed: int = 0):
+    """(kind, content, expected) triples: clean JSON and model defects."""
+    rng = random.Random(seed)
+    corpus = []
+    for i in range(count):
+        expected = make_analysis(rng)
+        text = json.dumps(expected, ensure_ascii=False,
+                          indent=rng.choice([None, 2]))
+        kind = ["json mode", "fenced", "prose around", "trailing commas",
+                "smart quotes", "raw newline", "invalid escape",
+                "truncated", "brace in prose"][i % 9]
+        if kind == "fenced":
+            text = f"```json\n{text}\n```"
+        elif kind == "prose around":
+            text = (f"Dưới đây là kết quả phân tích:\n{text}\n"
+                    "Hy vọng thông tin này hữu ích.")
+        elif kind == "trailing commas":
+            text = re.sub(r'(["\d\]])(\s*[\]}])', r"\1,\2", text)
+        elif kind == "smart quotes":
+            text = re.sub(r'"([^"]*)"', r"“\1”", text)
+        elif kind == "raw newline":
+            # Line breaks inside strings, unescaped
+            for words in ("viền vàng", "Cắt bỏ", "mép vào"):
+                text = text.replace(words, words.replace(" ", "\n"))
+            expected = json.loads(text.replace("\n", "\\n").replace(
+                ',\\n', ',\n').replace('[\\n', '[\n').replace(
+                '{\\n', '{\n').replace('\\n  ', '\n  ').replace(
+                '\\n]', '\n]').replace('\\n}', '\n}'))
+        elif kind == "invalid escape":
+            # \' around a quoted name, kept as a literal backslash
+            name = expected["disease_name"]
+            text = text.replace(f'"{name}"', f'"\\\'{name}\\\'"')
+            expected = {**expected, "disease_name": f"\\'{name}\\'"}
+        elif kind == "truncated":
+            text = text[:int(len(text) * rng.uniform(0.6, 0.95))]
+        elif kind == "brace in prose":
+            text = f"{text}\n\nGhi chú: độ tin cậy {{ước tính}} từ ảnh."
+        corpus.append((kind, text, expected))
+    return corpus
+
+
+def legacy_parse(response_content: str) -> dict:
+    """The parser used before jsonparse.py."""
+    cleaned_response = response_content.strip()
+    if cleaned_response.startswith('```json'):
+        cleaned_response = cleaned_response.replace(
+            '```json', '').replace('```', '').strip()
+    elif cleaned_response.startswith('```'):
+        cleaned_response = cleaned_response.replace('```', '').strip()
+    try:
+        return json.loads(cleaned_response)
+    except json.JSONDecodeError:
+        json_match = re.search(r'\{.*\}', response_content, re.DOTALL)
+        if json_match:
+            try:
+                return json.loads(json_match.group())
+            except json.JSONDecodeError:
+                pass
+        raise ValueError("Không thể phân tích API response thành JSON")
+
+
+def correct(data: dict, expected) -> bool:
+    """True if data holds the expected values (a subset if truncated)."""
+    if expected is None:
+        return True
+    return bool(data) and all(
+        expected.get(key) == value
+        or (isinstance(value, list) and value == expected[key][:len(value)])
+        for key, value in data.items()
+    )
+
+
+def run(parse, corpus, repeat: int):
+    """Correctly parsed count and mean microseconds per response, by kind."""
+    parsed, seconds = defaultdict(int), defaultdict(float)
+    for kind, content, expected in corpus:
+        try:
+            parsed[kind] += correct(parse(content), expected)
+        except ValueError:
+            pass
+        start = time.perf_counter()
+        for _ in range(repeat):
+            try:
+                parse(content)
+            except ValueError:
+                pass
+        seconds[kind] += (time.perf_counter() - start) / repeat
+    return parsed, seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--corpus", help="JSONL file of recorded responses")
+    parser.add_argument("--count", type=int, default=800)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    from jsonparse import parse_json_object, parse_stats
+
+    if args.corpus:
+        corpus = []
+        with open(args.corpus, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    if isinstance(entry, str):
+                        entry = {"kind": "recorded", "content": entry}
+                    corpus.append((entry.get("kind", "recorded"),
+                                   entry["content"], None))
+    else:
+        corpus = builtin_corpus(args.count)
+
+    before, before_seconds = run(legacy_parse, corpus, args.repeat)
+    parse_stats.reset()
+    after, after_seconds = run(
+        lambda content: parse_json_object(content, stats=None),
+        corpus, args.repeat
+    )
+    for _, content, _ in corpus:
+        try:
+            parse_json_object(content)
+        except ValueError:
+            pass
+
+    totals = defaultdict(int)
+    for kind, _, _ in corpus:
+        totals[kind] += 1
+    print(f"{'response kind':>16}{'count':>7}{'parsed before':>15}"
+          f"{'parsed after':>14}{'us before':>11}{'us after':>10}")
+    for kind, total in totals.items():
+        print(f"{kind:>16}{total:>7}{before[kind] / total:>15.0%}"
+              f"{after[kind] / total:>14.0%}"
+              f"{before_seconds[kind] / total * 1e6:>11.1f}"
+              f"{after_seconds[kind] / total * 1e6:>10.1f}")
+    count = len(corpus)
+    print(f"{'all':>16}{count:>7}{sum(before.values()) / count:>15.0%}"
+          f"{sum(after.values()) / count:>14.0%}"
+          f"{sum(before_seconds.values()) / count * 1e6:>11.1f}"
+          f"{sum(after_seconds.values()) / count * 1e6:>10.1f}")
+    print(f"\nparse_stats: {parse_stats.snapshot()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Request Scheduler Scenarios
+===========================
+
+Drives the detector through the fake Groq server with the RPM/TPM scheduler
+in ratelimit.py and checks that:
+
+    quota          the number of requests started never exceeds the bucket
+                   capacity plus what refills in the elapsed time
+    priority       interactive calls issued while a batch is queued wait far
+                   less than the batch calls
+    bounded wait   with the quota exhausted, an interactive call is rejected
+                   once its max wait is over instead of queueing forever
+
+Exits with status 1 if an expectation does not hold.
+
+Usage:
+    python benchmarks/bench_scheduler.py --rpm 240 --batch 300
+"""
+
+import argparse
+import base64
+import os
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_groq import start_server  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--port", type=int, default=9042)
+    parser.add_argument("--rpm", type=float, default=240)
+    parser.add_argument("--tpm", type=float, default=200000)
+    parser.add_argument("--batch", type=int, default=300)
+    parser.add_argument("--interactive", type=int, default=4)
+    args = parser.parse_args()
+
+    server = start_server(args.port, latency=0.02)
+    os.environ["GROQ_BASE_URL"] = f"http://127.0.0.1:{args.port}"
+
+    from core import PlantDiseaseDetector
+    from ratelimit import (
+        PRIORITY_BATCH, PRIORITY_INTERACTIVE, RequestScheduler,
+        SchedulerRejected
+    )
+
+    with open(os.path.join(ROOT, "Media", "brown-spot.jpg"), "rb") as f:
+        image = base64.b64encode(f.read()).decode("utf-8")
+
+    failures = []
+
+    def expect(condition: bool, message: str) -> None:
+        print(f"  {'ok  ' if condition else 'FAIL'} {message}")
+        if not condition:
+            failures.append(message)
+
+    # Quota and priority: a batch larger than the bucket, with interactive
+    # calls arriving while it is queued
+    scheduler = RequestScheduler(args.rpm, args.tpm, max_queue=1000)
+    detector = PlantDiseaseDetector(scheduler=scheduler)
+
+    def interactive_calls():
+        time.sleep(0.5)
+        for _ in range(args.interactive):
+            detector.analyze_plant_image_base64(image)
+            time.sleep(1.0)
+
+    start = time.perf_counter()
+    thread = threading.Thread(target=interactive_calls)
+    thread.start()
+    batch = detector.analyze_many([image] * args.batch, max_concurrency=8)
+    thread.join()
+    elapsed = time.perf_counter() - start
+
+    stats = scheduler.stats()
+    interactive = stats["priorities"]["interactive"]
+    queued = stats["priorities"]["batch"]
+    started = interactive["granted"] + queued["granted"]
+    print(f"{started} requests in {elapsed:.1f}s at {args.rpm:.0f} RPM, "
+          f"{batch['succeeded']}/{args.batch} batch ok")
+    print(f"{'priority':<14}{'granted':>8}{'p50 ms':>9}{'p95 ms':>9}"
+          f"{'max ms':>9}")
+    for name, row in stats["priorities"].items():
+        print(f"{name:<14}{row['granted']:>8}{row['wait_p50_ms']:>9.0f}"
+              f"{row['wait_p95_ms']:>9.0f}{row['wait_max_ms']:>9.0f}")
+
+    allowed = args.rpm + elapsed * args.rpm / 60
+    expect(started <= allowed,
+           f"requests stay within quota ({started} <= {allowed:.1f})")
+    expect(batch["succeeded"] == args.batch, "every batch call completes")
+    expect(interactive["wait_max_ms"] < queued["wait_max_ms"] / 2,
+           "interactive calls jump the batch queue")
+
+    # Bounded wait: quota exhausted, interactive max wait 0.3s
+    scheduler = RequestScheduler(
+        requests_per_minute=6, max_wait={PRIORITY_INTERACTIVE: 0.3}
+    )
+    for _ in range(6):
+        scheduler.acquire(0, PRIORITY_BATCH)
+    start = time.perf_counter()
+    try:
+        scheduler.acquire(0, PRIORITY_INTERACTIVE)
+        rejected = None
+    except SchedulerRejected as e:
+        rejected = e
+    waited = time.perf_counter() - start
+    expect(rejected is not None and waited < 0.5,
+           f"exhausted quota rejects after the max wait ({waited:.2f}s)")
+    if rejected is not None:
+        expect(rejected.retry_after >= 1,
+               f"rejection carries Retry-After ({rejected.retry_after:.1f}s)")
+
+    server.shutdown()
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Streamlit Rerun Latency Benchmark
+=================================
+
+Streamlit executes main.py from the top on every interaction. Measures the
+time spent executing the script per rerun (Streamlit's AppTest, timed
+around the script itself so the test harness' polling is not counted):
+
+    logos        the two logos as rendered before (read from disk and
+                 base64-encoded, st.image resizing the 499 px PNG on every
+                 rerun) against the cached assets (assets.py)
+    main.py      the whole app, idle page, as a user interaction would
+
+and the bytes of the logos sent to the browser per rerun.
+
+Usage:
+    python benchmarks/bench_streamlit_rerun.py --reruns 20
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+import warnings
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def render_uncached_logos():
+    """Logos as rendered before assets.py."""
+    import base64
+    import os
+    import streamlit as st
+    from assets import ASSET_DIR
+
+    os.chdir(ASSET_DIR)
+    st.image("black-tree-logo.png", width=100)
+    with open("agriculture.png", "rb") as f:
+        logo = base64.b64encode(f.read()).decode()
+    st.markdown(f'<img src="data:image/png;base64,{logo}">',
+                unsafe_allow_html=True)
+
+
+def render_cached_logos():
+    """Logos as rendered with assets.py."""
+    import streamlit as st
+    from assets import image_data_url, load_image
+
+    st.image(load_image("black-tree-logo.png", 100), width=100)
+    st.markdown(f'<img src="{image_data_url("agriculture.png", 210)}">',
+                unsafe_allow_html=True)
+
+
+def install_script_timer():
+    """Record the execution time of each script run."""
+    from streamlit.runtime.scriptrunner import script_runner
+
+    timings = []
+    run = script_runner.exec_func_with_error_handling
+
+    def timed(fn, ctx):
+        start = time.perf_counter()
+        try:
+            return run(fn, ctx)
+        finally:
+            timings.append(time.perf_counter() - start)
+
+    script_runner.exec_func_with_error_handling = timed
+    return timings
+
+
+def rerun_ms(app, timings, reruns: int) -> float:
+    """Median script time of a rerun in milliseconds."""
+    app.run()  # warm up, fills the caches
+    assert not app.exception, app.exception
+    del timings[:]
+    for _ in range(reruns):
+        app.run()
+    return statistics.median(timings) * 1e3
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--reruns", type=int, default=20)
+    args = parser.parse_args()
+    warnings.filterwarnings("ignore")
+
+    from streamlit.testing.v1 import AppTest
+
+    from assets import image_data_url, load_image
+
+    timings = install_script_timer()
+    print(f"{'script':>24}{'rerun ms':>10}")
+    for name, script in (("logos, uncached", render_uncached_logos),
+                         ("logos, assets.py", render_cached_logos)):
+        app = AppTest.from_function(script)
+        print(f"{name:>24}{rerun_ms(app, timings, args.reruns):>10.2f}")
+
+    app = AppTest.from_file(os.path.join(ROOT, "main.py"), default_timeout=30)
+    app.secrets["GROQ_API_KEY"] = "benchmark"
+    print(f"{'main.py':>24}{rerun_ms(app, timings, args.reruns):>10.2f}")
+
+    with open(os.path.join(ROOT, "agriculture.png"), "rb") as f:
+        header_before = (len(f.read()) + 2) // 3 * 4
+    with open(os.path.join(ROOT, "black-tree-logo.png"), "rb") as f:
+        sidebar_source = len(f.read())
+    print(f"header logo data URL: {header_before / 1024:.0f} KB before, "
+          f"{len(image_data_url('agriculture.png', 210)) / 1024:.0f} KB after")
+    print(f"sidebar logo: {sidebar_source / 1024:.0f} KB file, "
+          f"{len(load_image('black-tree-logo.png', 100)) / 1024:.0f} KB "
+          f"served at 100 px")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""
+Completion Token Budget Benchmark
+=================================
+
+Runs analyses against the fake Groq server (benchmarks/fake_groq.py) with
+answers of realistic lengths per outcome: short invalid-image and healthy
+answers, disease answers whose treatment list varies, a few very long
+answers beyond 1024 tokens and a few runaway answers repeating the same
+treatment until the cap. Compares:
+
+    fixed 1024    the detector before budget.py: max_completion_tokens
+                  1024 for every call, a truncated answer is repaired and
+                  loses its tail
+    adaptive      TokenBudget: max_tokens learned per outcome, a truncated
+                  answer is continued by a second request
+
+and reports, per analysis, the tokens generated, the max_tokens requested
+(what the rate limit scheduler reserves against the TPM quota), the API
+requests made and the share of results whose lists are complete.
+
+Usage:
+    python benchmarks/bench_token_budget.py --calls 1000
+"""
+
+import argparse
+import base64
+import hashlib
+import json
+import os
+import random
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_groq import FakeGroqHandler, start_server  # noqa: E402
+
+PHRASES = ["Đốm nâu hình tròn đường kính 3-5mm trên mặt lá",
+           "Phun Mancozeb 80WP pha theo hướng dẫn trên nhãn thuốc",
+           "Cắt bỏ lá bệnh và tiêu hủy xa vườn trồng",
+           "Giữ vườn khô ráo, tưới nước vào gốc buổi sáng",
+           "Bón phân kali để cây tăng sức đề kháng với nấm bệnh"]
+
+
+def make_answer(seed: bytes) -> dict:
+    """The analysis of an image: outcome and list lengths from its hash."""
+    rng = random.Random(hashlib.sha256(seed).digest())
+    roll = rng.random()
+    if roll < 0.2:
+        return {
+            "disease_detected": False, "disease_name": None,
+            "disease_type": "invalid_image", "severity": "không",
+            "confidence": 95,
+            "symptoms": ["Ảnh không chứa bộ phận cây"],
+            "possible_causes": ["Ảnh chụp người hoặc đồ vật"],
+            "treatment": ["Vui lòng chụp lại lá, thân hoặc rễ cây"],
+        }
+    if roll < 0.5:
+        return {
+            "disease_detected": False, "disease_name": None,
+            "disease_type": "khỏe mạnh", "severity": "không",
+            "confidence": 90,
+            "symptoms": ["Lá xanh đều, không có đốm bệnh"],
+            "possible_causes": [],
+            "treatment": ["Tiếp tục chăm sóc và theo dõi định kỳ",
+                          "Bón phân cân đối theo giai đoạn sinh trưởng"],
+        }
+    if roll < 0.505:
+        # Runaway generation: the same step over and over
+        return {
+            "disease_detected": True, "disease_name": "Bệnh thán thư",
+            "disease_type": "nấm", "severity": "nhẹ", "confidence": 70,
+            "symptoms": ["Vết bệnh lõm, màu nâu đen"],
+            "possible_causes": ["Độ ẩm cao"],
+            "treatment": [f"Bước 1: {PHRASES[1]}"] * 300,
+        }
+    # Disease: a few answers have very long treatment lists
+    items = rng.randint(40, 90) if roll > 0.99 else rng.randint(4, 14)
+    return {
+        "disease_detected": True, "disease_name": "Bệnh đốm lá nâu",
+        "disease_type": "nấm", "severity": "trung bình", "confidence": 85,
+        "symptoms": [f"{i + 1}. {rng.choice(PHRASES)}"
+                     for i in range(rng.randint(2, 6))],
+        "possible_causes": ["Nấm Cercospora phát triển khi độ ẩm cao"],
+        "treatment": [f"Bước {i + 1}: {rng.choice(PHRASES)}"
+                      for i in range(items)],
+    }
+
+
+class AnswerHandler(FakeGroqHandler):
+    """Fake server answering each image with its make_answer analysis."""
+
+    def analysis_content(self, request: dict) -> str:
+        url = request["messages"][0]["content"][1]["image_url"]["url"]
+        return json.dumps(make_answer(url.encode()), ensure_ascii=False)
+
+
+def run(detector, images) -> float:
+    """Analyze every image; return the share of complete results."""
+    # A runaway answer counts as complete with its step once
+    complete = 0
+    for image in images:
+        result = detector.analyze_plant_image(image)
+        expected = make_answer(f"data:{image.mime_type};base64,".encode()
+                               + base64.b64encode(image.data))
+        complete += list(dict.fromkeys(result["treatment"])) == list(
+            dict.fromkeys(expected["treatment"])
+        )
+    return complete / len(images)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--calls", type=int, default=1000)
+    parser.add_argument("--port", type=int, default=9052)
+    args = parser.parse_args()
+
+    os.environ["GROQ_BASE_URL"] = f"http://127.0.0.1:{args.port}"
+    server = start_server(args.port, latency=0.0, handler_class=AnswerHandler)
+
+    import logging
+
+    from budget import TokenBudget
+    from core import PlantDiseaseDetector
+    from payload import ImagePayload
+
+    logging.disable(logging.WARNING)
+    rng = random.Random(0)
+    images = [ImagePayload(rng.randbytes(64)) for _ in range(args.calls)]
+
+    class FixedDetector(PlantDiseaseDetector):
+        """Before budget.py: truncated answers are only repaired."""
+
+        def _resume_params(self, request, content, generated):
+            return None
+
+    print(f"{'':>14}{'tokens/call':>13}{'max_tokens/call':>17}"
+          f"{'requests/call':>15}{'truncated':>11}{'complete':>10}")
+    for name, detector in (
+        ("fixed 1024", FixedDetector(response_format="json_object")),
+        ("adaptive", PlantDiseaseDetector(response_format="json_object",
+                                          token_budget=TokenBudget())),
+    ):
+        counters = {"requests": 0, "generated": 0, "max_tokens": 0,
+                    "truncated": 0}
+        create = detector._create_completion
+
+        def counted(content, timeout=None, create=create, counters=counters):
+            completion = create(content, timeout)
+            counters["requests"] += 1
+            counters["generated"] += completion.usage.completion_tokens
+            counters["max_tokens"] += json.loads(content)[
+                "max_completion_tokens"
+            ]
+            counters["truncated"] += (
+                completion.choices[0].finish_reason == "length"
+            )
+            return completion
+
+        detector._create_completion = counted
+        complete = run(detector, images)
+        calls = len(images)
+        print(f"{name:>14}{counters['generated'] / calls:>13.1f}"
+              f"{counters['max_tokens'] / calls:>17.1f}"
+              f"{counters['requests'] / calls:>15.3f}"
+              f"{counters['truncated']:>11}{complete:>10.1%}")
+        if detector.token_budget is not None:
+            stats = detector.token_budget.stats()
+            print(f"{'':>14}budget {stats['max_tokens']} tokens; p95 per "
+                  f"outcome: " + ", ".join(
+                      f"{outcome} {values['p95_tokens']}"
+                      for outcome, values in stats["outcomes"].items()
+                  ))
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
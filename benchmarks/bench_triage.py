@@ -0,0 +1,117 @@
+"""
+Triage Cascade Benchmark
+========================
+
+Runs a mixed workload through the detector and the fake Groq server, with
+and without the local triage in triage.py. The workload holds the sample
+photos in Media/ and synthetic unusable uploads: a text screenshot, a
+dark, a blurred, a featureless, a tiny and a non-image file. Reports
+upstream calls, escalation rate, latency and the latency saved.
+
+Exits with status 1 if a sample photo is rejected by triage or an unusable
+upload reaches the model.
+
+Usage:
+    python benchmarks/bench_triage.py --latency 0.5
+"""
+
+import argparse
+import base64
+import io
+import os
+import sys
+import time
+
+from PIL import Image, ImageDraw, ImageFilter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_groq import start_server  # noqa: E402
+
+
+def encode(image: Image.Image) -> bytes:
+    buffer = io.BytesIO()
+    image.convert("RGB").save(buffer, "JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def unusable_uploads(leaf: Image.Image) -> dict:
+    """Build uploads that triage should answer locally, by expected reason."""
+    screenshot = Image.new("RGB", (800, 600), "white")
+    draw = ImageDraw.Draw(screenshot)
+    for row in range(30):
+        draw.text((10, row * 20), "Lorem ipsum dolor sit amet " * 3,
+                  fill="black")
+    return {
+        "no_vegetation": encode(screenshot),
+        "too_dark": encode(leaf.point(lambda x: x * 0.08)),
+        "blurry": encode(leaf.filter(ImageFilter.GaussianBlur(12))),
+        "low_contrast": encode(Image.new("RGB", (800, 600), (100, 150, 230))),
+        "too_small": encode(leaf.resize((48, 64))),
+        "not_image": b"%PDF-1.7 not an image" * 50,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--port", type=int, default=9044)
+    parser.add_argument("--latency", type=float, default=0.5)
+    args = parser.parse_args()
+
+    server = start_server(args.port, latency=args.latency)
+    handler = server.RequestHandlerClass
+    os.environ["GROQ_BASE_URL"] = f"http://127.0.0.1:{args.port}"
+
+    from core import PlantDiseaseDetector
+    from triage import ImageTriage
+
+    media = os.path.join(ROOT, "Media")
+    photos = {
+        name: open(os.path.join(media, name), "rb").read()
+        for name in sorted(os.listdir(media))
+    }
+    leaf = Image.open(io.BytesIO(photos["brown-spot.jpg"]))
+    unusable = unusable_uploads(leaf)
+    workload = list(photos.items()) + list(unusable.items())
+
+    failures = []
+    print(f"{len(photos)} sample photos + {len(unusable)} unusable uploads, "
+          f"upstream latency {args.latency * 1e3:.0f} ms")
+    print(f"{'case':<16}{'upstream':>9}{'escalated':>11}{'total s':>9}"
+          f"{'saved s':>9}")
+    for triage in (None, ImageTriage()):
+        detector = PlantDiseaseDetector(triage=triage)
+        before = handler.requests_received
+        start = time.perf_counter()
+        for name, data in workload:
+            result = detector.analyze_plant_image_base64(
+                base64.b64encode(data).decode("utf-8")
+            )
+            if triage is None:
+                continue
+            reason = result.get("triage")
+            if name in photos and reason is not None:
+                failures.append(f"{name} rejected ({reason})")
+            if name in unusable and reason != name:
+                failures.append(f"{name} upload answered as {reason}")
+        elapsed = time.perf_counter() - start
+        upstream = handler.requests_received - before
+        stats = triage.stats() if triage else None
+        label = "triage" if triage else "no triage"
+        print(f"{label:<16}{upstream:>9}"
+              f"{stats['escalation_rate'] if stats else 1.0:>11.0%}"
+              f"{elapsed:>9.2f}"
+              f"{stats['latency_saved_seconds'] if stats else 0.0:>9.2f}")
+    print(f"  triage: {stats['mean_triage_ms']:.1f} ms per image, "
+          f"short-circuited {stats['short_circuited']}")
+    for failure in failures:
+        print(f"  FAIL {failure}")
+
+    server.shutdown()
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Time-To-First-Byte Benchmark
+============================
+
+Compares time to first byte and total time of the buffered and streaming
+variants of the chatbot and batch detection endpoints of a running API.
+
+Usage (offline, against the fake Groq server):
+    python benchmarks/fake_groq.py --port 9000 --latency 0.3 \\
+        --token-delay 0.02 &
+    PLANT_CACHE_BACKEND=none GROQ_BASE_URL=http://127.0.0.1:9000 \\
+        uvicorn app:app --port 8000 &
+    python benchmarks/bench_ttfb.py --url http://127.0.0.1:8000
+"""
+
+import argparse
+import glob
+import os
+import statistics
+import time
+
+import httpx
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def measure(client: httpx.Client, method: str, path: str, **kwargs):
+    """Return (seconds to first body byte, seconds to end of body)."""
+    start = time.perf_counter()
+    first = None
+    with client.stream(method, path, **kwargs) as response:
+        response.raise_for_status()
+        for chunk in response.iter_bytes():
+            if chunk and first is None:
+                first = time.perf_counter() - start
+    return first, time.perf_counter() - start
+
+
+def batch_files(count: int):
+    paths = sorted(glob.glob(os.path.join(ROOT, "Media", "*.jpg")))
+    files = []
+    for i in range(count):
+        path = paths[i % len(paths)]
+        with open(path, "rb") as f:
+            files.append(("files", (f"{i}_{os.path.basename(path)}",
+                                    f.read(), "image/jpeg")))
+    return files
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--batch-size", type=int, default=16)
+    args = parser.parse_args()
+
+    chat = {"json": {"message": "Bệnh đốm lá nâu là gì?"}}
+    files = batch_files(args.batch_size)
+    batch = {"files": files, "params": {"max_concurrency": 4}}
+    cases = [
+        ("chatbot", "/chatbot", chat),
+        ("chatbot (SSE)", "/chatbot/stream", chat),
+        (f"batch x{args.batch_size}", "/disease-detection-batch", batch),
+        (f"batch x{args.batch_size} (NDJSON)",
+         "/disease-detection-batch/stream", batch),
+    ]
+
+    print(f"{'endpoint':<26}{'ttfb ms':>10}{'total ms':>10}")
+    with httpx.Client(base_url=args.url, timeout=300) as client:
+        for label, path, kwargs in cases:
+            firsts, totals = [], []
+            for _ in range(args.repeat):
+                first, total = measure(client, "POST", path, **kwargs)
+                firsts.append(first)
+                totals.append(total)
+            print(f"{label:<26}{statistics.median(firsts) * 1e3:>10.0f}"
+                  f"{statistics.median(totals) * 1e3:>10.0f}")
+        client.post("/chatbot/clear")
+
+
+if __name__ == "__main__":
+    main()
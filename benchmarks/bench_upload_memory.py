@@ -0,0 +1,136 @@
+"""
+Upload Memory Benchmark
+=======================
+
+Starts the API in a uvicorn subprocess (against the fake Groq server) and
+sends one upload per scenario: a phone photo, a large PNG, an upload above
+the size limit, a decompression bomb (a small PNG that decodes to a huge
+bitmap) and a file that is not an image. For each request it reports the
+status code and the peak RSS of the API process above its idle RSS.
+
+The peak is measured with the Linux VmHWM counter, reset before each
+request through /proc/<pid>/clear_refs.
+
+Usage:
+    python benchmarks/bench_upload_memory.py
+    PLANT_UPLOAD_MAX_BYTES=5000000 python benchmarks/bench_upload_memory.py
+"""
+
+import argparse
+import io
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+from PIL import Image, ImageFilter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_groq import start_server  # noqa: E402
+
+MB = 1024 * 1024
+
+
+def memory_kb(pid: int, field: str) -> int:
+    """Read a Vm* field of /proc/<pid>/status in kB."""
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1])
+    raise KeyError(field)
+
+
+def reset_peak(pid: int) -> None:
+    """Reset VmHWM to the current RSS."""
+    with open(f"/proc/{pid}/clear_refs", "w") as f:
+        f.write("5")
+
+
+def photo(width: int, height: int, image_format: str) -> bytes:
+    """Encode a detailed, photo-like image of the given size."""
+    with Image.open(os.path.join(ROOT, "Media", "brown-spot.jpg")) as leaf:
+        image = leaf.convert("RGB").resize((width, height), Image.BICUBIC)
+    noise = Image.effect_noise((width, height), 40).convert("RGB")
+    image = Image.blend(image, noise, 0.15).filter(ImageFilter.SHARPEN)
+    buffer = io.BytesIO()
+    image.save(buffer, format=image_format, quality=95)
+    return buffer.getvalue()
+
+
+def bomb(edge: int) -> bytes:
+    """Encode a single-colour PNG: a few hundred kB, edge x edge pixels."""
+    buffer = io.BytesIO()
+    Image.new("L", (edge, edge), 120).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--port", type=int, default=8043)
+    parser.add_argument("--groq-port", type=int, default=9044)
+    parser.add_argument("--oversized-mb", type=int, default=60)
+    args = parser.parse_args()
+
+    groq = start_server(args.groq_port, latency=0.05)
+    scenarios = [
+        ("phone photo 4000x3000 JPEG", "leaf.jpg", photo(4000, 3000, "JPEG")),
+        ("large PNG 3000x2250", "leaf.png", photo(3000, 2250, "PNG")),
+        ("bomb PNG 9000x9000", "bomb.png", bomb(9000)),
+        (f"oversized {args.oversized_mb} MB", "huge.jpg",
+         b"\xff\xd8\xff\xe0" + os.urandom(args.oversized_mb * MB)),
+        ("not an image", "notes.jpg", b"plain text, not a photo\n" * 1000),
+    ]
+
+    env = {
+        **os.environ,
+        "GROQ_BASE_URL": f"http://127.0.0.1:{args.groq_port}",
+        "GROQ_API_KEY": os.environ.get("GROQ_API_KEY", "test"),
+        "PLANT_CACHE_BACKEND": "none",
+        "PLANT_TRIAGE": "0",
+    }
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--port", str(args.port),
+         "--log-level", "warning"],
+        cwd=ROOT, env=env, stderr=subprocess.DEVNULL
+    )
+    url = f"http://127.0.0.1:{args.port}"
+    try:
+        with httpx.Client(base_url=url, timeout=120) as client:
+            for _ in range(100):
+                try:
+                    client.get("/")
+                    break
+                except httpx.TransportError:
+                    time.sleep(0.1)
+            # Warm up imports, pools and allocator arenas
+            client.post("/disease-detection-file",
+                        files={"file": scenarios[0][1:]})
+
+            print(f"{'scenario':<30}{'upload MB':>10}{'status':>8}"
+                  f"{'peak RSS MB':>13}{'ms':>8}")
+            for label, filename, data in scenarios:
+                idle = memory_kb(server.pid, "VmRSS")
+                reset_peak(server.pid)
+                start = time.perf_counter()
+                try:
+                    status = client.post(
+                        "/disease-detection-file",
+                        files={"file": (filename, data)}
+                    ).status_code
+                except httpx.TransportError:
+                    status = "closed"
+                elapsed = time.perf_counter() - start
+                peak = memory_kb(server.pid, "VmHWM") - idle
+                print(f"{label:<30}{len(data) / MB:>10.1f}{status:>8}"
+                      f"{peak / 1024:>13.1f}{elapsed * 1e3:>8.0f}")
+    finally:
+        server.terminate()
+        server.wait()
+        groq.shutdown()
+
+
+if __name__ == "__main__":
+    main()
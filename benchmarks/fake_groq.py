@@ -0,0 +1,374 @@
+"""
+Fake Groq API Server
+====================
+
+A minimal local stand-in for the Groq chat completions endpoint, so the API
+can be load-tested without network access or quota. Every request waits
+`latency` seconds before the first token and `token_delay` seconds per
+generated token, then returns a canned disease analysis (image requests) or
+a canned chatbot answer. Requests with "stream": true are answered as
+server-sent event chunks, like the real API.
+
+Like the real API, an answer longer than max_completion_tokens (one token
+per word) is cut with finish_reason "length", and a conversation ending
+with an assistant message is continued from that prefix. Subclasses can
+vary the analysis per request by overriding analysis_content.
+
+Faults can be injected to exercise retries and circuit breaking: a share of
+requests fails immediately with `error_status` (and a Retry-After header if
+`retry_after` is set), and a share stalls for `stall_seconds` before
+answering, to trigger client timeouts. Several error statuses can be mixed
+with --errors, e.g. "429:0.05,503:0.01".
+
+The latency before the first token is fixed, or drawn from an exponential
+or lognormal distribution with mean `latency` (--latency-dist). With
+--replay, answers are taken from recorded responses instead of the canned
+ones: a JSONL file with one {"kind": "analysis" | "chat", "content": ...}
+object per line (the format of bench_response_parser.py), or chat
+completion bodies. The answer to a request is picked by a hash of its
+image or last message, so a run replays the same answers, and --seed makes
+the latency and error draws reproducible too.
+
+Usage:
+    python benchmarks/fake_groq.py --port 9000 --latency 0.5
+    python benchmarks/fake_groq.py --error-rate 0.3 --error-status 429 \\
+        --retry-after 1
+    python benchmarks/fake_groq.py --replay responses.jsonl \\
+        --latency-dist lognormal --latency 1.5 --errors 429:0.02 --seed 1
+    GROQ_BASE_URL=http://127.0.0.1:9000 uvicorn app:app
+"""
+
+import argparse
+import json
+import math
+import random
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+CANNED_ANALYSIS = {
+    "disease_detected": True,
+    "disease_name": "Bệnh đốm lá nâu do nấm Cercospora",
+    "disease_type": "nấm",
+    "severity": "trung bình",
+    "confidence": 82,
+    "symptoms": ["Đốm nâu hình tròn đường kính 3-5mm, viền vàng rõ ràng"],
+    "possible_causes": ["Nấm Cercospora sp. phát triển khi độ ẩm cao"],
+    "treatment": ["Cắt bỏ lá bệnh và tiêu hủy", "Phun Mancozeb 80WP"],
+}
+
+
+CANNED_CHAT_REPLY = (
+    "Bệnh đốm lá nâu thường do nấm Cercospora gây ra 🌿. Bạn nên cắt bỏ "
+    "lá bệnh, tránh tưới nước lên lá vào buổi tối, giữ vườn thông thoáng "
+    "và phun thuốc gốc đồng hoặc Mancozeb theo hướng dẫn trên nhãn. Sau "
+    "7-10 ngày hãy kiểm tra lại, nếu bệnh vẫn lan rộng thì phun nhắc lại "
+    "một lần nữa và bổ sung phân kali để cây tăng sức đề kháng."
+)
+
+
+def split_tokens(text: str) -> list:
+    """Split text into word-sized pieces that keep their spacing."""
+    words = text.split(" ")
+    return [word + " " for word in words[:-1]] + words[-1:]
+
+
+def make_completion(content: str, model: str = "fake-model",
+                    finish_reason: str = "stop",
+                    completion_tokens: int = 0) -> dict:
+    """Build an OpenAI-compatible chat completion response body."""
+    return {
+        "id": "chatcmpl-fake",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": finish_reason,
+        }],
+        "usage": {
+            "prompt_tokens": 0,
+            "completion_tokens": completion_tokens,
+            "total_tokens": completion_tokens,
+        },
+    }
+
+
+def load_responses(path: str) -> dict:
+    """
+    Read recorded responses, grouped by kind ("analysis" or "chat").
+
+    Each line is {"kind": ..., "content": ...}, a chat completion body (an
+    analysis if its content is a JSON object) or a JSON string.
+    """
+    responses = {"analysis": [], "chat": []}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            if isinstance(entry, str):
+                entry = {"content": entry}
+            elif "choices" in entry:
+                entry = {"content": entry["choices"][0]["message"]["content"]}
+            content = entry["content"]
+            kind = entry.get("kind") or (
+                "analysis" if content.lstrip().startswith(("{", "```"))
+                else "chat"
+            )
+            responses.setdefault(kind, []).append(content)
+    return responses
+
+
+def parse_errors(spec: str) -> tuple:
+    """Parse "429:0.05,503:0.01" into ((429, 0.05), (503, 0.01))."""
+    errors = []
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        status, rate = item.split(":")
+        errors.append((int(status), float(rate)))
+    return tuple(errors)
+
+
+def make_chunk(delta: str, model: str = "fake-model",
+               finish_reason=None) -> dict:
+    """Build an OpenAI-compatible streaming chunk."""
+    return {
+        "id": "chatcmpl-fake",
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "delta": {"content": delta} if delta else {},
+            "finish_reason": finish_reason,
+        }],
+    }
+
+
+class FakeGroqHandler(BaseHTTPRequestHandler):
+    """Request handler answering POST /openai/v1/chat/completions."""
+
+    latency = 0.5
+    latency_dist = "fixed"
+    latency_sigma = 0.5
+    token_delay = 0.0
+    error_rate = 0.0
+    error_status = 429
+    errors = ()
+    retry_after = None
+    stall_rate = 0.0
+    stall_seconds = 30.0
+    recorded = None
+    rng = random.Random()
+    protocol_version = "HTTP/1.1"
+    requests_received = 0
+    _counter_lock = threading.Lock()
+
+    def do_POST(self):
+        with self._counter_lock:
+            type(self).requests_received += 1
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        request = json.loads(body or b"{}")
+        model = request.get("model", "fake-model")
+
+        status = self._draw_error()
+        if status is not None:
+            self._error(status)
+            return
+        if self.rng.random() < self.stall_rate:
+            time.sleep(self.stall_seconds)
+
+        messages = request.get("messages") or [{}]
+        prefix = ""
+        if messages[-1].get("role") == "assistant":
+            prefix = messages[-1].get("content") or ""
+            messages = messages[:-1]
+        if isinstance(messages[-1].get("content"), list):
+            content = self.analysis_content(request)
+        else:
+            content = self.chat_content(messages)
+        tokens = split_tokens(content)
+        if prefix and content.startswith(prefix):
+            # Continue the assistant prefix where it stops
+            done, length = 0, 0
+            while done < len(tokens) and length < len(prefix):
+                length += len(tokens[done])
+                done += 1
+            tokens = tokens[done:]
+        finish_reason = "stop"
+        limit = request.get("max_completion_tokens") or request.get(
+            "max_tokens"
+        )
+        if limit and len(tokens) > limit:
+            tokens, finish_reason = tokens[:limit], "length"
+
+        time.sleep(self._draw_latency())
+        if request.get("stream"):
+            self._stream(tokens, model, finish_reason)
+            return
+
+        time.sleep(self.token_delay * len(tokens))
+        payload = json.dumps(make_completion(
+            "".join(tokens), model, finish_reason, len(tokens)
+        )).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def analysis_content(self, request: dict) -> str:
+        """Answer to an analysis (image) request."""
+        if self.recorded and self.recorded.get("analysis"):
+            content = request["messages"][0]["content"]
+            image = next((part["image_url"]["url"] for part in content
+                          if part.get("type") == "image_url"), "")
+            return self._replay("analysis", image)
+        return json.dumps(CANNED_ANALYSIS, ensure_ascii=False)
+
+    def chat_content(self, messages: list) -> str:
+        """Answer to a chatbot request."""
+        if self.recorded and self.recorded.get("chat"):
+            return self._replay("chat", str(messages[-1].get("content")))
+        return CANNED_CHAT_REPLY
+
+    def _replay(self, kind: str, key: str) -> str:
+        """The recorded response of this kind picked by the request key."""
+        responses = self.recorded[kind]
+        return responses[zlib.crc32(key.encode("utf-8")) % len(responses)]
+
+    def _draw_latency(self) -> float:
+        """Latency before the first token, with mean self.latency."""
+        if self.latency <= 0 or self.latency_dist == "fixed":
+            return max(self.latency, 0.0)
+        if self.latency_dist == "exponential":
+            return self.rng.expovariate(1 / self.latency)
+        # Lognormal with the same mean: mu = ln(mean) - sigma^2 / 2
+        sigma = self.latency_sigma
+        return self.rng.lognormvariate(
+            math.log(self.latency) - sigma * sigma / 2, sigma
+        )
+
+    def _draw_error(self):
+        """Status of an injected error for this request, or None."""
+        draw = self.rng.random()
+        for status, rate in ((self.error_status, self.error_rate),
+                             *self.errors):
+            if draw < rate:
+                return status
+            draw -= rate
+        return None
+
+    def _error(self, status: int) -> None:
+        """Answer with an OpenAI-compatible error body."""
+        payload = json.dumps({"error": {
+            "message": f"Injected error {status}",
+            "type": "fake_error",
+        }}).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        if self.retry_after is not None:
+            self.send_header("Retry-After", str(self.retry_after))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _stream(self, tokens: list, model: str,
+                finish_reason: str = "stop") -> None:
+        """Send tokens as server-sent events, then close the connection."""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        for token in tokens:
+            event = json.dumps(make_chunk(token, model), ensure_ascii=False)
+            self.wfile.write(f"data: {event}\n\n".encode("utf-8"))
+            self.wfile.flush()
+            time.sleep(self.token_delay)
+        event = json.dumps(make_chunk("", model, finish_reason=finish_reason))
+        self.wfile.write(f"data: {event}\n\ndata: [DONE]\n\n".encode("utf-8"))
+        self.wfile.flush()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server(port: int = 9000, latency: float = 0.5,
+                 token_delay: float = 0.0, error_rate: float = 0.0,
+                 error_status: int = 429, retry_after=None,
+                 stall_rate: float = 0.0,
+                 stall_seconds: float = 30.0,
+                 handler_class: type = None,
+                 latency_dist: str = "fixed",
+                 latency_sigma: float = 0.5,
+                 errors: tuple = (),
+                 responses: dict = None,
+                 seed: int = None) -> ThreadingHTTPServer:
+    """Start the fake server in a background thread and return it."""
+    handler = type("Handler", (handler_class or FakeGroqHandler,), {
+        "latency": latency,
+        "latency_dist": latency_dist,
+        "latency_sigma": latency_sigma,
+        "token_delay": token_delay,
+        "error_rate": error_rate,
+        "error_status": error_status,
+        "errors": errors,
+        "retry_after": retry_after,
+        "stall_rate": stall_rate,
+        "stall_seconds": stall_seconds,
+        "recorded": responses,
+        "rng": random.Random(seed),
+    })
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--latency-dist", default="fixed",
+                        choices=["fixed", "exponential", "lognormal"])
+    parser.add_argument("--latency-sigma", type=float, default=0.5)
+    parser.add_argument("--token-delay", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=429)
+    parser.add_argument("--retry-after", type=float, default=None)
+    parser.add_argument("--stall-rate", type=float, default=0.0)
+    parser.add_argument("--stall-seconds", type=float, default=30.0)
+    parser.add_argument("--errors", type=parse_errors, default=(),
+                        help='status:rate pairs, e.g. "429:0.05,503:0.01"')
+    parser.add_argument("--replay", help="JSONL file of recorded responses")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    responses = load_responses(args.replay) if args.replay else None
+    server = start_server(args.port, args.latency, args.token_delay,
+                          args.error_rate, args.error_status,
+                          args.retry_after, args.stall_rate,
+                          args.stall_seconds,
+                          latency_dist=args.latency_dist,
+                          latency_sigma=args.latency_sigma,
+                          errors=args.errors, responses=responses,
+                          seed=args.seed)
+    replayed = (
+        f", replaying {sum(map(len, responses.values()))} responses"
+        if responses else ""
+    )
+    print(f"Fake Groq server on http://127.0.0.1:{args.port} "
+          f"({args.latency_dist} latency {args.latency}s, "
+          f"{args.token_delay}s/token{replayed})")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""
+API Load Test
+=============
+
+Sends requests to a running API at increasing concurrency levels and reports
+throughput and latency percentiles, showing whether requests are served in
+parallel or queue up behind each other in one worker. With --pid (the API
+process, Linux only) it also reports the RSS of the API after each level and
+its peak during the level.
+
+Usage (offline, against the fake Groq server):
+    python benchmarks/fake_groq.py --port 9000 --latency 0.5 &
+    PLANT_CACHE_BACKEND=none PLANT_COALESCE=0 \\
+        GROQ_BASE_URL=http://127.0.0.1:9000 uvicorn app:app --port 8000 &
+    python benchmarks/load_test.py --url http://127.0.0.1:8000 \\
+        --endpoint file --concurrency 1,4,16 --requests 32 \\
+        --pid $(pgrep -f "uvicorn app:app") --output load.json
+
+With the result cache and request coalescing disabled (every request sends
+the same image), a single worker should reach roughly
+concurrency / latency requests per second instead of 1 / latency.
+
+benchmarks/run_suite.py starts both servers and runs this test for you.
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from typing import Optional
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_upload_memory import memory_kb, reset_peak  # noqa: E402
+from results import save_results  # noqa: E402
+
+
+async def send(client: httpx.AsyncClient, endpoint: str, image: bytes) -> None:
+    if endpoint == "file":
+        response = await client.post(
+            "/disease-detection-file",
+            files={"file": ("leaf.jpg", image, "image/jpeg")}
+        )
+    else:
+        response = await client.post(
+            "/chatbot", json={"message": "Bệnh đốm lá nâu là gì?"}
+        )
+    response.raise_for_status()
+
+
+async def run_level(url: str, endpoint: str, image: bytes,
+                    concurrency: int, total: int,
+                    pid: Optional[int] = None) -> dict:
+    latencies = []
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency)
+
+    if pid is not None:
+        try:
+            reset_peak(pid)
+        except OSError:
+            # Not allowed: the peak is then the peak since the API started
+            pass
+
+    async with httpx.AsyncClient(base_url=url, timeout=120,
+                                 limits=limits) as client:
+        async def one():
+            nonlocal errors
+            async with semaphore:
+                t0 = time.perf_counter()
+                try:
+                    await send(client, endpoint, image)
+                    latencies.append(time.perf_counter() - t0)
+                except httpx.HTTPError:
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(total)))
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    pick = (lambda q: latencies[min(len(latencies) - 1,
+                                    int(len(latencies) * q))]
+            if latencies else float("nan"))
+    result = {
+        "concurrency": concurrency,
+        "requests": total,
+        "errors": errors,
+        "throughput_rps": len(latencies) / elapsed,
+        "p50_ms": pick(0.50) * 1e3,
+        "p95_ms": pick(0.95) * 1e3,
+        "p99_ms": pick(0.99) * 1e3,
+        "mean_ms": (statistics.fmean(latencies) * 1e3
+                    if latencies else float("nan")),
+    }
+    if pid is not None:
+        result["rss_mb"] = memory_kb(pid, "VmRSS") / 1024
+        result["peak_rss_mb"] = memory_kb(pid, "VmHWM") / 1024
+    return result
+
+
+def print_level(r: dict) -> None:
+    memory = (f"{r['rss_mb']:>9.0f}{r['peak_rss_mb']:>10.0f}"
+              if "rss_mb" in r else "")
+    print(f"{r['concurrency']:>12}{r['requests']:>10}{r['errors']:>8}"
+          f"{r['throughput_rps']:>9.2f}{r['p50_ms']:>10.0f}"
+          f"{r['p95_ms']:>10.0f}{r['p99_ms']:>10.0f}{memory}")
+
+
+async def run_levels(url: str, endpoint: str, image: bytes, levels,
+                     total: int, pid: Optional[int] = None) -> dict:
+    """
+    Run each concurrency level in turn.
+
+    Returns:
+        dict: Level results keyed "load/<endpoint>/c<concurrency>", the
+              format of results.save_results
+    """
+    print(f"{'concurrency':>12}{'requests':>10}{'errors':>8}"
+          f"{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+          + (f"{'rss MB':>9}{'peak MB':>10}" if pid is not None else ""))
+    results = {}
+    for level in levels:
+        r = await run_level(url, endpoint, image, level, total, pid)
+        print_level(r)
+        results[f"load/{endpoint}/c{level}"] = r
+    return results
+
+
+async def main_async(args) -> None:
+    with open(args.image, "rb") as f:
+        image = f.read()
+    levels = [int(level) for level in args.concurrency.split(",")]
+    results = await run_levels(args.url, args.endpoint, image, levels,
+                               args.requests, args.pid)
+    if args.output:
+        save_results(args.output, "load", results)
+        print(f"\nSaved to {args.output}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--endpoint", choices=["file", "chatbot"],
+                        default="file")
+    parser.add_argument("--concurrency", default="1,4,16")
+    parser.add_argument("--requests", type=int, default=32)
+    parser.add_argument("--image",
+                        default=os.path.join(ROOT, "Media", "brown-spot.jpg"))
+    parser.add_argument("--pid", type=int,
+                        help="API process to report the memory of")
+    parser.add_argument("--output", help="save the results as JSON")
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""
+Benchmark Results
+=================
+
+Benchmarks save their results as JSON so that runs can be compared and a
+regression caught before it ships:
+
+    {
+        "suite": "offline",
+        "created_at": "2026-01-01T12:00:00+00:00",
+        "environment": {"python": ..., "platform": ..., "cpus": ...,
+                        "git_commit": ...},
+        "results": {"load/file/c16": {"throughput_rps": 31.2,
+                                      "p99_ms": 612.0, ...}, ...}
+    }
+
+compare() lines up two result files and flags the metrics that got worse
+by more than a threshold. Lower is better for latencies, sizes and memory
+(names ending in _ms, _us, _s, _mb, _kb or _bytes, and error counts),
+higher is better for throughput (_rps, _per_s); other metrics are shown
+without a verdict.
+
+Usage:
+    python benchmarks/results.py baseline.json current.json --threshold 0.1
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+LOWER_IS_BETTER = ("_ms", "_us", "_s", "_mb", "_kb", "_bytes", "errors")
+HIGHER_IS_BETTER = ("_rps", "_per_s")
+
+
+def environment() -> Dict:
+    """Describe the machine and revision the benchmarks ran on."""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+            capture_output=True, text=True, timeout=10
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "git_commit": commit,
+    }
+
+
+def save_results(path: str, suite: str, results: Dict[str, Dict]) -> Dict:
+    """
+    Write results as JSON with the environment they were measured in.
+
+    Args:
+        path (str): Output file
+        suite (str): Name of the benchmark or suite
+        results (Dict[str, Dict]): Metrics by benchmark name
+
+    Returns:
+        Dict: The document written
+    """
+    document = {
+        "suite": suite,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "environment": environment(),
+        "results": results,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(document, f, indent=2, ensure_ascii=False)
+        f.write("\n")
+    return document
+
+
+def load_results(path: str) -> Dict:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def direction(metric: str) -> int:
+    """-1 if lower is better, 1 if higher is better, 0 if unknown."""
+    if metric.endswith(HIGHER_IS_BETTER):
+        return 1
+    if metric.endswith(LOWER_IS_BETTER):
+        return -1
+    return 0
+
+
+def compare(baseline: Dict, current: Dict, threshold: float = 0.1) -> List:
+    """
+    Compare the metrics present in both result documents.
+
+    Args:
+        baseline (Dict): Reference results
+        current (Dict): New results
+        threshold (float): Relative change counted as a regression or an
+                           improvement
+
+    Returns:
+        List: (benchmark, metric, baseline value, current value, relative
+              change, verdict) with verdict "regression", "improvement" or
+              ""
+    """
+    rows = []
+    for name, metrics in current["results"].items():
+        reference = baseline["results"].get(name)
+        if not reference:
+            continue
+        for metric, value in metrics.items():
+            old = reference.get(metric)
+            if not isinstance(value, (int, float)) or not isinstance(
+                old, (int, float)
+            ) or isinstance(value, bool):
+                continue
+            change = (value - old) / abs(old) if old else (
+                0.0 if value == old else float("inf")
+            )
+            better = direction(metric) * change
+            verdict = (
+                "" if direction(metric) == 0 or abs(change) <= threshold
+                else "improvement" if better > 0 else "regression"
+            )
+            rows.append((name, metric, old, value, change, verdict))
+    return rows
+
+
+def print_comparison(rows: List, only_changes: bool = False) -> None:
+    print(f"{'benchmark':<32}{'metric':<18}{'baseline':>12}{'current':>12}"
+          f"{'change':>9}")
+    for name, metric, old, value, change, verdict in rows:
+        if only_changes and not verdict:
+            continue
+        print(f"{name:<32}{metric:<18}{old:>12.4g}{value:>12.4g}"
+              f"{change:>+9.1%}  {verdict}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--threshold", type=float, default=0.1)
+    parser.add_argument("--only-changes", action="store_true")
+    args = parser.parse_args(argv)
+
+    rows = compare(load_results(args.baseline), load_results(args.current),
+                   args.threshold)
+    print_comparison(rows, args.only_changes)
+    regressions = sum(verdict == "regression" for *_, verdict in rows)
+    print(f"\n{regressions} regression(s) above {args.threshold:.0%}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,161 @@
+"""
+Offline Benchmark Suite
+=======================
+
+Runs the performance benchmarks without network access or a Groq API key,
+so runs on the same machine can be compared before and after a change:
+
+    1. starts the fake Groq server (fake_groq.py) in this process, with a
+       latency distribution, injected errors and optionally recorded
+       responses to replay, all drawn from a fixed seed;
+    2. starts the API in a uvicorn subprocess pointed at it, with the
+       result cache, request coalescing and triage disabled so that every
+       request goes through the whole pipeline;
+    3. runs load_test.py against /disease-detection-file and /chatbot at
+       each concurrency level (throughput, p50/p95/p99 latency, RSS and
+       peak RSS of the API process);
+    4. runs the microbenchmarks of bench_micro.py (base64 encoding, prompt
+       construction, response parsing);
+    5. saves everything as one JSON file (results.py) and, with --baseline,
+       compares it with an earlier run and exits with status 1 on a
+       regression above --threshold.
+
+The chatbot reads its API key from Streamlit secrets, so the API runs with
+HOME set to a temporary directory holding a .streamlit/secrets.toml with a
+dummy key; nothing is written to the repository or the real home.
+
+Usage:
+    python benchmarks/run_suite.py --output .cache/benchmarks/current.json
+    python benchmarks/run_suite.py --baseline .cache/benchmarks/main.json \\
+        --output .cache/benchmarks/current.json --threshold 0.15
+    python benchmarks/run_suite.py --replay responses.jsonl \\
+        --latency 1.2 --latency-dist lognormal --errors 429:0.02
+"""
+
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_micro import run_micro  # noqa: E402
+from fake_groq import load_responses, parse_errors, start_server  # noqa: E402
+from load_test import run_level, run_levels  # noqa: E402
+from results import (  # noqa: E402
+    compare, load_results, print_comparison, save_results
+)
+
+
+def start_api(port: int, groq_port: int, home: str) -> subprocess.Popen:
+    """Start the API in a uvicorn subprocess and wait until it answers."""
+    env = {
+        **os.environ,
+        "HOME": home,
+        "GROQ_BASE_URL": f"http://127.0.0.1:{groq_port}",
+        "GROQ_API_KEY": "test",
+        "PLANT_CACHE_BACKEND": "none",
+        "PLANT_COALESCE": "0",
+        "PLANT_TRIAGE": "0",
+    }
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--port", str(port),
+         "--log-level", "warning"],
+        cwd=ROOT, env=env, stderr=subprocess.DEVNULL
+    )
+    with httpx.Client(base_url=f"http://127.0.0.1:{port}") as client:
+        for _ in range(300):
+            if server.poll() is not None:
+                raise RuntimeError("The API did not start")
+            try:
+                client.get("/")
+                return server
+            except httpx.TransportError:
+                time.sleep(0.1)
+    server.terminate()
+    raise RuntimeError("The API did not answer within 30 s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--groq-port", type=int, default=9065)
+    parser.add_argument("--latency", type=float, default=0.3,
+                        help="mean latency of the fake Groq server (s)")
+    parser.add_argument("--latency-dist", default="lognormal",
+                        choices=["fixed", "exponential", "lognormal"])
+    parser.add_argument("--errors", type=parse_errors, default=(),
+                        help='injected errors, e.g. "429:0.02,503:0.01"')
+    parser.add_argument("--replay", help="JSONL file of recorded responses")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--endpoints", default="file,chatbot")
+    parser.add_argument("--concurrency", default="1,8,32")
+    parser.add_argument("--requests", type=int, default=64,
+                        help="requests per concurrency level")
+    parser.add_argument("--image",
+                        default=os.path.join(ROOT, "Media", "brown-spot.jpg"))
+    parser.add_argument("--skip-micro", action="store_true")
+    parser.add_argument("--output", default=os.path.join(
+        ROOT, ".cache", "benchmarks", "latest.json"
+    ))
+    parser.add_argument("--baseline", help="earlier results to compare with")
+    parser.add_argument("--threshold", type=float, default=0.1)
+    args = parser.parse_args()
+
+    responses = load_responses(args.replay) if args.replay else None
+    groq = start_server(args.groq_port, args.latency,
+                        latency_dist=args.latency_dist, errors=args.errors,
+                        responses=responses, seed=args.seed)
+    with open(args.image, "rb") as f:
+        image = f.read()
+    levels = [int(level) for level in args.concurrency.split(",")]
+    results = {}
+
+    with tempfile.TemporaryDirectory() as home:
+        os.makedirs(os.path.join(home, ".streamlit"))
+        with open(os.path.join(home, ".streamlit", "secrets.toml"), "w") as f:
+            f.write('GROQ_API_KEY = "test"\n')
+        api = start_api(args.port, args.groq_port, home)
+        url = f"http://127.0.0.1:{args.port}"
+        try:
+            for endpoint in filter(None, args.endpoints.split(",")):
+                route = ("/disease-detection-file" if endpoint == "file"
+                         else f"/{endpoint}")
+                print(f"\nload: {route}")
+                # Warm up imports, client pools and allocator arenas
+                asyncio.run(run_level(url, endpoint, image, 1, 2))
+                results.update(asyncio.run(run_levels(
+                    url, endpoint, image, levels, args.requests, api.pid
+                )))
+        finally:
+            api.terminate()
+            api.wait()
+            groq.shutdown()
+
+    if not args.skip_micro:
+        print("\nmicro:")
+        micro = run_micro(args.image)
+        for name, metrics in micro.items():
+            print(f"  {name:<40}{metrics['per_call_us']:>12.2f} us")
+        results.update(micro)
+
+    save_results(args.output, "offline", results)
+    print(f"\nSaved to {args.output}")
+    if args.baseline:
+        print()
+        rows = compare(load_results(args.baseline), load_results(args.output),
+                       args.threshold)
+        print_comparison(rows, only_changes=True)
+        regressions = sum(verdict == "regression" for *_, verdict in rows)
+        print(f"\n{regressions} regression(s) above {args.threshold:.0%}")
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+"""
+Adaptive Completion Token Budget
+================================
+
+Every analysis used to be sent with max_completion_tokens = 1024. A long
+Vietnamese treatment list could hit the cap and come back as unparseable,
+truncated JSON, while healthy and invalid-image answers need a fraction of
+it. The cap is also what the rate limit scheduler reserves against the TPM
+quota for every call.
+
+TokenBudget keeps a rolling history of the completion tokens of recent
+answers per outcome ("disease", "healthy", "invalid_image") and derives the
+max_tokens sent with the next call: the largest per-outcome quantile times
+a headroom factor, between floor and ceiling. Until min_samples answers are
+known, the ceiling is used.
+
+A call that still ends with finish_reason == "length" is resumed by the
+detector (the partial answer is sent back as an assistant prefix and the
+model continues it) or, if it cannot be resumed, repaired by jsonparse, so
+a tight budget costs a second request for the rare long answer instead of
+a failed analysis.
+
+Configuration (environment variables used by get_default_token_budget):
+    PLANT_TOKEN_BUDGET: "adaptive" (default) or "fixed" (always send the
+                        detector's DEFAULT_MAX_TOKENS)
+    PLANT_TOKEN_BUDGET_QUANTILE: Quantile of each outcome's answers that
+                                 must fit the budget (default: 0.95)
+    PLANT_TOKEN_BUDGET_CEILING: Max tokens of a first request
+                                (default: 1024)
+"""
+
+import logging
+import math
+import os
+import threading
+from collections import deque
+from typing import Deque, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Outcome of an analysis, as far as its answer length is concerned
+OUTCOMES = ("disease", "healthy", "invalid_image")
+
+
+def answer_outcome(result: Dict) -> str:
+    """Classify an analysis result as disease, healthy or invalid_image."""
+    disease_type = str(result.get("disease_type") or "").lower()
+    if disease_type == "invalid_image":
+        return "invalid_image"
+    if not result.get("disease_detected") or disease_type in (
+        "khỏe mạnh", "healthy"
+    ):
+        return "healthy"
+    return "disease"
+
+
+def _quantile(sorted_values, q: float) -> int:
+    """Nearest-rank quantile of a sorted sequence."""
+    return sorted_values[min(len(sorted_values) - 1,
+                             math.ceil(q * len(sorted_values)) - 1)]
+
+
+class TokenBudget:
+    """
+    Max completion tokens learned from the answers of previous calls.
+
+    Thread-safe: record() is called from request threads and the event
+    loop; max_tokens() only reads the budget computed by the last record().
+
+    Args:
+        ceiling (int): Budget before enough answers are known, and its upper
+                       bound
+        floor (int): Lower bound of the budget
+        quantile (float): Share of each outcome's answers the budget must fit
+        headroom (float): Factor applied to the quantile
+        window (int): Answers remembered per outcome
+        min_samples (int): Answers needed before the budget adapts; an
+                           outcome with fewer answers uses its longest one
+    """
+
+    def __init__(
+        self,
+        ceiling: int = 1024,
+        floor: int = 192,
+        quantile: float = 0.95,
+        headroom: float = 1.15,
+        window: int = 500,
+        min_samples: int = 20
+    ):
+        if not 0 < floor <= ceiling:
+            raise ValueError("Token budget needs 0 < floor <= ceiling")
+        if not 0 < quantile <= 1:
+            raise ValueError("Quantile must be in (0, 1]")
+        self.ceiling = ceiling
+        self.floor = floor
+        self.quantile = quantile
+        self.headroom = headroom
+        self.min_samples = min_samples
+        self._history: Dict[str, Deque[int]] = {
+            outcome: deque(maxlen=window) for outcome in OUTCOMES
+        }
+        self._budget = ceiling
+        self._lock = threading.Lock()
+        # Counters since start
+        self.calls = 0
+        self.tokens_generated = 0
+        self.truncated = 0
+        self.resumed = 0
+        self.repaired = 0
+
+    def max_tokens(self) -> int:
+        """Return the max completion tokens for the next call."""
+        return self._budget
+
+    def record(
+        self,
+        outcome: str,
+        completion_tokens: Optional[int],
+        truncated: bool = False,
+        resumed: bool = False
+    ) -> None:
+        """
+        Record the answer of one analysis call.
+
+        Args:
+            outcome (str): answer_outcome() of the result
+            completion_tokens (Optional[int]): Tokens generated for the
+                                               answer, resumption included
+            truncated (bool): The first request ended with finish_reason
+                              "length"
+            resumed (bool): The truncated answer was completed by a second
+                            request (otherwise it was repaired)
+        """
+        with self._lock:
+            self.calls += 1
+            self.truncated += truncated
+            self.resumed += truncated and resumed
+            self.repaired += truncated and not resumed
+            if completion_tokens is None:
+                return
+            self.tokens_generated += completion_tokens
+            self._history[outcome].append(completion_tokens)
+            self._budget = self._compute_budget()
+
+    def _compute_budget(self) -> int:
+        if sum(map(len, self._history.values())) < self.min_samples:
+            return self.ceiling
+        needed = 0
+        for samples in self._history.values():
+            if not samples:
+                continue
+            values = sorted(samples)
+            if len(values) >= self.min_samples:
+                needed = max(needed, _quantile(values, self.quantile))
+            else:
+                needed = max(needed, values[-1])
+        # Rounded up to 32 tokens so the budget (part of the request
+        # coalescing key) does not change with every answer
+        budget = math.ceil(needed * self.headroom / 32) * 32
+        return max(self.floor, min(self.ceiling, budget))
+
+    def stats(self) -> Dict:
+        """
+        Return the current budget, truncations and answer lengths per outcome.
+
+        Returns:
+            Dict: Budget, counters and p50/p95/max completion tokens of the
+                  remembered answers of each outcome
+        """
+        with self._lock:
+            outcomes = {}
+            for outcome, samples in self._history.items():
+                values = sorted(samples)
+                outcomes[outcome] = {
+                    "answers": len(values),
+                    "p50_tokens": _quantile(values, 0.5) if values else None,
+                    "p95_tokens": _quantile(values, 0.95) if values else None,
+                    "max_tokens": values[-1] if values else None,
+                }
+            return {
+                "max_tokens": self._budget,
+                "ceiling": self.ceiling,
+                "calls": self.calls,
+                "mean_completion_tokens": (
+                    round(self.tokens_generated / self.calls, 1)
+                    if self.calls else 0.0
+                ),
+                "truncated": self.truncated,
+                "truncation_rate": (
+                    round(self.truncated / self.calls, 4)
+                    if self.calls else 0.0
+                ),
+                "resumed": self.resumed,
+                "repaired": self.repaired,
+                "outcomes": outcomes,
+            }
+
+
+_default_budget: Optional[TokenBudget] = None
+_default_budget_lock = threading.Lock()
+
+
+def get_default_token_budget() -> Optional[TokenBudget]:
+    """
+    Get the process-wide token budget configured from environment variables.
+
+    Returns:
+        Optional[TokenBudget]: Shared budget, or None if PLANT_TOKEN_BUDGET
+                               is "fixed"
+    """
+    global _default_budget
+    if os.environ.get("PLANT_TOKEN_BUDGET", "adaptive") == "fixed":
+        return None
+    if _default_budget is None:
+        with _default_budget_lock:
+            if _default_budget is None:
+                _default_budget = TokenBudget(
+                    ceiling=int(os.environ.get(
+                        "PLANT_TOKEN_BUDGET_CEILING", 1024
+                    )),
+                    quantile=float(os.environ.get(
+                        "PLANT_TOKEN_BUDGET_QUANTILE", 0.95
+                    )),
+                )
+                logger.info("Bật ngân sách token phản hồi thích ứng")
+    return _default_budget
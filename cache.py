@@ -0,0 +1,278 @@
+"""
+Result Cache for Plant Disease Detection
+========================================
+
+This module provides a content-addressed cache for disease analysis results.
+Results are keyed on a hash of the decoded image bytes together with the
+model name, prompt version and temperature, so re-uploading the same photo
+returns the previous analysis without another vision-model round trip.
+
+Backends:
+    - MemoryCacheBackend: in-process LRU with TTL
+    - SQLiteCacheBackend: on-disk store that survives restarts
+
+Configuration (environment variables used by get_default_cache):
+    PLANT_CACHE_BACKEND: "memory" (default), "sqlite" or "none"
+    PLANT_CACHE_PATH: SQLite file path (default: .cache/results.sqlite3)
+    PLANT_CACHE_TTL: Time-to-live in seconds (default: 86400)
+    PLANT_CACHE_MAX_ENTRIES: Max entries for the memory backend (default: 1024)
+"""
+
+import copy
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+
+logger = logging.getLogger(__name__)
+
+
+def make_cache_key(
+    image_bytes: bytes,
+    model_name: str,
+    prompt_version: str,
+    temperature: float
+) -> str:
+    """
+    Build a content-addressed cache key for an analysis request.
+
+    Args:
+        image_bytes (bytes): Decoded image bytes (not base64)
+        model_name (str): Model used for the analysis
+        prompt_version (str): Version of the analysis prompt
+        temperature (float): Sampling temperature of the request
+
+    Returns:
+        str: Cache key
+    """
+    digest = hashlib.sha256(image_bytes).hexdigest()
+    return f"{digest}:{model_name}:{prompt_version}:{temperature}"
+
+
+class CacheBackend:
+    """
+    Storage interface for ResultCache.
+
+    Subclasses must implement get, set, clear and __len__.
+    """
+
+    name = "base"
+
+    def get(self, key: str) -> Optional[Dict]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: Dict) -> None:
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        raise NotImplementedError
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+
+class MemoryCacheBackend(CacheBackend):
+    """
+    In-process LRU cache with per-entry time-to-live.
+
+    Args:
+        max_entries (int): Maximum number of entries before LRU eviction
+        ttl (Optional[float]): Time-to-live in seconds, None to never expire
+    """
+
+    name = "memory"
+
+    def __init__(self, max_entries: int = 1024, ttl: Optional[float] = 86400):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Dict]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Dict) -> None:
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SQLiteCacheBackend(CacheBackend):
+    """
+    On-disk cache backed by SQLite so results survive restarts.
+
+    Args:
+        path (str): Path to the SQLite database file
+        ttl (Optional[float]): Time-to-live in seconds, None to never expire
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str = ".cache/results.sqlite3",
+                 ttl: Optional[float] = 86400):
+        self.path = path
+        self.ttl = ttl
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)"
+        )
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM results WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, expires_at = row
+            if expires_at is not None and expires_at < time.time():
+                self._conn.execute("DELETE FROM results WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+        return json.loads(value)
+
+    def set(self, key: str, value: Dict) -> None:
+        expires_at = time.time() + self.ttl if self.ttl else None
+        payload = json.dumps(value, ensure_ascii=False)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results (key, value, expires_at) "
+                "VALUES (?, ?, ?)",
+                (key, payload, expires_at)
+            )
+            self._conn.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM results")
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM results"
+            ).fetchone()[0]
+
+
+class ResultCache:
+    """
+    Analysis result cache with hit/miss counters.
+
+    Args:
+        backend (Optional[CacheBackend]): Storage backend. Defaults to a
+                                          MemoryCacheBackend.
+
+    Example:
+        >>> cache = ResultCache(SQLiteCacheBackend("results.sqlite3"))
+        >>> detector = PlantDiseaseDetector(cache=cache)
+        >>> cache.stats()
+        {'backend': 'sqlite', 'hits': 0, 'misses': 0, ...}
+    """
+
+    def __init__(self, backend: Optional[CacheBackend] = None):
+        self.backend = backend if backend is not None else MemoryCacheBackend()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Dict]:
+        """Return a copy of the cached result for key, or None on a miss."""
+        value = self.backend.get(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return copy.deepcopy(value) if value is not None else None
+
+    def set(self, key: str, value: Dict) -> None:
+        """Store a copy of value under key."""
+        self.backend.set(key, copy.deepcopy(value))
+
+    def clear(self) -> None:
+        """Remove all entries and reset the counters."""
+        self.backend.clear()
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> Dict:
+        """Return hit/miss counters and the current number of entries."""
+        total = self.hits + self.misses
+        return {
+            "backend": self.backend.name,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "size": len(self.backend),
+        }
+
+
+_default_cache: Optional[ResultCache] = None
+_default_cache_lock = threading.Lock()
+
+
+def get_default_cache() -> Optional[ResultCache]:
+    """
+    Get the process-wide result cache configured from environment variables.
+
+    Returns:
+        Optional[ResultCache]: Shared cache, or None if PLANT_CACHE_BACKEND
+                               is "none"
+    """
+    global _default_cache
+    if _default_cache is None:
+        with _default_cache_lock:
+            if _default_cache is None:
+                backend_name = os.environ.get("PLANT_CACHE_BACKEND", "memory")
+                ttl = float(os.environ.get("PLANT_CACHE_TTL", 86400))
+                if backend_name == "none":
+                    return None
+                if backend_name == "sqlite":
+                    backend = SQLiteCacheBackend(
+                        os.environ.get(
+                            "PLANT_CACHE_PATH", ".cache/results.sqlite3"
+                        ),
+                        ttl=ttl
+                    )
+                else:
+                    backend = MemoryCacheBackend(
+                        max_entries=int(
+                            os.environ.get("PLANT_CACHE_MAX_ENTRIES", 1024)
+                        ),
+                        ttl=ttl
+                    )
+                _default_cache = ResultCache(backend)
+                logger.info(f"Khởi tạo bộ nhớ đệm kết quả ({backend.name})")
+    return _default_cache
@@ -0,0 +1,456 @@
+"""
+Record and Replay of Model API Responses
+========================================
+
+Benchmarks and regression checks of the detector and the chatbot need the
+answers of the model without calling it: the API costs tokens and time,
+needs network access and does not answer the same request twice the same
+way.
+
+CassetteTransport sits below the Groq SDK, in the shared HTTP clients of
+clients.py, so PlantDiseaseDetector and PlantDiseaseChatbot (sync and
+async, streamed or not) are recorded and replayed without any change:
+
+    record   every request goes to the API; successful responses are
+             stored in the cassette
+    replay   responses come from the cassette, nothing is sent; a request
+             that was not recorded gets a 404 error response
+    auto     replay what was recorded, record the rest
+
+A cassette is a SQLite file keyed by request fingerprint: the SHA-256 of
+the method, path and body sent to the API (model, prompt, parameters and
+the base64 image), so a changed prompt, model or image is a new request.
+Only the fingerprint, model, size and kind of a request are kept, not its
+body, and response bodies are zlib-compressed: a recorded analysis takes
+about 1 kB whatever the size of the image.
+
+With strict=False a replay cassette answers any request: one that was not
+recorded gets a recorded response of the same kind picked by its
+fingerprint, so thousands of analyses of arbitrary images can be replayed
+deterministically to measure the pipeline at full speed
+(benchmarks/bench_replay.py). The kinds are analysis, chat and
+analysis_resume: the continuation of a truncated analysis, sent with the
+partial answer as an assistant message, whose response is only the rest
+of the JSON and is never served as a whole analysis.
+
+Recording reads a streamed response to the end before passing it on, so
+chunks arrive at once; replay serves the recorded stream the same way.
+
+Configuration (environment variables used by get_default_cassette):
+    PLANT_CASSETTE: "none" (default), "record", "replay" or "auto"
+    PLANT_CASSETTE_PATH: SQLite file path (default: .cache/cassette.sqlite3)
+    PLANT_CASSETTE_STRICT: "1" (default) to answer unrecorded requests with
+                           404 in replay mode, "0" to answer them with a
+                           recorded response of the same kind
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Dict, Iterator, List, NamedTuple, Optional
+
+import httpx
+
+
+logger = logging.getLogger(__name__)
+
+CASSETTE_MODES = ("none", "record", "replay", "auto")
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS responses ("
+    "fingerprint TEXT PRIMARY KEY, "
+    "kind TEXT NOT NULL, "
+    "model TEXT, "
+    "request_bytes INTEGER NOT NULL, "
+    "status INTEGER NOT NULL, "
+    "content_type TEXT, "
+    "body BLOB NOT NULL, "
+    "created_at REAL NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS responses_kind ON responses (kind)",
+)
+
+# Response headers that no longer apply to the decoded, stored body
+_DROPPED_HEADERS = ("content-encoding", "content-length", "transfer-encoding")
+
+_ASSISTANT_MESSAGE = re.compile(rb'"role"\s*:\s*"assistant"')
+
+
+class RecordedResponse(NamedTuple):
+    """One response of the cassette, body decompressed."""
+    fingerprint: str
+    kind: str
+    model: Optional[str]
+    status: int
+    content_type: Optional[str]
+    body: bytes
+
+
+def request_fingerprint(method: str, path: str, body: bytes) -> str:
+    """Return the SHA-256 hex digest identifying an API request."""
+    digest = hashlib.sha256(f"{method.upper()} {path}\n".encode("utf-8"))
+    digest.update(body)
+    return digest.hexdigest()
+
+
+def request_kind(body: bytes) -> str:
+    """
+    Return the kind of an API request from its body.
+
+    "analysis" for a request with an image, "analysis_resume" for one that
+    also carries an assistant message (the prefix of a truncated analysis
+    to continue), "chat" otherwise.
+    """
+    if b'"image_url"' not in body:
+        return "chat"
+    if _ASSISTANT_MESSAGE.search(body):
+        return "analysis_resume"
+    return "analysis"
+
+
+def _request_model(body: bytes) -> Optional[str]:
+    # The model name is near the start of both request bodies; the image
+    # is not parsed
+    start = body.find(b'"model"')
+    if start < 0:
+        return None
+    opening = body.find(b'"', body.find(b":", start) + 1)
+    closing = body.find(b'"', opening + 1)
+    if opening < 0 or closing < 0:
+        return None
+    return body[opening + 1:closing].decode("utf-8", "replace")
+
+
+def completion_content(response: RecordedResponse) -> str:
+    """
+    Return the text the model generated in a recorded response.
+
+    Args:
+        response (RecordedResponse): A chat completion or a server-sent
+                                     event stream of chunks
+
+    Returns:
+        str: The message content (the deltas joined, for a stream)
+    """
+    text = response.body.decode("utf-8")
+    if "text/event-stream" not in (response.content_type or ""):
+        return json.loads(text)["choices"][0]["message"]["content"] or ""
+    pieces = []
+    for line in text.splitlines():
+        if not line.startswith("data:") or line[5:].strip() == "[DONE]":
+            continue
+        choices = json.loads(line[5:]).get("choices") or [{}]
+        pieces.append(choices[0].get("delta", {}).get("content") or "")
+    return "".join(pieces)
+
+
+class CassetteStore:
+    """
+    SQLite store of API responses keyed by request fingerprint.
+
+    Thread-safe; a write is one short transaction, so recording adds well
+    under a millisecond to a call that takes seconds.
+
+    Args:
+        path (str): Path to the SQLite database file
+    """
+
+    def __init__(self, path: str = ".cache/cassette.sqlite3"):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        for statement in _SCHEMA:
+            self._conn.execute(statement)
+        self._conn.commit()
+        # Sorted fingerprints of each kind, for pick()
+        self._by_kind: Dict[str, List[str]] = {}
+        # Counters since start
+        self.hits = 0
+        self.misses = 0
+        self.recorded = 0
+
+    def get(self, fingerprint: str) -> Optional[RecordedResponse]:
+        """Return the response recorded for a fingerprint, or None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT fingerprint, kind, model, status, content_type, body "
+                "FROM responses WHERE fingerprint = ?", (fingerprint,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return RecordedResponse(*row[:5], zlib.decompress(row[5]))
+
+    def pick(self, fingerprint: str, kind: str) -> Optional[RecordedResponse]:
+        """
+        Return a recorded response of a kind chosen by a fingerprint.
+
+        The same fingerprint always gets the same response, as long as no
+        response of that kind is added.
+        """
+        with self._lock:
+            fingerprints = self._by_kind.get(kind)
+            if fingerprints is None:
+                # Sorted once per kind, until a response of it is recorded
+                fingerprints = self._by_kind[kind] = [
+                    row[0] for row in self._conn.execute(
+                        "SELECT fingerprint FROM responses WHERE kind = ? "
+                        "ORDER BY fingerprint", (kind,)
+                    )
+                ]
+            if not fingerprints:
+                return None
+            row = self._conn.execute(
+                "SELECT fingerprint, kind, model, status, content_type, body "
+                "FROM responses WHERE fingerprint = ?",
+                (fingerprints[int(fingerprint[:12], 16) % len(fingerprints)],)
+            ).fetchone()
+        return RecordedResponse(*row[:5], zlib.decompress(row[5]))
+
+    def put(
+        self,
+        fingerprint: str,
+        kind: str,
+        model: Optional[str],
+        request_bytes: int,
+        status: int,
+        content_type: Optional[str],
+        body: bytes
+    ) -> None:
+        """Record a response, replacing an earlier one for the fingerprint."""
+        row = (fingerprint, kind, model, request_bytes, status, content_type,
+               zlib.compress(body), time.time())
+        with self._lock:
+            with self._conn:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO responses (fingerprint, kind, "
+                    "model, request_bytes, status, content_type, body, "
+                    "created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", row
+                )
+            self._by_kind.pop(kind, None)
+            self.recorded += 1
+
+    def responses(
+        self, kind: Optional[str] = None, limit: Optional[int] = None
+    ) -> Iterator[RecordedResponse]:
+        """
+        Iterate over the recorded responses, oldest first.
+
+        Args:
+            kind (Optional[str]): Only responses of this kind ("analysis",
+                                  "analysis_resume" or "chat")
+            limit (Optional[int]): Max responses returned
+        """
+        where, params = ("WHERE kind = ? ", (kind,)) if kind else ("", ())
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT fingerprint, kind, model, status, content_type, body "
+                f"FROM responses {where}ORDER BY created_at LIMIT ?",
+                (*params, -1 if limit is None else limit)
+            ).fetchall()
+        for row in rows:
+            yield RecordedResponse(*row[:5], zlib.decompress(row[5]))
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM responses"
+            ).fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def stats(self) -> Dict:
+        """Return lookups, recordings and the stored responses per kind."""
+        with self._lock:
+            by_kind = self._conn.execute(
+                "SELECT kind, COUNT(*), SUM(LENGTH(body)), SUM(request_bytes) "
+                "FROM responses GROUP BY kind"
+            ).fetchall()
+            hits, misses, recorded = self.hits, self.misses, self.recorded
+        return {
+            "path": self.path,
+            "responses": sum(count for _, count, _, _ in by_kind),
+            "hits": hits,
+            "misses": misses,
+            "recorded": recorded,
+            "by_kind": {
+                kind: {
+                    "responses": count,
+                    "stored_bytes": stored,
+                    "request_bytes": requested,
+                }
+                for kind, count, stored, requested in by_kind
+            },
+        }
+
+
+class _Cassette:
+    """Decisions shared by the sync and async transports."""
+
+    def __init__(self, store: CassetteStore, mode: str, strict: bool):
+        if mode not in CASSETTE_MODES[1:]:
+            raise ValueError(
+                f"Unknown cassette mode {mode!r}, expected one of "
+                f"{', '.join(CASSETTE_MODES[1:])}"
+            )
+        self.store = store
+        self.mode = mode
+        self.strict = strict
+
+    def lookup(self, request: httpx.Request) -> Optional[httpx.Response]:
+        """Response to replay for a request, None to send it."""
+        if self.mode == "record":
+            return None
+        body = request.content
+        fingerprint = request_fingerprint(
+            request.method, request.url.path, body
+        )
+        recorded = self.store.get(fingerprint)
+        if recorded is None and self.mode == "replay" and not self.strict:
+            recorded = self.store.pick(fingerprint, request_kind(body))
+        if recorded is not None:
+            return httpx.Response(
+                recorded.status,
+                headers={"content-type": recorded.content_type or
+                         "application/json"},
+                content=recorded.body, request=request
+            )
+        if self.mode == "replay":
+            return httpx.Response(404, json={"error": {
+                "message": f"No recorded response for request {fingerprint}",
+                "type": "cassette_miss",
+            }}, request=request)
+        return None
+
+    def record(self, request: httpx.Request, response: httpx.Response,
+               body: bytes) -> httpx.Response:
+        """Store a successful response; return a response serving body."""
+        if response.is_success:
+            content = request.content
+            self.store.put(
+                request_fingerprint(request.method, request.url.path,
+                                    content),
+                request_kind(content), _request_model(content), len(content),
+                response.status_code, response.headers.get("content-type"),
+                body
+            )
+        headers = [(name, value) for name, value in response.headers.items()
+                   if name.lower() not in _DROPPED_HEADERS]
+        return httpx.Response(response.status_code, headers=headers,
+                              content=body, request=request)
+
+
+class CassetteTransport(httpx.BaseTransport):
+    """
+    httpx transport recording or replaying the responses of another one.
+
+    Args:
+        transport (httpx.BaseTransport): Transport sending the requests
+        store (CassetteStore): Cassette
+        mode (str): "record", "replay" or "auto"
+        strict (bool): In replay mode, answer unrecorded requests with 404
+                       instead of a recorded response of the same kind
+    """
+
+    def __init__(self, transport: httpx.BaseTransport, store: CassetteStore,
+                 mode: str = "auto", strict: bool = True):
+        self.transport = transport
+        self.cassette = _Cassette(store, mode, strict)
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        request.read()
+        response = self.cassette.lookup(request)
+        if response is not None:
+            return response
+        response = self.transport.handle_request(request)
+        try:
+            body = response.read()
+        finally:
+            response.close()
+        return self.cassette.record(request, response, body)
+
+    def close(self) -> None:
+        self.transport.close()
+
+
+class AsyncCassetteTransport(httpx.AsyncBaseTransport):
+    """Async variant of CassetteTransport, with the same arguments."""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport,
+                 store: CassetteStore, mode: str = "auto",
+                 strict: bool = True):
+        self.transport = transport
+        self.cassette = _Cassette(store, mode, strict)
+
+    async def handle_async_request(
+        self, request: httpx.Request
+    ) -> httpx.Response:
+        await request.aread()
+        response = self.cassette.lookup(request)
+        if response is not None:
+            return response
+        response = await self.transport.handle_async_request(request)
+        try:
+            body = await response.aread()
+        finally:
+            await response.aclose()
+        return self.cassette.record(request, response, body)
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+
+_default_cassette: Optional[CassetteStore] = None
+_default_cassette_lock = threading.Lock()
+
+
+def cassette_mode() -> str:
+    """Return the PLANT_CASSETTE mode ("none" if recording is off)."""
+    mode = os.environ.get("PLANT_CASSETTE", "none")
+    if mode not in CASSETTE_MODES:
+        raise ValueError(
+            f"Unknown PLANT_CASSETTE {mode!r}, expected one of "
+            f"{', '.join(CASSETTE_MODES)}"
+        )
+    return mode
+
+
+def cassette_strict() -> bool:
+    return os.environ.get("PLANT_CASSETTE_STRICT", "1") != "0"
+
+
+def get_default_cassette() -> Optional[CassetteStore]:
+    """
+    Get the process-wide cassette configured from environment variables.
+
+    Returns:
+        Optional[CassetteStore]: Shared cassette, or None if PLANT_CASSETTE
+                                 is "none"
+    """
+    global _default_cassette
+    if cassette_mode() == "none":
+        return None
+    if _default_cassette is None:
+        with _default_cassette_lock:
+            if _default_cassette is None:
+                _default_cassette = CassetteStore(os.environ.get(
+                    "PLANT_CASSETTE_PATH", ".cache/cassette.sqlite3"
+                ))
+                logger.info(
+                    f"Cassette phản hồi API ({cassette_mode()}) tại "
+                    f"{_default_cassette.path}"
+                )
+    return _default_cassette
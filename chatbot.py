@@ -18,12 +18,22 @@ import os
 import streamlit
 import json
 import logging
-from typing import List, Dict, Optional
+import time
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Tuple
 from dataclasses import dataclass
 
-from groq import Groq
+from groq import AsyncGroq, Groq
 from dotenv import load_dotenv
 
+from clients import create_async_groq_client, create_groq_client
+from memory import ChatMemory, create_chat_memory
+from resilience import ResilientCaller, get_default_caller
+from prompts import count_tokens, get_prompt
+from ratelimit import (
+    PRIORITY_INTERACTIVE, RequestScheduler, get_default_scheduler
+)
+from telemetry import observe_completion, observe_error, tracer
+
 
 # Configure logging
 logging.basicConfig(
@@ -68,6 +78,8 @@ class PlantDiseaseChatbot:
         api_key (str): Groq API key for authentication
         client (Groq): Instance of the Groq API client
         chat_history (List[ChatMessage]): History of the conversation
+        memory (ChatMemory): Token-budgeted window of the history that is
+                             actually sent to the model
     
     Example:
         >>> chatbot = PlantDiseaseChatbot()
@@ -79,7 +91,14 @@ class PlantDiseaseChatbot:
     DEFAULT_TEMPERATURE = 0.7
     DEFAULT_MAX_TOKENS = 1024
     
-    def __init__(self, api_key: Optional[str] = None):
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        prompt_variant: Optional[str] = None,
+        memory: Optional[ChatMemory] = None,
+        caller: Optional[ResilientCaller] = None,
+        scheduler: Optional[RequestScheduler] = None
+    ):
         """
         Initialize the Plant Disease Chatbot with API credentials.
         
@@ -90,6 +109,16 @@ class PlantDiseaseChatbot:
         Args:
             api_key (Optional[str]): Groq API key. If None, will attempt to
                                      load from GROQ_API_KEY environment variable.
+            prompt_variant (Optional[str]): "full" or "compact" system prompt.
+                If None, uses the PLANT_PROMPT_VARIANT environment variable.
+            memory (Optional[ChatMemory]): Window of the history sent to the
+                model. If None, one is configured from PLANT_CHAT_*
+                environment variables.
+            caller (Optional[ResilientCaller]): Retry and circuit breaker
+                layer for API calls. If None, the process-wide one is used.
+            scheduler (Optional[RequestScheduler]): RPM/TPM quota scheduler;
+                chat calls are admitted before batch detection. If None,
+                the one shared with the detector is used.
         
         Raises:
             ValueError: If no valid API key is found in parameters or environment.
@@ -104,74 +133,49 @@ class PlantDiseaseChatbot:
         #     raise ValueError(
         #         "GROQ_API_KEY không được tìm thấy trong biến môi trường"
         #     )
-        self.client = Groq(api_key=self.api_key)
+        self.client = self._create_client()
         self.chat_history: List[ChatMessage] = []
+        self.memory = memory if memory is not None else create_chat_memory()
+        self.caller = caller if caller is not None else get_default_caller()
+        self.scheduler = (
+            scheduler if scheduler is not None else get_default_scheduler()
+        )
         self.disease_context: Optional[Dict] = None  # Store disease analysis result
+        self.prompt_variant = prompt_variant
+        self._system_prompt: Optional[str] = None  # Built once per context
         logger.info("Khởi tạo Plant Disease Chatbot")
     
+    def _create_client(self) -> Groq:
+        """Create a Groq client on the shared connection pool."""
+        return create_groq_client(self.api_key)
+    
     def _create_system_prompt(self) -> str:
         """
         Create the system prompt that defines the chatbot's personality and role.
         
+        The prompt is built once and reused on every turn until the disease
+        context changes.
+        
         Returns:
             str: System prompt for the chatbot
         """
-        base_prompt = """BẠN LÀ CHUYÊN GIA TƯ VẤN BỆNH CÂY TRỒNG thân thiện và am hiểu sâu sắc về:
-- Bệnh cây trồng (nấm, vi khuẩn, vi rút, sâu bệnh)
-- Triệu chứng và cách nhận biết bệnh
-- Phương pháp điều trị và phòng ngừa
-- Chăm sóc cây trồng và kỹ thuật canh tác
-- Dinh dưỡng và phân bón
-
-NHIỆM VỤ CỦA BẠN:
-✓ Trả lời câu hỏi của người dùng một cách rõ ràng, chính xác
-✓ Cung cấp lời khuyên thiết thực, dễ áp dụng
-✓ Giải thích bằng ngôn ngữ đơn giản, dễ hiểu
-✓ Thân thiện, nhiệt tình như một người bạn đồng hành
-✓ Hỏi lại nếu cần thêm thông tin để tư vấn tốt hơn
-
-CÁCH TRẢ LỜI:
-- Sử dụng TIẾNG VIỆT trong mọi câu trả lời
-- Trả lời ngắn gọn nhưng đầy đủ thông tin
-- Chia nhỏ thành các bước nếu câu trả lời dài
-- Sử dụng emoji phù hợp để thân thiện hơn
-- Đưa ra ví dụ cụ thể khi có thể
-
-QUAN TRỌNG:
-- Nếu không chắc chắn, hãy thừa nhận và đề xuất người dùng tham khảo thêm
-- Không đưa ra lời khuyên có thể gây hại cho cây hoặc người dùng
-- Khuyến khích người dùng sử dụng tính năng phát hiện bệnh bằng ảnh nếu cần chẩn đoán chính xác"""
-        
-        # Add disease context if available
-        if self.disease_context:
-            context_str = json.dumps(self.disease_context, ensure_ascii=False, indent=2)
-            base_prompt += f"""
-
-═══════════════════════════════════════════════════════════════
-THÔNG TIN PHÂN TÍCH BỆNH HIỆN TẠI
-═══════════════════════════════════════════════════════════════
-
-Người dùng vừa phân tích một lá cây và nhận được kết quả sau:
-
-{context_str}
-
-HƯỚNG DẪN SỬ DỤNG THÔNG TIN NÀY:
-✓ Sử dụng thông tin này để trả lời các câu hỏi của người dùng về kết quả phân tích
-✓ Có thể giải thích chi tiết hơn về bệnh đã phát hiện
-✓ Đưa ra lời khuyên bổ sung dựa trên kết quả
-✓ Trả lời câu hỏi về triệu chứng, nguyên nhân, cách điều trị
-✓ Nếu người dùng hỏi về "bệnh này", "kết quả vừa rồi", "ảnh vừa phân tích" - hãy tham khảo thông tin trên
-
-VÍ DỤ CÂU HỎI NGƯỜI DÙNG CÓ THỂ HỎI:
-- "Giải thích rõ hơn về bệnh này được không?"
-- "Tại sao lá cây bị bệnh này?"
-- "Có cách nào khác để chữa không?"
-- "Bệnh này có nguy hiểm không?"
-- "Tôi nên làm gì tiếp theo?"
-- "Thuốc nào hiệu quả nhất?"
-"""
+        if self._system_prompt is None:
+            system_prompt = get_prompt("chat_system", self.prompt_variant).text
+            
+            # Add disease context if available
+            if self.disease_context:
+                context_prompt = get_prompt("chat_context", self.prompt_variant)
+                indent = 2 if context_prompt.variant == "full" else None
+                context_str = json.dumps(
+                    self.disease_context, ensure_ascii=False, indent=indent
+                )
+                system_prompt += "\n\n" + context_prompt.text.format(
+                    context=context_str
+                )
+            
+            self._system_prompt = system_prompt
         
-        return base_prompt
+        return self._system_prompt
     
     def chat(
         self,
@@ -202,64 +206,190 @@ VÍ DỤ CÂU HỎI NGƯỜI DÙNG CÓ THỂ HỎI:
             >>> response = chatbot.chat("Cách chữa bệnh phấn trắng?")
             >>> print(response)
         """
+        with tracer.start_as_current_span("PlantDiseaseChatbot.chat"):
+            try:
+                messages, params = self._prepare_chat(
+                    user_message, temperature, max_tokens
+                )
+                
+                reserved = self.scheduler.acquire(
+                    self._estimate_tokens(params), PRIORITY_INTERACTIVE
+                )
+                
+                # Make API request (retried on transient errors)
+                start = time.perf_counter()
+                completion = self.caller.call(
+                    self.client.chat.completions.create,
+                    messages=messages,
+                    **params
+                )
+                observe_completion(
+                    "chat", completion, time.perf_counter() - start
+                )
+                
+                return self._record_reply(completion, reserved)
+                
+            except Exception as e:
+                observe_error("chat", e)
+                logger.error(f"Lỗi khi chat: {str(e)}")
+                raise
+    
+    def _prepare_chat(
+        self,
+        user_message: str,
+        temperature: Optional[float],
+        max_tokens: Optional[int]
+    ) -> Tuple[List[Dict[str, str]], Dict]:
+        """
+        Validate the user message, add it to history and build the request.
+        
+        Args:
+            user_message (str): The user's message/question
+            temperature (Optional[float]): Temperature for response generation
+            max_tokens (Optional[int]): Maximum tokens for the response
+        
+        Returns:
+            Tuple[List[Dict[str, str]], Dict]: Messages for the API and the
+                                               remaining request parameters
+        
+        Raises:
+            ValueError: If user_message is empty
+        """
+        if not user_message or not user_message.strip():
+            raise ValueError("Tin nhắn không thể để trống")
+        
+        logger.info(f"Nhận tin nhắn từ người dùng: {user_message[:50]}...")
+        
+        # Add user message to history
+        self.chat_history.append(ChatMessage(
+            role="user",
+            content=user_message
+        ))
+        self.memory.add("user", user_message)
+        
+        # Prepare messages for API: system prompt, summary of older turns
+        # and the most recent turns that fit the token budget
+        messages = self.memory.build_messages(self._create_system_prompt())
+        logger.info(f"Chat memory: {self.memory.last_turn}")
+        
+        # Set parameters
+        params = {
+            "model": self.MODEL_NAME,
+            "temperature": temperature or self.DEFAULT_TEMPERATURE,
+            "max_tokens": max_tokens or self.DEFAULT_MAX_TOKENS,
+            "top_p": 1,
+            "stream": False,
+            "stop": None,
+        }
+        return messages, params
+    
+    def chat_stream(
+        self,
+        user_message: str,
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None
+    ) -> Iterator[str]:
+        """
+        Send a message to the chatbot and yield the response as it is
+        generated.
+        
+        The complete response is added to the chat history once the stream
+        finishes.
+        
+        Args:
+            user_message (str): The user's message/question
+            temperature (Optional[float]): Temperature for response generation
+            max_tokens (Optional[int]): Maximum tokens for the response
+        
+        Yields:
+            str: Successive pieces of the chatbot's response
+        
+        Raises:
+            ValueError: If user_message is empty
+            Exception: If the API call fails
+        
+        Example:
+            >>> for piece in chatbot.chat_stream("Cách chữa bệnh phấn trắng?"):
+            ...     print(piece, end="", flush=True)
+        """
         try:
-            if not user_message or not user_message.strip():
-                raise ValueError("Tin nhắn không thể để trống")
-            
-            logger.info(f"Nhận tin nhắn từ người dùng: {user_message[:50]}...")
-            
-            # Add user message to history
-            self.chat_history.append(ChatMessage(
-                role="user",
-                content=user_message
-            ))
-            
-            # Prepare messages for API
-            messages = [
-                {
-                    "role": "system",
-                    "content": self._create_system_prompt()
-                }
-            ]
-            
-            # Add chat history
-            for msg in self.chat_history:
-                messages.append({
-                    "role": msg.role,
-                    "content": msg.content
-                })
-            
-            # Set parameters
-            temperature = temperature or self.DEFAULT_TEMPERATURE
-            max_tokens = max_tokens or self.DEFAULT_MAX_TOKENS
+            messages, params = self._prepare_chat(
+                user_message, temperature, max_tokens
+            )
+            params["stream"] = True
+            reserved = self.scheduler.acquire(
+                self._estimate_tokens(params), PRIORITY_INTERACTIVE
+            )
             
-            # Make API request
-            completion = self.client.chat.completions.create(
-                model=self.MODEL_NAME,
+            # Make streaming API request (retried until the stream opens)
+            start = time.perf_counter()
+            stream = self.caller.call(
+                self.client.chat.completions.create,
                 messages=messages,
-                temperature=temperature,
-                max_tokens=max_tokens,
-                top_p=1,
-                stream=False,
-                stop=None,
+                **params
             )
+            observe_completion("chat_stream", None, time.perf_counter() - start)
             
-            # Extract response
-            assistant_message = completion.choices[0].message.content
+            pieces = []
+            for chunk in stream:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    pieces.append(delta)
+                    yield delta
             
-            # Add assistant response to history
-            self.chat_history.append(ChatMessage(
-                role="assistant",
-                content=assistant_message
-            ))
-            
-            logger.info("Chatbot đã trả lời thành công")
-            return assistant_message
+            self._settle_stream(reserved, "".join(pieces))
             
         except Exception as e:
+            observe_error("chat", e)
             logger.error(f"Lỗi khi chat: {str(e)}")
             raise
     
+    def _estimate_tokens(self, params: Dict) -> int:
+        """Estimate the tokens a request reserves: prompt plus max reply."""
+        return self.memory.last_turn["prompt_tokens"] + params["max_tokens"]
+    
+    def _record_reply(self, completion, reserved: int) -> str:
+        """
+        Extract the assistant reply from a completion and add it to history.
+        
+        Args:
+            completion: Chat completion returned by the API
+            reserved (int): Tokens reserved from the scheduler
+        
+        Returns:
+            str: The chatbot's response
+        """
+        if completion.usage is not None:
+            self.memory.record_usage(completion.usage.prompt_tokens)
+            self.scheduler.settle(reserved, completion.usage.total_tokens)
+        return self._add_reply(completion.choices[0].message.content)
+    
+    def _settle_stream(self, reserved: int, reply: str) -> str:
+        """Add a streamed reply to history and release unused tokens."""
+        used = self.memory.last_turn["prompt_tokens"] + count_tokens(reply)
+        self.scheduler.settle(reserved, used)
+        return self._add_reply(reply)
+    
+    def _add_reply(self, assistant_message: str) -> str:
+        """
+        Add an assistant reply to the chat history.
+        
+        Args:
+            assistant_message (str): The chatbot's response
+        
+        Returns:
+            str: The same response
+        """
+        # Add assistant response to history
+        self.chat_history.append(ChatMessage(
+            role="assistant",
+            content=assistant_message
+        ))
+        self.memory.add("assistant", assistant_message)
+        
+        logger.info("Chatbot đã trả lời thành công")
+        return assistant_message
+    
     def clear_history(self):
         """
         Clear the conversation history.
@@ -268,6 +398,7 @@ VÍ DỤ CÂU HỎI NGƯỜI DÙNG CÓ THỂ HỎI:
         any context from previous messages.
         """
         self.chat_history = []
+        self.memory.clear()
         logger.info("Đã xóa lịch sử chat")
     
     def set_disease_context(self, disease_analysis: Dict):
@@ -287,6 +418,7 @@ VÍ DỤ CÂU HỎI NGƯỜI DÙNG CÓ THỂ HỎI:
             >>> response = chatbot.chat("Giải thích về bệnh này?")
         """
         self.disease_context = disease_analysis
+        self._system_prompt = None
         logger.info("Đã thiết lập context phân tích bệnh cho chatbot")
     
     def clear_disease_context(self):
@@ -297,6 +429,7 @@ VÍ DỤ CÂU HỎI NGƯỜI DÙNG CÓ THỂ HỎI:
         chatbot to general consultation mode.
         """
         self.disease_context = None
+        self._system_prompt = None
         logger.info("Đã xóa context phân tích bệnh")
     
     def get_disease_context(self) -> Optional[Dict]:
@@ -308,6 +441,47 @@ VÍ DỤ CÂU HỎI NGƯỜI DÙNG CÓ THỂ HỎI:
         """
         return self.disease_context
     
+    def export_state(self, max_history: Optional[int] = None) -> Dict:
+        """
+        Export the conversation state as JSON-serializable data.
+        
+        Used to keep one conversation per API session in a session store.
+        
+        Args:
+            max_history (Optional[int]): Keep only the last messages of the
+                                         full transcript (the window sent to
+                                         the model is kept in full)
+        
+        Returns:
+            Dict: State accepted by load_state()
+        """
+        history = self.get_history()
+        if max_history is not None:
+            history = history[-max_history:] if max_history > 0 else []
+        return {
+            "history": history,
+            "disease_context": self.disease_context,
+            "memory": self.memory.export_state(),
+        }
+    
+    def load_state(self, state: Dict):
+        """
+        Restore a conversation exported with export_state().
+        
+        Args:
+            state (Dict): Exported conversation state
+        """
+        self.chat_history = [
+            ChatMessage(role=msg["role"], content=msg["content"])
+            for msg in state.get("history", [])
+        ]
+        self.disease_context = state.get("disease_context")
+        self._system_prompt = None
+        if state.get("memory"):
+            self.memory.load_state(state["memory"])
+        else:
+            self.memory.clear()
+    
     def get_history(self) -> List[Dict[str, str]]:
         """
         Get the conversation history.
@@ -321,6 +495,109 @@ VÍ DỤ CÂU HỎI NGƯỜI DÙNG CÓ THỂ HỎI:
         ]
 
 
+
+class AsyncPlantDiseaseChatbot(PlantDiseaseChatbot):
+    """
+    Async variant of PlantDiseaseChatbot for the FastAPI service.
+    
+    Uses the AsyncGroq client on the shared HTTP connection pool so a slow
+    model call does not block the event loop.
+    
+    Example:
+        >>> chatbot = AsyncPlantDiseaseChatbot()
+        >>> response = await chatbot.chat("Bệnh đốm lá nâu là gì?")
+    """
+    
+    def _create_client(self) -> AsyncGroq:
+        """Create an AsyncGroq client on the shared connection pool."""
+        return create_async_groq_client(self.api_key)
+    
+    async def chat(
+        self,
+        user_message: str,
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None
+    ) -> str:
+        """
+        Send a message to the chatbot and await the response.
+        
+        Arguments, return value and exceptions are the same as
+        PlantDiseaseChatbot.chat.
+        """
+        with tracer.start_as_current_span("PlantDiseaseChatbot.chat"):
+            try:
+                messages, params = self._prepare_chat(
+                    user_message, temperature, max_tokens
+                )
+                
+                reserved = await self.scheduler.acquire_async(
+                    self._estimate_tokens(params), PRIORITY_INTERACTIVE
+                )
+                
+                # Make API request (retried on transient errors)
+                start = time.perf_counter()
+                completion = await self.caller.acall(
+                    self.client.chat.completions.create,
+                    messages=messages,
+                    **params
+                )
+                observe_completion(
+                    "chat", completion, time.perf_counter() - start
+                )
+                
+                return self._record_reply(completion, reserved)
+                
+            except Exception as e:
+                observe_error("chat", e)
+                logger.error(f"Lỗi khi chat: {str(e)}")
+                raise
+    
+    async def chat_stream(
+        self,
+        user_message: str,
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None
+    ) -> AsyncIterator[str]:
+        """
+        Send a message to the chatbot and yield the response as it is
+        generated.
+        
+        Arguments and exceptions are the same as
+        PlantDiseaseChatbot.chat_stream.
+        """
+        try:
+            messages, params = self._prepare_chat(
+                user_message, temperature, max_tokens
+            )
+            params["stream"] = True
+            reserved = await self.scheduler.acquire_async(
+                self._estimate_tokens(params), PRIORITY_INTERACTIVE
+            )
+            
+            # Make streaming API request (retried until the stream opens)
+            start = time.perf_counter()
+            stream = await self.caller.acall(
+                self.client.chat.completions.create,
+                messages=messages,
+                **params
+            )
+            observe_completion("chat_stream", None, time.perf_counter() - start)
+            
+            pieces = []
+            async for chunk in stream:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    pieces.append(delta)
+                    yield delta
+            
+            self._settle_stream(reserved, "".join(pieces))
+            
+        except Exception as e:
+            observe_error("chat", e)
+            logger.error(f"Lỗi khi chat: {str(e)}")
+            raise
+
+
 def main():
     """Main execution function for testing the chatbot."""
     try:
@@ -342,8 +619,10 @@ def main():
                 continue
             
             try:
-                response = chatbot.chat(user_input)
-                print(f"\n🌿 Chuyên gia: {response}\n")
+                print("\n🌿 Chuyên gia: ", end="", flush=True)
+                for piece in chatbot.chat_stream(user_input):
+                    print(piece, end="", flush=True)
+                print("\n")
             except Exception as e:
                 print(f"❌ Lỗi: {str(e)}\n")
     
@@ -0,0 +1,255 @@
+"""
+Shared Groq API Clients
+=======================
+
+This module owns the HTTP connection pools used to talk to the Groq API so
+that the detector and the chatbot reuse keep-alive connections instead of
+opening a new pool (and TLS handshake) per object.
+
+The SDK's built-in retries are disabled; retries, deadlines and circuit
+breaking are done once, in resilience.py.
+
+Every request through the shared pools is traced, so connection_stats can
+report how many requests reused an open connection and roughly how much
+connection setup time that saved. If a cassette is configured (cassette.py,
+PLANT_CASSETTE), responses are recorded or replayed below the pools.
+
+Configuration (environment variables):
+    PLANT_HTTP_MAX_CONNECTIONS: Max open connections per pool (default: 100)
+    PLANT_HTTP_MAX_KEEPALIVE: Max idle keep-alive connections (default: 20)
+    PLANT_HTTP_KEEPALIVE_EXPIRY: Seconds an idle connection is kept open
+                                 (default: 60)
+"""
+
+import logging
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+import httpx
+from groq import AsyncGroq, DefaultAsyncHttpxClient, DefaultHttpxClient, Groq
+
+from cassette import (
+    AsyncCassetteTransport, CassetteTransport, cassette_mode, cassette_strict,
+    get_default_cassette
+)
+
+
+logger = logging.getLogger(__name__)
+
+_http_client: Optional[httpx.Client] = None
+_async_http_client: Optional[httpx.AsyncClient] = None
+_http_client_lock = threading.Lock()
+
+
+class ConnectionStats:
+    """
+    Thread-safe counters for connection reuse in the shared pools.
+
+    Attributes:
+        requests (int): Requests sent through the shared pools
+        new_connections (int): Requests that had to open a new connection
+        connect_seconds (float): Total time spent on TCP connect and TLS
+                                 handshakes for new connections
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.new_connections = 0
+        self.connect_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def record_request(self) -> None:
+        with self._lock:
+            self.requests += 1
+
+    def record_connection(self, seconds: float) -> None:
+        with self._lock:
+            self.new_connections += 1
+            self.connect_seconds += seconds
+
+    def snapshot(self) -> Dict:
+        """
+        Return the counters and the estimated setup time saved by reuse.
+
+        Returns:
+            Dict: requests, new/reused connection counts, reuse rate, mean
+                  connection setup time and estimated seconds saved
+        """
+        with self._lock:
+            reused = max(0, self.requests - self.new_connections)
+            mean_connect = (
+                self.connect_seconds / self.new_connections
+                if self.new_connections else 0.0
+            )
+            return {
+                "requests": self.requests,
+                "new_connections": self.new_connections,
+                "reused_connections": reused,
+                "reuse_rate": reused / self.requests if self.requests else 0.0,
+                "mean_connect_ms": round(mean_connect * 1e3, 2),
+                "estimated_seconds_saved": round(reused * mean_connect, 3),
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self.requests = 0
+            self.new_connections = 0
+            self.connect_seconds = 0.0
+
+
+connection_stats = ConnectionStats()
+
+
+class _ConnectionTracer:
+    """httpcore trace callback measuring connection setup of one request."""
+
+    def __init__(self):
+        self.started: Optional[float] = None
+
+    def __call__(self, event: str, info: Dict) -> None:
+        if event == "connection.connect_tcp.started":
+            self.started = time.perf_counter()
+        elif event in ("connection.connect_tcp.failed",
+                       "connection.start_tls.failed"):
+            self.started = None
+        elif self.started is not None and event in (
+            "http11.send_request_headers.started",
+            "http2.send_request_headers.started",
+        ):
+            # Headers go out right after TCP connect (and TLS, if any)
+            connection_stats.record_connection(
+                time.perf_counter() - self.started
+            )
+            self.started = None
+
+
+class _AsyncConnectionTracer(_ConnectionTracer):
+    """Async variant; httpcore awaits trace callbacks of async clients."""
+
+    async def __call__(self, event: str, info: Dict) -> None:
+        _ConnectionTracer.__call__(self, event, info)
+
+
+def _trace_request(request: httpx.Request) -> None:
+    connection_stats.record_request()
+    request.extensions["trace"] = _ConnectionTracer()
+
+
+async def _atrace_request(request: httpx.Request) -> None:
+    connection_stats.record_request()
+    request.extensions["trace"] = _AsyncConnectionTracer()
+
+
+def connection_limits() -> httpx.Limits:
+    """Return connection pool limits configured from environment."""
+    return httpx.Limits(
+        max_connections=int(
+            os.environ.get("PLANT_HTTP_MAX_CONNECTIONS", 100)
+        ),
+        max_keepalive_connections=int(
+            os.environ.get("PLANT_HTTP_MAX_KEEPALIVE", 20)
+        ),
+        keepalive_expiry=float(
+            os.environ.get("PLANT_HTTP_KEEPALIVE_EXPIRY", 60)
+        ),
+    )
+
+
+def _transport() -> Optional[httpx.BaseTransport]:
+    """Connection pool, behind the cassette if one is configured."""
+    cassette = get_default_cassette()
+    if cassette is None:
+        return None
+    return CassetteTransport(
+        httpx.HTTPTransport(limits=connection_limits()), cassette,
+        cassette_mode(), cassette_strict()
+    )
+
+
+def _async_transport() -> Optional[httpx.AsyncBaseTransport]:
+    cassette = get_default_cassette()
+    if cassette is None:
+        return None
+    return AsyncCassetteTransport(
+        httpx.AsyncHTTPTransport(limits=connection_limits()), cassette,
+        cassette_mode(), cassette_strict()
+    )
+
+
+def get_http_client() -> httpx.Client:
+    """
+    Get the process-wide HTTP client shared by all sync Groq clients.
+
+    Returns:
+        httpx.Client: Shared client with a keep-alive connection pool
+    """
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        with _http_client_lock:
+            if _http_client is None or _http_client.is_closed:
+                _http_client = DefaultHttpxClient(
+                    limits=connection_limits(),
+                    transport=_transport(),
+                    event_hooks={"request": [_trace_request]}
+                )
+                logger.info("Khởi tạo HTTP client dùng chung")
+    return _http_client
+
+
+def get_async_http_client() -> httpx.AsyncClient:
+    """
+    Get the process-wide async HTTP client shared by all async Groq clients.
+
+    Returns:
+        httpx.AsyncClient: Shared client with a keep-alive connection pool
+    """
+    global _async_http_client
+    if _async_http_client is None or _async_http_client.is_closed:
+        with _http_client_lock:
+            if _async_http_client is None or _async_http_client.is_closed:
+                _async_http_client = DefaultAsyncHttpxClient(
+                    limits=connection_limits(),
+                    transport=_async_transport(),
+                    event_hooks={"request": [_atrace_request]}
+                )
+                logger.info("Khởi tạo HTTP client bất đồng bộ dùng chung")
+    return _async_http_client
+
+
+def create_groq_client(api_key: str) -> Groq:
+    """
+    Create a Groq client on top of the shared connection pool.
+
+    Args:
+        api_key (str): Groq API key
+
+    Returns:
+        Groq: Client sharing connections with other clients
+    """
+    return Groq(api_key=api_key, http_client=get_http_client(), max_retries=0)
+
+
+def create_async_groq_client(api_key: str) -> AsyncGroq:
+    """
+    Create an AsyncGroq client on top of the shared connection pool.
+
+    Args:
+        api_key (str): Groq API key
+
+    Returns:
+        AsyncGroq: Async client sharing connections with other clients
+    """
+    return AsyncGroq(
+        api_key=api_key, http_client=get_async_http_client(), max_retries=0
+    )
+
+
+async def close_async_http_client() -> None:
+    """Close the shared async HTTP client and its connections."""
+    global _async_http_client
+    client, _async_http_client = _async_http_client, None
+    if client is not None and not client.is_closed:
+        await client.aclose()
+        logger.info("Đã đóng HTTP client bất đồng bộ dùng chung")
@@ -1,13 +1,43 @@
 import os
+import asyncio
+import copy
+import io
 import json
 import logging
 import sys
-from typing import Dict, Optional, List
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import AsyncIterator, Dict, Iterator, Optional, List, Tuple, Union
 from dataclasses import dataclass
 from datetime import datetime
 
-from groq import Groq
+from groq import AsyncGroq, Groq
+from groq.types.chat import ChatCompletion
 from dotenv import load_dotenv
+from PIL import Image
+
+from backends import AnalysisBackend, get_default_backend
+from budget import TokenBudget, answer_outcome, get_default_token_budget
+from cache import ResultCache, get_default_cache, make_cache_key
+from clients import create_async_groq_client, create_groq_client
+from jsonparse import parse_json_object
+from payload import IMAGE_URL_PLACEHOLDER, ImagePayload, encode_request_body
+from phash import NearDuplicateIndex, dhash, get_default_index
+from prompts import (
+    IMAGE_MAX_TILES, IMAGE_TILE_TOKENS, estimate_image_tokens, get_prompt
+)
+from ratelimit import (
+    PRIORITY_BATCH, PRIORITY_INTERACTIVE, RequestPacer, RequestScheduler,
+    get_default_scheduler
+)
+from resilience import ResilientCaller, get_default_caller
+from singleflight import SingleFlight, get_default_flights, make_flight_key
+from telemetry import (
+    CACHE_LOOKUPS, PARSE_SECONDS, REQUEST_ENCODE_SECONDS, observe_completion,
+    observe_error, tracer
+)
+from triage import ImageTriage, get_default_triage
 
 
 # Định cấu hình ghi nhật ký
@@ -17,6 +47,13 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+CHAT_COMPLETIONS_PATH = "/openai/v1/chat/completions"
+
+# Định dạng đầu ra yêu cầu từ mô hình: "json_object" (JSON mode),
+# "json_schema" (structured output theo ANALYSIS_SCHEMA) hoặc "none"
+RESPONSE_FORMATS = ("json_object", "json_schema", "none")
+DEFAULT_RESPONSE_FORMAT = os.environ.get("PLANT_RESPONSE_FORMAT", "json_object")
+
 
 @dataclass
 class DiseaseAnalysisResult:
@@ -38,6 +75,9 @@ class DiseaseAnalysisResult:
         symptoms (List[str]): Danh sách các triệu chứng quan sát được
         possible_causes (List[str]): Danh sách nguyên nhân có thể
         treatment (List[str]): Danh sách khuyến nghị điều trị
+        prompt_version (Optional[str]): Phiên bản lời nhắc đã tạo kết quả
+        triage (Optional[str]): Lý do ảnh được trả lời ở bước sàng lọc cục
+                                bộ mà không gọi mô hình, None nếu không
     """
     disease_detected:  bool
     disease_name: Optional[str]
@@ -47,6 +87,90 @@ class DiseaseAnalysisResult:
     symptoms:  List[str]
     possible_causes: List[str]
     treatment: List[str]
+    prompt_version: Optional[str] = None
+    triage: Optional[str] = None
+
+
+# JSON Schema of the fields the model fills in (structured output mode)
+ANALYSIS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "disease_detected": {"type": "boolean"},
+        "disease_name": {"type": ["string", "null"]},
+        "disease_type": {"type": "string"},
+        "severity": {"type": "string"},
+        "confidence": {"type": "number"},
+        "symptoms": {"type": "array", "items": {"type": "string"}},
+        "possible_causes": {"type": "array", "items": {"type": "string"}},
+        "treatment": {"type": "array", "items": {"type": "string"}},
+    },
+    "required": [
+        "disease_detected", "disease_name", "disease_type", "severity",
+        "confidence", "symptoms", "possible_causes", "treatment",
+    ],
+    "additionalProperties": False,
+}
+
+
+def response_format_param(response_format: str) -> Optional[Dict]:
+    """
+    Tham số response_format của API cho định dạng đầu ra đã chọn.
+
+    Args:
+        response_format (str): "json_object", "json_schema" hoặc "none"
+
+    Returns:
+        Optional[Dict]: Tham số response_format, None nếu là "none"
+
+    Raises:
+        ValueError: Nếu định dạng không được hỗ trợ
+    """
+    if response_format not in RESPONSE_FORMATS:
+        raise ValueError(
+            f"response_format phải là một trong {', '.join(RESPONSE_FORMATS)}"
+        )
+    if response_format == "json_schema":
+        return {
+            "type": "json_schema",
+            "json_schema": {
+                "name": "disease_analysis", "schema": ANALYSIS_SCHEMA,
+            },
+        }
+    if response_format == "json_object":
+        return {"type": "json_object"}
+    return None
+
+
+@dataclass
+class AnalysisRequest:
+    """
+    Yêu cầu phân tích đã được chuẩn bị, dùng chung cho bản đồng bộ và bất
+    đồng bộ của bộ phát hiện.
+
+    Thuộc tính:
+        params (Dict): Tham số JSON của chat completion, với
+                       IMAGE_URL_PLACEHOLDER thay cho data URL của ảnh
+        payload (ImagePayload): Ảnh đã giải mã; chỉ được mã hóa base64 một
+                                lần, thẳng vào thân yêu cầu HTTP
+        cache_key (Optional[str]): Khóa bộ nhớ đệm, None nếu tắt cache
+        image_hash (Optional[int]): Perceptual hash của ảnh, None nếu tắt
+                                    tra cứu ảnh gần trùng lặp
+        cached_result (Optional[Dict]): Kết quả có sẵn, không cần gọi API
+        estimated_tokens (int): Số token ước tính (lời nhắc, ảnh và phản
+                                hồi tối đa) để giữ chỗ trong hạn mức TPM
+        flight_key (Optional[str]): Khóa gộp yêu cầu giống hệt đang chạy,
+                                    None nếu tắt gộp yêu cầu
+        completion_limit (int): Số token tối đa của phản hồi, kể cả phần
+                                mô hình viết tiếp khi bị cắt ngắn
+    """
+    params: Dict
+    payload: ImagePayload
+    cache_key: Optional[str] = None
+    image_hash: Optional[int] = None
+    cached_result: Optional[Dict] = None
+    estimated_tokens: int = 0
+    flight_key: Optional[str] = None
+    completion_limit: int = 0
 
 
 class PlantDiseaseDetector: 
@@ -60,9 +184,9 @@ class PlantDiseaseDetector:
     lên chứa phần cây thực tế và từ chối hình ảnh con người, động vật hoặc các 
     đối tượng không phù hợp.
 
-    Hệ thống hỗ trợ hình ảnh được mã hóa base64 và trả về kết quả JSON có cấu
-    trúc chứa thông tin bệnh, điểm tin cậy, triệu chứng, nguyên nhân và gợi ý
-    điều trị. 
+    Hệ thống hỗ trợ hình ảnh dạng bytes (ImagePayload) hoặc được mã hóa
+    base64 và trả về kết quả JSON có cấu trúc chứa thông tin bệnh, điểm tin
+    cậy, triệu chứng, nguyên nhân và gợi ý điều trị. 
 
     Tính năng:
         - Xác thực hình ảnh (đảm bảo hình ảnh được tải lên chứa lá, rễ, hoặc thân cây)
@@ -80,8 +204,16 @@ class PlantDiseaseDetector:
         MODEL_NAME (str): Mô hình AI được sử dụng để phân tích
         DEFAULT_TEMPERATURE (float): Nhiệt độ mặc định để tạo phản hồi
         DEFAULT_MAX_TOKENS (int): Số lượng token tối đa mặc định cho phản hồi
+        MAX_COMPLETION_TOKENS (int): Số token tối đa của một phản hồi bị cắt
+                                     ngắn sau khi mô hình viết tiếp
         api_key (str): Khóa API Groq để xác thực
         client (Groq): Thể hiện của trình khách API Groq
+        analysis_prompt (Prompt): Lời nhắc phân tích đã dựng sẵn; phiên bản
+                                  của nó là một phần của khóa cache và được
+                                  trả về trong kết quả (prompt_version)
+        cache (Optional[ResultCache]): Bộ nhớ đệm kết quả phân tích
+        near_duplicates (Optional[NearDuplicateIndex]): Chỉ mục ảnh gần
+                                                        trùng lặp
 
     Ví dụ:
         >>> detector = PlantDiseaseDetector()
@@ -97,8 +229,23 @@ class PlantDiseaseDetector:
     MODEL_NAME = "meta-llama/llama-4-scout-17b-16e-instruct"
     DEFAULT_TEMPERATURE = 0.3
     DEFAULT_MAX_TOKENS = 1024
+    MAX_COMPLETION_TOKENS = 2048
 
-    def __init__(self, api_key: Optional[str] = None):
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        cache: Optional[ResultCache] = None,
+        near_duplicates: Optional[NearDuplicateIndex] = None,
+        near_duplicate_distance: int = 4,
+        prompt_variant: Optional[str] = None,
+        caller: Optional[ResilientCaller] = None,
+        scheduler: Optional[RequestScheduler] = None,
+        flights: Optional[SingleFlight] = None,
+        backend: Optional[AnalysisBackend] = None,
+        triage: Optional[ImageTriage] = None,
+        response_format: Optional[str] = None,
+        token_budget: Optional[TokenBudget] = None
+    ):
         """
         Khởi tạo Bộ phát hiện bệnh lá với thông tin xác thực API.
 
@@ -109,6 +256,37 @@ class PlantDiseaseDetector:
         Args:
             api_key (Optional[str]): Khóa API Groq. Nếu là None, sẽ cố gắng
                                      tải từ biến môi trường GROQ_API_KEY. 
+            cache (Optional[ResultCache]): Bộ nhớ đệm kết quả. Nếu là None,
+                                           mọi yêu cầu đều gọi API.
+            near_duplicates (Optional[NearDuplicateIndex]): Chỉ mục perceptual
+                hash để tái sử dụng kết quả của ảnh gần trùng lặp (đã nén lại,
+                đổi kích thước hoặc cắt nhẹ).
+            near_duplicate_distance (int): Khoảng cách hamming tối đa để coi
+                                           hai ảnh là gần trùng lặp.
+            prompt_variant (Optional[str]): "full" hoặc "compact". Nếu là
+                None, dùng biến môi trường PLANT_PROMPT_VARIANT.
+            caller (Optional[ResilientCaller]): Lớp thử lại/circuit breaker
+                cho lệnh gọi API. Nếu là None, dùng lớp dùng chung của tiến
+                trình.
+            scheduler (Optional[RequestScheduler]): Bộ điều phối hạn mức
+                RPM/TPM. Nếu là None, dùng bộ điều phối dùng chung với
+                chatbot.
+            flights (Optional[SingleFlight]): Lớp gộp các yêu cầu giống hệt
+                đang chạy thành một lệnh gọi API. Nếu là None, mọi yêu cầu
+                đều gọi API.
+            backend (Optional[AnalysisBackend]): Backend suy luận cục bộ
+                (ví dụ OnnxClassifierBackend) thay cho mô hình Groq. Nếu là
+                None, ảnh được phân tích bằng Groq.
+            triage (Optional[ImageTriage]): Bước sàng lọc cục bộ trả lời
+                ngay ảnh không hợp lệ, quá tối, mờ... thay vì gọi mô hình.
+                Nếu là None, mọi ảnh đều được gửi tới mô hình.
+            response_format (Optional[str]): "json_object" (JSON mode),
+                "json_schema" (structured output theo ANALYSIS_SCHEMA) hoặc
+                "none". Nếu là None, dùng biến môi trường
+                PLANT_RESPONSE_FORMAT (mặc định "json_object").
+            token_budget (Optional[TokenBudget]): Ngân sách max_tokens học
+                từ độ dài các phản hồi trước theo kết quả (bệnh, khỏe mạnh,
+                ảnh không hợp lệ). Nếu là None, luôn dùng DEFAULT_MAX_TOKENS.
 
         Raises:
             ValueError: Nếu không tìm thấy khóa API hợp lệ trong các tham số
@@ -124,8 +302,60 @@ class PlantDiseaseDetector:
         #     raise ValueError(
         #         "GROQ_API_KEY không được tìm thấy trong biến môi trường"
         #     )
-        self.client = Groq(api_key=self.api_key)
-        logger.info("Khởi tạo Bộ phát hiện bệnh lá")
+        self.client = self._create_client()
+        self.cache = cache
+        self.near_duplicates = near_duplicates
+        self.near_duplicate_distance = near_duplicate_distance
+        self.analysis_prompt = get_prompt("analysis", prompt_variant)
+        self.caller = caller if caller is not None else get_default_caller()
+        self.scheduler = (
+            scheduler if scheduler is not None else get_default_scheduler()
+        )
+        self.flights = flights
+        self.backend = backend
+        self.triage = triage
+        self.response_format = response_format_param(
+            response_format or DEFAULT_RESPONSE_FORMAT
+        )
+        self.token_budget = token_budget
+        # Model and version that produced a result, for cache keys and
+        # DiseaseAnalysisResult.prompt_version
+        if backend is not None:
+            self.model_name, self.result_version = (
+                backend.model_name, backend.version
+            )
+            logger.info(
+                f"Khởi tạo Bộ phát hiện bệnh lá (backend {backend.name}, "
+                f"mô hình {backend.model_name} {backend.version})"
+            )
+        else:
+            self.model_name, self.result_version = (
+                self.MODEL_NAME, self.analysis_prompt.version
+            )
+            logger.info(
+                f"Khởi tạo Bộ phát hiện bệnh lá (lời nhắc "
+                f"{self.analysis_prompt.variant} "
+                f"{self.analysis_prompt.version}, "
+                f"~{self.analysis_prompt.tokens} token)"
+            )
+
+    def _create_client(self) -> Groq:
+        """Tạo trình khách Groq trên nhóm kết nối dùng chung."""
+        return create_groq_client(self.api_key)
+
+    def _create_completion(
+        self, content: bytes, timeout: Optional[float] = None
+    ) -> ChatCompletion:
+        """
+        Gửi thân yêu cầu chat completion đã mã hóa sẵn.
+
+        Tương đương client.chat.completions.create nhưng không tuần tự hóa
+        lại tham số (và ảnh base64) thành JSON.
+        """
+        return self.client.post(
+            CHAT_COMPLETIONS_PATH, cast_to=ChatCompletion, content=content,
+            options={"timeout": timeout} if timeout is not None else {}
+        )
 
     def create_analysis_prompt(self) -> str:
         """
@@ -142,461 +372,17 @@ class PlantDiseaseDetector:
         Note:
             Lời nhắc đảm bảo định dạng đầu ra nhất quán trên tất cả các phân tích
             và bao gồm tất cả các lĩnh vực cần thiết để đánh giá bệnh toàn diện.
+            Văn bản được dựng một lần trong prompts.py; phiên bản của nó nằm
+            trong self.analysis_prompt.version.
         """
-        return """BẠN LÀ CHUYÊN GIA BỆNH HỌC THỰC VẬT với kiến thức chuyên sâu về bệnh cây trồng.  Phân tích hình ảnh các bộ phận cây (lá, rễ, thân) và trả về kết quả ở định dạng JSON BẰNG TIẾNG VIỆT.
-
-    ═══════════════════════════════════════════════════════════════
-    BƯỚC 1: XÁC THỰC HÌNH ẢNH
-    ═══════════════════════════════════════════════════════════════
-
-    QUAN TRỌNG: Trước tiên hãy xác định xem hình ảnh này có chứa bộ phận cây/thực vật hay không. 
-
-    HÌNH ẢNH HỢP LỆ: 
-    ✓ Lá cây (đơn lá hoặc lá kép)
-    ✓ Rễ cây (rễ chính, rễ phụ, rễ củ)
-    ✓ Thân cây (thân gỗ, thân thảo, cành, nhánh)
-    ✓ Cành cây có lá
-    ✓ Cây trồng (rau, hoa, cây ăn quả, cây công nghiệp)
-    ✓ Thực vật có triệu chứng bệnh hoặc khỏe mạnh
-
-    HÌNH ẢNH KHÔNG HỢP LỆ:
-    ✗ Con người (toàn thân hoặc bộ phận cơ thể)
-    ✗ Động vật (chó, mèo, chim, côn trùng riêng lẻ...)
-    ✗ Đồ vật (điện thoại, xe cộ, đồ gia dụng...)
-    ✗ Tòa nhà, phong cảnh không có cây
-    ✗ Ảnh mờ hoàn toàn, không nhận diện được
-    ✗ Văn bản, biểu đồ, sơ đồ
-
-    Nếu hình ảnh KHÔNG HỢP LỆ → Trả về định dạng "invalid_image". 
-
-    ═══════════════════════════════════════════════════════════════
-    BƯỚC 2: PHÂN TÍCH CHI TIẾT (Nếu là hình ảnh bộ phận cây hợp lệ)
-    ═══════════════════════════════════════════════════════════════
-
-    Hãy quan sát KỸ LƯỠNG và xác định: 
-
-    1. NHẬN DẠNG BỆNH (disease_name):
-    • Xác định TÊN CỤ THỂ của bệnh dựa trên kiến thức của bạn
-    • Nếu không chắc chắn giữa 2 bệnh → Ghi cả 2 (VD: "Bệnh đốm lá nấm hoặc vi khuẩn")
-    • Nếu khỏe mạnh → null
-    • Ví dụ tên bệnh tốt: 
-        - "Bệnh đốm lá nâu do nấm Cercospora"
-        - "Bệnh phấn trắng"
-        - "Thiếu Nitơ"
-        - "Bệnh đốm lá vi khuẩn"
-
-    2. LOẠI BỆNH (disease_type):
-    • Phân loại chính xác:  "nấm", "vi khuẩn", "vi rút", "sâu bệnh", "thiếu dinh dưỡng", "stress môi trường", "khỏe mạnh", "invalid_image"
-    • Dựa trên ĐẶC ĐIỂM TRIỆU CHỨNG để phân loại
-
-    3. MỨC ĐỘ NGHIÊM TRỌNG (severity):
-    • "nhẹ": < 20% diện tích lá bị ảnh hưởng, cây vẫn phát triển tốt
-    • "trung bình": 20-50% lá bị ảnh hưởng, ảnh hưởng đến sinh trưởng
-    • "nặng": > 50% lá bị ảnh hưởng, cây có nguy cơ chết
-    • "none":  Lá khỏe mạnh hoặc hình ảnh không hợp lệ
-
-    4. TRIỆU CHỨNG (symptoms):
-    • MÔ TẢ CHI TIẾT những gì BẠN NHÌN THẤY trên bộ phận cây (lá, rễ, thân):
-        - Màu sắc: vàng, nâu, đen, trắng, đỏ... 
-        - Hình dạng bất thường: đốm, vệt, viền, vòng tròn, nứt, thối... 
-        - Kết cấu: lồi, lõm, khô, ướt, bột, nhầy, mục nát... 
-        - Vị trí: 
-            * Trên lá: mép lá, đầu lá, giữa lá, gân lá, mặt trên/dưới
-            * Trên rễ: rễ chính, rễ phụ, đầu rễ, vỏ rễ
-            * Trên thân: vỏ thân, lõi, mặt cắt, mắt chồi
-        - Kích thước: nhỏ li ti, lớn, lan rộng... 
-    • CÀNG CHI TIẾT CÀNG TỐT (ít nhất 3-5 triệu chứng cụ thể)
-    • Ví dụ triệu chứng TỐT:
-        ✓ "Đốm nâu hình tròn đường kính 3-5mm, viền vàng rõ ràng trên lá"
-        ✓ "Lớp bột trắng phủ đều trên mặt trên lá, dày nhất ở lá non"
-        ✓ "Lá vàng từ mép vào trong, phần vàng khô giòn và cong lên"
-        ✓ "Rễ có màu nâu đen, mềm nhũn, dễ bong vỏ, mùi hôi thối"
-        ✓ "Thân cây xuất hiện vết nứt dọc, tiết dịch màu nâu sẫm"
-        ✓ "Vỏ thân bong tróc, lộ lõi màu nâu, có vệt đen lan rộng"
-
-    5. NGUYÊN NHÂN (possible_causes):
-    • Liệt kê TẤT CẢ nguyên nhân có thể dựa trên triệu chứng: 
-        - Tác nhân gây bệnh (nấm, vi khuẩn, vi rút) - GHI TÊN KHOA HỌC nếu biết
-        - Côn trùng gây hại (rệp, nhện, bọ trĩ...)
-        - Điều kiện môi trường (nhiệt độ, độ ẩm, ánh sáng...)
-        - Quản lý canh tác (tưới nước, bón phân, thoát nước...)
-        - Thiếu hụt dinh dưỡng cụ thể (N, P, K, Fe, Mg...)
-    • CÀNG CỤ THỂ CÀNG TỐT (ít nhất 3-5 nguyên nhân)
-
-    6. PHƯƠNG PHÁP ĐIỀU TRỊ (treatment):
-    • Đưa ra các biện pháp THỰC TẾ, KHẢ THI, THEO THỨ TỰ ƯU TIÊN: 
-        A.  Biện pháp CẤP BÁCH (làm ngay)
-        B. Biện pháp HÓA HỌC (nếu cần) - Tên thuốc CỤ THỂ, liều lượng
-        C. Biện pháp SINH HỌC/HỮU CƠ
-        D. Biện pháp DÀI HẠN (phòng ngừa)
-    • CÀNG CỤ THỂ, CHI TIẾT CÀNG TỐT (ít nhất 4-6 bước điều trị)
-
-    ═══════════════════════════════════════════════════════════════
-    HỆ THỐNG ĐÁNH GIÁ ĐIỂM TIN CẬY (CONFIDENCE) - QUY TẮC CHI TIẾT
-    ═══════════════════════════════════════════════════════════════
-
-    CONFIDENCE được tính theo CÔNG THỨC 3 YẾU TỐ: 
-    Confidence = Điểm_Chất_Lượng_Ảnh + Điểm_Triệu_Chứng + Điểm_Chẩn_Đoán
-
-    ───────────────────────────────────────────────────────────────
-    YẾU TỐ 1: CHẤT LƯỢNG HÌNH ẢNH (0-30 điểm)
-    ───────────────────────────────────────────────────────────────
-
-    QUY TẮC ĐÁNH GIÁ: 
-
-    [28-30 điểm] - CHẤT LƯỢNG XUẤT SẮC:
-    ✓ Ảnh cận cảnh rất rõ nét, có thể zoom in thấy chi tiết
-    ✓ Ánh sáng tự nhiên đầy đủ, không quá sáng/tối
-    ✓ Bộ phận cây (lá/rễ/thân) chiếm >70% khung hình
-    ✓ Focus chuẩn, không bị mờ/nhòe
-    ✓ Nhiều góc độ hoặc nhiều mẫu bộ phận cây
-    ✓ Độ phân giải cao (>1080p)
-
-    [22-27 điểm] - CHẤT LƯỢNG TỐT:
-    ✓ Ảnh khá rõ, có thể nhìn thấy triệu chứng
-    ✓ Ánh sáng ổn, một số vùng hơi tối/sáng
-    ✓ Bộ phận cây (lá/rễ/thân) chiếm 50-70% khung hình
-    ✓ Focus tốt ở phần quan trọng
-    ✓ 1-2 góc độ
-    ✓ Độ phân giải trung bình (720p-1080p)
-
-    [14-21 điểm] - CHẤT LƯỢNG TRUNG BÌNH:
-    ✓ Ảnh bình thường, nhìn thấy được triệu chứng chính
-    ✓ Ánh sáng chấp nhận được
-    ✓ Bộ phận cây (lá/rễ/thân) chiếm 30-50% khung hình
-    ✓ Focus ổn nhưng không sắc nét
-    ✓ 1 góc độ duy nhất
-    ✓ Độ phân giải trung bình (480p-720p)
-
-    [8-13 điểm] - CHẤT LƯỢNG YẾU: 
-    ✓ Ảnh hơi mờ, khó nhìn chi tiết
-    ✓ Ánh sáng kém (quá tối hoặc quá sáng)
-    ✓ Bộ phận cây (lá/rễ/thân) chiếm <30% khung hình hoặc quá xa
-    ✓ Focus không chuẩn, mờ nhiều chỗ
-    ✓ Độ phân giải thấp (<480p)
-
-    [1-7 điểm] - CHẤT LƯỢNG RẤT KÉM:
-    ✓ Ảnh rất mờ, khó nhận diện
-    ✓ Ánh sáng rất kém (tối đen hoặc cháy sáng)
-    ✓ Bộ phận cây (lá/rễ/thân) rất nhỏ trong khung hình
-    ✓ Bị rung/nhòe nặng
-    ✓ Độ phân giải rất thấp
-
-    ───────────────────────────────────────────────────────────────
-    YẾU TỐ 2: ĐỘ RÕ RÀNG CỦA TRIỆU CHỨNG (0-40 điểm)
-    ───────────────────────────────────────────────────────────────
-
-    QUY TẮC ĐÁNH GIÁ: 
-
-    [36-40 điểm] - TRIỆU CHỨNG ĐIỂN HÌNH, RÕ RÀNG:
-    ✓ Triệu chứng rất đặc trưng, dễ nhận biết ngay
-    ✓ Có ≥5 triệu chứng rõ ràng cùng xuất hiện
-    ✓ Triệu chứng phát triển đầy đủ các giai đoạn
-    ✓ Hình dạng, màu sắc, vị trí hoàn toàn điển hình
-    ✓ Không có triệu chứng nhiễu/lẫn lộn
-
-    VÍ DỤ:  Bệnh phấn trắng trên lá - lớp bột trắng dày đặc, rõ ràng
-
-    [28-35 điểm] - TRIỆU CHỨNG RÕ RÀNG: 
-    ✓ Triệu chứng khá đặc trưng, có thể nhận diện
-    ✓ Có 3-4 triệu chứng rõ ràng
-    ✓ Triệu chứng đang phát triển, chưa hoàn chỉnh
-    ✓ Hình dạng, màu sắc khá điển hình
-    ✓ Ít triệu chứng nhiễu
-
-    VÍ DỤ: Bệnh đốm lá - đốm nâu rõ, có viền vàng
-           Bệnh thối rễ - rễ nâu đen, mềm nhũn
-
-    [18-27 điểm] - TRIỆU CHỨNG KHÁ RÕ:
-    ✓ Triệu chứng nhận biết được nhưng cần suy luận
-    ✓ Có 2-3 triệu chứng khá rõ
-    ✓ Triệu chứng ở giai đoạn đầu hoặc cuối
-    ✓ Hình dạng/màu sắc chưa hoàn toàn điển hình
-    ✓ Có một số triệu chứng nhiễu
-
-    VÍ DỤ: Lá vàng - có thể thiếu N hoặc úng nước
-           Thân có vết nâu - có thể nấm hoặc sâu đục
-
-    [10-17 điểm] - TRIỆU CHỨNG MƠ HỒ:
-    ✓ Triệu chứng không rõ ràng, khó nhận diện
-    ✓ Chỉ có 1-2 triệu chứng mờ nhạt
-    ✓ Triệu chứng rất sơ khai hoặc đã phai
-    ✓ Hình dạng/màu sắc không điển hình
-    ✓ Nhiều triệu chứng nhiễu gây nhầm lẫn
-
-    VÍ DỤ: Lá hơi xỉn màu - chưa rõ nguyên nhân
-           Rễ có màu hơi sẫm - chưa rõ bệnh hay tự nhiên
-
-    [1-9 điểm] - TRIỆU CHỨNG RẤT MƠ HỒ: 
-    ✓ Hầu như không thấy triệu chứng rõ ràng
-    ✓ Triệu chứng rất nhẹ, khó phát hiện
-    ✓ Không thể xác định giai đoạn bệnh
-    ✓ Hoàn toàn không điển hình
-    ✓ Quá nhiều yếu tố gây nhiễu
-
-    VÍ DỤ: Bộ phận cây có màu hơi khác thường, không rõ lý do
-
-    ───────────────────────────────────────────────────────────────
-    YẾU TỐ 3: ĐỘ CHẮC CHẮN TRONG CHẨN ĐOÁN (0-30 điểm)
-    ───────────────────────────────────────────────────────────────
-
-    QUY TẮC ĐÁNH GIÁ: 
-
-    [27-30 điểm] - CHẮC CHẮN TUYỆT ĐỐI:
-    ✓ CHỈ CÓ DUY NHẤT 1 BỆNH phù hợp 100%
-    ✓ Không có khả năng nào khác
-    ✓ Triệu chứng khớp hoàn toàn với 1 bệnh cụ thể
-    ✓ Có thể ghi rõ tên khoa học tác nhân gây bệnh
-
-    VÍ DỤ: Lớp bột trắng dày trên lá → CHẮC CHẮN là bệnh phấn trắng
-           Rễ đen mềm nhũn có mùi hôi → CHẮC CHẮN là bệnh thối rễ
-
-    [21-26 điểm] - RẤT CHẮC CHẮN:
-    ✓ 1 bệnh có khả năng rất cao (>80%)
-    ✓ Có thể có 1 bệnh khác nhưng khả năng thấp (<20%)
-    ✓ Triệu chứng thiên về 1 bệnh rõ rệt
-    ✓ Có thể loại trừ hầu hết các bệnh khác
-
-    VÍ DỤ: Đốm nâu viền vàng trên lá → Rất có thể là đốm lá nấm
-           Thân nứt tiết dịch nâu → Rất có thể là bệnh loét thân
-
-    [15-20 điểm] - KHẢNG CHẮC CHẮN: 
-    ✓ 1-2 bệnh có khả năng cao ngang nhau (60-80%)
-    ✓ Cần thêm thông tin để xác định chính xác
-    ✓ Triệu chứng phù hợp với nhóm bệnh
-    ✓ Có thể loại trừ một số bệnh
-
-    VÍ DỤ: Đốm nâu trên lá → Có thể nấm hoặc vi khuẩn
-           Rễ màu nâu → Có thể thối rễ hoặc thiếu oxy
-
-    [8-14 điểm] - KHÔNG CHẮC CHẮN:
-    ✓ 2-3 bệnh có khả năng tương đương (40-60%)
-    ✓ Triệu chứng chung chung, nhiều bệnh có thể gây ra
-    ✓ Khó loại trừ các khả năng
-    ✓ Cần thêm nhiều thông tin
-
-    VÍ DỤ:  Lá vàng → Thiếu N, úng, bệnh rễ, hoặc già tự nhiên? 
-            Thân có vết đen → Nấm, vi khuẩn, sâu đục, hoặc va đập?
-
-    [1-7 điểm] - RẤT KHÔNG CHẮC CHẮN:
-    ✓ Nhiều hơn 3 bệnh có thể (<40% mỗi bệnh)
-    ✓ Triệu chứng quá chung, không đủ thông tin
-    ✓ Không thể loại trừ bất kỳ khả năng nào
-    ✓ Gần như đoán mò
-
-    VÍ DỤ: Bộ phận cây có vẻ không bình thường nhưng không rõ lý do
-
-    ───────────────────────────────────────────────────────────────
-    THANG ĐÁNH GIÁ TỔNG HỢP (0-100%)
-    ───────────────────────────────────────────────────────────────
-
-    CỘNG 3 YẾU TỐ = CONFIDENCE SCORE
-
-    [90-100%] - RẤT CHẮC CHẮN: 
-    • Ảnh xuất sắc (28-30) + Triệu chứng điển hình (36-40) + 1 bệnh duy nhất (27-30)
-    • Tổng:  91-100 điểm
-    • Có thể khẳng định chắc chắn bệnh gì
-    • VÍ DỤ:  Ảnh rõ bệnh phấn trắng trên lá → 95%
-             Ảnh rõ bệnh thối rễ điển hình → 94%
-
-    [75-89%] - KHẢNG CHẮC CHẮN:
-    • Ảnh tốt (22-27) + Triệu chứng rõ (28-35) + 1-2 bệnh (21-26)
-    • Tổng: 75-90 điểm
-    • Rất có khả năng đúng, tin cậy cao
-    • VÍ DỤ: Ảnh khá rõ đốm lá nấm → 82%
-            Ảnh khá rõ thân bị loét → 80%
-
-    [60-74%] - KHẢ NĂNG CAO:
-    • Ảnh trung bình (14-21) + Triệu chứng khá rõ (18-27) + 2-3 bệnh (15-20)
-    • Tổng: 60-74 điểm
-    • Có thể tin tưởng nhưng nên xác nhận thêm
-    • VÍ DỤ: Ảnh OK, đốm lá không rõ nấm hay khuẩn → 68%
-            Ảnh OK, rễ nâu chưa rõ nguyên nhân → 65%
-
-    [40-59%] - KHÔNG CHẮC CHẮN:
-    • Ảnh yếu (8-13) + Triệu chứng mơ hồ (10-17) + Nhiều khả năng (8-14)
-    • Tổng: 40-59 điểm
-    • Chỉ là dự đoán, cần thêm thông tin
-    • VÍ DỤ: Ảnh mờ, lá vàng không rõ nguyên nhân → 48%
-            Ảnh mờ, thân có vết bất thường → 45%
-
-    [20-39%] - RẤT KHÔNG CHẮC CHẮN:
-    • Ảnh kém (1-7) + Triệu chứng rất mơ hồ (1-9) + Quá nhiều khả năng (1-7)
-    • Tổng:  20-39 điểm
-    • Gần như không thể chẩn đoán
-    • VÍ DỤ: Ảnh rất mờ, lá có vẻ lạ → 28%
-            Ảnh rất mờ, rễ không rõ ràng → 25%
-
-    [<20%] - GẦN NHƯ ĐOÁN:
-    • Tổng: <20 điểm
-    • Không đủ thông tin để phân tích
-    • NÊN TRẢ LỜI:  "Không thể xác định, cần ảnh rõ hơn"
-
-    ───────────────────────────────────────────────────────────────
-    TRƯỜNG HỢP ĐẶC BIỆT
-    ───────────────────────────────────────────────────────────────
-
-    • Hình ảnh KHÔNG phải bộ phận cây (invalid_image):
-    → Confidence: 90-98%
-    → Lý do: Dễ nhận biết đây không phải lá, rễ, hay thân cây
-
-    • Bộ phận cây KHỎE MẠNH (không có bệnh):
-    → Confidence: 85-95%
-    → Lý do: Dễ xác nhận không có triệu chứng bệnh
-
-    • Bộ phận cây có dấu hiệu BẤT THƯỜNG nhưng ảnh quá KÉM:
-    → Confidence: <40%
-    → NÊN GỢI Ý:  "Vui lòng chụp ảnh rõ hơn để phân tích chính xác"
-
-    ═══════════════════════════════════════════════════════════════
-    VÍ DỤ TÍNH CONFIDENCE CỤ THỂ
-    ═══════════════════════════════════════════════════════════════
-
-    VÍ DỤ 1: Bệnh phấn trắng rõ ràng trên lá
-    • Chất lượng ảnh:  Ảnh cận cảnh rõ nét, ánh sáng tốt → 28 điểm
-    • Triệu chứng: Lớp bột trắng dày, điển hình → 38 điểm
-    • Chẩn đoán: Chỉ có bệnh phấn trắng phù hợp → 28 điểm
-    • TỔNG: 28 + 38 + 28 = 94%
-    → Confidence: 94%
-
-    VÍ DỤ 2: Đốm lá không rõ nấm hay vi khuẩn
-    • Chất lượng ảnh: Ảnh khá rõ, có thể thấy đốm → 24 điểm
-    • Triệu chứng:  Đốm nâu rõ, nhưng viền không rõ lắm → 30 điểm
-    • Chẩn đoán: Có thể nấm (60%) hoặc vi khuẩn (40%) → 18 điểm
-    • TỔNG: 24 + 30 + 18 = 72%
-    → Confidence: 72%
-
-    VÍ DỤ 3: Lá vàng, ảnh mờ
-    • Chất lượng ảnh:  Ảnh mờ, xa, thiếu sáng → 9 điểm
-    • Triệu chứng:  Chỉ thấy lá vàng chung chung → 12 điểm
-    • Chẩn đoán:  Có thể thiếu N, úng, bệnh rễ...  → 10 điểm
-    • TỔNG: 9 + 12 + 10 = 31%
-    → Confidence: 31%
-
-    VÍ DỤ 4: Lá khỏe mạnh
-    • Chất lượng ảnh: Ảnh rõ → 26 điểm
-    • Triệu chứng:  Không có triệu chứng bệnh (dễ xác nhận) → 38 điểm
-    • Chẩn đoán:  Chắc chắn khỏe mạnh → 28 điểm
-    • TỔNG: 26 + 38 + 28 = 92%
-    → Confidence: 92%
-
-    VÍ DỤ 5: Bệnh thối rễ điển hình
-    • Chất lượng ảnh: Ảnh cận cảnh rõ, thấy rõ rễ → 27 điểm
-    • Triệu chứng: Rễ nâu đen, mềm nhũn, bong vỏ, mùi hôi → 39 điểm
-    • Chẩn đoán: Chắc chắn là bệnh thối rễ → 28 điểm
-    • TỔNG: 27 + 39 + 28 = 94%
-    → Confidence: 94%
-
-    VÍ DỤ 6: Thân cây có vết loét
-    • Chất lượng ảnh: Ảnh khá rõ, thấy được vết thương → 23 điểm
-    • Triệu chứng: Vỏ nứt, tiết dịch nâu, có thể nấm hoặc vi khuẩn → 28 điểm
-    • Chẩn đoán: 2 khả năng (nấm 60%, vi khuẩn 40%) → 17 điểm
-    • TỔNG: 23 + 28 + 17 = 68%
-    → Confidence: 68%
-
-    ═══════════════════════════════════════════════════════════════
-    YÊU CẦU BẮT BUỘC KHI ĐÁNH GIÁ CONFIDENCE
-    ═══════════════════════════════════════════════════════════════
-
-    ✓ PHẢI tính toán CHÍNH XÁC theo công thức 3 yếu tố
-    ✓ PHẢI cho điểm từng yếu tố một cách KHÁCH QUAN
-    ✓ KHÔNG được làm tròn tùy tiện
-    ✓ KHÔNG được "cảm tính" mà phải dựa vào QUY TẮC
-    ✓ Nếu confidence < 40% → NÊN GỢI Ý chụp ảnh rõ hơn
-
-    ═══════════════════════════════════════════════════════════════
-    ĐỊNH DẠNG TRẢ VỀ
-    ═══════════════════════════════════════════════════════════════
-
-    Đối với hình ảnh KHÔNG PHẢI BỘ PHẬN CÂY:
-    {
-        "disease_detected": false,
-        "disease_name": null,
-        "disease_type": "invalid_image",
-        "severity": "none",
-        "confidence": confidence,
-        "symptoms": ["Hình ảnh này không chứa bộ phận cây hoặc thực vật"],
-        "possible_causes": ["Loại hình ảnh được tải lên không hợp lệ - không phải lá, rễ, hoặc thân cây"],
-        "treatment": ["Vui lòng tải lên hình ảnh bộ phận cây (lá, rễ, thân) để phân tích bệnh"]
-    }
-
-    Đối với CÂY KHỎE MẠNH:
-    {
-        "disease_detected": false,
-        "disease_name":  null,
-        "disease_type": "khỏe mạnh",
-        "severity":  "none",
-        "confidence": confidence,
-        "symptoms": [
-            "Không phát hiện triệu chứng bệnh",
-            "Màu sắc tự nhiên, đều đặn (lá xanh tươi / rễ trắng ngà / thân nâu tự nhiên, vỏ nguyên vẹn)",
-            "Không có đốm, vết hoặc biến dạng",
-            "Bề mặt nhẵn, không có lớp phủ bất thường hoặc vết nứt"
-        ],
-        "possible_causes": [
-            "Cây đang phát triển tốt",
-            "Chế độ chăm sóc phù hợp"
-        ],
-        "treatment":  [
-            "Tiếp tục chăm sóc như hiện tại",
-            "Duy trì lịch tưới nước đều đặn",
-            "Bón phân định kỳ theo nhu cầu cây",
-            "Theo dõi thường xuyên để phát hiện sớm nếu có bệnh"
-        ]
-    }
-
-    Đối với CÂY BỊ BỆNH:
-    {
-        "disease_detected": true,
-        "disease_name": "Tên bệnh cụ thể bằng tiếng Việt",
-        "disease_type": "nấm/vi khuẩn/vi rút/sâu bệnh/thiếu dinh dưỡng/stress môi trường",
-        "severity": "nhẹ/trung bình/nặng",
-        "confidence": confidence,
-        "symptoms": [
-            "Triệu chứng 1 - MÔ TẢ CỤ THỂ, CHI TIẾT",
-            "Triệu chứng 2 - VỊ TRÍ, MÀU SẮC, HÌNH DẠNG",
-            "Triệu chứng 3 - KẾT CẤU, KÍCH THƯỚC",
-            "Triệu chứng 4 - ĐỘ LAN RỘNG",
-            "...  (3-7 triệu chứng)"
-        ],
-        "possible_causes": [
-            "Nguyên nhân 1 - TÁC NHÂN GÂY BỆNH CỤ THỂ (tên khoa học nếu có)",
-            "Nguyên nhân 2 - ĐIỀU KIỆN MÔI TRƯỜNG",
-            "Nguyên nhân 3 - QUẢN LÝ CANH TÁC",
-            "Nguyên nhân 4 - YẾU TỐ KHÁC",
-            "...  (3-6 nguyên nhân)"
-        ],
-        "treatment": [
-            "Bước 1 - BIỆN PHÁP CẤP BÁCH (cắt, cách ly... )",
-            "Bước 2 - XỊT THUỐC CỤ THỂ (tên, liều lượng, tần suất)",
-            "Bước 3 - BIỆN PHÁP SINH HỌC/TỰ NHIÊN (nếu có)",
-            "Bước 4 - CẢI THIỆN ĐIỀU KIỆN (thoát nước, thông gió...)",
-            "Bước 5 - BÓN PHÂN/DINH DƯỠNG (loại, liều lượng)",
-            "Bước 6 - PHÒNG NGỪA TÁI PHÁT",
-            "...  (4-8 bước điều trị)"
-        ]
-    }
-
-    ═══════════════════════════════════════════════════════════════
-    YÊU CẦU QUAN TRỌNG
-    ═══════════════════════════════════════════════════════════════
-
-    ✓ TẤT CẢ nội dung phải BẰNG TIẾNG VIỆT
-    ✓ Tên bệnh phải CỤ THỂ, CHÍNH XÁC
-    ✓ Loại bệnh:  "nấm", "vi khuẩn", "vi rút", "sâu bệnh", "thiếu dinh dưỡng", "stress môi trường", "khỏe mạnh", "invalid_image"
-    ✓ Mức độ:  "nhẹ", "trung bình", "nặng", "none"
-    ✓ CONFIDENCE phải tính CHÍNH XÁC theo HỆ THỐNG QUY TẮC 3 YẾU TỐ ở trên
-    ✓ Triệu chứng:  ÍT NHẤT 3-5 mục, MÔ TẢ CHI TIẾT
-    ✓ Nguyên nhân: ÍT NHẤT 3-5 mục, CỤ THỂ
-    ✓ Điều trị: ÍT NHẤT 4-6 bước, KHẢ THI, THỰC TẾ
-
-    CHỈ TRẢ VỀ JSON, KHÔNG CÓ GHI CHÚ HOẶC GIẢI THÍCH THÊM."""
+        return self.analysis_prompt.text
 
     def analyze_plant_image_base64(
         self,
         base64_image:  str,
         temperature: float = None,
-        max_tokens: int = None
+        max_tokens: int = None,
+        mime_type: str = "image/jpeg"
     ) -> Dict: 
         """
         Phân tích dữ liệu hình ảnh được mã hóa base64 để tìm bệnh trên cây. 
@@ -611,6 +397,8 @@ class PlantDiseaseDetector:
                                tiền tố data:image)
             temperature (float, optional): Nhiệt độ mô hình để tạo phản hồi
             max_tokens (int, optional): Số lượng token tối đa cho phản hồi
+            mime_type (str, optional): Kiểu MIME của ảnh. Bị ghi đè bởi tiền
+                                       tố data URL nếu có.
 
         Returns:
             Dict: Kết quả phân tích dưới dạng từ điển (có thể tuần tự hóa JSON)
@@ -623,136 +411,568 @@ class PlantDiseaseDetector:
             ValueError: Nếu base64_image không hợp lệ hoặc rỗng
             Exception: Nếu phân tích thất bại
         """
-        try:
-            logger.info("Bắt đầu phân tích hình ảnh base64")
-
-            # Validate base64 input
-            if not isinstance(base64_image, str):
-                raise ValueError("base64_image must be a string")
-
-            if not base64_image: 
-                raise ValueError("base64_image cannot be empty")
-
-            # Clean base64 string (remove data URL prefix if present)
-            if base64_image.startswith('data:'):
-                base64_image = base64_image. split(',', 1)[1]
-
-            # Prepare request parameters
-            temperature = temperature or self.DEFAULT_TEMPERATURE
-            max_tokens = max_tokens or self.DEFAULT_MAX_TOKENS
-
-            # Make API request
-            completion = self.client.chat.completions.create(
-                model=self.MODEL_NAME,
-                messages=[
-                    {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "text",
-                                "text": self. create_analysis_prompt()
-                            },
-                            {
-                                "type": "image_url",
-                                "image_url": {
-                                    "url": f"data:image/jpeg;base64,{base64_image}"
-                                }
-                            }
-                        ]
-                    }
-                ],
-                temperature=temperature,
-                max_completion_tokens=max_tokens,
-                top_p=1,
-                stream=False,
-                stop=None,
-            )
+        return self._analyze(base64_image, temperature, max_tokens, mime_type)
 
-            logger.info("API trả về kết quả thành công")
-            result = self._parse_response(
-                completion.choices[0].message.content
+    def analyze_plant_image(
+        self,
+        image: ImagePayload,
+        temperature: float = None,
+        max_tokens: int = None
+    ) -> Dict:
+        """
+        Phân tích ảnh dạng bytes để tìm bệnh trên cây.
+
+        Giống analyze_plant_image_base64 nhưng không cần mã hóa base64 trước:
+        ảnh chỉ được mã hóa một lần, thẳng vào thân yêu cầu gửi tới mô hình.
+
+        Args:
+            image (ImagePayload): Ảnh (bytes hoặc memoryview) và kiểu MIME
+            temperature (float, optional): Nhiệt độ mô hình để tạo phản hồi
+            max_tokens (int, optional): Số lượng token tối đa cho phản hồi
+
+        Returns:
+            Dict: Kết quả phân tích, như analyze_plant_image_base64
+
+        Ví dụ:
+            >>> prepared = prepare_image(upload_bytes)
+            >>> result = detector.analyze_plant_image(
+            ...     ImagePayload(prepared.data, prepared.mime_type)
+            ... )
+        """
+        return self._analyze(image, temperature, max_tokens, image.mime_type)
+
+    def _analyze(
+        self,
+        image: Union[str, ImagePayload],
+        temperature: Optional[float],
+        max_tokens: Optional[int],
+        mime_type: str,
+        pacer: Optional[RequestPacer] = None,
+        priority: int = PRIORITY_INTERACTIVE
+    ) -> Dict:
+        """
+        Thực hiện phân tích; pacer (nếu có) và hạn mức của bộ điều phối chỉ
+        được chờ khi thực sự gọi API.
+        """
+        with tracer.start_as_current_span(
+            "PlantDiseaseDetector.analyze"
+        ) as span:
+            try:
+                logger.info("Bắt đầu phân tích hình ảnh")
+                request = self._prepare_request(
+                    image, temperature, max_tokens, mime_type
+                )
+                span.set_attribute("plant.image.bytes", len(request.payload))
+                span.set_attribute(
+                    "plant.result.cached", request.cached_result is not None
+                )
+                if request.cached_result is not None:
+                    return request.cached_result
+
+                start = time.perf_counter()
+                if request.flight_key is None:
+                    result = self._call_api(request, pacer, priority)
+                else:
+                    # Identical requests in flight share one API call
+                    result, shared = self.flights.do(
+                        request.flight_key, self._call_api, request, pacer,
+                        priority
+                    )
+                    if shared:
+                        logger.info(
+                            "Dùng chung kết quả của yêu cầu giống hệt đang chạy"
+                        )
+                if self.triage is not None:
+                    self.triage.record_upstream(time.perf_counter() - start)
+                return result
+
+            except Exception as e:
+                observe_error("analysis", e)
+                logger.error(f"Phân tích thất bại: {str(e)}")
+                raise
+
+    def _call_api(
+        self,
+        request: "AnalysisRequest",
+        pacer: Optional[RequestPacer],
+        priority: int
+    ) -> Dict:
+        """Chờ hạn mức, gọi API và xử lý phản hồi của một yêu cầu."""
+        if self.backend is not None:
+            fields = self.backend.analyze_image(request.payload.data)
+            return self._store_result(request, DiseaseAnalysisResult(**fields))
+        if pacer is not None:
+            pacer.wait()
+        reserved = self.scheduler.acquire(request.estimated_tokens, priority)
+
+        # Make API request (retried on transient errors); the body is only
+        # built once the request may be sent
+        completion = self._complete(request, request.params)
+        self.scheduler.settle(reserved, _total_tokens(completion))
+        content, generated, truncated = _completion_output(completion)
+
+        # Cut off by max_tokens: let the model continue its answer once,
+        # otherwise the truncated JSON is repaired
+        resumed = False
+        params = self._resume_params(request, content, generated) if (
+            truncated
+        ) else None
+        if params is not None:
+            try:
+                reserved = self.scheduler.acquire(
+                    _resume_tokens(request, params, generated), priority
+                )
+                more = self._complete(request, params)
+                self.scheduler.settle(reserved, _total_tokens(more))
+                text, extra, still_truncated = _completion_output(more)
+                content += text
+                generated = _add_tokens(generated, extra)
+                resumed = not still_truncated
+            except Exception as e:
+                logger.warning(f"Không thể viết tiếp phản hồi bị cắt ngắn: {e}")
+
+        logger.info("API trả về kết quả thành công")
+        return self._finish_request(
+            request, content, generated, truncated, resumed
+        )
+
+    def _complete(self, request: "AnalysisRequest", params: Dict):
+        """
+        Gửi một yêu cầu chat completion (thử lại khi lỗi tạm thời), ghi lại
+        độ trễ và số token.
+        """
+        with tracer.start_as_current_span("groq.chat.completions"):
+            content = self._request_body(params, request.payload)
+            start = time.perf_counter()
+            completion = self.caller.call(
+                self._create_completion, content=content
+            )
+            observe_completion(
+                "analysis", completion, time.perf_counter() - start
             )
+            return completion
+
+    def _request_body(self, params: Dict, payload: ImagePayload) -> bytes:
+        """Mã hóa thân yêu cầu (ảnh base64 ghi thẳng vào JSON)."""
+        with REQUEST_ENCODE_SECONDS.time():
+            return encode_request_body(params, payload)
+
+    def analyze_many(
+        self,
+        base64_images: List[Union[str, ImagePayload]],
+        max_concurrency: int = 4,
+        requests_per_minute: Optional[float] = None,
+        temperature: float = None,
+        max_tokens: int = None,
+        mime_type: str = "image/jpeg"
+    ) -> Dict:
+        """
+        Phân tích nhiều hình ảnh song song với giới hạn đồng thời và ngân sách
+        số yêu cầu mỗi phút.
+
+        Lỗi của từng ảnh không làm dừng cả lô; mỗi ảnh có mục kết quả riêng
+        theo đúng thứ tự đầu vào.
+
+        Args:
+            base64_images (List[Union[str, ImagePayload]]): Danh sách ảnh
+                base64 (có thể kèm tiền tố data URL để chỉ định kiểu MIME)
+                hoặc ImagePayload (không cần mã hóa base64)
+            max_concurrency (int): Số lệnh gọi API chạy đồng thời tối đa
+            requests_per_minute (Optional[float]): Ngân sách yêu cầu mỗi phút,
+                                                   None nếu không giới hạn
+            temperature (float, optional): Nhiệt độ mô hình
+            max_tokens (int, optional): Số lượng token tối đa cho phản hồi
+            mime_type (str, optional): Kiểu MIME mặc định của ảnh
+
+        Returns:
+            Dict: Kết quả lô gồm 'results' (mỗi mục có index, status, result,
+                  error, elapsed_seconds), số ảnh thành công/thất bại và
+                  thời gian tổng hợp
+
+        Ví dụ:
+            >>> batch = detector.analyze_many(images, max_concurrency=8)
+            >>> batch['succeeded'], batch['failed']
+            (98, 2)
+        """
+        start = time.perf_counter()
+        items = sorted(
+            self.analyze_many_stream(
+                base64_images, max_concurrency, requests_per_minute,
+                temperature, max_tokens, mime_type
+            ),
+            key=lambda item: item["index"]
+        )
+        return summarize_batch(items, time.perf_counter() - start)
+
+    def analyze_many_stream(
+        self,
+        base64_images: List[Union[str, ImagePayload]],
+        max_concurrency: int = 4,
+        requests_per_minute: Optional[float] = None,
+        temperature: float = None,
+        max_tokens: int = None,
+        mime_type: str = "image/jpeg"
+    ) -> Iterator[Dict]:
+        """
+        Giống analyze_many nhưng trả về từng mục kết quả ngay khi ảnh tương
+        ứng được phân tích xong (theo thứ tự hoàn thành, không theo đầu vào).
+
+        Với backend cục bộ, ảnh được suy luận theo từng lô của backend
+        (một lệnh suy luận cho cả lô); max_concurrency và
+        requests_per_minute không áp dụng.
 
-            # Return as dictionary for JSON serialization
-            return result.__dict__
+        Yields:
+            Dict: Mục kết quả của một ảnh (index, status, result, error,
+                  elapsed_seconds)
+        """
+        logger.info(f"Bắt đầu phân tích lô {len(base64_images)} hình ảnh")
+        if self.backend is not None:
+            for offset in range(0, len(base64_images), self.backend.batch_size):
+                yield from self._analyze_local_chunk(
+                    base64_images, offset, temperature, max_tokens, mime_type
+                )
+            return
+        pacer = RequestPacer(requests_per_minute)
+        with ThreadPoolExecutor(max_workers=max(1, max_concurrency)) as pool:
+            futures = [
+                pool.submit(
+                    self._analyze_batch_item, index, base64_image,
+                    temperature, max_tokens, mime_type, pacer
+                )
+                for index, base64_image in enumerate(base64_images)
+            ]
+            try:
+                for future in as_completed(futures):
+                    yield future.result()
+            finally:
+                for future in futures:
+                    future.cancel()
+
+    def _analyze_local_chunk(
+        self,
+        base64_images: List[Union[str, ImagePayload]],
+        offset: int,
+        temperature: Optional[float],
+        max_tokens: Optional[int],
+        mime_type: str
+    ) -> List[Dict]:
+        """
+        Phân tích một lô ảnh bằng backend cục bộ trong một lệnh suy luận.
+
+        Ảnh có sẵn trong bộ nhớ đệm không được suy luận lại; lỗi của từng ảnh
+        được ghi nhận trong mục kết quả của ảnh đó.
+        """
+        start = time.perf_counter()
+        chunk = base64_images[offset:offset + self.backend.batch_size]
+        items, pending = [], []
+        for index, base64_image in enumerate(chunk, offset):
+            try:
+                request = self._prepare_request(
+                    base64_image, temperature, max_tokens, mime_type
+                )
+            except Exception as e:
+                items.append(_batch_item(index, start, error=e))
+                continue
+            if request.cached_result is not None:
+                items.append(
+                    _batch_item(index, start, result=request.cached_result)
+                )
+            else:
+                pending.append((index, request))
+        if not pending:
+            return items
 
+        try:
+            results = self.backend.analyze_images(
+                [request.payload.data for _, request in pending]
+            )
         except Exception as e:
-            logger.error(f"Phân tích thất bại: {str(e)}")
-            raise
+            logger.error(f"Suy luận cục bộ thất bại: {str(e)}")
+            return items + [
+                _batch_item(index, start, error=e) for index, _ in pending
+            ]
+        for (index, request), fields in zip(pending, results):
+            if isinstance(fields, Exception):
+                items.append(_batch_item(index, start, error=fields))
+                continue
+            result = self._store_result(request, DiseaseAnalysisResult(**fields))
+            items.append(_batch_item(index, start, result=result))
+        return items
+
+    def _analyze_batch_item(
+        self,
+        index: int,
+        base64_image: Union[str, ImagePayload],
+        temperature: Optional[float],
+        max_tokens: Optional[int],
+        mime_type: str,
+        pacer: RequestPacer
+    ) -> Dict:
+        """Phân tích một ảnh trong lô, ghi nhận lỗi thay vì ném ngoại lệ."""
+        start = time.perf_counter()
+        try:
+            result = self._analyze(
+                base64_image, temperature, max_tokens, mime_type, pacer,
+                PRIORITY_BATCH
+            )
+            return _batch_item(index, start, result=result)
+        except Exception as e:
+            return _batch_item(index, start, error=e)
 
-    def _parse_response(self, response_content: str) -> DiseaseAnalysisResult: 
+    def _prepare_request(
+        self,
+        image: Union[str, ImagePayload],
+        temperature: Optional[float],
+        max_tokens: Optional[int],
+        mime_type: str
+    ) -> "AnalysisRequest":
         """
-        Parse and validate API response. 
+        Xác thực đầu vào, tra cứu bộ nhớ đệm và dựng tham số gọi API.
 
         Args:
-            response_content (str): Raw response from API
+            image (Union[str, ImagePayload]): Ảnh, hoặc dữ liệu hình ảnh được
+                                              mã hóa Base64 (giải mã một lần)
+            temperature (Optional[float]): Nhiệt độ mô hình
+            max_tokens (Optional[int]): Số lượng token tối đa cho phản hồi.
+                Nếu là None, dùng ngân sách thích ứng (token_budget) và cho
+                phép mô hình viết tiếp tới MAX_COMPLETION_TOKENS.
+            mime_type (str): Kiểu MIME của ảnh base64
 
         Returns:
-            DiseaseAnalysisResult:  Parsed and validated results
+            AnalysisRequest: Yêu cầu đã chuẩn bị; cached_result khác None nếu
+                             có thể trả kết quả mà không cần gọi API
 
         Raises:
-            ValueError:  Nếu không thể phân tích response thành JSON
+            ValueError: Nếu ảnh base64 không hợp lệ hoặc rỗng
         """
-        try:
-            # Clean up response - remove markdown code blocks if present
-            cleaned_response = response_content.strip()
-            if cleaned_response.startswith('```json'):
-                cleaned_response = cleaned_response. replace(
-                    '```json', ''
-                ).replace('```', '').strip()
-            elif cleaned_response.startswith('```'):
-                cleaned_response = cleaned_response.replace('```', '').strip()
-
-            # Parse JSON
-            disease_data = json.loads(cleaned_response)
-            logger. info("Phân tích JSON thành công")
-
-            # Validate required fields and create result object
-            return DiseaseAnalysisResult(
-                disease_detected=bool(
-                    disease_data.get('disease_detected', False)
-                ),
-                disease_name=disease_data. get('disease_name'),
-                disease_type=disease_data.get('disease_type', 'unknown'),
-                severity=disease_data.get('severity', 'unknown'),
-                confidence=float(disease_data.get('confidence', 0)),
-                symptoms=disease_data.get('symptoms', []),
-                possible_causes=disease_data.get('possible_causes', []),
-                treatment=disease_data.get('treatment', [])
+        # Validate and decode base64 input (data URL prefix allowed)
+        if isinstance(image, ImagePayload):
+            payload = image
+        else:
+            payload = ImagePayload.from_base64(image, mime_type)
+        image_bytes = payload.data
+
+        # Prepare request parameters; the image is added to the body when
+        # it is sent
+        temperature = temperature or self.DEFAULT_TEMPERATURE
+        if max_tokens:
+            completion_limit = max_tokens
+        else:
+            max_tokens = (
+                self.token_budget.max_tokens()
+                if self.token_budget is not None else self.DEFAULT_MAX_TOKENS
+            )
+            completion_limit = self.MAX_COMPLETION_TOKENS
+        request = AnalysisRequest(params={
+            "model": self.MODEL_NAME,
+            "messages": [
+                {
+                    "role": "user",
+                    "content": [
+                        {
+                            "type": "text",
+                            "text": self.create_analysis_prompt()
+                        },
+                        {
+                            "type": "image_url",
+                            "image_url": {"url": IMAGE_URL_PLACEHOLDER}
+                        }
+                    ]
+                }
+            ],
+            "temperature": temperature,
+            "max_completion_tokens": max_tokens,
+            "top_p": 1,
+            "stream": False,
+            "stop": None,
+        }, payload=payload, completion_limit=completion_limit)
+        if self.response_format is not None:
+            request.params["response_format"] = self.response_format
+
+        # Return cached result for identical image and parameters
+        if self.cache is not None:
+            request.cache_key = make_cache_key(
+                image_bytes, self.model_name, self.result_version, temperature
+            )
+            cached = self.cache.get(request.cache_key)
+            CACHE_LOOKUPS.labels(
+                "result", "miss" if cached is None else "hit"
+            ).inc()
+            if cached is not None:
+                logger.info("Trả về kết quả từ bộ nhớ đệm")
+                request.cached_result = cached
+                return request
+
+        # Reuse result of a visually near-identical image
+        if self.near_duplicates is not None:
+            try:
+                request.image_hash = dhash(image_bytes)
+            except (OSError, ValueError):
+                logger.warning("Không thể tính perceptual hash của ảnh")
+            if request.image_hash is not None:
+                match = self.near_duplicates.find(
+                    request.image_hash, self.near_duplicate_distance
+                )
+                # Only reuse results produced by the same prompt or model
+                hit = match is not None and match[1].get("prompt_version") == (
+                    self.result_version
+                )
+                CACHE_LOOKUPS.labels(
+                    "near_duplicate", "hit" if hit else "miss"
+                ).inc()
+                if hit:
+                    distance, near_result = match
+                    logger.info(
+                        f"Trả về kết quả của ảnh gần trùng lặp "
+                        f"(khoảng cách {distance})"
+                    )
+                    request.cached_result = copy.deepcopy(near_result)
+                    if request.cache_key is not None:
+                        self.cache.set(request.cache_key, near_result)
+                    return request
+
+        # Answer invalid or unusable images locally, without the model
+        if self.triage is not None:
+            verdict = self.triage.check(image_bytes)
+            if verdict is not None:
+                logger.info(
+                    f"Trả lời từ bước sàng lọc cục bộ ({verdict['triage']})"
+                )
+                request.cached_result = DiseaseAnalysisResult(**verdict).__dict__
+                return request
+
+        if self.flights is not None:
+            request.flight_key = make_flight_key(
+                image_bytes, payload.mime_type, self.model_name,
+                self.result_version, temperature, max_tokens
+            )
+        if self.backend is None and self.scheduler.limited:
+            request.estimated_tokens = (
+                self.analysis_prompt.tokens
+                + _estimate_image_tokens(image_bytes)
+                + max_tokens
+            )
+
+        return request
+
+    def _resume_params(
+        self, request: "AnalysisRequest", content: str,
+        generated: Optional[int]
+    ) -> Optional[Dict]:
+        """
+        Dựng tham số để mô hình viết tiếp phản hồi bị cắt ngắn.
+
+        Phần đã tạo được gửi lại làm tiền tố của tin nhắn assistant, nên
+        mô hình tiếp tục đúng chỗ bị cắt.
+
+        Args:
+            request (AnalysisRequest): Yêu cầu đã chuẩn bị
+            content (str): Phản hồi bị cắt ngắn
+            generated (Optional[int]): Số token đã tạo
+
+        Returns:
+            Optional[Dict]: Tham số chat completion, None nếu nên sửa JSON
+                            bị cắt ngắn thay vì viết tiếp (hết ngân sách
+                            completion_limit hoặc mô hình đang lặp lại)
+        """
+        remaining = request.completion_limit - (
+            generated or request.params["max_completion_tokens"]
+        )
+        if remaining < 32 or _is_repeating(content):
+            logger.warning("Phản hồi bị cắt ngắn, sửa JSON đã nhận")
+            return None
+        logger.warning(
+            f"Phản hồi bị cắt ngắn, yêu cầu mô hình viết tiếp "
+            f"(tối đa {remaining} token)"
+        )
+        params = dict(request.params)
+        # JSON mode would make the model start a new object
+        params.pop("response_format", None)
+        params["messages"] = request.params["messages"] + [
+            {"role": "assistant", "content": content}
+        ]
+        params["max_completion_tokens"] = remaining
+        return params
+
+    def _finish_request(
+        self,
+        request: "AnalysisRequest",
+        content: str,
+        completion_tokens: Optional[int] = None,
+        truncated: bool = False,
+        resumed: bool = False
+    ) -> Dict:
+        """
+        Phân tích phản hồi API và lưu kết quả vào bộ nhớ đệm.
+
+        Args:
+            request (AnalysisRequest): Yêu cầu đã chuẩn bị
+            content (str): Nội dung phản hồi của mô hình
+            completion_tokens (Optional[int]): Số token đã tạo
+            truncated (bool): Phản hồi đầu tiên bị cắt ngắn bởi max_tokens
+            resumed (bool): Mô hình đã viết tiếp phản hồi bị cắt ngắn
+
+        Returns:
+            Dict: Kết quả phân tích dưới dạng từ điển
+        """
+        result = self._parse_response(content)
+        if self.token_budget is not None:
+            self.token_budget.record(
+                answer_outcome(result.__dict__), completion_tokens,
+                truncated, resumed
             )
+        return self._store_result(request, result)
+
+    def _store_result(
+        self, request: "AnalysisRequest", result: DiseaseAnalysisResult
+    ) -> Dict:
+        """
+        Gắn phiên bản vào kết quả và lưu vào bộ nhớ đệm.
+
+        Args:
+            request (AnalysisRequest): Yêu cầu đã chuẩn bị
+            result (DiseaseAnalysisResult): Kết quả phân tích
+
+        Returns:
+            Dict: Kết quả phân tích dưới dạng từ điển
+        """
+        result.prompt_version = self.result_version
 
-        except json.JSONDecodeError:
-            logger.warning(
-                "Không thể phân tích JSON, đang thử trích xuất JSON từ response"
+        if request.cache_key is not None:
+            self.cache.set(request.cache_key, result.__dict__)
+        if request.image_hash is not None:
+            self.near_duplicates.add(
+                request.image_hash, copy.deepcopy(result.__dict__)
             )
 
-            # Try to find JSON in the response using regex
-            import re
-            json_match = re.search(r'\{.*\}', response_content, re.DOTALL)
-            if json_match:
-                try:
-                    disease_data = json.loads(json_match.group())
-                    logger. info("Trích xuất và phân tích JSON thành công")
-
-                    return DiseaseAnalysisResult(
-                        disease_detected=bool(
-                            disease_data. get('disease_detected', False)
-                        ),
-                        disease_name=disease_data.get('disease_name'),
-                        disease_type=disease_data. get(
-                            'disease_type', 'unknown'
-                        ),
-                        severity=disease_data.get('severity', 'unknown'),
-                        confidence=float(disease_data.get('confidence', 0)),
-                        symptoms=disease_data.get('symptoms', []),
-                        possible_causes=disease_data.get(
-                            'possible_causes', []
-                        ),
-                        treatment=disease_data.get('treatment', [])
-                    )
-                except json.JSONDecodeError:
-                    pass
+        # Return as dictionary for JSON serialization
+        return result.__dict__
+
+    def _parse_response(self, response_content: str) -> DiseaseAnalysisResult:
+        """
+        Parse and validate API response.
+
+        The first JSON object of the response is read in one pass, whatever
+        fences or text surround it, and repaired if the model produced
+        trailing commas, smart quotes or a truncated reply (see
+        jsonparse.py). Outcomes are counted in jsonparse.parse_stats.
+
+        Args:
+            response_content (str): Raw response from API
+
+        Returns:
+            DiseaseAnalysisResult:  Parsed and validated results
 
+        Raises:
+            ValueError:  Nếu không thể phân tích response thành JSON
+        """
+        try:
+            with tracer.start_as_current_span(
+                "PlantDiseaseDetector._parse_response"
+            ) as span, PARSE_SECONDS.time():
+                span.set_attribute("plant.response.chars", len(response_content))
+                disease_data = parse_json_object(response_content)
+        except ValueError:
             # If all parsing attempts fail, log the raw response and raise error
             logger.error(
                 f"Không thể phân tích response thành JSON.  "
@@ -760,8 +980,461 @@ class PlantDiseaseDetector:
             )
             raise ValueError(
                 f"Không thể phân tích API response thành JSON:  "
-                f"{response_content[: 200]}..."
+                f"{str(response_content)[: 200]}..."
+            )
+        return _analysis_result(disease_data)
+
+
+class AsyncPlantDiseaseDetector(PlantDiseaseDetector):
+    """
+    Phiên bản bất đồng bộ của PlantDiseaseDetector cho dịch vụ FastAPI.
+
+    Sử dụng trình khách AsyncGroq trên nhóm kết nối HTTP dùng chung, nên một
+    lệnh gọi mô hình chậm không chặn vòng lặp sự kiện và nhiều yêu cầu có thể
+    được xử lý đồng thời trong cùng một worker.
+
+    Ví dụ:
+        >>> detector = AsyncPlantDiseaseDetector()
+        >>> result = await detector.analyze_plant_image_base64(base64_image)
+    """
+
+    def _create_client(self) -> AsyncGroq:
+        """Tạo trình khách AsyncGroq trên nhóm kết nối dùng chung."""
+        return create_async_groq_client(self.api_key)
+
+    async def analyze_plant_image_base64(
+        self,
+        base64_image: str,
+        temperature: float = None,
+        max_tokens: int = None,
+        mime_type: str = "image/jpeg"
+    ) -> Dict:
+        """
+        Phân tích bất đồng bộ dữ liệu hình ảnh base64 để tìm bệnh trên cây.
+
+        Args và Returns giống PlantDiseaseDetector.analyze_plant_image_base64.
+        Giải mã base64 và tính perceptual hash chạy trong luồng riêng để không
+        chặn vòng lặp sự kiện.
+        """
+        return await self._analyze(
+            base64_image, temperature, max_tokens, mime_type
+        )
+
+    async def analyze_plant_image(
+        self,
+        image: ImagePayload,
+        temperature: float = None,
+        max_tokens: int = None
+    ) -> Dict:
+        """
+        Phân tích bất đồng bộ ảnh dạng bytes để tìm bệnh trên cây.
+
+        Args và Returns giống PlantDiseaseDetector.analyze_plant_image.
+        """
+        return await self._analyze(
+            image, temperature, max_tokens, image.mime_type
+        )
+
+    async def _analyze(
+        self,
+        image: Union[str, ImagePayload],
+        temperature: Optional[float],
+        max_tokens: Optional[int],
+        mime_type: str,
+        pacer: Optional[RequestPacer] = None,
+        priority: int = PRIORITY_INTERACTIVE
+    ) -> Dict:
+        """
+        Thực hiện phân tích; pacer (nếu có) và hạn mức của bộ điều phối chỉ
+        được chờ khi thực sự gọi API.
+        """
+        with tracer.start_as_current_span(
+            "PlantDiseaseDetector.analyze"
+        ) as span:
+            try:
+                logger.info("Bắt đầu phân tích hình ảnh")
+                request = await asyncio.to_thread(
+                    self._prepare_request,
+                    image, temperature, max_tokens, mime_type
+                )
+                span.set_attribute("plant.image.bytes", len(request.payload))
+                span.set_attribute(
+                    "plant.result.cached", request.cached_result is not None
+                )
+                if request.cached_result is not None:
+                    return request.cached_result
+
+                start = time.perf_counter()
+                if request.flight_key is None:
+                    result = await self._call_api(request, pacer, priority)
+                else:
+                    # Identical requests in flight share one API call
+                    result, shared = await self.flights.do_async(
+                        request.flight_key, self._call_api, request, pacer,
+                        priority
+                    )
+                    if shared:
+                        logger.info(
+                            "Dùng chung kết quả của yêu cầu giống hệt đang chạy"
+                        )
+                if self.triage is not None:
+                    self.triage.record_upstream(time.perf_counter() - start)
+                return result
+
+            except Exception as e:
+                observe_error("analysis", e)
+                logger.error(f"Phân tích thất bại: {str(e)}")
+                raise
+
+    async def _call_api(
+        self,
+        request: "AnalysisRequest",
+        pacer: Optional[RequestPacer],
+        priority: int
+    ) -> Dict:
+        """Chờ hạn mức, gọi API và xử lý phản hồi của một yêu cầu."""
+        if self.backend is not None:
+            fields = await self.backend.analyze_image_async(
+                request.payload.data
+            )
+            return self._store_result(request, DiseaseAnalysisResult(**fields))
+        if pacer is not None:
+            await pacer.wait_async()
+        reserved = await self.scheduler.acquire_async(
+            request.estimated_tokens, priority
+        )
+
+        # Make API request (retried on transient errors); the body is only
+        # built once the request may be sent
+        completion = await self._complete(request, request.params)
+        self.scheduler.settle(reserved, _total_tokens(completion))
+        content, generated, truncated = _completion_output(completion)
+
+        # Cut off by max_tokens: let the model continue its answer once,
+        # otherwise the truncated JSON is repaired
+        resumed = False
+        params = self._resume_params(request, content, generated) if (
+            truncated
+        ) else None
+        if params is not None:
+            try:
+                reserved = await self.scheduler.acquire_async(
+                    _resume_tokens(request, params, generated), priority
+                )
+                more = await self._complete(request, params)
+                self.scheduler.settle(reserved, _total_tokens(more))
+                text, extra, still_truncated = _completion_output(more)
+                content += text
+                generated = _add_tokens(generated, extra)
+                resumed = not still_truncated
+            except Exception as e:
+                logger.warning(f"Không thể viết tiếp phản hồi bị cắt ngắn: {e}")
+
+        logger.info("API trả về kết quả thành công")
+        return self._finish_request(
+            request, content, generated, truncated, resumed
+        )
+
+    async def _complete(self, request: "AnalysisRequest", params: Dict):
+        """
+        Gửi một yêu cầu chat completion (thử lại khi lỗi tạm thời), ghi lại
+        độ trễ và số token.
+        """
+        with tracer.start_as_current_span("groq.chat.completions"):
+            content = self._request_body(params, request.payload)
+            start = time.perf_counter()
+            completion = await self.caller.acall(
+                self._create_completion, content=content
+            )
+            observe_completion(
+                "analysis", completion, time.perf_counter() - start
+            )
+            return completion
+
+    async def analyze_many(
+        self,
+        base64_images: List[Union[str, ImagePayload]],
+        max_concurrency: int = 4,
+        requests_per_minute: Optional[float] = None,
+        temperature: float = None,
+        max_tokens: int = None,
+        mime_type: str = "image/jpeg"
+    ) -> Dict:
+        """
+        Phân tích bất đồng bộ nhiều hình ảnh với giới hạn đồng thời.
+
+        Args và Returns giống PlantDiseaseDetector.analyze_many.
+        """
+        start = time.perf_counter()
+        items = [
+            item async for item in self.analyze_many_stream(
+                base64_images, max_concurrency, requests_per_minute,
+                temperature, max_tokens, mime_type
             )
+        ]
+        items.sort(key=lambda item: item["index"])
+        return summarize_batch(items, time.perf_counter() - start)
+
+    async def analyze_many_stream(
+        self,
+        base64_images: List[Union[str, ImagePayload]],
+        max_concurrency: int = 4,
+        requests_per_minute: Optional[float] = None,
+        temperature: float = None,
+        max_tokens: int = None,
+        mime_type: str = "image/jpeg"
+    ) -> AsyncIterator[Dict]:
+        """
+        Giống analyze_many nhưng trả về từng mục kết quả ngay khi ảnh tương
+        ứng được phân tích xong.
+
+        Args và Yields giống PlantDiseaseDetector.analyze_many_stream.
+        """
+        logger.info(f"Bắt đầu phân tích lô {len(base64_images)} hình ảnh")
+        if self.backend is not None:
+            for offset in range(0, len(base64_images), self.backend.batch_size):
+                for item in await asyncio.to_thread(
+                    self._analyze_local_chunk, base64_images, offset,
+                    temperature, max_tokens, mime_type
+                ):
+                    yield item
+            return
+        pacer = RequestPacer(requests_per_minute)
+        semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+        async def run_one(
+            index: int, base64_image: Union[str, ImagePayload]
+        ) -> Dict:
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    result = await self._analyze(
+                        base64_image, temperature, max_tokens, mime_type,
+                        pacer, PRIORITY_BATCH
+                    )
+                    return _batch_item(index, start, result=result)
+                except Exception as e:
+                    return _batch_item(index, start, error=e)
+
+        tasks = [
+            asyncio.ensure_future(run_one(index, image))
+            for index, image in enumerate(base64_images)
+        ]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                task.cancel()
+
+
+_shared_detectors: Dict[type, PlantDiseaseDetector] = {}
+_shared_detectors_lock = threading.Lock()
+
+
+def _get_shared(detector_class: type) -> PlantDiseaseDetector:
+    """Lấy hoặc tạo bộ phát hiện dùng chung của lớp đã cho (an toàn luồng)."""
+    detector = _shared_detectors.get(detector_class)
+    if detector is None:
+        with _shared_detectors_lock:
+            # Double-check locking pattern
+            detector = _shared_detectors.get(detector_class)
+            if detector is None:
+                detector = detector_class(
+                    cache=get_default_cache(),
+                    near_duplicates=get_default_index(),
+                    flights=get_default_flights(),
+                    backend=get_default_backend(),
+                    triage=get_default_triage(),
+                    token_budget=get_default_token_budget()
+                )
+                _shared_detectors[detector_class] = detector
+    return detector
+
+
+def get_detector() -> PlantDiseaseDetector:
+    """
+    Lấy bộ phát hiện đồng bộ dùng chung cho cả tiến trình.
+
+    Bộ phát hiện được tạo một lần với bộ nhớ đệm, chỉ mục gần trùng lặp và
+    lớp gộp yêu cầu mặc định, nên mọi lệnh gọi tái sử dụng cùng các kết nối
+    keep-alive thay vì bắt tay TCP/TLS lại cho mỗi lần phân tích, và các
+    yêu cầu giống hệt gửi cùng lúc chỉ tốn một lệnh gọi API.
+
+    Returns:
+        PlantDiseaseDetector: Bộ phát hiện dùng chung
+    """
+    return _get_shared(PlantDiseaseDetector)
+
+
+def get_async_detector() -> "AsyncPlantDiseaseDetector":
+    """
+    Lấy bộ phát hiện bất đồng bộ dùng chung cho cả tiến trình.
+
+    Returns:
+        AsyncPlantDiseaseDetector: Bộ phát hiện bất đồng bộ dùng chung
+    """
+    return _get_shared(AsyncPlantDiseaseDetector)
+
+
+def reset_async_detectors() -> None:
+    """
+    Bỏ các bộ phát hiện bất đồng bộ dùng chung.
+
+    Gọi cùng lúc đóng HTTP client bất đồng bộ dùng chung: AsyncGroq của
+    chúng gắn với nhóm kết nối đã đóng, nên lần gọi get_async_detector()
+    sau (ví dụ lifespan khởi động lại trong cùng tiến trình) tạo bộ mới
+    trên nhóm kết nối mới.
+    """
+    with _shared_detectors_lock:
+        for detector_class in list(_shared_detectors):
+            if issubclass(detector_class, AsyncPlantDiseaseDetector):
+                del _shared_detectors[detector_class]
+
+
+def _estimate_image_tokens(image_bytes: Union[bytes, memoryview]) -> int:
+    """
+    Ước tính số token của ảnh từ kích thước (chỉ đọc phần đầu tệp ảnh).
+
+    Nếu không đọc được kích thước, trả về ước tính tối đa để không vượt
+    hạn mức TPM.
+    """
+    try:
+        with Image.open(io.BytesIO(image_bytes)) as image:
+            return estimate_image_tokens(*image.size)
+    except (OSError, ValueError):
+        return (IMAGE_MAX_TILES + 1) * IMAGE_TILE_TOKENS
+
+
+def _total_tokens(completion) -> Optional[int]:
+    """Trả về tổng số token API đã tính cho phản hồi, None nếu không có."""
+    usage = getattr(completion, "usage", None)
+    return getattr(usage, "total_tokens", None)
+
+
+def _completion_output(completion) -> Tuple[str, Optional[int], bool]:
+    """Nội dung, số token đã tạo và việc phản hồi bị cắt bởi max_tokens."""
+    choice = completion.choices[0]
+    usage = getattr(completion, "usage", None)
+    return (
+        choice.message.content or "",
+        getattr(usage, "completion_tokens", None),
+        choice.finish_reason == "length",
+    )
+
+
+def _add_tokens(a: Optional[int], b: Optional[int]) -> Optional[int]:
+    """Cộng hai số token, None nếu thiếu một trong hai."""
+    return a + b if a is not None and b is not None else None
+
+
+def _resume_tokens(
+    request: "AnalysisRequest", params: Dict, generated: Optional[int]
+) -> int:
+    """Số token ước tính của yêu cầu viết tiếp để giữ chỗ trong hạn mức TPM."""
+    if not request.estimated_tokens:
+        return 0
+    return (
+        request.estimated_tokens
+        - request.params["max_completion_tokens"]
+        + (generated or request.params["max_completion_tokens"])
+        + params["max_completion_tokens"]
+    )
+
+
+def _is_repeating(content: str) -> bool:
+    """True nếu phản hồi bị cắt ngắn lặp lại cùng một mục trong danh sách."""
+    try:
+        data = parse_json_object(content, stats=None)
+    except ValueError:
+        return False
+    return any(
+        isinstance(value, list)
+        and len(value) != len({json.dumps(item) for item in value})
+        for value in data.values()
+    )
+
+
+def _as_float(value) -> float:
+    """Đọc số như 85, "85" hoặc "85%"; 0 nếu không đọc được."""
+    if isinstance(value, str):
+        value = value.strip().rstrip("%").replace(",", ".")
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _as_bool(value) -> bool:
+    """Đọc true/false, kể cả khi mô hình trả về chuỗi "false"."""
+    if isinstance(value, str):
+        return value.strip().lower() in ("true", "yes", "1", "có")
+    return bool(value)
+
+
+def _as_list(value) -> List[str]:
+    """Danh sách chuỗi từ một danh sách, một chuỗi hoặc None."""
+    if value is None:
+        return []
+    if isinstance(value, list):
+        return [str(item) for item in value]
+    return [str(value)]
+
+
+def _analysis_result(disease_data: Dict) -> DiseaseAnalysisResult:
+    """Tạo kết quả phân tích từ đối tượng JSON của mô hình."""
+    return DiseaseAnalysisResult(
+        disease_detected=_as_bool(disease_data.get('disease_detected', False)),
+        disease_name=disease_data.get('disease_name'),
+        disease_type=disease_data.get('disease_type', 'unknown'),
+        severity=disease_data.get('severity', 'unknown'),
+        confidence=_as_float(disease_data.get('confidence', 0)),
+        symptoms=_as_list(disease_data.get('symptoms')),
+        possible_causes=_as_list(disease_data.get('possible_causes')),
+        treatment=_as_list(disease_data.get('treatment'))
+    )
+
+
+def _batch_item(
+    index: int,
+    start: float,
+    result: Optional[Dict] = None,
+    error: Optional[Exception] = None
+) -> Dict:
+    """Tạo mục kết quả cho một ảnh trong lô."""
+    return {
+        "index": index,
+        "status": "error" if error is not None else "success",
+        "result": result,
+        "error": str(error) if error is not None else None,
+        "elapsed_seconds": round(time.perf_counter() - start, 4),
+    }
+
+
+def summarize_batch(items: List[Dict], elapsed_seconds: float) -> Dict:
+    """
+    Tổng hợp các mục kết quả của một lô phân tích.
+
+    Args:
+        items (List[Dict]): Các mục kết quả theo thứ tự đầu vào
+        elapsed_seconds (float): Thời gian thực của cả lô
+
+    Returns:
+        Dict: Kết quả lô kèm số lượng thành công/thất bại và thời gian
+    """
+    durations = [item["elapsed_seconds"] for item in items]
+    succeeded = sum(1 for item in items if item["status"] == "success")
+    return {
+        "results": items,
+        "total": len(items),
+        "succeeded": succeeded,
+        "failed": len(items) - succeeded,
+        "elapsed_seconds": round(elapsed_seconds, 4),
+        "mean_item_seconds": (
+            round(sum(durations) / len(durations), 4) if durations else 0.0
+        ),
+        "max_item_seconds": max(durations, default=0.0),
+    }
 
 
 def main():
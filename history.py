@@ -0,0 +1,310 @@
+"""
+Image History for the Streamlit App
+===================================
+
+The analysis history used to keep every image as a base64 string in the
+Streamlit session (1.33x the image bytes, for the lifetime of the session)
+and decoded and sent every one of them to the browser on each rerun.
+
+ImageHistory keeps only a small JPEG thumbnail and the analysis result of
+each record in memory. The analyzed images themselves are written once to
+a content-addressed BlobStore on disk, shared by all sessions of the
+process: the same photo uploaded twice, or by two users, is stored once.
+History is capped at max_items records; the oldest are evicted first and
+a blob is deleted as soon as no record references it anymore (including
+when a session ends and its history is garbage collected).
+
+Configuration (environment variables):
+    PLANT_HISTORY_DIR: Parent directory of the blob store (default: the
+                       system temporary directory); each process uses its
+                       own subdirectory, removed at exit
+    PLANT_HISTORY_MAX_ITEMS: Max records per session (default: 50)
+    PLANT_HISTORY_THUMBNAIL: Longest thumbnail edge in pixels (default: 320)
+"""
+
+import atexit
+import hashlib
+import io
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import uuid
+import weakref
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Deque, Dict, List, Optional, Union
+
+from PIL import Image
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ITEMS = int(os.environ.get("PLANT_HISTORY_MAX_ITEMS", 50))
+DEFAULT_THUMBNAIL_SIZE = int(os.environ.get("PLANT_HISTORY_THUMBNAIL", 320))
+THUMBNAIL_QUALITY = 80
+
+BytesLike = Union[bytes, bytearray, memoryview]
+
+
+class BlobStore:
+    """
+    Content-addressed, reference-counted file store.
+
+    Blobs are named after the SHA-256 of their content. put() and release()
+    count references, and the file is deleted when the last reference is
+    released. Thread-safe; shared by all sessions of the process.
+
+    Args:
+        directory (str): Directory for the blob files (created if missing)
+
+    Example:
+        >>> blobs = BlobStore("/tmp/plant-history")
+        >>> digest = blobs.put(image_bytes)
+        >>> blobs.get(digest) == image_bytes
+        True
+        >>> blobs.release(digest)
+    """
+
+    def __init__(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self._refs: Dict[str, int] = {}
+        self._sizes: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def _path(self, digest: str) -> str:
+        return os.path.join(self.directory, digest)
+
+    def put(self, data: BytesLike) -> str:
+        """
+        Store data (if not stored yet) and add a reference to it.
+
+        Returns:
+            str: Digest identifying the blob
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            if digest not in self._refs:
+                # Write to a temporary name first so readers never see a
+                # partial blob
+                fd, temp_path = tempfile.mkstemp(dir=self.directory)
+                with os.fdopen(fd, "wb") as f:
+                    f.write(data)
+                os.replace(temp_path, self._path(digest))
+                self._refs[digest] = 0
+                self._sizes[digest] = len(memoryview(data).cast("B"))
+            self._refs[digest] += 1
+        return digest
+
+    def get(self, digest: str) -> Optional[bytes]:
+        """Read a blob, None if it does not exist (anymore)."""
+        try:
+            with open(self._path(digest), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def release(self, digest: str) -> None:
+        """Drop a reference; the blob is deleted with its last reference."""
+        with self._lock:
+            count = self._refs.get(digest)
+            if count is None:
+                return
+            if count > 1:
+                self._refs[digest] = count - 1
+                return
+            del self._refs[digest]
+            del self._sizes[digest]
+            try:
+                os.remove(self._path(digest))
+            except FileNotFoundError:
+                pass
+
+    def stats(self) -> Dict:
+        """Return the number of blobs, references and bytes on disk."""
+        with self._lock:
+            return {
+                "blobs": len(self._refs),
+                "references": sum(self._refs.values()),
+                "bytes": sum(self._sizes.values()),
+            }
+
+
+def make_thumbnail(
+    image_bytes: BytesLike, size: int = DEFAULT_THUMBNAIL_SIZE
+) -> bytes:
+    """
+    Encode a small JPEG preview of an image.
+
+    Args:
+        image_bytes (BytesLike): Encoded image
+        size (int): Longest edge of the thumbnail in pixels
+
+    Returns:
+        bytes: JPEG thumbnail
+    """
+    with Image.open(io.BytesIO(image_bytes)) as image:
+        image.draft("RGB", (size, size))
+        thumbnail = image.convert("RGB")
+    thumbnail.thumbnail((size, size))
+    buffer = io.BytesIO()
+    thumbnail.save(buffer, format="JPEG", quality=THUMBNAIL_QUALITY)
+    return buffer.getvalue()
+
+
+@dataclass
+class HistoryRecord:
+    """
+    Data class for one analyzed image in the history.
+
+    Attributes:
+        filename (str): Name of the uploaded file
+        timestamp (str): Time of the analysis
+        result (Dict): Analysis result
+        thumbnail (bytes): JPEG preview kept in memory
+        digest (str): Blob holding the analyzed image
+        mime_type (str): MIME type of the analyzed image
+        size (int): Size in bytes of the analyzed image
+        id (str): Stable identifier, e.g. for widget keys
+    """
+    filename: str
+    timestamp: str
+    result: Dict
+    thumbnail: bytes
+    digest: str
+    mime_type: str
+    size: int
+    id: str = field(default_factory=lambda: uuid.uuid4().hex[:12])
+
+
+def _release_all(blobs: BlobStore, digests: List[str]) -> None:
+    """Release the blobs of a history that is cleared or collected."""
+    for digest in digests:
+        blobs.release(digest)
+    digests.clear()
+
+
+class ImageHistory:
+    """
+    Bounded history of analyzed images for one session.
+
+    Args:
+        blobs (Optional[BlobStore]): Store for the analyzed images, None for
+                                     the process-wide store
+        max_items (int): Max records; the oldest are evicted first
+        thumbnail_size (int): Longest thumbnail edge in pixels
+
+    Example:
+        >>> history = ImageHistory()
+        >>> record = history.add("leaf.jpg", prepared.data, "image/jpeg", result)
+        >>> for record in history.records():
+        ...     st.image(record.thumbnail)
+    """
+
+    def __init__(
+        self,
+        blobs: Optional[BlobStore] = None,
+        max_items: int = DEFAULT_MAX_ITEMS,
+        thumbnail_size: int = DEFAULT_THUMBNAIL_SIZE
+    ):
+        self.blobs = blobs if blobs is not None else get_default_blob_store()
+        self.max_items = max(1, max_items)
+        self.thumbnail_size = thumbnail_size
+        self._records: Deque[HistoryRecord] = deque()
+        # Digests referenced by this history, released when it is collected
+        self._digests: List[str] = []
+        self._lock = threading.Lock()
+        weakref.finalize(self, _release_all, self.blobs, self._digests)
+
+    def add(
+        self,
+        filename: str,
+        image_bytes: BytesLike,
+        mime_type: str,
+        result: Dict,
+        timestamp: Optional[str] = None
+    ) -> HistoryRecord:
+        """
+        Add an analyzed image, evicting the oldest records beyond max_items.
+
+        Args:
+            filename (str): Name of the uploaded file
+            image_bytes (BytesLike): Analyzed image
+            mime_type (str): MIME type of the image
+            result (Dict): Analysis result
+            timestamp (Optional[str]): Time of the analysis, None for now
+
+        Returns:
+            HistoryRecord: The new record
+        """
+        record = HistoryRecord(
+            filename=filename,
+            timestamp=timestamp or datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            result=result,
+            thumbnail=make_thumbnail(image_bytes, self.thumbnail_size),
+            digest=self.blobs.put(image_bytes),
+            mime_type=mime_type,
+            size=len(memoryview(image_bytes).cast("B")),
+        )
+        with self._lock:
+            self._records.append(record)
+            self._digests.append(record.digest)
+            while len(self._records) > self.max_items:
+                evicted = self._records.popleft()
+                self._digests.remove(evicted.digest)
+                self.blobs.release(evicted.digest)
+        return record
+
+    def records(self) -> List[HistoryRecord]:
+        """Return the records, most recent first."""
+        with self._lock:
+            return list(reversed(self._records))
+
+    def original(self, record: HistoryRecord) -> Optional[bytes]:
+        """Read the analyzed image of a record, None if it is gone."""
+        return self.blobs.get(record.digest)
+
+    def clear(self) -> None:
+        """Remove every record and release its image."""
+        with self._lock:
+            self._records.clear()
+            _release_all(self.blobs, self._digests)
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def memory_bytes(self) -> int:
+        """Return the bytes of thumbnails kept in memory."""
+        with self._lock:
+            return sum(len(record.thumbnail) for record in self._records)
+
+
+_default_blob_store: Optional[BlobStore] = None
+_default_blob_store_lock = threading.Lock()
+
+
+def get_default_blob_store() -> BlobStore:
+    """
+    Get the process-wide blob store.
+
+    The store lives in a directory of its own under PLANT_HISTORY_DIR (or
+    the system temporary directory), removed when the process exits.
+
+    Returns:
+        BlobStore: Shared blob store
+    """
+    global _default_blob_store
+    if _default_blob_store is None:
+        with _default_blob_store_lock:
+            if _default_blob_store is None:
+                parent = os.environ.get("PLANT_HISTORY_DIR") or None
+                if parent:
+                    os.makedirs(parent, exist_ok=True)
+                directory = tempfile.mkdtemp(prefix="plant-history-", dir=parent)
+                atexit.register(shutil.rmtree, directory, ignore_errors=True)
+                _default_blob_store = BlobStore(directory)
+                logger.info(f"Lưu ảnh lịch sử phân tích tại {directory}")
+    return _default_blob_store
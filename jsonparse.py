@@ -0,0 +1,305 @@
+"""
+Tolerant JSON Parsing of Model Responses
+========================================
+
+The analysis used to be parsed by stripping markdown fences and calling
+json.loads; on failure a greedy regex (first "{" to last "}") was tried,
+and anything else raised, costing the user a whole new analysis for a
+trailing comma.
+
+parse_json_object reads the first JSON object of a response:
+
+    1. Fast path: json's C decoder (raw_decode) from the first "{" parses
+       the object and ignores any fence or prose around it
+    2. Otherwise repair_json makes one pass over the object, jumping from
+       one structural character to the next, and fixes the defects models
+       produce: trailing and missing commas, “smart quotes” used as string
+       delimiters, raw newlines inside strings, invalid backslash escapes
+       (\\' or a Windows path, kept as a literal backslash), Python
+       literals, unquoted keys, and truncated output (the incomplete last
+       value is dropped and open strings, arrays and objects are closed)
+
+Every outcome ("clean", "extracted", "repaired", "failed") is counted in
+parse_stats, so the parse-failure rate can be monitored.
+
+Example:
+    >>> parse_json_object('```json\\n{"a": [1, 2,],}\\n```')
+    {'a': [1, 2]}
+    >>> parse_json_object('{"symptoms": ["Đốm nâu", "Lá vàng')
+    {'symptoms': ['Đốm nâu']}
+"""
+
+import json
+import re
+import threading
+from typing import Dict, List, Optional
+
+# Outside strings: the next character that changes the parser state
+_STRUCTURAL = re.compile('["“”{}\\[\\],:]')
+# A valid JSON escape sequence (without its backslash)
+_VALID_ESCAPE = re.compile(r'["\\/bfnrt]|u[0-9a-fA-F]{4}')
+# A well-formed rest of a string, copied as is
+_PLAIN_STRING = re.compile(
+    r'(?:[^"\\\n\r\t]|\\["\\/bfnrt]|\\u[0-9a-fA-F]{4})*"'
+)
+# Inside a string: its end, an escape or a raw newline
+_PLAIN_STRING_STOP = re.compile(r'["\\\n\r\t]')
+_SMART_STRING_STOP = re.compile('[“”"\\\\\n\r\t]')
+_SCALAR = re.compile(
+    r"-?(?:0|[1-9]\d*)(?:\.\d+)?(?:[eE][+-]?\d+)?|true|false|null"
+)
+_KEY = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+_LITERALS = {"True": "true", "False": "false", "None": "null"}
+_CONTROL = {"\n": "\\n", "\r": "\\r", "\t": "\\t"}
+_CLOSERS = {"{": "}", "[": "]"}
+
+# What the innermost container expects next
+_KEY_NEXT, _COLON_NEXT, _VALUE_NEXT, _COMMA_NEXT = range(4)
+
+_decoder = json.JSONDecoder()
+
+
+class ParseStats:
+    """
+    Thread-safe counters of how model responses were parsed.
+
+    Outcomes:
+        clean: the response was exactly one JSON object
+        extracted: a valid object surrounded by fences or prose
+        repaired: an object that needed repair_json
+        failed: no object could be recovered
+    """
+
+    OUTCOMES = ("clean", "extracted", "repaired", "failed")
+
+    def __init__(self):
+        self._counts = dict.fromkeys(self.OUTCOMES, 0)
+        self._lock = threading.Lock()
+
+    def record(self, outcome: str) -> None:
+        with self._lock:
+            self._counts[outcome] += 1
+
+    def snapshot(self) -> Dict:
+        """Return the count of each outcome and the failure/repair rates."""
+        with self._lock:
+            counts = dict(self._counts)
+        total = sum(counts.values())
+        return {
+            "responses": total,
+            **counts,
+            "failure_rate": counts["failed"] / total if total else 0.0,
+            "repair_rate": counts["repaired"] / total if total else 0.0,
+        }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counts = dict.fromkeys(self.OUTCOMES, 0)
+
+
+parse_stats = ParseStats()
+
+
+def repair_json(text: str, start: int = 0) -> str:
+    """
+    Rewrite the first JSON object from text[start:] as valid JSON.
+
+    One pass over the text; stops at the end of the first balanced object.
+    If the text ends first, the output is cut back to the last complete
+    value and the containers still open are closed.
+
+    Args:
+        text (str): Text containing a (possibly malformed) JSON object
+        start (int): Position of its opening "{"
+
+    Returns:
+        str: JSON text, to be checked by json.loads
+    """
+    out: List[str] = []
+    kinds: List[str] = []     # open containers, "{" or "["
+    expects: List[int] = []   # what each open container expects next
+    # Last point where out plus closers for safe_kinds is valid JSON
+    safe_length, safe_kinds = 0, ""
+    position, end = start, len(text)
+
+    def mark_safe():
+        nonlocal safe_length, safe_kinds
+        safe_length, safe_kinds = len(out), "".join(kinds)
+
+    def value_done():
+        if expects:
+            expects[-1] = _COMMA_NEXT
+        mark_safe()
+
+    while position < end:
+        match = _STRUCTURAL.search(text, position)
+        if match is None:
+            break  # a trailing number or literal may be cut, drop it
+        bare = text[position:match.start()].strip()
+        if bare and kinds:
+            expect = expects[-1]
+            if expect == _COMMA_NEXT and kinds[-1] == "[":
+                out.append(",")  # missing comma between elements
+                expect = _VALUE_NEXT
+            if expect == _VALUE_NEXT:
+                tokens = [_LITERALS.get(token, token) for token in bare.split()]
+                if all(_SCALAR.fullmatch(token) for token in tokens) and (
+                    len(tokens) == 1 or kinds[-1] == "["
+                ):
+                    out.append(",".join(tokens))  # [1 2 3] -> [1,2,3]
+                else:
+                    # Other bare words (e.g. 85%) are kept as a string
+                    out.append(json.dumps(bare, ensure_ascii=False))
+                value_done()
+            elif expect == _KEY_NEXT and _KEY.fullmatch(bare):
+                out.append(f'"{bare}"')  # unquoted key
+                expects[-1] = _COLON_NEXT
+            # Anything else is stray text between tokens and is dropped
+
+        char = match.group()
+        position = match.end()
+        expect = expects[-1] if expects else _VALUE_NEXT
+
+        if char in "{[":
+            if kinds and expect == _COMMA_NEXT and kinds[-1] == "[":
+                out.append(",")
+            elif kinds and expect != _VALUE_NEXT:
+                continue  # no container can start here
+            out.append(char)
+            kinds.append(char)
+            expects.append(_KEY_NEXT if char == "{" else _VALUE_NEXT)
+            mark_safe()
+
+        elif char in "}]":
+            if not kinds:
+                continue
+            if expect == _COLON_NEXT:
+                out.append(":null")
+            elif expect == _VALUE_NEXT and kinds[-1] == "{":
+                out.append("null")
+            elif out[-1] == ",":
+                out.pop()  # trailing comma
+            out.append(_CLOSERS[kinds.pop()])
+            expects.pop()
+            value_done()
+            if not kinds:
+                return "".join(out)
+
+        elif char == ",":
+            if kinds and expect == _COMMA_NEXT:
+                out.append(",")
+                expects[-1] = _KEY_NEXT if kinds[-1] == "{" else _VALUE_NEXT
+
+        elif char == ":":
+            if kinds and expect == _COLON_NEXT:
+                out.append(":")
+                expects[-1] = _VALUE_NEXT
+
+        else:  # a string: '"', or a smart quote used as a delimiter
+            if not kinds:
+                continue
+            if expect == _COMMA_NEXT:
+                out.append(",")  # missing comma before a key or element
+                expect = _KEY_NEXT if kinds[-1] == "{" else _VALUE_NEXT
+            elif expect == _COLON_NEXT:
+                out.append(":")  # missing colon after a key
+                expect = _VALUE_NEXT
+            plain = _PLAIN_STRING.match(text, position) if char == '"' else None
+            if plain is not None:
+                out.append(text[position - 1:plain.end()])
+                position = plain.end()
+                if expect == _KEY_NEXT:
+                    expects[-1] = _COLON_NEXT
+                else:
+                    value_done()
+                continue
+            stops = _PLAIN_STRING_STOP if char == '"' else _SMART_STRING_STOP
+            parts = ['"']
+            closed = False
+            nested = 0  # “quotes” inside a string delimited by smart quotes
+            while position < end:
+                found = stops.search(text, position)
+                if found is None:
+                    break
+                parts.append(text[position:found.start()])
+                stop_char = found.group()
+                position = found.end()
+                if stop_char == "\\":
+                    if position >= end:
+                        continue
+                    escape = _VALID_ESCAPE.match(text, position)
+                    if escape is not None:
+                        parts.append(text[position - 1:escape.end()])
+                        position = escape.end()
+                    else:
+                        # Invalid escape (\' or a Windows path): a literal
+                        # backslash; the next character is read as usual
+                        parts.append("\\\\")
+                    continue
+                if stop_char in _CONTROL:
+                    parts.append(_CONTROL[stop_char])
+                elif stop_char == '"' and char != '"':
+                    parts.append('\\"')  # plain quote inside a smart one
+                elif stop_char == "“":
+                    parts.append(stop_char)
+                    nested += 1
+                elif stop_char == "”" and nested:
+                    parts.append(stop_char)
+                    nested -= 1
+                else:
+                    closed = True
+                    break
+            if not closed:
+                break  # truncated inside a string
+            parts.append('"')
+            out.append("".join(parts))
+            if expect == _KEY_NEXT:
+                expects[-1] = _COLON_NEXT
+            else:
+                value_done()
+
+    # The text ended inside the object: keep what was complete and close
+    # the containers that were open then
+    del out[safe_length:]
+    out.extend(_CLOSERS[kind] for kind in reversed(safe_kinds))
+    return "".join(out)
+
+
+def parse_json_object(
+    text: str, stats: Optional[ParseStats] = parse_stats
+) -> Dict:
+    """
+    Parse the first JSON object in a model response, repairing it if needed.
+
+    Args:
+        text (str): Model response
+        stats (Optional[ParseStats]): Counters to record the outcome in
+
+    Returns:
+        Dict: Parsed object
+
+    Raises:
+        ValueError: If the response contains no recoverable JSON object
+    """
+    outcome, data = "failed", None
+    start = text.find("{") if isinstance(text, str) else -1
+    if start >= 0:
+        try:
+            data, stop = _decoder.raw_decode(text, start)
+            outcome = (
+                "clean" if not text[:start].strip() and not text[stop:].strip()
+                else "extracted"
+            )
+        except ValueError:
+            try:
+                data = json.loads(repair_json(text, start))
+                outcome = "repaired"
+            except ValueError:
+                data = None
+        if not isinstance(data, dict):
+            outcome, data = "failed", None
+    if stats is not None:
+        stats.record(outcome)
+    if data is None:
+        raise ValueError("Response contains no JSON object")
+    return data
@@ -1,11 +1,17 @@
 import streamlit as st
-import base64
-from datetime import datetime
-from core import PlantDiseaseDetector
+from assets import image_data_url, load_image
+from core import get_detector
+from history import ImageHistory
+from payload import ImagePayload
+from preprocess import prepare_image
+from records import get_default_analysis_store
 from chatbot import PlantDiseaseChatbot
 
 # Constants
 DISEASE_TYPE_INVALID = "invalid_image"
+SIDEBAR_LOGO_WIDTH = 100
+# The header logo is shown at most 105 px wide; keep 2x for HiDPI screens
+HEADER_LOGO_WIDTH = 210
 
 # Set Streamlit theme to light and wide mode
 st.set_page_config(
@@ -24,9 +30,10 @@ if 'disease_result' not in st.session_state:
     st.session_state.disease_result = None
 if 'show_chat_dialog' not in st.session_state:
     st.session_state.show_chat_dialog = False
-# Initialize session state for uploaded images history
-if 'uploaded_images' not in st.session_state:
-    st.session_state.uploaded_images = []
+# Initialize session state for uploaded images history (thumbnails in
+# memory, analyzed images on disk)
+if 'history' not in st.session_state:
+    st.session_state.history = ImageHistory()
 if 'confirm_clear_history' not in st.session_state:
     st.session_state.confirm_clear_history = False
 
@@ -34,7 +41,8 @@ if 'confirm_clear_history' not in st.session_state:
 with st.sidebar:
     col1, col2, col3 = st.columns([1, 2, 1])
     with col2:
-        st.image("black-tree-logo.png", width=100)
+        st.image(load_image("black-tree-logo.png", SIDEBAR_LOGO_WIDTH),
+                 width=SIDEBAR_LOGO_WIDTH)
     st.title("Developing an AI Application")
     st.info("""
     Hệ thống đánh giá, phân tích và phát hiện bệnh dựa trên hình ảnh lá, rễ, và thân cây nhờ vào Computer Vision và Machine Learning.
@@ -158,9 +166,9 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-with open("agriculture.png", "rb") as f:
-    logo = base64.b64encode(f.read()).decode()
-logo_html = f'<img src="data:image/png;base64,{logo}" class="header-logo">'
+# Logo read, resized and encoded once per process, not on every rerun
+logo_url = image_data_url("agriculture.png", HEADER_LOGO_WIDTH)
+logo_html = f'<img src="{logo_url}" class="header-logo">'
 
 st.markdown(
         f"""<div style="text-align: center; margin: 0.2em auto; margin-bottom: 0; max-width: 105px;">
@@ -185,26 +193,31 @@ if uploaded_file is not None:
         with st.spinner("Đang phân tích..."):
             try:
                 # ✅ GỌI TRỰC TIẾP (KHÔNG QUA API)
-                detector = PlantDiseaseDetector()
+                detector = get_detector()
                 
-                # Convert image to base64
-                image_bytes = uploaded_file.getvalue()
-                base64_image = base64.b64encode(image_bytes).decode('utf-8')
+                # Downscale and re-encode image, read from the upload buffer
+                prepared = prepare_image(uploaded_file)
                 
-                # Phân tích
-                result = detector.analyze_plant_image_base64(base64_image)
+                # Phân tích (ảnh được mã hóa base64 một lần, khi gửi đi)
+                result = detector.analyze_plant_image(
+                    ImagePayload(prepared.data, prepared.mime_type)
+                )
                 
                 # Save result to session state for chatbot
                 st.session_state.disease_result = result
                 
                 # Save uploaded image to history with metadata
-                image_record = {
-                    'filename': uploaded_file.name,
-                    'image_base64': base64_image,
-                    'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                    'result': result
-                }
-                st.session_state.uploaded_images.append(image_record)
+                record = st.session_state.history.add(
+                    uploaded_file.name, prepared.data, prepared.mime_type,
+                    result
+                )
+                
+                # Keep the result beyond this session (written in the
+                # background)
+                store = get_default_analysis_store()
+                if store is not None:
+                    store.record(result, "streamlit", uploaded_file.name,
+                                 record.digest)
                 
                 # Automatically send context to chatbot
                 if st.session_state.chatbot is None:
@@ -332,37 +345,50 @@ if st.session_state.disease_result is not None:
 
 st.markdown("---")
 st.markdown("## 📁 Lịch sử hình ảnh đã tải")
-if st.session_state.uploaded_images:
+history = st.session_state.history
+if len(history):
     # Add clear history button with confirmation
     if not st.session_state.confirm_clear_history:
         if st.button("🗑️ Xóa lịch sử", key="clear_history"):
             st.session_state.confirm_clear_history = True
-            st.session_state.uploaded_images = []
+            history.clear()
             st.session_state.confirm_clear_history = False
     
-    # Display in reverse order (most recent first)
-    for idx, img_record in enumerate(reversed(st.session_state.uploaded_images)):
-        with st.expander(f"🖼️ {img_record['filename']} - {img_record['timestamp']}", expanded=False):
+    # Display most recent first; a record is only rendered while its
+    # expander is open
+    for img_record in history.records():
+        with st.expander(
+            f"🖼️ {img_record.filename} - {img_record.timestamp}",
+            expanded=False, key=f"history_{img_record.id}", on_change="rerun"
+        ) as history_expander:
+            if not history_expander.open:
+                continue
             col1, col2 = st.columns([1, 2])
             
             with col1:
-                # Decode base64 image for display
-                image_bytes = base64.b64decode(img_record['image_base64'])
-                st.image(image_bytes, caption=img_record['filename'], use_container_width=True)
+                # Thumbnail from memory; the analyzed image is read from
+                # disk only on request
+                st.image(img_record.thumbnail, caption=img_record.filename, use_container_width=True)
+                if st.toggle("🔍 Xem ảnh gốc", key=f"original_{img_record.id}"):
+                    original = history.original(img_record)
+                    if original is not None:
+                        st.image(original, use_container_width=True)
+                    else:
+                        st.caption("Ảnh gốc không còn được lưu")
                 
                 # Add chatbot button for this image's analysis
-                if st.button("💬 Hỏi Chatbot về ảnh này", key=f"chat_btn_{idx}", type="secondary", use_container_width=True):
+                if st.button("💬 Hỏi Chatbot về ảnh này", key=f"chat_btn_{img_record.id}", type="secondary", use_container_width=True):
                     # Initialize chatbot if not exists
                     if st.session_state.chatbot is None:
                         st.session_state.chatbot = PlantDiseaseChatbot()
                     # Set the disease context to this image's result
-                    st.session_state.chatbot.set_disease_context(img_record['result'])
+                    st.session_state.chatbot.set_disease_context(img_record.result)
                     # Open chatbot dialog
                     st.session_state.show_chat_dialog = True
                     st.rerun()
             
             with col2:
-                result = img_record['result']
+                result = img_record.result
                 
                 # Display detailed results based on result type
                 if result.get("disease_type") == DISEASE_TYPE_INVALID:
@@ -506,12 +532,19 @@ def show_chatbot():
     if prompt := st.chat_input("Nhập câu hỏi...", key="chat_dlg_input"):
         st.session_state.chat_messages.append({"role": "user", "content": prompt})
         
-        try:
-            response = st.session_state.chatbot.chat(prompt)
-            st.session_state.chat_messages.append({"role": "assistant", "content": response})
-        except Exception as e:
-            error_msg = f"Xin lỗi, đã có lỗi: {str(e)}"
-            st.session_state.chat_messages.append({"role": "assistant", "content": error_msg})
+        # Render the answer incrementally while it is being generated
+        with chat_container:
+            with st.chat_message("user"):
+                st.markdown(prompt)
+            with st.chat_message("assistant"):
+                try:
+                    response = st.write_stream(
+                        st.session_state.chatbot.chat_stream(prompt)
+                    )
+                    st.session_state.chat_messages.append({"role": "assistant", "content": response})
+                except Exception as e:
+                    error_msg = f"Xin lỗi, đã có lỗi: {str(e)}"
+                    st.session_state.chat_messages.append({"role": "assistant", "content": error_msg})
         
         # Rerun to show new messages (dialog stays open automatically)
         st.rerun()
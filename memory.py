@@ -0,0 +1,290 @@
+"""
+Token-Budgeted Chat Memory
+==========================
+
+This module bounds what the chatbot sends to the model on every turn. The
+system prompt (with its disease context) is always sent, the last turns are
+kept verbatim, and older turns are folded into a short running summary (or
+dropped), so the prompt size stays flat instead of growing with every turn
+of the conversation.
+
+Older turns are summarized incrementally and locally: each evicted turn
+becomes one line with the start of the question and of the answer, and the
+oldest lines are dropped once the summary exceeds its own budget. No extra
+model call is made.
+
+Configuration (environment variables used by create_chat_memory):
+    PLANT_CHAT_TOKEN_BUDGET: Max estimated prompt tokens per request,
+                             0 for unlimited (default: 6000)
+    PLANT_CHAT_KEEP_TURNS: Max turns kept verbatim, 0 for unlimited
+                           (default: 8)
+    PLANT_CHAT_SUMMARY_TOKENS: Max tokens of the summary of older turns,
+                               0 to drop older turns instead (default: 400)
+"""
+
+import logging
+import os
+import re
+from collections import deque
+from dataclasses import dataclass
+from typing import Deque, Dict, List, Optional
+
+from prompts import count_tokens
+
+
+logger = logging.getLogger(__name__)
+
+# Approximate per-message overhead of the chat template (role, separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+SUMMARY_HEADER = "TÓM TẮT CÁC LƯỢT TRÒ CHUYỆN TRƯỚC ĐÓ:"
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s")
+
+
+@dataclass
+class _Entry:
+    role: str
+    content: str
+    tokens: int
+
+
+def _shorten(text: str, limit: int) -> str:
+    """Return the first sentence of text, cut to at most limit characters."""
+    text = " ".join(text.split())
+    text = _SENTENCE_END.split(text, 1)[0]
+    return text if len(text) <= limit else text[:limit - 1].rstrip() + "…"
+
+
+class ChatMemory:
+    """
+    Sliding window over a conversation, bounded by turns and tokens.
+
+    A turn is a user message and the assistant reply that follows it. The
+    turn in progress is always sent, even if it alone exceeds the budget.
+
+    Args:
+        token_budget (Optional[int]): Max estimated prompt tokens per
+                                      request, None for unlimited
+        keep_turns (Optional[int]): Max turns kept verbatim, None for
+                                    unlimited
+        summary_tokens (int): Max tokens of the summary of older turns,
+                              0 to drop them
+
+    Example:
+        >>> memory = ChatMemory(token_budget=4000, keep_turns=6)
+        >>> memory.add("user", "Bệnh đốm lá nâu là gì?")
+        >>> messages = memory.build_messages(system_prompt)
+        >>> memory.last_turn["prompt_tokens"]
+    """
+
+    def __init__(
+        self,
+        token_budget: Optional[int] = 6000,
+        keep_turns: Optional[int] = 8,
+        summary_tokens: int = 400
+    ):
+        self.token_budget = token_budget
+        self.keep_turns = keep_turns
+        self.summary_tokens = summary_tokens
+        self.clear()
+
+    def clear(self) -> None:
+        """Forget the conversation and reset the metrics."""
+        self._turns: Deque[List[_Entry]] = deque()
+        self._summary: Deque[_Entry] = deque()
+        self._summary_total = 0
+        self._system_prompt: Optional[str] = None
+        self._system_tokens = 0
+        self.last_turn: Dict = {}
+        self.turns = 0
+        self.prompt_tokens_total = 0
+        self.summarized_turns = 0
+        self.dropped_turns = 0
+
+    def add(self, role: str, content: str) -> None:
+        """
+        Append a message; a user message starts a new turn.
+
+        Args:
+            role (str): "user" or "assistant"
+            content (str): Message text
+        """
+        entry = _Entry(
+            role, content, count_tokens(content) + MESSAGE_OVERHEAD_TOKENS
+        )
+        if role == "user" or not self._turns:
+            self._turns.append([entry])
+        else:
+            self._turns[-1].append(entry)
+
+    def build_messages(self, system_prompt: str) -> List[Dict[str, str]]:
+        """
+        Evict old turns as needed and return the messages for the API.
+
+        Args:
+            system_prompt (str): System prompt including disease context
+
+        Returns:
+            List[Dict[str, str]]: System prompt, summary of older turns (if
+                                  any) and the turns kept verbatim
+        """
+        if system_prompt != self._system_prompt:
+            self._system_prompt = system_prompt
+            self._system_tokens = (
+                count_tokens(system_prompt) + MESSAGE_OVERHEAD_TOKENS
+            )
+
+        summarized, dropped = self.summarized_turns, self.dropped_turns
+        if self.keep_turns:
+            while len(self._turns) > self.keep_turns:
+                self._evict()
+        if self.token_budget:
+            while len(self._turns) > 1 and self._total() > self.token_budget:
+                self._evict()
+
+        messages = [{"role": "system", "content": system_prompt}]
+        if self._summary:
+            messages.append({"role": "system", "content": self.summary()})
+        for turn in self._turns:
+            messages.extend(
+                {"role": entry.role, "content": entry.content}
+                for entry in turn
+            )
+
+        prompt_tokens = self._total()
+        self.turns += 1
+        self.prompt_tokens_total += prompt_tokens
+        self.last_turn = {
+            "prompt_tokens": prompt_tokens,
+            "messages": len(messages),
+            "turns_kept": len(self._turns),
+            "summary_tokens": self._summary_tokens(),
+            "turns_summarized": self.summarized_turns - summarized,
+            "turns_dropped": self.dropped_turns - dropped,
+        }
+        logger.debug(f"Chat memory: {self.last_turn}")
+        return messages
+
+    def record_usage(self, prompt_tokens: Optional[int]) -> None:
+        """Attach the prompt token count reported by the API to last_turn."""
+        if prompt_tokens is not None:
+            self.last_turn["api_prompt_tokens"] = prompt_tokens
+
+    def summary(self) -> str:
+        """Return the running summary of evicted turns ("" if none)."""
+        if not self._summary:
+            return ""
+        return "\n".join(
+            [SUMMARY_HEADER] + [line.content for line in self._summary]
+        )
+
+    def stats(self) -> Dict:
+        """
+        Return cumulative metrics of the conversation.
+
+        Returns:
+            Dict: turns, total and mean prompt tokens, the number of turns
+                  folded into the summary, the number no longer sent at all
+                  (dropped, or aged out of the summary) and the last turn's
+                  metrics
+        """
+        return {
+            "turns": self.turns,
+            "prompt_tokens_total": self.prompt_tokens_total,
+            "mean_prompt_tokens": (
+                round(self.prompt_tokens_total / self.turns, 1)
+                if self.turns else 0.0
+            ),
+            "summarized_turns": self.summarized_turns,
+            "dropped_turns": self.dropped_turns,
+            "last_turn": dict(self.last_turn),
+        }
+
+    def export_state(self) -> Dict:
+        """
+        Return the window, summary and counters as JSON-serializable data.
+
+        Returns:
+            Dict: State accepted by load_state()
+        """
+        return {
+            "turns": [
+                [[e.role, e.content, e.tokens] for e in turn]
+                for turn in self._turns
+            ],
+            "summary": [[e.content, e.tokens] for e in self._summary],
+            "counters": [self.turns, self.prompt_tokens_total,
+                         self.summarized_turns, self.dropped_turns],
+            "last_turn": self.last_turn,
+        }
+
+    def load_state(self, state: Dict) -> None:
+        """
+        Restore a state produced by export_state().
+
+        Args:
+            state (Dict): Exported memory state
+        """
+        self.clear()
+        self._turns = deque(
+            [_Entry(*entry) for entry in turn] for turn in state["turns"]
+        )
+        self._summary = deque(
+            _Entry("system", content, tokens)
+            for content, tokens in state["summary"]
+        )
+        self._summary_total = sum(e.tokens for e in self._summary)
+        (self.turns, self.prompt_tokens_total,
+         self.summarized_turns, self.dropped_turns) = state["counters"]
+        self.last_turn = dict(state.get("last_turn") or {})
+
+    def _summary_tokens(self) -> int:
+        if not self._summary:
+            return 0
+        return (
+            self._summary_total + count_tokens(SUMMARY_HEADER)
+            + MESSAGE_OVERHEAD_TOKENS
+        )
+
+    def _total(self) -> int:
+        return (
+            self._system_tokens + self._summary_tokens()
+            + sum(entry.tokens for turn in self._turns for entry in turn)
+        )
+
+    def _evict(self) -> None:
+        """Move the oldest turn into the summary, or drop it."""
+        turn = self._turns.popleft()
+        if self.summary_tokens <= 0:
+            self.dropped_turns += 1
+            return
+
+        question = next((e.content for e in turn if e.role == "user"), "")
+        answer = next((e.content for e in turn if e.role == "assistant"), "")
+        line = f"- Người dùng: {_shorten(question, 160)}"
+        if answer:
+            line += f" → Trợ lý: {_shorten(answer, 200)}"
+        tokens = count_tokens(line) + 1
+        self._summary.append(_Entry("system", line, tokens))
+        self._summary_total += tokens
+        self.summarized_turns += 1
+
+        while self._summary and self._summary_tokens() > self.summary_tokens:
+            self._summary_total -= self._summary.popleft().tokens
+            self.dropped_turns += 1
+
+
+def create_chat_memory() -> ChatMemory:
+    """
+    Create a chat memory configured from environment variables.
+
+    Returns:
+        ChatMemory: New, empty chat memory
+    """
+    return ChatMemory(
+        token_budget=int(os.environ.get("PLANT_CHAT_TOKEN_BUDGET", 6000))
+        or None,
+        keep_turns=int(os.environ.get("PLANT_CHAT_KEEP_TURNS", 8)) or None,
+        summary_tokens=int(os.environ.get("PLANT_CHAT_SUMMARY_TOKENS", 400)),
+    )
@@ -0,0 +1,173 @@
+"""
+Image Payloads for the Vision Model
+===================================
+
+Between the upload and the model request an image used to be copied at
+every step: the upload bytes, base64 bytes, a base64 str, the str without
+its data URL prefix, the data URL f-string, and the JSON str and bytes built
+by the HTTP client. For a 1 MB photo that is several megabytes allocated
+per request.
+
+ImagePayload carries the raw image bytes (or a memoryview of them) through
+the pipeline instead. The base64 text only ever exists inside the request
+body: encode_request_body serializes the other request parameters once and
+base64-encodes the image in chunks directly into the body buffer, which is
+handed to the HTTP client as is.
+
+Example:
+    >>> payload = ImagePayload(jpeg_bytes, "image/jpeg")
+    >>> body = encode_request_body(
+    ...     {"messages": [{"role": "user", "content": [
+    ...         {"type": "image_url",
+    ...          "image_url": {"url": IMAGE_URL_PLACEHOLDER}}]}]},
+    ...     payload
+    ... )
+"""
+
+import binascii
+import io
+import json
+import re
+from typing import BinaryIO, Dict, Union
+
+# Stands for the image's data URL in request parameters until the body is
+# encoded
+IMAGE_URL_PLACEHOLDER = "plant-image-payload:3f9c2a7e"
+
+# Raw bytes per base64 chunk (a multiple of 3, so chunks concatenate)
+ENCODE_CHUNK_BYTES = 3 * 16 * 1024
+
+_BASE64 = re.compile(r"[A-Za-z0-9+/]*={0,2}")
+_MIME_TYPE = re.compile(r"[A-Za-z0-9.+-]+/[A-Za-z0-9.+-]+")
+
+BytesLike = Union[bytes, bytearray, memoryview]
+
+
+class ImagePayload:
+    """
+    Encoded image file (JPEG, PNG, ...) on its way to the vision model.
+
+    The data is referenced, never copied: a memoryview into a larger buffer
+    is kept as a view.
+
+    Args:
+        data (BytesLike): Image file bytes
+        mime_type (str): MIME type of the image
+
+    Raises:
+        ValueError: If data is empty or mime_type is malformed
+    """
+
+    __slots__ = ("data", "mime_type")
+
+    def __init__(self, data: BytesLike, mime_type: str = "image/jpeg"):
+        if not isinstance(data, (bytes, bytearray, memoryview)):
+            raise ValueError("Image data must be bytes-like")
+        if not _MIME_TYPE.fullmatch(mime_type):
+            raise ValueError(f"Invalid MIME type: {mime_type!r}")
+        self.data = data
+        self.mime_type = mime_type
+        if not len(self):
+            raise ValueError("Image data cannot be empty")
+
+    @classmethod
+    def from_base64(
+        cls, base64_image: str, mime_type: str = "image/jpeg"
+    ) -> "ImagePayload":
+        """
+        Decode a base64 image, with or without a data URL prefix.
+
+        Args:
+            base64_image (str): Base64 image, or a data:...;base64, URL
+            mime_type (str): MIME type if there is no data URL prefix
+
+        Returns:
+            ImagePayload: Decoded image
+
+        Raises:
+            ValueError: If base64_image is not a non-empty base64 string
+        """
+        if not isinstance(base64_image, str):
+            raise ValueError("base64_image must be a string")
+        if not base64_image:
+            raise ValueError("base64_image cannot be empty")
+
+        if base64_image.startswith("data:"):
+            comma = base64_image.find(",")
+            if comma < 0:
+                raise ValueError("base64_image is not valid base64")
+            mime_type = base64_image[5:comma].split(";", 1)[0] or mime_type
+            base64_image = base64_image[comma + 1:]
+        # a2b_base64 reads an ASCII str in place, without an encoded copy
+        if not _BASE64.fullmatch(base64_image):
+            raise ValueError("base64_image is not valid base64")
+        try:
+            return cls(binascii.a2b_base64(base64_image), mime_type)
+        except binascii.Error:
+            raise ValueError("base64_image is not valid base64")
+
+    def __len__(self) -> int:
+        if isinstance(self.data, memoryview):
+            return self.data.nbytes
+        return len(self.data)
+
+    def __repr__(self) -> str:
+        return f"ImagePayload({self.mime_type}, {len(self)} bytes)"
+
+    @property
+    def data_url_size(self) -> int:
+        """Length of the data URL in bytes."""
+        return len(self._data_url_prefix()) + (len(self) + 2) // 3 * 4
+
+    def _data_url_prefix(self) -> bytes:
+        return f"data:{self.mime_type};base64,".encode("ascii")
+
+    def write_data_url(self, out: BinaryIO) -> None:
+        """
+        Write the image as a data URL, base64-encoding it chunk by chunk.
+
+        Args:
+            out (BinaryIO): Destination, e.g. the request body buffer
+        """
+        out.write(self._data_url_prefix())
+        view = memoryview(self.data).cast("B")
+        for offset in range(0, len(view), ENCODE_CHUNK_BYTES):
+            out.write(binascii.b2a_base64(
+                view[offset:offset + ENCODE_CHUNK_BYTES], newline=False
+            ))
+
+
+def encode_request_body(params: Dict, payload: ImagePayload) -> bytes:
+    """
+    Serialize request parameters to a JSON body containing the image.
+
+    Args:
+        params (Dict): JSON request parameters with IMAGE_URL_PLACEHOLDER as
+                       the URL of the image
+        payload (ImagePayload): Image to embed as a data URL
+
+    Returns:
+        bytes: UTF-8 JSON body
+
+    Raises:
+        ValueError: If params contain no IMAGE_URL_PLACEHOLDER
+    """
+    text = json.dumps(
+        params, ensure_ascii=False, separators=(",", ":")
+    ).encode("utf-8")
+    head, placeholder, tail = text.partition(
+        IMAGE_URL_PLACEHOLDER.encode("ascii")
+    )
+    if not placeholder:
+        raise ValueError("Request parameters have no image placeholder")
+    size = len(head) + payload.data_url_size + len(tail)
+    body = io.BytesIO()
+    # Allocate the whole body once instead of growing it chunk by chunk
+    body.seek(size - 1)
+    body.write(b"\0")
+    body.seek(0)
+    body.write(head)
+    payload.write_data_url(body)
+    body.write(tail)
+    # getvalue hands over the buffer without copying it
+    return body.getvalue()
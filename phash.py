@@ -0,0 +1,261 @@
+"""
+Perceptual Hash Index for Plant Disease Detection
+=================================================
+
+This module finds near-duplicate images (re-encoded, resized or slightly
+recropped versions of the same photo) so a previous analysis result can be
+reused instead of calling the vision model again.
+
+Images are reduced to a 64-bit difference hash (dHash). Hashes are stored in
+a multi-index hash table: each hash is split into m disjoint chunks and
+indexed by every chunk. By the pigeonhole principle, any stored hash within
+r bits of a query differs by at most r // m bits in at least one chunk, so a
+lookup only probes the buckets within that sub-radius of each query chunk
+instead of scanning the whole index.
+
+Configuration (environment variables used by get_default_index):
+    PLANT_NEAR_DUPLICATE_DISTANCE: Max hamming distance for reuse. Unset
+                                   disables near-duplicate lookup.
+    PLANT_NEAR_DUPLICATE_MAX_ENTRIES: Max hashes kept before LRU eviction
+                                      (default: 1024)
+"""
+
+import io
+import logging
+import os
+import threading
+from collections import OrderedDict
+from itertools import combinations
+from typing import Any, Dict, List, Optional, Tuple
+
+from PIL import Image
+
+
+logger = logging.getLogger(__name__)
+
+HASH_BITS = 64
+
+
+def dhash(image_bytes: bytes, hash_size: int = 8) -> int:
+    """
+    Compute the difference hash of an image.
+
+    The image is converted to grayscale, shrunk to (hash_size + 1) x
+    hash_size pixels and each bit records whether a pixel is brighter than
+    its right neighbour.
+
+    Args:
+        image_bytes (bytes): Encoded image data (JPEG, PNG, ...)
+        hash_size (int): Hash width/height, giving hash_size ** 2 bits
+
+    Returns:
+        int: Hash value as an unsigned integer
+    """
+    with Image.open(io.BytesIO(image_bytes)) as image:
+        image.draft("L", (hash_size * 4, hash_size * 4))
+        small = image.convert("L").resize(
+            (hash_size + 1, hash_size), Image.Resampling.LANCZOS
+        )
+    pixels = list(small.getdata())
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (
+                pixels[offset + col] > pixels[offset + col + 1]
+            )
+    return value
+
+
+def hamming_distance(a: int, b: int) -> int:
+    """Return the number of differing bits between two hashes."""
+    return (a ^ b).bit_count()
+
+
+class NearDuplicateIndex:
+    """
+    Multi-index hamming table for 64-bit perceptual hashes.
+
+    Args:
+        max_distance (int): Maximum hamming distance supported by lookups
+        chunks (int): Number of disjoint chunks each hash is indexed by.
+                      About 64 / log2(expected size) is optimal; the default
+                      of 4 (16-bit chunks) suits up to a few million hashes.
+        max_entries (Optional[int]): Maximum number of hashes before the least
+                                     recently used one is evicted, None for
+                                     no limit
+
+    Example:
+        >>> index = NearDuplicateIndex(max_distance=6)
+        >>> index.add(dhash(image_bytes), result)
+        >>> match = index.find(dhash(other_bytes), max_distance=4)
+        >>> if match is not None:
+        ...     distance, result = match
+    """
+
+    def __init__(self, max_distance: int = 6, chunks: int = 4,
+                 max_entries: Optional[int] = 1024):
+        if not 0 <= max_distance < HASH_BITS:
+            raise ValueError("max_distance phải nằm trong khoảng [0, 63]")
+        if not 1 <= chunks <= HASH_BITS:
+            raise ValueError("chunks phải nằm trong khoảng [1, 64]")
+        if max_entries is not None and max_entries < 1:
+            raise ValueError("max_entries phải lớn hơn 0")
+        self.max_distance = max_distance
+        self.max_entries = max_entries
+        # Split 64 bits into `chunks` contiguous ranges of near-equal width
+        bounds = [HASH_BITS * i // chunks for i in range(chunks + 1)]
+        self._chunks: List[Tuple[int, int]] = [
+            (bounds[i], (1 << (bounds[i + 1] - bounds[i])) - 1)
+            for i in range(chunks)
+        ]
+        self._tables: List[Dict[int, List[int]]] = [{} for _ in self._chunks]
+        self._probe_cache: Dict[Tuple[int, int], List[int]] = {}
+        self._values: "OrderedDict[int, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _probes(self, width: int, radius: int) -> List[int]:
+        """Return XOR masks of `width` bits with at most `radius` bits set."""
+        key = (width, radius)
+        probes = self._probe_cache.get(key)
+        if probes is None:
+            probes = [0]
+            for count in range(1, radius + 1):
+                probes.extend(
+                    sum(1 << bit for bit in bits)
+                    for bits in combinations(range(width), count)
+                )
+            self._probe_cache[key] = probes
+        return probes
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def add(self, hash_value: int, value: Any) -> None:
+        """
+        Store a value under a perceptual hash.
+
+        Args:
+            hash_value (int): 64-bit perceptual hash
+            value (Any): Payload returned by find(), e.g. an analysis result.
+                         Replaces any value stored under the same hash.
+        """
+        with self._lock:
+            if hash_value not in self._values:
+                for table, (shift, mask) in zip(self._tables, self._chunks):
+                    table.setdefault(
+                        (hash_value >> shift) & mask, []
+                    ).append(hash_value)
+            self._values[hash_value] = value
+            self._values.move_to_end(hash_value)
+            if self.max_entries is not None:
+                while len(self._values) > self.max_entries:
+                    self._remove(self._values.popitem(last=False)[0])
+
+    def _remove(self, hash_value: int) -> None:
+        """Drop an evicted hash from every chunk table (lock held)."""
+        for table, (shift, mask) in zip(self._tables, self._chunks):
+            chunk = (hash_value >> shift) & mask
+            bucket = table[chunk]
+            bucket.remove(hash_value)
+            if not bucket:
+                del table[chunk]
+
+    def _touch(self, hash_value: int) -> Optional[Any]:
+        """Mark a hash as recently used; None if it was evicted meanwhile."""
+        with self._lock:
+            value = self._values.get(hash_value)
+            if value is not None:
+                self._values.move_to_end(hash_value)
+            return value
+
+    def find(
+        self,
+        hash_value: int,
+        max_distance: Optional[int] = None
+    ) -> Optional[Tuple[int, Any]]:
+        """
+        Find the closest stored hash within max_distance.
+
+        Args:
+            hash_value (int): 64-bit perceptual hash to look up
+            max_distance (Optional[int]): Maximum hamming distance, must not
+                                          exceed the index's max_distance
+
+        Returns:
+            Optional[Tuple[int, Any]]: (distance, value) of the closest match,
+                                       or None if nothing is close enough
+        """
+        if max_distance is None:
+            max_distance = self.max_distance
+        elif max_distance > self.max_distance:
+            raise ValueError(
+                f"max_distance vượt quá giới hạn của chỉ mục "
+                f"({self.max_distance})"
+            )
+
+        exact = self._touch(hash_value)
+        if exact is not None:
+            return 0, exact
+
+        radius = max_distance // len(self._chunks)
+        best_hash = None
+        best_distance = max_distance + 1
+        for table, (shift, mask) in zip(self._tables, self._chunks):
+            chunk = (hash_value >> shift) & mask
+            for probe in self._probes(mask.bit_length(), radius):
+                # Snapshot: add() evicts hashes from the buckets concurrently
+                with self._lock:
+                    bucket = tuple(table.get(chunk ^ probe) or ())
+                if not bucket:
+                    continue
+                distances = [(h ^ hash_value).bit_count() for h in bucket]
+                distance = min(distances)
+                if distance < best_distance:
+                    best_distance = distance
+                    best_hash = bucket[distances.index(distance)]
+        if best_hash is None:
+            return None
+        value = self._touch(best_hash)
+        if value is None:
+            return None
+        return best_distance, value
+
+    def clear(self) -> None:
+        """Remove all stored hashes."""
+        with self._lock:
+            for table in self._tables:
+                table.clear()
+            self._values.clear()
+
+
+_default_index: Optional[NearDuplicateIndex] = None
+_default_index_lock = threading.Lock()
+
+
+def get_default_index() -> Optional[NearDuplicateIndex]:
+    """
+    Get the process-wide near-duplicate index configured from environment.
+
+    Returns:
+        Optional[NearDuplicateIndex]: Shared index, or None if
+                                      PLANT_NEAR_DUPLICATE_DISTANCE is unset
+    """
+    global _default_index
+    distance = os.environ.get("PLANT_NEAR_DUPLICATE_DISTANCE")
+    if not distance:
+        return None
+    if _default_index is None:
+        with _default_index_lock:
+            if _default_index is None:
+                _default_index = NearDuplicateIndex(
+                    max_distance=int(distance),
+                    max_entries=int(os.environ.get(
+                        "PLANT_NEAR_DUPLICATE_MAX_ENTRIES", 1024
+                    ))
+                )
+                logger.info(
+                    f"Khởi tạo chỉ mục ảnh gần trùng lặp "
+                    f"(khoảng cách tối đa {distance})"
+                )
+    return _default_index
@@ -0,0 +1,195 @@
+"""
+Image Preprocessing for Plant Disease Detection
+===============================================
+
+This module prepares uploaded images before they are sent to the vision
+model. Phone photos and PNG screenshots are often several megabytes, while
+the model only needs a moderately sized image to judge leaf symptoms, so
+every upload is:
+
+    1. Decoded (rejecting data that is not an image, and images whose
+       bitmap would exceed max_pixels: decompression bombs)
+    2. Rotated according to its EXIF orientation tag
+    3. Downscaled so the longest edge is at most max_edge pixels
+    4. Re-encoded to JPEG or WebP at the target quality
+
+The result carries the MIME type matching the encoded bytes so the data URL
+sent to the model is always correct. If re-encoding would not make an
+already small image any smaller, the original bytes are kept.
+
+Uploads can be passed as bytes or as a seekable file (e.g. the spooled
+file of an upload), so large uploads are never copied into memory whole.
+JPEG images are decoded directly at a reduced scale; the pixel limit
+applies to the size actually decoded.
+
+Configuration (environment variables, read at import):
+    PLANT_IMAGE_MAX_EDGE: Longest edge in pixels (default: 1024)
+    PLANT_IMAGE_FORMAT: "JPEG" (default) or "WEBP"
+    PLANT_IMAGE_QUALITY: Encoder quality 1-95 (default: 85)
+    PLANT_IMAGE_MAX_PIXELS: Max pixels decoded per image (default: 25
+                            million, about 100 MB of bitmap)
+"""
+
+import io
+import logging
+import os
+from dataclasses import dataclass
+from typing import BinaryIO, Union
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_EDGE = int(os.environ.get("PLANT_IMAGE_MAX_EDGE", 1024))
+DEFAULT_FORMAT = os.environ.get("PLANT_IMAGE_FORMAT", "JPEG").upper()
+DEFAULT_QUALITY = int(os.environ.get("PLANT_IMAGE_QUALITY", 85))
+DEFAULT_MAX_PIXELS = int(os.environ.get("PLANT_IMAGE_MAX_PIXELS", 25_000_000))
+
+MIME_TYPES = {
+    "JPEG": "image/jpeg",
+    "PNG": "image/png",
+    "WEBP": "image/webp",
+    "GIF": "image/gif",
+}
+
+
+@dataclass
+class PreparedImage:
+    """
+    Data class for an image ready to be sent to the vision model.
+
+    Attributes:
+        data (bytes): Encoded image bytes
+        mime_type (str): MIME type matching data (e.g. "image/jpeg")
+        width (int): Width in pixels after preprocessing
+        height (int): Height in pixels after preprocessing
+        original_size (int): Size in bytes of the uploaded image
+    """
+    data: bytes
+    mime_type: str
+    width: int
+    height: int
+    original_size: int
+
+
+def _read_source(source: Union[bytes, BinaryIO]) -> bytes:
+    """Return the original bytes of an upload."""
+    if isinstance(source, (bytes, bytearray)):
+        return bytes(source)
+    source.seek(0)
+    return source.read()
+
+
+def prepare_image(
+    image_bytes: Union[bytes, BinaryIO],
+    max_edge: int = DEFAULT_MAX_EDGE,
+    image_format: str = DEFAULT_FORMAT,
+    quality: int = DEFAULT_QUALITY,
+    max_pixels: int = DEFAULT_MAX_PIXELS
+) -> PreparedImage:
+    """
+    Decode, orient, downscale and re-encode an uploaded image.
+
+    Args:
+        image_bytes (Union[bytes, BinaryIO]): Raw uploaded image data, or a
+                                              seekable file containing it
+        max_edge (int): Maximum length of the longest edge in pixels
+        image_format (str): Output format, "JPEG" or "WEBP"
+        quality (int): Encoder quality (1-95)
+        max_pixels (int): Maximum number of pixels to decode
+
+    Returns:
+        PreparedImage: Encoded image with its MIME type and dimensions
+
+    Raises:
+        ValueError: If image_bytes is empty, not a decodable image or would
+                    decode to more than max_pixels pixels
+    """
+    if isinstance(image_bytes, (bytes, bytearray)):
+        source = io.BytesIO(image_bytes)
+        original_size = len(image_bytes)
+    else:
+        source = image_bytes
+        original_size = source.seek(0, os.SEEK_END)
+        source.seek(0)
+    if not original_size:
+        raise ValueError("Dữ liệu ảnh rỗng")
+    image_format = image_format.upper()
+    if image_format not in ("JPEG", "WEBP"):
+        raise ValueError(f"Định dạng đầu ra không được hỗ trợ: {image_format}")
+
+    try:
+        image = Image.open(source)
+    except (UnidentifiedImageError, OSError) as e:
+        raise ValueError(f"Không thể đọc dữ liệu ảnh: {str(e)}")
+    except Image.DecompressionBombError as e:
+        raise ValueError(f"Ảnh quá lớn để giải mã: {str(e)}")
+
+    with image:
+        source_format = image.format
+        needs_resize = max(image.size) > max_edge
+        if source_format == "JPEG" and needs_resize:
+            # Let the JPEG decoder downscale by a power of two
+            image.draft("RGB", (max_edge, max_edge))
+        # Decompression bombs: a small file declaring a huge bitmap. Checked
+        # before reading EXIF, which decodes the whole image for PNG.
+        if image.width * image.height > max_pixels:
+            raise ValueError(
+                f"Ảnh quá lớn để giải mã: {image.width}x{image.height} "
+                f"pixel (tối đa {max_pixels} pixel)"
+            )
+        needs_rotation = image.getexif().get(0x0112, 1) != 1
+
+        # Small image already in the target format: sending it as is avoids
+        # a full decode and a lossy re-encode that would not save any bytes.
+        if (not needs_resize and not needs_rotation
+                and source_format == image_format):
+            return PreparedImage(
+                data=_read_source(image_bytes),
+                mime_type=MIME_TYPES[source_format],
+                width=image.width,
+                height=image.height,
+                original_size=original_size
+            )
+
+        try:
+            image.load()
+        except OSError as e:
+            raise ValueError(f"Không thể đọc dữ liệu ảnh: {str(e)}")
+
+        oriented = ImageOps.exif_transpose(image)
+        if oriented.mode in ("RGBA", "LA", "P"):
+            # Flatten transparency onto white; JPEG has no alpha channel
+            rgba = oriented.convert("RGBA")
+            background = Image.new("RGB", rgba.size, (255, 255, 255))
+            background.paste(rgba, mask=rgba.getchannel("A"))
+            oriented = background
+        elif oriented.mode != "RGB":
+            oriented = oriented.convert("RGB")
+
+        if needs_resize:
+            oriented.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+
+        buffer = io.BytesIO()
+        oriented.save(buffer, format=image_format, quality=quality)
+        data = buffer.getvalue()
+
+    if (len(data) >= original_size and not needs_resize
+            and not needs_rotation and source_format in MIME_TYPES):
+        data = _read_source(image_bytes)
+        mime_type = MIME_TYPES[source_format]
+    else:
+        mime_type = MIME_TYPES[image_format]
+
+    logger.info(
+        f"Tiền xử lý ảnh: {original_size} -> {len(data)} bytes "
+        f"({oriented.width}x{oriented.height}, {mime_type})"
+    )
+    return PreparedImage(
+        data=data,
+        mime_type=mime_type,
+        width=oriented.width,
+        height=oriented.height,
+        original_size=original_size
+    )
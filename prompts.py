@@ -0,0 +1,804 @@
+"""
+Prompt Registry
+===============
+
+This module builds every model prompt once per process and identifies it by
+a content hash, so a prompt change automatically invalidates cached results
+and can be traced in result metadata.
+
+Each prompt has a "full" variant (the text sent so far) and a "compact"
+variant derived from it by dropping indentation, ruler lines and repeated
+blank lines. Both carry an estimated token count, so a shorter prompt can
+be A/B tested for latency and cost by switching the variant, without
+editing code.
+
+Configuration (environment variables):
+    PLANT_PROMPT_VARIANT: Variant used when none is requested explicitly,
+                          "full" (default) or "compact"
+
+Usage:
+    >>> prompt = get_prompt("analysis")
+    >>> prompt.version, prompt.tokens
+    >>> python prompts.py    # print the token report of all prompts
+"""
+
+import hashlib
+import math
+import os
+import re
+import threading
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+try:
+    import tiktoken
+except ImportError:  # Optional, only makes token counts more accurate
+    tiktoken = None
+
+
+PROMPT_VARIANTS = ("full", "compact")
+
+_TOKEN_PIECE = re.compile(r"\w+|[^\w\s]|\s{2,}|\n")
+_RULER_LINE = re.compile(r"^[═─━=\-_\s]+$")
+
+
+def default_variant() -> str:
+    """Return the prompt variant configured from environment."""
+    variant = os.environ.get("PLANT_PROMPT_VARIANT", "full").lower()
+    if variant not in PROMPT_VARIANTS:
+        raise ValueError(
+            f"PLANT_PROMPT_VARIANT must be one of {PROMPT_VARIANTS}, "
+            f"got {variant!r}"
+        )
+    return variant
+
+
+def count_tokens(text: str) -> int:
+    """
+    Count (or estimate) the number of tokens in a prompt.
+
+    Uses tiktoken when it is installed. Otherwise every word, punctuation
+    mark and whitespace run counts as one token per started 4 bytes of
+    UTF-8, which tracks BPE tokenizers on Vietnamese text reasonably well.
+
+    Args:
+        text (str): Prompt text
+
+    Returns:
+        int: Token count
+    """
+    if tiktoken is not None:
+        try:
+            return len(_encoding().encode(text))
+        except Exception:  # Encoding files unavailable (e.g. offline)
+            pass
+    return sum(
+        math.ceil(len(piece.encode("utf-8")) / 4)
+        for piece in _TOKEN_PIECE.findall(text)
+    )
+
+
+_encoding_cache = []
+
+
+# Vision models split an image into square tiles; each tile costs a fixed
+# number of tokens, plus one downscaled overview tile for multi-tile images.
+IMAGE_TILE_SIZE = 336
+IMAGE_TILE_TOKENS = 144
+IMAGE_MAX_TILES = 16
+
+
+def estimate_image_tokens(width: int, height: int) -> int:
+    """
+    Estimate the prompt tokens of an image from its dimensions.
+
+    Args:
+        width (int): Image width in pixels
+        height (int): Image height in pixels
+
+    Returns:
+        int: Estimated token count
+    """
+    tiles = min(
+        IMAGE_MAX_TILES,
+        math.ceil(width / IMAGE_TILE_SIZE) * math.ceil(height / IMAGE_TILE_SIZE)
+    )
+    if tiles > 1:
+        tiles += 1
+    return tiles * IMAGE_TILE_TOKENS
+
+
+def _encoding():
+    if not _encoding_cache:
+        _encoding_cache.append(tiktoken.get_encoding("cl100k_base"))
+    return _encoding_cache[0]
+
+
+def compact_text(text: str) -> str:
+    """
+    Shrink a prompt without changing its wording.
+
+    Removes the indentation shared by all lines (keeping the nesting of
+    lists and JSON examples), trailing and repeated spaces, decorative
+    ruler lines and consecutive blank lines.
+
+    Args:
+        text (str): Full prompt text
+
+    Returns:
+        str: Compact prompt text
+    """
+    lines = text.strip().splitlines()
+    common = min(
+        (len(line) - len(line.lstrip(" ")) for line in lines[1:] if line.strip()),
+        default=0
+    )
+    compacted = []
+    for line in lines:
+        indent = max(0, len(line) - len(line.lstrip(" ")) - common)
+        line = re.sub(r" {2,}", " ", line.strip())
+        if line and _RULER_LINE.match(line):
+            continue
+        if not line and (not compacted or not compacted[-1]):
+            continue
+        compacted.append(" " * indent + line if line else "")
+    return "\n".join(compacted).strip()
+
+
+@dataclass(frozen=True)
+class Prompt:
+    """
+    A built prompt.
+
+    Attributes:
+        name (str): Registry name of the prompt
+        variant (str): "full" or "compact"
+        text (str): Prompt text
+        version (str): Short SHA-256 of the text, changes with any edit
+        tokens (int): Token count from count_tokens()
+    """
+    name: str
+    variant: str
+    text: str
+    version: str
+    tokens: int
+
+    def describe(self) -> Dict:
+        """Return name, variant, version, size and token count."""
+        return {
+            "name": self.name,
+            "variant": self.variant,
+            "version": self.version,
+            "chars": len(self.text),
+            "tokens": self.tokens,
+        }
+
+
+class PromptRegistry:
+    """
+    Thread-safe registry building each prompt variant once.
+
+    Prompts are registered with the builder of their full text; the compact
+    variant is derived with compact_text() unless a builder is registered
+    for it explicitly.
+
+    Example:
+        >>> registry = PromptRegistry()
+        >>> registry.register("greeting", lambda: "Xin chào")
+        >>> registry.get("greeting", "compact").version
+    """
+
+    def __init__(self):
+        self._builders: Dict[Tuple[str, str], Callable[[], str]] = {}
+        self._built: Dict[Tuple[str, str], Prompt] = {}
+        self._lock = threading.Lock()
+
+    def register(
+        self,
+        name: str,
+        builder: Callable[[], str],
+        variant: str = "full"
+    ) -> None:
+        """
+        Register the builder of a prompt variant.
+
+        Args:
+            name (str): Prompt name
+            builder (Callable[[], str]): Returns the prompt text
+            variant (str): Variant the builder produces
+        """
+        if variant not in PROMPT_VARIANTS:
+            raise ValueError(f"Unknown prompt variant: {variant!r}")
+        with self._lock:
+            self._builders[(name, variant)] = builder
+            self._built.pop((name, variant), None)
+            if variant == "full":
+                self._built.pop((name, "compact"), None)
+
+    def get(self, name: str, variant: Optional[str] = None) -> Prompt:
+        """
+        Get a prompt, building it on first use.
+
+        Args:
+            name (str): Prompt name
+            variant (Optional[str]): "full" or "compact", None for the
+                                     configured default
+
+        Returns:
+            Prompt: The built prompt
+
+        Raises:
+            KeyError: If no prompt with this name is registered
+        """
+        key = (name, variant or default_variant())
+        prompt = self._built.get(key)
+        if prompt is None:
+            with self._lock:
+                prompt = self._built.get(key)
+                if prompt is None:
+                    prompt = self._build(*key)
+                    self._built[key] = prompt
+        return prompt
+
+    def _build(self, name: str, variant: str) -> Prompt:
+        builder = self._builders.get((name, variant))
+        if builder is not None:
+            text = builder()
+        elif variant == "compact" and (name, "full") in self._builders:
+            text = compact_text(self._builders[(name, "full")]())
+        else:
+            raise KeyError(f"Prompt not registered: {name!r}")
+        version = hashlib.sha256(text.encode("utf-8")).hexdigest()[:12]
+        return Prompt(name, variant, text, version, count_tokens(text))
+
+    def names(self) -> List[str]:
+        """Return the names of all registered prompts."""
+        return sorted({name for name, _ in self._builders})
+
+    def report(self) -> List[Dict]:
+        """Describe every variant of every registered prompt."""
+        return [
+            self.get(name, variant).describe()
+            for name in self.names()
+            for variant in PROMPT_VARIANTS
+        ]
+
+
+# Disease analysis prompt sent with every image to the vision model
+ANALYSIS_PROMPT = """BẠN LÀ CHUYÊN GIA BỆNH HỌC THỰC VẬT với kiến thức chuyên sâu về bệnh cây trồng.  Phân tích hình ảnh các bộ phận cây (lá, rễ, thân) và trả về kết quả ở định dạng JSON BẰNG TIẾNG VIỆT.
+
+    ═══════════════════════════════════════════════════════════════
+    BƯỚC 1: XÁC THỰC HÌNH ẢNH
+    ═══════════════════════════════════════════════════════════════
+
+    QUAN TRỌNG: Trước tiên hãy xác định xem hình ảnh này có chứa bộ phận cây/thực vật hay không. 
+
+    HÌNH ẢNH HỢP LỆ: 
+    ✓ Lá cây (đơn lá hoặc lá kép)
+    ✓ Rễ cây (rễ chính, rễ phụ, rễ củ)
+    ✓ Thân cây (thân gỗ, thân thảo, cành, nhánh)
+    ✓ Cành cây có lá
+    ✓ Cây trồng (rau, hoa, cây ăn quả, cây công nghiệp)
+    ✓ Thực vật có triệu chứng bệnh hoặc khỏe mạnh
+
+    HÌNH ẢNH KHÔNG HỢP LỆ:
+    ✗ Con người (toàn thân hoặc bộ phận cơ thể)
+    ✗ Động vật (chó, mèo, chim, côn trùng riêng lẻ...)
+    ✗ Đồ vật (điện thoại, xe cộ, đồ gia dụng...)
+    ✗ Tòa nhà, phong cảnh không có cây
+    ✗ Ảnh mờ hoàn toàn, không nhận diện được
+    ✗ Văn bản, biểu đồ, sơ đồ
+
+    Nếu hình ảnh KHÔNG HỢP LỆ → Trả về định dạng "invalid_image". 
+
+    ═══════════════════════════════════════════════════════════════
+    BƯỚC 2: PHÂN TÍCH CHI TIẾT (Nếu là hình ảnh bộ phận cây hợp lệ)
+    ═══════════════════════════════════════════════════════════════
+
+    Hãy quan sát KỸ LƯỠNG và xác định: 
+
+    1. NHẬN DẠNG BỆNH (disease_name):
+    • Xác định TÊN CỤ THỂ của bệnh dựa trên kiến thức của bạn
+    • Nếu không chắc chắn giữa 2 bệnh → Ghi cả 2 (VD: "Bệnh đốm lá nấm hoặc vi khuẩn")
+    • Nếu khỏe mạnh → null
+    • Ví dụ tên bệnh tốt: 
+        - "Bệnh đốm lá nâu do nấm Cercospora"
+        - "Bệnh phấn trắng"
+        - "Thiếu Nitơ"
+        - "Bệnh đốm lá vi khuẩn"
+
+    2. LOẠI BỆNH (disease_type):
+    • Phân loại chính xác:  "nấm", "vi khuẩn", "vi rút", "sâu bệnh", "thiếu dinh dưỡng", "stress môi trường", "khỏe mạnh", "invalid_image"
+    • Dựa trên ĐẶC ĐIỂM TRIỆU CHỨNG để phân loại
+
+    3. MỨC ĐỘ NGHIÊM TRỌNG (severity):
+    • "nhẹ": < 20% diện tích lá bị ảnh hưởng, cây vẫn phát triển tốt
+    • "trung bình": 20-50% lá bị ảnh hưởng, ảnh hưởng đến sinh trưởng
+    • "nặng": > 50% lá bị ảnh hưởng, cây có nguy cơ chết
+    • "none":  Lá khỏe mạnh hoặc hình ảnh không hợp lệ
+
+    4. TRIỆU CHỨNG (symptoms):
+    • MÔ TẢ CHI TIẾT những gì BẠN NHÌN THẤY trên bộ phận cây (lá, rễ, thân):
+        - Màu sắc: vàng, nâu, đen, trắng, đỏ... 
+        - Hình dạng bất thường: đốm, vệt, viền, vòng tròn, nứt, thối... 
+        - Kết cấu: lồi, lõm, khô, ướt, bột, nhầy, mục nát... 
+        - Vị trí: 
+            * Trên lá: mép lá, đầu lá, giữa lá, gân lá, mặt trên/dưới
+            * Trên rễ: rễ chính, rễ phụ, đầu rễ, vỏ rễ
+            * Trên thân: vỏ thân, lõi, mặt cắt, mắt chồi
+        - Kích thước: nhỏ li ti, lớn, lan rộng... 
+    • CÀNG CHI TIẾT CÀNG TỐT (ít nhất 3-5 triệu chứng cụ thể)
+    • Ví dụ triệu chứng TỐT:
+        ✓ "Đốm nâu hình tròn đường kính 3-5mm, viền vàng rõ ràng trên lá"
+        ✓ "Lớp bột trắng phủ đều trên mặt trên lá, dày nhất ở lá non"
+        ✓ "Lá vàng từ mép vào trong, phần vàng khô giòn và cong lên"
+        ✓ "Rễ có màu nâu đen, mềm nhũn, dễ bong vỏ, mùi hôi thối"
+        ✓ "Thân cây xuất hiện vết nứt dọc, tiết dịch màu nâu sẫm"
+        ✓ "Vỏ thân bong tróc, lộ lõi màu nâu, có vệt đen lan rộng"
+
+    5. NGUYÊN NHÂN (possible_causes):
+    • Liệt kê TẤT CẢ nguyên nhân có thể dựa trên triệu chứng: 
+        - Tác nhân gây bệnh (nấm, vi khuẩn, vi rút) - GHI TÊN KHOA HỌC nếu biết
+        - Côn trùng gây hại (rệp, nhện, bọ trĩ...)
+        - Điều kiện môi trường (nhiệt độ, độ ẩm, ánh sáng...)
+        - Quản lý canh tác (tưới nước, bón phân, thoát nước...)
+        - Thiếu hụt dinh dưỡng cụ thể (N, P, K, Fe, Mg...)
+    • CÀNG CỤ THỂ CÀNG TỐT (ít nhất 3-5 nguyên nhân)
+
+    6. PHƯƠNG PHÁP ĐIỀU TRỊ (treatment):
+    • Đưa ra các biện pháp THỰC TẾ, KHẢ THI, THEO THỨ TỰ ƯU TIÊN: 
+        A.  Biện pháp CẤP BÁCH (làm ngay)
+        B. Biện pháp HÓA HỌC (nếu cần) - Tên thuốc CỤ THỂ, liều lượng
+        C. Biện pháp SINH HỌC/HỮU CƠ
+        D. Biện pháp DÀI HẠN (phòng ngừa)
+    • CÀNG CỤ THỂ, CHI TIẾT CÀNG TỐT (ít nhất 4-6 bước điều trị)
+
+    ═══════════════════════════════════════════════════════════════
+    HỆ THỐNG ĐÁNH GIÁ ĐIỂM TIN CẬY (CONFIDENCE) - QUY TẮC CHI TIẾT
+    ═══════════════════════════════════════════════════════════════
+
+    CONFIDENCE được tính theo CÔNG THỨC 3 YẾU TỐ: 
+    Confidence = Điểm_Chất_Lượng_Ảnh + Điểm_Triệu_Chứng + Điểm_Chẩn_Đoán
+
+    ───────────────────────────────────────────────────────────────
+    YẾU TỐ 1: CHẤT LƯỢNG HÌNH ẢNH (0-30 điểm)
+    ───────────────────────────────────────────────────────────────
+
+    QUY TẮC ĐÁNH GIÁ: 
+
+    [28-30 điểm] - CHẤT LƯỢNG XUẤT SẮC:
+    ✓ Ảnh cận cảnh rất rõ nét, có thể zoom in thấy chi tiết
+    ✓ Ánh sáng tự nhiên đầy đủ, không quá sáng/tối
+    ✓ Bộ phận cây (lá/rễ/thân) chiếm >70% khung hình
+    ✓ Focus chuẩn, không bị mờ/nhòe
+    ✓ Nhiều góc độ hoặc nhiều mẫu bộ phận cây
+    ✓ Độ phân giải cao (>1080p)
+
+    [22-27 điểm] - CHẤT LƯỢNG TỐT:
+    ✓ Ảnh khá rõ, có thể nhìn thấy triệu chứng
+    ✓ Ánh sáng ổn, một số vùng hơi tối/sáng
+    ✓ Bộ phận cây (lá/rễ/thân) chiếm 50-70% khung hình
+    ✓ Focus tốt ở phần quan trọng
+    ✓ 1-2 góc độ
+    ✓ Độ phân giải trung bình (720p-1080p)
+
+    [14-21 điểm] - CHẤT LƯỢNG TRUNG BÌNH:
+    ✓ Ảnh bình thường, nhìn thấy được triệu chứng chính
+    ✓ Ánh sáng chấp nhận được
+    ✓ Bộ phận cây (lá/rễ/thân) chiếm 30-50% khung hình
+    ✓ Focus ổn nhưng không sắc nét
+    ✓ 1 góc độ duy nhất
+    ✓ Độ phân giải trung bình (480p-720p)
+
+    [8-13 điểm] - CHẤT LƯỢNG YẾU: 
+    ✓ Ảnh hơi mờ, khó nhìn chi tiết
+    ✓ Ánh sáng kém (quá tối hoặc quá sáng)
+    ✓ Bộ phận cây (lá/rễ/thân) chiếm <30% khung hình hoặc quá xa
+    ✓ Focus không chuẩn, mờ nhiều chỗ
+    ✓ Độ phân giải thấp (<480p)
+
+    [1-7 điểm] - CHẤT LƯỢNG RẤT KÉM:
+    ✓ Ảnh rất mờ, khó nhận diện
+    ✓ Ánh sáng rất kém (tối đen hoặc cháy sáng)
+    ✓ Bộ phận cây (lá/rễ/thân) rất nhỏ trong khung hình
+    ✓ Bị rung/nhòe nặng
+    ✓ Độ phân giải rất thấp
+
+    ───────────────────────────────────────────────────────────────
+    YẾU TỐ 2: ĐỘ RÕ RÀNG CỦA TRIỆU CHỨNG (0-40 điểm)
+    ───────────────────────────────────────────────────────────────
+
+    QUY TẮC ĐÁNH GIÁ: 
+
+    [36-40 điểm] - TRIỆU CHỨNG ĐIỂN HÌNH, RÕ RÀNG:
+    ✓ Triệu chứng rất đặc trưng, dễ nhận biết ngay
+    ✓ Có ≥5 triệu chứng rõ ràng cùng xuất hiện
+    ✓ Triệu chứng phát triển đầy đủ các giai đoạn
+    ✓ Hình dạng, màu sắc, vị trí hoàn toàn điển hình
+    ✓ Không có triệu chứng nhiễu/lẫn lộn
+
+    VÍ DỤ:  Bệnh phấn trắng trên lá - lớp bột trắng dày đặc, rõ ràng
+
+    [28-35 điểm] - TRIỆU CHỨNG RÕ RÀNG: 
+    ✓ Triệu chứng khá đặc trưng, có thể nhận diện
+    ✓ Có 3-4 triệu chứng rõ ràng
+    ✓ Triệu chứng đang phát triển, chưa hoàn chỉnh
+    ✓ Hình dạng, màu sắc khá điển hình
+    ✓ Ít triệu chứng nhiễu
+
+    VÍ DỤ: Bệnh đốm lá - đốm nâu rõ, có viền vàng
+           Bệnh thối rễ - rễ nâu đen, mềm nhũn
+
+    [18-27 điểm] - TRIỆU CHỨNG KHÁ RÕ:
+    ✓ Triệu chứng nhận biết được nhưng cần suy luận
+    ✓ Có 2-3 triệu chứng khá rõ
+    ✓ Triệu chứng ở giai đoạn đầu hoặc cuối
+    ✓ Hình dạng/màu sắc chưa hoàn toàn điển hình
+    ✓ Có một số triệu chứng nhiễu
+
+    VÍ DỤ: Lá vàng - có thể thiếu N hoặc úng nước
+           Thân có vết nâu - có thể nấm hoặc sâu đục
+
+    [10-17 điểm] - TRIỆU CHỨNG MƠ HỒ:
+    ✓ Triệu chứng không rõ ràng, khó nhận diện
+    ✓ Chỉ có 1-2 triệu chứng mờ nhạt
+    ✓ Triệu chứng rất sơ khai hoặc đã phai
+    ✓ Hình dạng/màu sắc không điển hình
+    ✓ Nhiều triệu chứng nhiễu gây nhầm lẫn
+
+    VÍ DỤ: Lá hơi xỉn màu - chưa rõ nguyên nhân
+           Rễ có màu hơi sẫm - chưa rõ bệnh hay tự nhiên
+
+    [1-9 điểm] - TRIỆU CHỨNG RẤT MƠ HỒ: 
+    ✓ Hầu như không thấy triệu chứng rõ ràng
+    ✓ Triệu chứng rất nhẹ, khó phát hiện
+    ✓ Không thể xác định giai đoạn bệnh
+    ✓ Hoàn toàn không điển hình
+    ✓ Quá nhiều yếu tố gây nhiễu
+
+    VÍ DỤ: Bộ phận cây có màu hơi khác thường, không rõ lý do
+
+    ───────────────────────────────────────────────────────────────
+    YẾU TỐ 3: ĐỘ CHẮC CHẮN TRONG CHẨN ĐOÁN (0-30 điểm)
+    ───────────────────────────────────────────────────────────────
+
+    QUY TẮC ĐÁNH GIÁ: 
+
+    [27-30 điểm] - CHẮC CHẮN TUYỆT ĐỐI:
+    ✓ CHỈ CÓ DUY NHẤT 1 BỆNH phù hợp 100%
+    ✓ Không có khả năng nào khác
+    ✓ Triệu chứng khớp hoàn toàn với 1 bệnh cụ thể
+    ✓ Có thể ghi rõ tên khoa học tác nhân gây bệnh
+
+    VÍ DỤ: Lớp bột trắng dày trên lá → CHẮC CHẮN là bệnh phấn trắng
+           Rễ đen mềm nhũn có mùi hôi → CHẮC CHẮN là bệnh thối rễ
+
+    [21-26 điểm] - RẤT CHẮC CHẮN:
+    ✓ 1 bệnh có khả năng rất cao (>80%)
+    ✓ Có thể có 1 bệnh khác nhưng khả năng thấp (<20%)
+    ✓ Triệu chứng thiên về 1 bệnh rõ rệt
+    ✓ Có thể loại trừ hầu hết các bệnh khác
+
+    VÍ DỤ: Đốm nâu viền vàng trên lá → Rất có thể là đốm lá nấm
+           Thân nứt tiết dịch nâu → Rất có thể là bệnh loét thân
+
+    [15-20 điểm] - KHẢNG CHẮC CHẮN: 
+    ✓ 1-2 bệnh có khả năng cao ngang nhau (60-80%)
+    ✓ Cần thêm thông tin để xác định chính xác
+    ✓ Triệu chứng phù hợp với nhóm bệnh
+    ✓ Có thể loại trừ một số bệnh
+
+    VÍ DỤ: Đốm nâu trên lá → Có thể nấm hoặc vi khuẩn
+           Rễ màu nâu → Có thể thối rễ hoặc thiếu oxy
+
+    [8-14 điểm] - KHÔNG CHẮC CHẮN:
+    ✓ 2-3 bệnh có khả năng tương đương (40-60%)
+    ✓ Triệu chứng chung chung, nhiều bệnh có thể gây ra
+    ✓ Khó loại trừ các khả năng
+    ✓ Cần thêm nhiều thông tin
+
+    VÍ DỤ:  Lá vàng → Thiếu N, úng, bệnh rễ, hoặc già tự nhiên? 
+            Thân có vết đen → Nấm, vi khuẩn, sâu đục, hoặc va đập?
+
+    [1-7 điểm] - RẤT KHÔNG CHẮC CHẮN:
+    ✓ Nhiều hơn 3 bệnh có thể (<40% mỗi bệnh)
+    ✓ Triệu chứng quá chung, không đủ thông tin
+    ✓ Không thể loại trừ bất kỳ khả năng nào
+    ✓ Gần như đoán mò
+
+    VÍ DỤ: Bộ phận cây có vẻ không bình thường nhưng không rõ lý do
+
+    ───────────────────────────────────────────────────────────────
+    THANG ĐÁNH GIÁ TỔNG HỢP (0-100%)
+    ───────────────────────────────────────────────────────────────
+
+    CỘNG 3 YẾU TỐ = CONFIDENCE SCORE
+
+    [90-100%] - RẤT CHẮC CHẮN: 
+    • Ảnh xuất sắc (28-30) + Triệu chứng điển hình (36-40) + 1 bệnh duy nhất (27-30)
+    • Tổng:  91-100 điểm
+    • Có thể khẳng định chắc chắn bệnh gì
+    • VÍ DỤ:  Ảnh rõ bệnh phấn trắng trên lá → 95%
+             Ảnh rõ bệnh thối rễ điển hình → 94%
+
+    [75-89%] - KHẢNG CHẮC CHẮN:
+    • Ảnh tốt (22-27) + Triệu chứng rõ (28-35) + 1-2 bệnh (21-26)
+    • Tổng: 75-90 điểm
+    • Rất có khả năng đúng, tin cậy cao
+    • VÍ DỤ: Ảnh khá rõ đốm lá nấm → 82%
+            Ảnh khá rõ thân bị loét → 80%
+
+    [60-74%] - KHẢ NĂNG CAO:
+    • Ảnh trung bình (14-21) + Triệu chứng khá rõ (18-27) + 2-3 bệnh (15-20)
+    • Tổng: 60-74 điểm
+    • Có thể tin tưởng nhưng nên xác nhận thêm
+    • VÍ DỤ: Ảnh OK, đốm lá không rõ nấm hay khuẩn → 68%
+            Ảnh OK, rễ nâu chưa rõ nguyên nhân → 65%
+
+    [40-59%] - KHÔNG CHẮC CHẮN:
+    • Ảnh yếu (8-13) + Triệu chứng mơ hồ (10-17) + Nhiều khả năng (8-14)
+    • Tổng: 40-59 điểm
+    • Chỉ là dự đoán, cần thêm thông tin
+    • VÍ DỤ: Ảnh mờ, lá vàng không rõ nguyên nhân → 48%
+            Ảnh mờ, thân có vết bất thường → 45%
+
+    [20-39%] - RẤT KHÔNG CHẮC CHẮN:
+    • Ảnh kém (1-7) + Triệu chứng rất mơ hồ (1-9) + Quá nhiều khả năng (1-7)
+    • Tổng:  20-39 điểm
+    • Gần như không thể chẩn đoán
+    • VÍ DỤ: Ảnh rất mờ, lá có vẻ lạ → 28%
+            Ảnh rất mờ, rễ không rõ ràng → 25%
+
+    [<20%] - GẦN NHƯ ĐOÁN:
+    • Tổng: <20 điểm
+    • Không đủ thông tin để phân tích
+    • NÊN TRẢ LỜI:  "Không thể xác định, cần ảnh rõ hơn"
+
+    ───────────────────────────────────────────────────────────────
+    TRƯỜNG HỢP ĐẶC BIỆT
+    ───────────────────────────────────────────────────────────────
+
+    • Hình ảnh KHÔNG phải bộ phận cây (invalid_image):
+    → Confidence: 90-98%
+    → Lý do: Dễ nhận biết đây không phải lá, rễ, hay thân cây
+
+    • Bộ phận cây KHỎE MẠNH (không có bệnh):
+    → Confidence: 85-95%
+    → Lý do: Dễ xác nhận không có triệu chứng bệnh
+
+    • Bộ phận cây có dấu hiệu BẤT THƯỜNG nhưng ảnh quá KÉM:
+    → Confidence: <40%
+    → NÊN GỢI Ý:  "Vui lòng chụp ảnh rõ hơn để phân tích chính xác"
+
+    ═══════════════════════════════════════════════════════════════
+    VÍ DỤ TÍNH CONFIDENCE CỤ THỂ
+    ═══════════════════════════════════════════════════════════════
+
+    VÍ DỤ 1: Bệnh phấn trắng rõ ràng trên lá
+    • Chất lượng ảnh:  Ảnh cận cảnh rõ nét, ánh sáng tốt → 28 điểm
+    • Triệu chứng: Lớp bột trắng dày, điển hình → 38 điểm
+    • Chẩn đoán: Chỉ có bệnh phấn trắng phù hợp → 28 điểm
+    • TỔNG: 28 + 38 + 28 = 94%
+    → Confidence: 94%
+
+    VÍ DỤ 2: Đốm lá không rõ nấm hay vi khuẩn
+    • Chất lượng ảnh: Ảnh khá rõ, có thể thấy đốm → 24 điểm
+    • Triệu chứng:  Đốm nâu rõ, nhưng viền không rõ lắm → 30 điểm
+    • Chẩn đoán: Có thể nấm (60%) hoặc vi khuẩn (40%) → 18 điểm
+    • TỔNG: 24 + 30 + 18 = 72%
+    → Confidence: 72%
+
+    VÍ DỤ 3: Lá vàng, ảnh mờ
+    • Chất lượng ảnh:  Ảnh mờ, xa, thiếu sáng → 9 điểm
+    • Triệu chứng:  Chỉ thấy lá vàng chung chung → 12 điểm
+    • Chẩn đoán:  Có thể thiếu N, úng, bệnh rễ...  → 10 điểm
+    • TỔNG: 9 + 12 + 10 = 31%
+    → Confidence: 31%
+
+    VÍ DỤ 4: Lá khỏe mạnh
+    • Chất lượng ảnh: Ảnh rõ → 26 điểm
+    • Triệu chứng:  Không có triệu chứng bệnh (dễ xác nhận) → 38 điểm
+    • Chẩn đoán:  Chắc chắn khỏe mạnh → 28 điểm
+    • TỔNG: 26 + 38 + 28 = 92%
+    → Confidence: 92%
+
+    VÍ DỤ 5: Bệnh thối rễ điển hình
+    • Chất lượng ảnh: Ảnh cận cảnh rõ, thấy rõ rễ → 27 điểm
+    • Triệu chứng: Rễ nâu đen, mềm nhũn, bong vỏ, mùi hôi → 39 điểm
+    • Chẩn đoán: Chắc chắn là bệnh thối rễ → 28 điểm
+    • TỔNG: 27 + 39 + 28 = 94%
+    → Confidence: 94%
+
+    VÍ DỤ 6: Thân cây có vết loét
+    • Chất lượng ảnh: Ảnh khá rõ, thấy được vết thương → 23 điểm
+    • Triệu chứng: Vỏ nứt, tiết dịch nâu, có thể nấm hoặc vi khuẩn → 28 điểm
+    • Chẩn đoán: 2 khả năng (nấm 60%, vi khuẩn 40%) → 17 điểm
+    • TỔNG: 23 + 28 + 17 = 68%
+    → Confidence: 68%
+
+    ═══════════════════════════════════════════════════════════════
+    YÊU CẦU BẮT BUỘC KHI ĐÁNH GIÁ CONFIDENCE
+    ═══════════════════════════════════════════════════════════════
+
+    ✓ PHẢI tính toán CHÍNH XÁC theo công thức 3 yếu tố
+    ✓ PHẢI cho điểm từng yếu tố một cách KHÁCH QUAN
+    ✓ KHÔNG được làm tròn tùy tiện
+    ✓ KHÔNG được "cảm tính" mà phải dựa vào QUY TẮC
+    ✓ Nếu confidence < 40% → NÊN GỢI Ý chụp ảnh rõ hơn
+
+    ═══════════════════════════════════════════════════════════════
+    ĐỊNH DẠNG TRẢ VỀ
+    ═══════════════════════════════════════════════════════════════
+
+    Đối với hình ảnh KHÔNG PHẢI BỘ PHẬN CÂY:
+    {
+        "disease_detected": false,
+        "disease_name": null,
+        "disease_type": "invalid_image",
+        "severity": "none",
+        "confidence": confidence,
+        "symptoms": ["Hình ảnh này không chứa bộ phận cây hoặc thực vật"],
+        "possible_causes": ["Loại hình ảnh được tải lên không hợp lệ - không phải lá, rễ, hoặc thân cây"],
+        "treatment": ["Vui lòng tải lên hình ảnh bộ phận cây (lá, rễ, thân) để phân tích bệnh"]
+    }
+
+    Đối với CÂY KHỎE MẠNH:
+    {
+        "disease_detected": false,
+        "disease_name":  null,
+        "disease_type": "khỏe mạnh",
+        "severity":  "none",
+        "confidence": confidence,
+        "symptoms": [
+            "Không phát hiện triệu chứng bệnh",
+            "Màu sắc tự nhiên, đều đặn (lá xanh tươi / rễ trắng ngà / thân nâu tự nhiên, vỏ nguyên vẹn)",
+            "Không có đốm, vết hoặc biến dạng",
+            "Bề mặt nhẵn, không có lớp phủ bất thường hoặc vết nứt"
+        ],
+        "possible_causes": [
+            "Cây đang phát triển tốt",
+            "Chế độ chăm sóc phù hợp"
+        ],
+        "treatment":  [
+            "Tiếp tục chăm sóc như hiện tại",
+            "Duy trì lịch tưới nước đều đặn",
+            "Bón phân định kỳ theo nhu cầu cây",
+            "Theo dõi thường xuyên để phát hiện sớm nếu có bệnh"
+        ]
+    }
+
+    Đối với CÂY BỊ BỆNH:
+    {
+        "disease_detected": true,
+        "disease_name": "Tên bệnh cụ thể bằng tiếng Việt",
+        "disease_type": "nấm/vi khuẩn/vi rút/sâu bệnh/thiếu dinh dưỡng/stress môi trường",
+        "severity": "nhẹ/trung bình/nặng",
+        "confidence": confidence,
+        "symptoms": [
+            "Triệu chứng 1 - MÔ TẢ CỤ THỂ, CHI TIẾT",
+            "Triệu chứng 2 - VỊ TRÍ, MÀU SẮC, HÌNH DẠNG",
+            "Triệu chứng 3 - KẾT CẤU, KÍCH THƯỚC",
+            "Triệu chứng 4 - ĐỘ LAN RỘNG",
+            "...  (3-7 triệu chứng)"
+        ],
+        "possible_causes": [
+            "Nguyên nhân 1 - TÁC NHÂN GÂY BỆNH CỤ THỂ (tên khoa học nếu có)",
+            "Nguyên nhân 2 - ĐIỀU KIỆN MÔI TRƯỜNG",
+            "Nguyên nhân 3 - QUẢN LÝ CANH TÁC",
+            "Nguyên nhân 4 - YẾU TỐ KHÁC",
+            "...  (3-6 nguyên nhân)"
+        ],
+        "treatment": [
+            "Bước 1 - BIỆN PHÁP CẤP BÁCH (cắt, cách ly... )",
+            "Bước 2 - XỊT THUỐC CỤ THỂ (tên, liều lượng, tần suất)",
+            "Bước 3 - BIỆN PHÁP SINH HỌC/TỰ NHIÊN (nếu có)",
+            "Bước 4 - CẢI THIỆN ĐIỀU KIỆN (thoát nước, thông gió...)",
+            "Bước 5 - BÓN PHÂN/DINH DƯỠNG (loại, liều lượng)",
+            "Bước 6 - PHÒNG NGỪA TÁI PHÁT",
+            "...  (4-8 bước điều trị)"
+        ]
+    }
+
+    ═══════════════════════════════════════════════════════════════
+    YÊU CẦU QUAN TRỌNG
+    ═══════════════════════════════════════════════════════════════
+
+    ✓ TẤT CẢ nội dung phải BẰNG TIẾNG VIỆT
+    ✓ Tên bệnh phải CỤ THỂ, CHÍNH XÁC
+    ✓ Loại bệnh:  "nấm", "vi khuẩn", "vi rút", "sâu bệnh", "thiếu dinh dưỡng", "stress môi trường", "khỏe mạnh", "invalid_image"
+    ✓ Mức độ:  "nhẹ", "trung bình", "nặng", "none"
+    ✓ CONFIDENCE phải tính CHÍNH XÁC theo HỆ THỐNG QUY TẮC 3 YẾU TỐ ở trên
+    ✓ Triệu chứng:  ÍT NHẤT 3-5 mục, MÔ TẢ CHI TIẾT
+    ✓ Nguyên nhân: ÍT NHẤT 3-5 mục, CỤ THỂ
+    ✓ Điều trị: ÍT NHẤT 4-6 bước, KHẢ THI, THỰC TẾ
+
+    CHỈ TRẢ VỀ JSON, KHÔNG CÓ GHI CHÚ HOẶC GIẢI THÍCH THÊM."""
+
+
+# Chatbot personality and role
+CHAT_SYSTEM_PROMPT = """BẠN LÀ CHUYÊN GIA TƯ VẤN BỆNH CÂY TRỒNG thân thiện và am hiểu sâu sắc về:
+- Bệnh cây trồng (nấm, vi khuẩn, vi rút, sâu bệnh)
+- Triệu chứng và cách nhận biết bệnh
+- Phương pháp điều trị và phòng ngừa
+- Chăm sóc cây trồng và kỹ thuật canh tác
+- Dinh dưỡng và phân bón
+
+NHIỆM VỤ CỦA BẠN:
+✓ Trả lời câu hỏi của người dùng một cách rõ ràng, chính xác
+✓ Cung cấp lời khuyên thiết thực, dễ áp dụng
+✓ Giải thích bằng ngôn ngữ đơn giản, dễ hiểu
+✓ Thân thiện, nhiệt tình như một người bạn đồng hành
+✓ Hỏi lại nếu cần thêm thông tin để tư vấn tốt hơn
+
+CÁCH TRẢ LỜI:
+- Sử dụng TIẾNG VIỆT trong mọi câu trả lời
+- Trả lời ngắn gọn nhưng đầy đủ thông tin
+- Chia nhỏ thành các bước nếu câu trả lời dài
+- Sử dụng emoji phù hợp để thân thiện hơn
+- Đưa ra ví dụ cụ thể khi có thể
+
+QUAN TRỌNG:
+- Nếu không chắc chắn, hãy thừa nhận và đề xuất người dùng tham khảo thêm
+- Không đưa ra lời khuyên có thể gây hại cho cây hoặc người dùng
+- Khuyến khích người dùng sử dụng tính năng phát hiện bệnh bằng ảnh nếu cần chẩn đoán chính xác"""
+
+
+# Appended (after a blank line) to the chatbot system prompt while a disease
+# analysis is set; {context} is replaced by the analysis result as JSON
+CHAT_CONTEXT_PROMPT = """═══════════════════════════════════════════════════════════════
+THÔNG TIN PHÂN TÍCH BỆNH HIỆN TẠI
+═══════════════════════════════════════════════════════════════
+
+Người dùng vừa phân tích một lá cây và nhận được kết quả sau:
+
+{context}
+
+HƯỚNG DẪN SỬ DỤNG THÔNG TIN NÀY:
+✓ Sử dụng thông tin này để trả lời các câu hỏi của người dùng về kết quả phân tích
+✓ Có thể giải thích chi tiết hơn về bệnh đã phát hiện
+✓ Đưa ra lời khuyên bổ sung dựa trên kết quả
+✓ Trả lời câu hỏi về triệu chứng, nguyên nhân, cách điều trị
+✓ Nếu người dùng hỏi về "bệnh này", "kết quả vừa rồi", "ảnh vừa phân tích" - hãy tham khảo thông tin trên
+
+VÍ DỤ CÂU HỎI NGƯỜI DÙNG CÓ THỂ HỎI:
+- "Giải thích rõ hơn về bệnh này được không?"
+- "Tại sao lá cây bị bệnh này?"
+- "Có cách nào khác để chữa không?"
+- "Bệnh này có nguy hiểm không?"
+- "Tôi nên làm gì tiếp theo?"
+- "Thuốc nào hiệu quả nhất?"
+"""
+
+
+registry = PromptRegistry()
+registry.register("analysis", lambda: ANALYSIS_PROMPT)
+registry.register("chat_system", lambda: CHAT_SYSTEM_PROMPT)
+registry.register("chat_context", lambda: CHAT_CONTEXT_PROMPT)
+
+
+def get_prompt(name: str, variant: Optional[str] = None) -> Prompt:
+    """
+    Get a prompt from the default registry.
+
+    Args:
+        name (str): "analysis", "chat_system" or "chat_context"
+        variant (Optional[str]): "full" or "compact", None for the
+                                 configured default
+
+    Returns:
+        Prompt: The built prompt
+    """
+    return registry.get(name, variant)
+
+
+def main():
+    """Print version and token count of every prompt variant."""
+    print(f"{'prompt':<14}{'variant':<10}{'version':<14}"
+          f"{'chars':>8}{'tokens':>8}")
+    for row in registry.report():
+        print(f"{row['name']:<14}{row['variant']:<10}{row['version']:<14}"
+              f"{row['chars']:>8}{row['tokens']:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,422 @@
+"""
+Rate Limiting for Groq API Calls
+================================
+
+This module keeps API usage within the account's quotas:
+
+    - RequestPacer spaces out the request starts of one batch
+    - RequestScheduler is shared by the detector and the chatbot and admits
+      calls within the requests-per-minute and tokens-per-minute quotas,
+      interactive work first
+
+Configuration (environment variables used by get_default_scheduler):
+    PLANT_GROQ_RPM: Requests-per-minute quota, 0 for no limit (default: 0)
+    PLANT_GROQ_TPM: Tokens-per-minute quota, 0 for no limit (default: 0)
+    PLANT_SCHEDULER_MAX_QUEUE: Max calls waiting for quota (default: 100)
+    PLANT_SCHEDULER_INTERACTIVE_MAX_WAIT: Max seconds chat and single image
+                                          calls wait (default: 10)
+    PLANT_SCHEDULER_BATCH_MAX_WAIT: Max seconds batch calls wait
+                                    (default: 300)
+"""
+
+import asyncio
+import heapq
+import itertools
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional
+
+
+class RequestPacer:
+    """
+    Space request starts to stay under a requests-per-minute budget.
+
+    Each caller reserves the next free start slot, so concurrent workers are
+    released one interval apart instead of all at once.
+
+    Args:
+        requests_per_minute (Optional[float]): Budget, None or 0 for no limit
+
+    Example:
+        >>> pacer = RequestPacer(requests_per_minute=30)
+        >>> pacer.wait()          # from a worker thread
+        >>> await pacer.wait_async()  # from a coroutine
+    """
+
+    def __init__(self, requests_per_minute: Optional[float] = None):
+        self.interval = 60.0 / requests_per_minute if requests_per_minute else 0
+        self._next_start = 0.0
+        self._lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        """Reserve the next start slot and return the delay until it."""
+        if not self.interval:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_start)
+            self._next_start = start + self.interval
+        return start - now
+
+    def wait(self) -> None:
+        """Block the calling thread until its start slot."""
+        delay = self._reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+    async def wait_async(self) -> None:
+        """Sleep the calling coroutine until its start slot."""
+        delay = self._reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 1
+PRIORITY_NAMES = {PRIORITY_INTERACTIVE: "interactive", PRIORITY_BATCH: "batch"}
+
+
+class SchedulerRejected(Exception):
+    """Raised when a request cannot get quota within its bounded wait."""
+
+    def __init__(self, reason: str, retry_after: float):
+        self.reason = reason
+        self.retry_after = retry_after
+        super().__init__(
+            f"Hệ thống đang quá tải ({reason}), thử lại sau "
+            f"{retry_after:.0f} giây"
+        )
+
+
+class TokenBucket:
+    """
+    Bucket refilled continuously at per_minute / 60 units per second.
+
+    Args:
+        per_minute (float): Budget per minute, also the bucket capacity
+    """
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.level = min(
+            self.capacity, self.level + (now - self._updated) * self.rate
+        )
+        self._updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Return seconds until amount is available (0 if it is now)."""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        return max(0.0, (amount - self.level) / self.rate)
+
+    def take(self, amount: float) -> None:
+        self.level -= min(amount, self.capacity)
+
+    def give(self, amount: float) -> None:
+        self.level = min(self.capacity, self.level + amount)
+
+
+class _Waiter:
+    __slots__ = ("priority", "seq", "tokens", "enqueued", "granted",
+                 "cancelled", "notify")
+
+    def __init__(self, priority: int, seq: int, tokens: int, notify):
+        self.priority = priority
+        self.seq = seq
+        self.tokens = tokens
+        self.enqueued = time.monotonic()
+        self.granted = False
+        self.cancelled = False
+        self.notify = notify
+
+    def __lt__(self, other: "_Waiter") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class RequestScheduler:
+    """
+    Admit API calls within requests-per-minute and tokens-per-minute quotas.
+
+    Every call reserves one request and its estimated tokens (prompt, image
+    and max completion tokens) from two token buckets. Calls that do not
+    fit wait in a priority queue: interactive work (chat, single image
+    analysis) is always admitted before batch work, and calls of the same
+    priority are admitted in arrival order. Waits are bounded per priority,
+    and the queue length is bounded, so overload surfaces as a fast
+    SchedulerRejected instead of an ever-growing latency. After a call,
+    settle() returns the unused part of the token reservation.
+
+    With no quota configured, calls are admitted immediately.
+
+    Args:
+        requests_per_minute (Optional[float]): RPM quota, None for no limit
+        tokens_per_minute (Optional[float]): TPM quota, None for no limit
+        max_queue (int): Max waiting calls before new ones are rejected
+        max_wait (Optional[Dict[int, float]]): Max wait in seconds per
+                                               priority
+
+    Example:
+        >>> scheduler = RequestScheduler(requests_per_minute=30,
+        ...                              tokens_per_minute=30000)
+        >>> reserved = scheduler.acquire(2500, PRIORITY_INTERACTIVE)
+        >>> completion = client.chat.completions.create(...)
+        >>> scheduler.settle(reserved, completion.usage.total_tokens)
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+        max_queue: int = 100,
+        max_wait: Optional[Dict[int, float]] = None
+    ):
+        self.rpm = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tpm = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.max_queue = max_queue
+        self.max_wait = {PRIORITY_INTERACTIVE: 10.0, PRIORITY_BATCH: 300.0}
+        self.max_wait.update(max_wait or {})
+        self._queue: List[_Waiter] = []
+        self._waiting = {priority: 0 for priority in PRIORITY_NAMES}
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._dispatcher: Optional[threading.Thread] = None
+        self.granted = {priority: 0 for priority in PRIORITY_NAMES}
+        self.rejected = {priority: 0 for priority in PRIORITY_NAMES}
+        self.timed_out = {priority: 0 for priority in PRIORITY_NAMES}
+        self._waits = {
+            priority: deque(maxlen=1000) for priority in PRIORITY_NAMES
+        }
+
+    @property
+    def limited(self) -> bool:
+        """True if any quota is configured."""
+        return self.rpm is not None or self.tpm is not None
+
+    def acquire(self, tokens: int, priority: int = PRIORITY_INTERACTIVE) -> int:
+        """
+        Block the calling thread until the call fits the quotas.
+
+        Args:
+            tokens (int): Estimated tokens of the call
+            priority (int): PRIORITY_INTERACTIVE or PRIORITY_BATCH
+
+        Returns:
+            int: Reserved tokens, to pass to settle()
+
+        Raises:
+            SchedulerRejected: If the queue is full or the wait is too long
+        """
+        event = threading.Event()
+        waiter = self._enqueue(tokens, priority, event.set)
+        if waiter is not None and not event.wait(self.max_wait[priority]):
+            self._give_up(waiter)
+        return tokens
+
+    async def acquire_async(
+        self, tokens: int, priority: int = PRIORITY_INTERACTIVE
+    ) -> int:
+        """Coroutine version of acquire()."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def notify():
+            loop.call_soon_threadsafe(
+                lambda: future.done() or future.set_result(None)
+            )
+
+        waiter = self._enqueue(tokens, priority, notify)
+        if waiter is not None:
+            try:
+                await asyncio.wait_for(future, self.max_wait[priority])
+            except asyncio.TimeoutError:
+                self._give_up(waiter)
+            except asyncio.CancelledError:
+                with self._cond:
+                    if not waiter.granted:
+                        self._cancel(waiter)
+                raise
+        return tokens
+
+    def settle(self, reserved: int, used: Optional[int]) -> None:
+        """
+        Return the unused part of a token reservation.
+
+        Args:
+            reserved (int): Value returned by acquire()
+            used (Optional[int]): Tokens reported by the API, None to keep
+                                  the whole reservation
+        """
+        if self.tpm is None or used is None or used >= reserved:
+            return
+        with self._cond:
+            self.tpm.give(reserved - used)
+            self._cond.notify()
+
+    def _enqueue(self, tokens: int, priority: int, notify) -> Optional[_Waiter]:
+        """Admit now (returns None) or queue a waiter."""
+        with self._cond:
+            if not self.limited or (
+                not self._queue and self._fits(tokens, time.monotonic()) == 0
+            ):
+                self._take(tokens)
+                self.granted[priority] += 1
+                self._waits[priority].append(0.0)
+                return None
+            if sum(self._waiting.values()) >= self.max_queue:
+                self.rejected[priority] += 1
+                raise SchedulerRejected(
+                    "hàng đợi đầy", self._fits(tokens, time.monotonic()) or 1
+                )
+            waiter = _Waiter(priority, next(self._seq), tokens, notify)
+            heapq.heappush(self._queue, waiter)
+            self._waiting[priority] += 1
+            if self._dispatcher is None:
+                self._dispatcher = threading.Thread(
+                    target=self._dispatch_loop, daemon=True,
+                    name="request-scheduler"
+                )
+                self._dispatcher.start()
+            self._cond.notify()
+            return waiter
+
+    def _give_up(self, waiter: _Waiter) -> None:
+        """Handle a wait timeout; a grant may have raced the timeout."""
+        with self._cond:
+            if waiter.granted:
+                return
+            self._cancel(waiter)
+            self.timed_out[waiter.priority] += 1
+            retry_after = self._fits(waiter.tokens, time.monotonic())
+        raise SchedulerRejected("chờ quá lâu", max(retry_after, 1))
+
+    def _cancel(self, waiter: _Waiter) -> None:
+        waiter.cancelled = True
+        self._waiting[waiter.priority] -= 1
+        self._cond.notify()
+
+    def _fits(self, tokens: int, now: float) -> float:
+        """Return seconds until one request with tokens fits the buckets."""
+        wait = 0.0
+        if self.rpm is not None:
+            wait = self.rpm.wait_time(1, now)
+        if self.tpm is not None:
+            wait = max(wait, self.tpm.wait_time(tokens, now))
+        return wait
+
+    def _take(self, tokens: int) -> None:
+        if self.rpm is not None:
+            self.rpm.take(1)
+        if self.tpm is not None:
+            self.tpm.take(tokens)
+
+    def _dispatch_loop(self) -> None:
+        with self._cond:
+            while True:
+                self._cond.wait(self._dispatch())
+
+    def _dispatch(self) -> Optional[float]:
+        """Admit queued calls in priority order; return the next deadline."""
+        while self._queue:
+            head = self._queue[0]
+            if head.cancelled:
+                heapq.heappop(self._queue)
+                continue
+            now = time.monotonic()
+            wait = self._fits(head.tokens, now)
+            if wait > 0:
+                return wait
+            heapq.heappop(self._queue)
+            self._take(head.tokens)
+            head.granted = True
+            self._waiting[head.priority] -= 1
+            self.granted[head.priority] += 1
+            self._waits[head.priority].append(now - head.enqueued)
+            head.notify()
+        return None
+
+    def stats(self) -> Dict:
+        """
+        Return queue depth, admissions and wait latency per priority.
+
+        Returns:
+            Dict: Quotas, current bucket levels and per-priority counters
+                  with p50/p95/max wait in milliseconds
+        """
+        with self._cond:
+            now = time.monotonic()
+            for bucket in (self.rpm, self.tpm):
+                if bucket is not None:
+                    bucket._refill(now)
+            priorities = {}
+            for priority, name in PRIORITY_NAMES.items():
+                waits = sorted(self._waits[priority])
+                pick = (lambda q: round(
+                    waits[min(len(waits) - 1, int(len(waits) * q))] * 1e3, 1
+                ) if waits else 0.0)
+                priorities[name] = {
+                    "queue_depth": self._waiting[priority],
+                    "granted": self.granted[priority],
+                    "rejected": self.rejected[priority],
+                    "timed_out": self.timed_out[priority],
+                    "wait_p50_ms": pick(0.50),
+                    "wait_p95_ms": pick(0.95),
+                    "wait_max_ms": round(waits[-1] * 1e3, 1) if waits else 0.0,
+                }
+            return {
+                "requests_per_minute": self.rpm.capacity if self.rpm else None,
+                "tokens_per_minute": self.tpm.capacity if self.tpm else None,
+                "requests_available": (
+                    round(self.rpm.level, 2) if self.rpm else None
+                ),
+                "tokens_available": round(self.tpm.level) if self.tpm else None,
+                "queue_depth": sum(self._waiting.values()),
+                "priorities": priorities,
+            }
+
+
+_default_scheduler: Optional[RequestScheduler] = None
+_default_scheduler_lock = threading.Lock()
+
+
+def get_default_scheduler() -> RequestScheduler:
+    """
+    Get the process-wide scheduler configured from environment variables.
+
+    The detector and the chatbot share it, so they draw on one RPM/TPM
+    budget. Without PLANT_GROQ_RPM/PLANT_GROQ_TPM it admits every call
+    immediately.
+
+    Returns:
+        RequestScheduler: Shared scheduler
+    """
+    global _default_scheduler
+    if _default_scheduler is None:
+        with _default_scheduler_lock:
+            if _default_scheduler is None:
+                _default_scheduler = RequestScheduler(
+                    requests_per_minute=float(
+                        os.environ.get("PLANT_GROQ_RPM", 0)
+                    ) or None,
+                    tokens_per_minute=float(
+                        os.environ.get("PLANT_GROQ_TPM", 0)
+                    ) or None,
+                    max_queue=int(
+                        os.environ.get("PLANT_SCHEDULER_MAX_QUEUE", 100)
+                    ),
+                    max_wait={
+                        PRIORITY_INTERACTIVE: float(os.environ.get(
+                            "PLANT_SCHEDULER_INTERACTIVE_MAX_WAIT", 10
+                        )),
+                        PRIORITY_BATCH: float(os.environ.get(
+                            "PLANT_SCHEDULER_BATCH_MAX_WAIT", 300
+                        )),
+                    },
+                )
+    return _default_scheduler
@@ -0,0 +1,407 @@
+"""
+Persistent Analysis Records
+===========================
+
+Analysis results used to live only in the Streamlit session (lost on
+refresh) and the API did not keep them at all. AnalysisStore keeps every
+result in a SQLite database together with the SHA-256 of the analyzed
+image, the time and the source of the request, and answers paginated
+queries by disease name, disease type, severity and time.
+
+Writes never happen on the request path: record() only puts the row on a
+bounded queue, and a background thread writes queued rows in batches, one
+transaction per batch. If the queue is full (the disk cannot keep up) new
+records are dropped and counted rather than slowing down requests. The
+database uses WAL mode, so queries are not blocked by the writer.
+
+Pages are ordered newest first and use keyset pagination: next_cursor is
+passed back as before= and each page costs an index range scan, however
+deep the client pages.
+
+Configuration (environment variables used by get_default_analysis_store):
+    PLANT_ANALYSIS_STORE: "sqlite" (default) or "none"
+    PLANT_ANALYSIS_PATH: SQLite file path (default: .cache/analyses.sqlite3)
+    PLANT_ANALYSIS_QUEUE: Max records waiting to be written (default: 10000)
+"""
+
+import atexit
+import hashlib
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple, Union
+
+
+logger = logging.getLogger(__name__)
+
+# Max rows written per transaction
+WRITE_BATCH_SIZE = 256
+MAX_PAGE_SIZE = 200
+
+# Columns that can be filtered on with an exact match (ASCII case-insensitive)
+FILTER_COLUMNS = ("disease_name", "disease_type", "severity", "source",
+                  "image_hash")
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS analyses ("
+    "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+    "created_at REAL NOT NULL, "
+    "source TEXT NOT NULL COLLATE NOCASE, "
+    "filename TEXT, "
+    "image_hash TEXT COLLATE NOCASE, "
+    "disease_detected INTEGER, "
+    "disease_name TEXT COLLATE NOCASE, "
+    "disease_type TEXT COLLATE NOCASE, "
+    "severity TEXT COLLATE NOCASE, "
+    "confidence REAL, "
+    "prompt_version TEXT, "
+    "result TEXT NOT NULL)",
+    # Pages are ordered by (created_at, id). An index on (column,
+    # created_at) also holds the rowid, so a filtered page, with or without
+    # a time range, is one index range scan and is never sorted
+    "CREATE INDEX IF NOT EXISTS analyses_disease_name "
+    "ON analyses (disease_name, created_at)",
+    "CREATE INDEX IF NOT EXISTS analyses_disease_type "
+    "ON analyses (disease_type, created_at)",
+    "CREATE INDEX IF NOT EXISTS analyses_severity "
+    "ON analyses (severity, created_at)",
+    "CREATE INDEX IF NOT EXISTS analyses_created_at ON analyses (created_at)",
+    "CREATE INDEX IF NOT EXISTS analyses_image_hash ON analyses (image_hash)",
+)
+
+_INSERT = (
+    "INSERT INTO analyses (created_at, source, filename, image_hash, "
+    "disease_detected, disease_name, disease_type, severity, confidence, "
+    "prompt_version, result) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+)
+
+_STOP = object()
+
+BytesLike = Union[bytes, bytearray, memoryview]
+
+
+def image_digest(image_bytes: BytesLike) -> str:
+    """Return the SHA-256 hex digest identifying an analyzed image."""
+    return hashlib.sha256(image_bytes).hexdigest()
+
+
+def _confidence(value) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _timestamp(value: float) -> str:
+    return datetime.fromtimestamp(value, timezone.utc).isoformat()
+
+
+class AnalysisStore:
+    """
+    SQLite store of analysis results with asynchronous, batched writes.
+
+    Args:
+        path (str): Path to the SQLite database file
+        queue_size (int): Max records waiting to be written; further
+                          records are dropped
+        batch_size (int): Max records written per transaction
+
+    Example:
+        >>> store = AnalysisStore(".cache/analyses.sqlite3")
+        >>> store.record(result, source="file", filename="leaf.jpg",
+        ...              image_hash=image_digest(image_bytes))
+        >>> page = store.query(disease_type="nấm", limit=20)
+        >>> store.query(disease_type="nấm", before=page["next_cursor"])
+    """
+
+    def __init__(self, path: str = ".cache/analyses.sqlite3",
+                 queue_size: int = 10000, batch_size: int = WRITE_BATCH_SIZE):
+        self.path = path
+        self.batch_size = max(1, batch_size)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max(1, queue_size))
+        # _lock guards the query connection, _counters_lock the counters, so
+        # record() never waits for a query
+        self._lock = threading.Lock()
+        self._counters_lock = threading.Lock()
+        self._conn = self._connect()
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        for statement in _SCHEMA:
+            self._conn.execute(statement)
+        self._conn.commit()
+        self.written = 0
+        self.dropped = 0
+        self.errors = 0
+        self._closed = False
+        self._writer = threading.Thread(
+            target=self._write_loop, name="analysis-store-writer", daemon=True
+        )
+        self._writer.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False, timeout=10)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def record(
+        self,
+        result: Dict,
+        source: str,
+        filename: Optional[str] = None,
+        image_hash: Optional[str] = None,
+        created_at: Optional[float] = None
+    ) -> bool:
+        """
+        Queue an analysis result to be written; never blocks.
+
+        Args:
+            result (Dict): Analysis result (DiseaseAnalysisResult fields)
+            source (str): Where the analysis was requested, e.g. "file"
+            filename (Optional[str]): Name of the analyzed file
+            image_hash (Optional[str]): SHA-256 of the analyzed image
+            created_at (Optional[float]): Unix time, None for now
+
+        Returns:
+            bool: False if the record was dropped (queue full or closed)
+        """
+        if self._closed:
+            return False
+        row = (
+            created_at if created_at is not None else time.time(),
+            source,
+            filename,
+            image_hash,
+            (None if result.get("disease_detected") is None
+             else int(bool(result.get("disease_detected")))),
+            result.get("disease_name"),
+            result.get("disease_type"),
+            result.get("severity"),
+            _confidence(result.get("confidence")),
+            result.get("prompt_version"),
+            json.dumps(result, ensure_ascii=False),
+        )
+        try:
+            self._queue.put_nowait(row)
+            return True
+        except queue.Full:
+            with self._counters_lock:
+                self.dropped += 1
+            logger.warning("Hàng đợi lưu kết quả phân tích đầy, bỏ qua bản ghi")
+            return False
+
+    def _write_loop(self) -> None:
+        conn = self._connect()
+        try:
+            while True:
+                rows = [self._queue.get()]
+                while len(rows) < self.batch_size:
+                    try:
+                        rows.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                stop = any(row is _STOP for row in rows)
+                rows_to_write = [row for row in rows if row is not _STOP]
+                try:
+                    if rows_to_write:
+                        with conn:
+                            conn.executemany(_INSERT, rows_to_write)
+                        with self._counters_lock:
+                            self.written += len(rows_to_write)
+                except sqlite3.Error as e:
+                    with self._counters_lock:
+                        self.errors += len(rows_to_write)
+                    logger.error(f"Lỗi ghi kết quả phân tích: {str(e)}")
+                finally:
+                    for _ in rows:
+                        self._queue.task_done()
+                if stop:
+                    return
+        finally:
+            conn.close()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait until every queued record is written.
+
+        Returns:
+            bool: False if the timeout expired first
+        """
+        with self._queue.all_tasks_done:
+            return self._queue.all_tasks_done.wait_for(
+                lambda: not self._queue.unfinished_tasks, timeout
+            )
+
+    def close(self, timeout: Optional[float] = 10) -> None:
+        """Write the queued records and stop the writer thread."""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._writer.join(timeout)
+        with self._lock:
+            self._conn.close()
+
+    def _rows(self, sql: str, params: Tuple = ()) -> List[Tuple]:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    @staticmethod
+    def _item(row: Tuple) -> Dict:
+        record_id, created_at, source, filename, image_hash, result = row
+        return {
+            "id": record_id,
+            "created_at": _timestamp(created_at),
+            "source": source,
+            "filename": filename,
+            "image_hash": image_hash,
+            "result": json.loads(result),
+        }
+
+    def get(self, record_id: int) -> Optional[Dict]:
+        """Return one record by id, None if it does not exist."""
+        rows = self._rows(
+            "SELECT id, created_at, source, filename, image_hash, result "
+            "FROM analyses WHERE id = ?", (record_id,)
+        )
+        return self._item(rows[0]) if rows else None
+
+    def query(
+        self,
+        disease_name: Optional[str] = None,
+        disease_type: Optional[str] = None,
+        severity: Optional[str] = None,
+        source: Optional[str] = None,
+        image_hash: Optional[str] = None,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        before: Optional[int] = None,
+        limit: int = 50
+    ) -> Dict:
+        """
+        Return one page of records, newest first.
+
+        Text filters match exactly, ignoring ASCII case; filters are
+        combined.
+
+        Args:
+            disease_name, disease_type, severity, source, image_hash
+                (Optional[str]): Exact values to match
+            since (Optional[float]): Unix time, only records from then on
+            until (Optional[float]): Unix time, only records before then
+            before (Optional[int]): Cursor: next_cursor of the previous page
+            limit (int): Page size, at most MAX_PAGE_SIZE
+
+        Returns:
+            Dict: {"items": [...], "next_cursor": id or None}
+        """
+        values = {
+            "disease_name": disease_name, "disease_type": disease_type,
+            "severity": severity, "source": source, "image_hash": image_hash,
+        }
+        clauses, params = [], []
+        for column in FILTER_COLUMNS:
+            if values[column] is not None:
+                clauses.append(f"{column} = ?")
+                params.append(values[column])
+        if since is not None:
+            clauses.append("created_at >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("created_at < ?")
+            params.append(until)
+        if before is not None:
+            # Resume after the cursor's row in (created_at, id) order
+            clauses.append(
+                "(created_at, id) < "
+                "(SELECT created_at, id FROM analyses WHERE id = ?)"
+            )
+            params.append(before)
+        where = f"WHERE {' AND '.join(clauses)} " if clauses else ""
+        limit = min(max(1, limit), MAX_PAGE_SIZE)
+        rows = self._rows(
+            "SELECT id, created_at, source, filename, image_hash, result "
+            f"FROM analyses {where}ORDER BY created_at DESC, id DESC LIMIT ?",
+            (*params, limit + 1)
+        )
+        items = [self._item(row) for row in rows[:limit]]
+        return {
+            "items": items,
+            "next_cursor": items[-1]["id"] if len(rows) > limit else None,
+        }
+
+    def stats(self) -> Dict:
+        """Return write counters and the number of records per type."""
+        by_type = self._rows(
+            "SELECT disease_type, COUNT(*) FROM analyses GROUP BY disease_type"
+        )
+        by_severity = self._rows(
+            "SELECT severity, COUNT(*) FROM analyses GROUP BY severity"
+        )
+        with self._counters_lock:
+            written, dropped, errors = self.written, self.dropped, self.errors
+        return {
+            "backend": "sqlite",
+            "records": sum(count for _, count in by_type),
+            "queued": self._queue.qsize(),
+            "written": written,
+            "dropped": dropped,
+            "errors": errors,
+            "by_disease_type": {str(key): count for key, count in by_type},
+            "by_severity": {str(key): count for key, count in by_severity},
+        }
+
+
+_default_store: Optional[AnalysisStore] = None
+_default_store_lock = threading.Lock()
+
+
+def get_default_analysis_store() -> Optional[AnalysisStore]:
+    """
+    Get the process-wide analysis store configured from environment variables.
+
+    Queued records are written when the process exits.
+
+    Returns:
+        Optional[AnalysisStore]: Shared store, or None if PLANT_ANALYSIS_STORE
+                                 is "none"
+    """
+    global _default_store
+    if _default_store is None:
+        with _default_store_lock:
+            if _default_store is None:
+                if os.environ.get("PLANT_ANALYSIS_STORE", "sqlite") == "none":
+                    return None
+                _default_store = AnalysisStore(
+                    os.environ.get(
+                        "PLANT_ANALYSIS_PATH", ".cache/analyses.sqlite3"
+                    ),
+                    queue_size=int(
+                        os.environ.get("PLANT_ANALYSIS_QUEUE", 10000)
+                    )
+                )
+                atexit.register(_default_store.close)
+                logger.info(
+                    f"Lưu kết quả phân tích tại {_default_store.path}"
+                )
+    return _default_store
+
+
+def close_default_analysis_store() -> None:
+    """
+    Write the queued records and close the process-wide analysis store.
+
+    The next get_default_analysis_store() opens a new store, so a restarted
+    server in the same process keeps recording analyses.
+    """
+    global _default_store
+    with _default_store_lock:
+        store, _default_store = _default_store, None
+    if store is not None:
+        store.close()
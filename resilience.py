@@ -0,0 +1,434 @@
+"""
+Resilience Layer for Groq API Calls
+===================================
+
+This module wraps every chat completion call of the detector and the
+chatbot with:
+
+    - retries with jittered exponential backoff for rate limits (429),
+      upstream errors (5xx), timeouts and connection errors, honoring the
+      Retry-After header sent by the API
+    - a per-call deadline covering all attempts and backoff sleeps
+    - a circuit breaker shared by all callers that fails fast while the
+      upstream keeps failing, instead of piling more requests onto it
+    - metrics for attempts, retries, give-ups and time spent open
+
+The SDK's own retries are disabled (see clients.py) so that retries are
+not multiplied across two layers.
+
+Configuration (environment variables used by get_default_caller):
+    PLANT_RETRY_MAX_ATTEMPTS: Attempts per call, including the first
+                              (default: 3)
+    PLANT_RETRY_BASE_DELAY: Backoff base in seconds (default: 0.5)
+    PLANT_RETRY_MAX_DELAY: Max backoff sleep in seconds (default: 8)
+    PLANT_CALL_DEADLINE: Seconds allowed per call, all attempts included
+                         (default: 60)
+    PLANT_CIRCUIT_FAILURES: Consecutive failures that open the circuit
+                            (default: 5)
+    PLANT_CIRCUIT_RESET: Seconds the circuit stays open before a trial
+                         call (default: 30)
+"""
+
+import asyncio
+import email.utils
+import logging
+import os
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+import groq
+
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(Exception):
+    """Raised without calling the API while the circuit breaker is open."""
+
+    def __init__(self, retry_after: float):
+        self.retry_after = retry_after
+        super().__init__(
+            f"Dịch vụ mô hình tạm thời không khả dụng, thử lại sau "
+            f"{retry_after:.0f} giây"
+        )
+
+
+def is_retryable(error: Exception) -> bool:
+    """Return True for errors worth retrying (429, 408, 409, 5xx, network)."""
+    if isinstance(error, groq.APIConnectionError):
+        return True
+    if isinstance(error, groq.APIStatusError):
+        return error.status_code in (408, 409, 429) or error.status_code >= 500
+    return False
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """
+    Read the delay requested by the API from a failed response.
+
+    Supports retry-after-ms, and Retry-After as seconds or an HTTP date.
+
+    Args:
+        error (Exception): Error raised by the Groq client
+
+    Returns:
+        Optional[float]: Seconds to wait, or None if not specified
+    """
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if "retry-after-ms" in headers:
+            return max(0.0, float(headers["retry-after-ms"]) / 1000)
+        value = headers.get("retry-after")
+        if value is None:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            retry_at = email.utils.parsedate_to_datetime(value).timestamp()
+            return max(0.0, retry_at - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RetryPolicy:
+    """
+    Backoff schedule and deadline of a call.
+
+    Args:
+        max_attempts (int): Attempts per call, including the first
+        base_delay (float): Backoff base in seconds
+        max_delay (float): Max backoff sleep in seconds
+        deadline (Optional[float]): Seconds allowed per call, None for no
+                                    deadline
+    """
+
+    def __init__(
+        self,
+        max_attempts: int = 3,
+        base_delay: float = 0.5,
+        max_delay: float = 8.0,
+        deadline: Optional[float] = 60.0
+    ):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+
+    def backoff(self, attempt: int, error: Exception) -> float:
+        """
+        Return the sleep before the next attempt.
+
+        Uses "full jitter" (uniform between 0 and the exponential cap) so
+        that clients failing together do not retry together; a Retry-After
+        from the API is used as the lower bound.
+
+        Args:
+            attempt (int): Number of attempts made so far (1-based)
+            error (Exception): Error of the last attempt
+
+        Returns:
+            float: Seconds to sleep
+        """
+        cap = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        delay = random.uniform(0, cap)
+        retry_after = retry_after_seconds(error)
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+
+class CircuitBreaker:
+    """
+    Fail fast while the upstream keeps failing.
+
+    Closed: calls pass; consecutive retryable failures are counted.
+    Open: calls raise CircuitOpenError until reset_timeout has passed.
+    Half-open: one trial call passes; success closes the circuit, failure
+    opens it again.
+
+    Args:
+        failure_threshold (int): Consecutive failures that open the circuit
+        reset_timeout (float): Seconds to stay open before a trial call
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_count = 0
+        self.rejected = 0
+        self.open_seconds = 0.0
+        self._opened_at = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def before_call(self) -> None:
+        """Raise CircuitOpenError if the call must not reach the API."""
+        with self._lock:
+            if self.state == "closed":
+                return
+            now = time.monotonic()
+            if self.state == "open":
+                remaining = self._opened_at + self.reset_timeout - now
+                if remaining > 0:
+                    self.rejected += 1
+                    raise CircuitOpenError(remaining)
+                self.state = "half_open"
+                self.open_seconds += now - self._opened_at
+                logger.info("Circuit breaker nửa mở: thử một lệnh gọi")
+            if self._trial_running:
+                self.rejected += 1
+                raise CircuitOpenError(self.reset_timeout)
+            self._trial_running = True
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self.state != "closed":
+                logger.info("Circuit breaker đóng lại")
+            self.state = "closed"
+            self.failures = 0
+            self._trial_running = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            if self.state == "half_open" or (
+                self.state == "closed"
+                and self.failures >= self.failure_threshold
+            ):
+                self.state = "open"
+                self._opened_at = time.monotonic()
+                self.opened_count += 1
+                logger.warning(
+                    f"Circuit breaker mở sau {self.failures} lỗi liên tiếp"
+                )
+
+    def record_ignored(self) -> None:
+        """End a trial call whose outcome says nothing about the upstream."""
+        with self._lock:
+            self._trial_running = False
+
+    def stats(self) -> Dict:
+        with self._lock:
+            open_seconds = self.open_seconds
+            if self.state == "open":
+                open_seconds += time.monotonic() - self._opened_at
+            return {
+                "state": self.state,
+                "consecutive_failures": self.failures,
+                "opened": self.opened_count,
+                "rejected_calls": self.rejected,
+                "open_seconds": round(open_seconds, 3),
+            }
+
+
+class ResilientCaller:
+    """
+    Run API calls with retries, a deadline and a circuit breaker.
+
+    Args:
+        policy (Optional[RetryPolicy]): Retry schedule and deadline
+        breaker (Optional[CircuitBreaker]): Circuit breaker, None to disable
+
+    Example:
+        >>> caller = ResilientCaller()
+        >>> completion = caller.call(client.chat.completions.create, **params)
+        >>> completion = await caller.acall(
+        ...     async_client.chat.completions.create, **params
+        ... )
+    """
+
+    def __init__(
+        self,
+        policy: Optional[RetryPolicy] = None,
+        breaker: Optional[CircuitBreaker] = None
+    ):
+        self.policy = policy if policy is not None else RetryPolicy()
+        self.breaker = breaker
+        self.calls = 0
+        self.attempts = 0
+        self.retries = 0
+        self.failures = 0
+        self.deadline_exceeded = 0
+        self.retry_after_honored = 0
+        self.backoff_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def call(self, fn: Callable[..., Any], **kwargs) -> Any:
+        """Call fn(**kwargs) from a thread, retrying transient errors."""
+        start = time.monotonic()
+        attempt = 0
+        self._count(calls=1)
+        while True:
+            attempt += 1
+            self._before_attempt()
+            try:
+                result = fn(**self._attempt_kwargs(kwargs, start))
+            except Exception as e:
+                delay = self._after_failure(e, attempt, start)
+                time.sleep(delay)
+                continue
+            except BaseException:
+                # Cancelled (CancelledError, KeyboardInterrupt): says nothing
+                # about the upstream, but must end a half-open trial
+                self._after_cancel()
+                raise
+            self._after_success()
+            return result
+
+    async def acall(self, fn: Callable[..., Any], **kwargs) -> Any:
+        """Await fn(**kwargs), retrying transient errors."""
+        start = time.monotonic()
+        attempt = 0
+        self._count(calls=1)
+        while True:
+            attempt += 1
+            self._before_attempt()
+            try:
+                result = await fn(**self._attempt_kwargs(kwargs, start))
+            except Exception as e:
+                delay = self._after_failure(e, attempt, start)
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                # Cancelled (CancelledError, KeyboardInterrupt): says nothing
+                # about the upstream, but must end a half-open trial
+                self._after_cancel()
+                raise
+            self._after_success()
+            return result
+
+    def _attempt_kwargs(self, kwargs: Dict, start: float) -> Dict:
+        """Cap the request timeout by the time left before the deadline."""
+        if self.policy.deadline is None:
+            return kwargs
+        remaining = self.policy.deadline - (time.monotonic() - start)
+        timeout = kwargs.get("timeout")
+        if isinstance(timeout, (int, float)):
+            remaining = min(remaining, timeout)
+        return {**kwargs, "timeout": max(remaining, 0.001)}
+
+    def _before_attempt(self) -> None:
+        if self.breaker is not None:
+            self.breaker.before_call()
+        self._count(attempts=1)
+
+    def _after_success(self) -> None:
+        if self.breaker is not None:
+            self.breaker.record_success()
+
+    def _after_cancel(self) -> None:
+        if self.breaker is not None:
+            self.breaker.record_ignored()
+
+    def _after_failure(
+        self, error: Exception, attempt: int, start: float
+    ) -> float:
+        """Record a failed attempt; return the backoff or re-raise."""
+        retryable = is_retryable(error)
+        if self.breaker is not None:
+            if retryable:
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_ignored()
+        if not retryable or attempt >= self.policy.max_attempts:
+            self._count(failures=1)
+            raise error
+
+        delay = self.policy.backoff(attempt, error)
+        if self.policy.deadline is not None:
+            remaining = self.policy.deadline - (time.monotonic() - start)
+            if delay >= remaining:
+                self._count(failures=1, deadline_exceeded=1)
+                logger.warning(
+                    f"Bỏ thử lại: vượt quá thời hạn {self.policy.deadline}s"
+                )
+                raise error
+
+        self._count(
+            retries=1,
+            retry_after_honored=int(retry_after_seconds(error) is not None),
+            backoff_seconds=delay,
+        )
+        logger.warning(
+            f"Lệnh gọi API thất bại ({error.__class__.__name__}), thử lại "
+            f"lần {attempt + 1}/{self.policy.max_attempts} sau {delay:.2f}s"
+        )
+        return delay
+
+    def _count(self, **deltas) -> None:
+        with self._lock:
+            for name, delta in deltas.items():
+                setattr(self, name, getattr(self, name) + delta)
+
+    def stats(self) -> Dict:
+        """
+        Return call, retry and circuit breaker metrics.
+
+        Returns:
+            Dict: Counters and the circuit breaker state
+        """
+        with self._lock:
+            stats = {
+                "calls": self.calls,
+                "attempts": self.attempts,
+                "retries": self.retries,
+                "failures": self.failures,
+                "deadline_exceeded": self.deadline_exceeded,
+                "retry_after_honored": self.retry_after_honored,
+                "backoff_seconds": round(self.backoff_seconds, 3),
+            }
+        if self.breaker is not None:
+            stats["circuit"] = self.breaker.stats()
+        return stats
+
+
+_default_caller: Optional[ResilientCaller] = None
+_default_caller_lock = threading.Lock()
+
+
+def get_default_caller() -> ResilientCaller:
+    """
+    Get the process-wide caller configured from environment variables.
+
+    The detector and the chatbot share it, so they share one circuit
+    breaker for the Groq API.
+
+    Returns:
+        ResilientCaller: Shared caller
+    """
+    global _default_caller
+    if _default_caller is None:
+        with _default_caller_lock:
+            if _default_caller is None:
+                deadline = float(os.environ.get("PLANT_CALL_DEADLINE", 60))
+                _default_caller = ResilientCaller(
+                    RetryPolicy(
+                        max_attempts=int(
+                            os.environ.get("PLANT_RETRY_MAX_ATTEMPTS", 3)
+                        ),
+                        base_delay=float(
+                            os.environ.get("PLANT_RETRY_BASE_DELAY", 0.5)
+                        ),
+                        max_delay=float(
+                            os.environ.get("PLANT_RETRY_MAX_DELAY", 8)
+                        ),
+                        deadline=deadline or None,
+                    ),
+                    CircuitBreaker(
+                        failure_threshold=int(
+                            os.environ.get("PLANT_CIRCUIT_FAILURES", 5)
+                        ),
+                        reset_timeout=float(
+                            os.environ.get("PLANT_CIRCUIT_RESET", 30)
+                        ),
+                    ),
+                )
+    return _default_caller
@@ -0,0 +1,263 @@
+"""
+Chatbot Session Store
+=====================
+
+This module keeps one chatbot conversation per API session instead of a
+single conversation shared by every client. A session's state (transcript,
+disease context and the token-budgeted memory window) is stored as plain
+JSON-serializable data and loaded into a fresh chatbot for each request.
+
+Backends:
+    - MemorySessionStore: in-process LRU with idle expiry, for a single
+      worker
+    - SQLiteSessionStore: shared database file, so all uvicorn workers on
+      a host see the same sessions
+
+Configuration (environment variables used by get_default_session_store):
+    PLANT_SESSION_BACKEND: "memory" (default) or "sqlite"
+    PLANT_SESSION_PATH: SQLite file path (default: .cache/sessions.sqlite3)
+    PLANT_SESSION_IDLE_TTL: Seconds a session survives without requests
+                            (default: 1800)
+    PLANT_SESSION_MAX: Max sessions kept by the memory backend (default: 1000)
+    PLANT_SESSION_MAX_HISTORY: Max transcript messages stored per session
+                               (default: 100)
+"""
+
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+
+logger = logging.getLogger(__name__)
+
+SESSION_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{8,128}$")
+
+
+def is_valid_session_id(session_id: str) -> bool:
+    """Return True if session_id is 8-128 URL-safe characters."""
+    return bool(SESSION_ID_PATTERN.match(session_id))
+
+
+class SessionStore:
+    """
+    Storage interface for chatbot session state.
+
+    Subclasses must implement get, set, delete and __len__.
+    """
+
+    name = "base"
+
+    def __init__(self):
+        self.evictions = 0
+
+    def get(self, session_id: str) -> Optional[Dict]:
+        raise NotImplementedError
+
+    def set(self, session_id: str, state: Dict) -> None:
+        raise NotImplementedError
+
+    def delete(self, session_id: str) -> None:
+        raise NotImplementedError
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    def stats(self) -> Dict:
+        """Return the backend name, live session count and evictions."""
+        return {
+            "backend": self.name,
+            "sessions": len(self),
+            "evictions": self.evictions,
+        }
+
+
+class MemorySessionStore(SessionStore):
+    """
+    In-process LRU of sessions, expiring sessions left idle too long.
+
+    Entries are ordered by last access, so idle sessions are always at the
+    front and are purged in O(1) per expired session.
+
+    Args:
+        max_sessions (int): Maximum number of sessions before LRU eviction
+        idle_ttl (Optional[float]): Idle seconds before a session expires,
+                                    None to never expire
+    """
+
+    name = "memory"
+
+    def __init__(self, max_sessions: int = 1000,
+                 idle_ttl: Optional[float] = 1800):
+        super().__init__()
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self._sessions: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str) -> Optional[Dict]:
+        with self._lock:
+            self._purge_idle()
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return None
+            self._sessions[session_id] = (time.monotonic(), entry[1])
+            self._sessions.move_to_end(session_id)
+            return entry[1]
+
+    def set(self, session_id: str, state: Dict) -> None:
+        with self._lock:
+            self._sessions[session_id] = (time.monotonic(), state)
+            self._sessions.move_to_end(session_id)
+            self._purge_idle()
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, session_id: str) -> None:
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def _purge_idle(self) -> None:
+        if not self.idle_ttl:
+            return
+        deadline = time.monotonic() - self.idle_ttl
+        while self._sessions:
+            session_id, (last_access, _) = next(iter(self._sessions.items()))
+            if last_access >= deadline:
+                break
+            del self._sessions[session_id]
+            self.evictions += 1
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    Session store in a SQLite database shared by all workers on a host.
+
+    Uses WAL mode so readers in one worker do not block writers in another.
+    Expired sessions are ignored on read and purged periodically on write.
+
+    Args:
+        path (str): Path to the SQLite database file
+        idle_ttl (Optional[float]): Idle seconds before a session expires,
+                                    None to never expire
+        purge_every (int): Purge expired sessions every this many writes
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str = ".cache/sessions.sqlite3",
+                 idle_ttl: Optional[float] = 1800, purge_every: int = 100):
+        super().__init__()
+        self.path = path
+        self.idle_ttl = idle_ttl
+        self.purge_every = purge_every
+        self._writes = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False,
+                                     timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "id TEXT PRIMARY KEY, state TEXT NOT NULL, "
+            "updated_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS sessions_updated_at "
+            "ON sessions (updated_at)"
+        )
+        self._conn.commit()
+
+    def _deadline(self) -> float:
+        return time.time() - self.idle_ttl if self.idle_ttl else float("-inf")
+
+    def get(self, session_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT state FROM sessions WHERE id = ? AND updated_at >= ?",
+                (session_id, self._deadline())
+            ).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def set(self, session_id: str, state: Dict) -> None:
+        payload = json.dumps(state, ensure_ascii=False)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sessions (id, state, updated_at) "
+                "VALUES (?, ?, ?)",
+                (session_id, payload, time.time())
+            )
+            self._writes += 1
+            if self.idle_ttl and self._writes % self.purge_every == 0:
+                purged = self._conn.execute(
+                    "DELETE FROM sessions WHERE updated_at < ?",
+                    (self._deadline(),)
+                ).rowcount
+                self.evictions += purged
+            self._conn.commit()
+
+    def delete(self, session_id: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM sessions WHERE id = ?",
+                               (session_id,))
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM sessions WHERE updated_at >= ?",
+                (self._deadline(),)
+            ).fetchone()[0]
+
+
+_default_store: Optional[SessionStore] = None
+_default_store_lock = threading.Lock()
+
+
+def session_history_limit() -> int:
+    """Return the max transcript messages stored per session."""
+    return int(os.environ.get("PLANT_SESSION_MAX_HISTORY", 100))
+
+
+def get_default_session_store() -> SessionStore:
+    """
+    Get the process-wide session store configured from environment variables.
+
+    Returns:
+        SessionStore: Shared session store
+    """
+    global _default_store
+    if _default_store is None:
+        with _default_store_lock:
+            if _default_store is None:
+                idle_ttl = float(os.environ.get("PLANT_SESSION_IDLE_TTL", 1800))
+                if os.environ.get("PLANT_SESSION_BACKEND", "memory") == "sqlite":
+                    _default_store = SQLiteSessionStore(
+                        os.environ.get(
+                            "PLANT_SESSION_PATH", ".cache/sessions.sqlite3"
+                        ),
+                        idle_ttl=idle_ttl
+                    )
+                else:
+                    _default_store = MemorySessionStore(
+                        max_sessions=int(
+                            os.environ.get("PLANT_SESSION_MAX", 1000)
+                        ),
+                        idle_ttl=idle_ttl
+                    )
+                logger.info(
+                    f"Khởi tạo kho phiên chatbot ({_default_store.name})"
+                )
+    return _default_store
@@ -0,0 +1,182 @@
+"""
+Request Coalescing for Plant Disease Detection
+==============================================
+
+This module merges identical analyses that are in flight at the same time
+(a double-clicked button, several clients uploading the same photo) into a
+single model call. The first caller of a key runs the call; callers that
+arrive before it finishes wait for it and receive a copy of its result, or
+its exception.
+
+Flights are backed by concurrent.futures.Future, so threads (Streamlit,
+batch workers) and asyncio tasks (FastAPI) can join the same flight.
+
+Configuration (environment variables used by get_default_flights):
+    PLANT_COALESCE: "1" (default) to coalesce identical requests, "0" to
+                    send every request upstream
+"""
+
+import asyncio
+import copy
+import hashlib
+import logging
+import os
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple, Union
+
+
+logger = logging.getLogger(__name__)
+
+
+def make_flight_key(
+    payload: Union[str, bytes, memoryview], *params: Any
+) -> str:
+    """
+    Build the key identifying identical requests.
+
+    Args:
+        payload (Union[str, bytes, memoryview]): Request payload, e.g. the
+                                                 image bytes
+        *params: Request parameters that change the result
+
+    Returns:
+        str: Flight key
+    """
+    if isinstance(payload, str):
+        payload = payload.encode("utf-8")
+    digest = hashlib.sha256(payload).hexdigest()
+    return ":".join([digest, *map(str, params)])
+
+
+class _LeaderCancelled(Exception):
+    """The caller running a flight was cancelled before it finished."""
+
+
+class SingleFlight:
+    """
+    Run at most one call per key at a time and share its outcome.
+
+    Example:
+        >>> flights = SingleFlight()
+        >>> result, shared = flights.do(key, detector_call, request)
+        >>> result, shared = await flights.do_async(key, coroutine_fn, request)
+    """
+
+    def __init__(self):
+        self._flights: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.coalesced = 0
+
+    def _join(self, key: str) -> Tuple[Future, bool]:
+        """Return the flight for key and whether the caller leads it."""
+        with self._lock:
+            future = self._flights.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future, False
+            future = Future()
+            # A running future cannot be cancelled by a waiting follower
+            future.set_running_or_notify_cancel()
+            self._flights[key] = future
+            self.leaders += 1
+            return future, True
+
+    def _land(self, key: str, future: Future, result: Any = None,
+              error: Optional[BaseException] = None) -> None:
+        """Publish the outcome of a flight and retire its key."""
+        with self._lock:
+            self._flights.pop(key, None)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(copy.deepcopy(result))
+
+    def do(self, key: str, fn: Callable[..., Any], *args: Any) -> Tuple[Any, bool]:
+        """
+        Call fn(*args), or wait for the identical call already in flight.
+
+        Args:
+            key (str): Flight key, see make_flight_key
+            fn (Callable): Function producing the result
+            *args: Arguments of fn
+
+        Returns:
+            Tuple[Any, bool]: Result and whether it came from another caller
+
+        Raises:
+            Exception: Whatever fn raised, for the leader and every follower
+        """
+        while True:
+            future, leader = self._join(key)
+            if leader:
+                try:
+                    result = fn(*args)
+                except BaseException as e:
+                    self._land(key, future, error=(
+                        e if isinstance(e, Exception) else _LeaderCancelled()
+                    ))
+                    raise
+                self._land(key, future, result)
+                return result, False
+            try:
+                return copy.deepcopy(future.result()), True
+            except _LeaderCancelled:
+                continue
+
+    async def do_async(
+        self, key: str, fn: Callable[..., Awaitable[Any]], *args: Any
+    ) -> Tuple[Any, bool]:
+        """Coroutine version of do(); fn must be a coroutine function."""
+        while True:
+            future, leader = self._join(key)
+            if leader:
+                try:
+                    result = await fn(*args)
+                except BaseException as e:
+                    self._land(key, future, error=(
+                        e if isinstance(e, Exception) else _LeaderCancelled()
+                    ))
+                    raise
+                self._land(key, future, result)
+                return result, False
+            try:
+                return copy.deepcopy(await asyncio.wrap_future(future)), True
+            except _LeaderCancelled:
+                continue
+
+    def stats(self) -> Dict:
+        """Return upstream calls made, requests coalesced and flights open."""
+        with self._lock:
+            in_flight = len(self._flights)
+        total = self.leaders + self.coalesced
+        return {
+            "upstream_calls": self.leaders,
+            "coalesced": self.coalesced,
+            "in_flight": in_flight,
+            "coalesced_ratio": round(self.coalesced / total, 4) if total else 0.0,
+        }
+
+
+_default_flights: Optional[SingleFlight] = None
+_default_flights_lock = threading.Lock()
+
+
+def get_default_flights() -> Optional[SingleFlight]:
+    """
+    Get the process-wide coalescing layer configured from environment.
+
+    Returns:
+        Optional[SingleFlight]: Shared instance, or None if PLANT_COALESCE
+                                is "0"
+    """
+    global _default_flights
+    if os.environ.get("PLANT_COALESCE", "1") == "0":
+        return None
+    if _default_flights is None:
+        with _default_flights_lock:
+            if _default_flights is None:
+                _default_flights = SingleFlight()
+                logger.info("Bật gộp các yêu cầu phân tích giống hệt nhau")
+    return _default_flights
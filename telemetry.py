@@ -0,0 +1,271 @@
+"""
+Metrics and Tracing for the Plant Disease Detection API
+=======================================================
+
+Prometheus metrics, served by app.py at /metrics, and OpenTelemetry spans
+along the request path, so latency can be broken down beyond the log lines.
+
+Metrics:
+    plant_http_requests_total{method, route, status}
+    plant_http_request_seconds{method, route}     whole request
+    plant_upload_read_seconds{route}              receiving the request body
+    plant_image_prepare_seconds                   decode, resize and re-encode
+                                                  an upload (preprocess.py)
+    plant_request_encode_seconds                  base64 image into the JSON
+                                                  request body (payload.py)
+    plant_upstream_seconds{kind}                  model API call, retries
+                                                  included (a stream: until
+                                                  it opens)
+    plant_parse_seconds                           parsing a model response
+    plant_tokens_total{kind, type}                prompt/completion tokens
+    plant_cache_lookups_total{cache, result}      result cache and near-
+                                                  duplicate index hits/misses
+    plant_errors_total{component, error}          exceptions by class
+
+Spans (the OpenTelemetry API is a no-op until tracing is configured):
+    PlantDiseaseDetector.analyze        one image, whatever the entry point
+    groq.chat.completions               the model API call
+    PlantDiseaseDetector._parse_response
+    PlantDiseaseChatbot.chat
+
+Configuration (environment variables used by configure_tracing):
+    PLANT_TRACING: "none" (default), "otlp" (OTLP/HTTP to
+                   OTEL_EXPORTER_OTLP_ENDPOINT, needs
+                   opentelemetry-exporter-otlp-proto-http), "file" (one JSON
+                   span per line in PLANT_TRACING_FILE) or "console"
+    PLANT_TRACING_FILE: File for "file" (default: .cache/spans.jsonl)
+    OTEL_SERVICE_NAME: Service name of the spans (default:
+                       plant-disease-api)
+"""
+
+import logging
+import os
+import threading
+import time
+from typing import Optional
+
+from opentelemetry import trace
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, Counter, Histogram, generate_latest
+)
+
+
+logger = logging.getLogger(__name__)
+
+TRACING_EXPORTERS = ("none", "otlp", "file", "console")
+
+tracer = trace.get_tracer("plant-disease")
+
+# Latency buckets: sub-millisecond CPU steps up to slow model calls
+_FAST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                 0.25, 0.5, 1.0, 2.5)
+_SLOW_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 3.0, 5.0, 7.5, 10.0, 15.0,
+                 20.0, 30.0, 60.0)
+
+HTTP_REQUESTS = Counter(
+    "plant_http_requests_total", "HTTP requests answered",
+    ["method", "route", "status"]
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    "plant_http_request_seconds", "Time to answer an HTTP request",
+    ["method", "route"], buckets=_SLOW_BUCKETS
+)
+UPLOAD_READ_SECONDS = Histogram(
+    "plant_upload_read_seconds", "Time to receive a request body",
+    ["route"], buckets=_FAST_BUCKETS + (5.0, 10.0, 30.0, 60.0)
+)
+IMAGE_PREPARE_SECONDS = Histogram(
+    "plant_image_prepare_seconds",
+    "Time to decode, resize and re-encode an uploaded image",
+    buckets=_FAST_BUCKETS
+)
+REQUEST_ENCODE_SECONDS = Histogram(
+    "plant_request_encode_seconds",
+    "Time to encode a model request body with its base64 image",
+    buckets=_FAST_BUCKETS
+)
+UPSTREAM_SECONDS = Histogram(
+    "plant_upstream_seconds", "Latency of a model API call, retries included",
+    ["kind"], buckets=_SLOW_BUCKETS
+)
+PARSE_SECONDS = Histogram(
+    "plant_parse_seconds", "Time to parse a model response",
+    buckets=_FAST_BUCKETS
+)
+TOKENS = Counter(
+    "plant_tokens_total", "Tokens billed by the model API",
+    ["kind", "type"]
+)
+CACHE_LOOKUPS = Counter(
+    "plant_cache_lookups_total", "Result cache and near-duplicate lookups",
+    ["cache", "result"]
+)
+ERRORS = Counter(
+    "plant_errors_total", "Exceptions raised by the analysis and chatbot",
+    ["component", "error"]
+)
+
+
+def observe_completion(kind: str, completion, seconds: float) -> None:
+    """
+    Record the latency and billed tokens of one model API call.
+
+    Args:
+        kind (str): "analysis", "chat" or "chat_stream"
+        completion: Chat completion, or None if it has no usage (streams)
+        seconds (float): Latency of the call
+    """
+    UPSTREAM_SECONDS.labels(kind).observe(seconds)
+    usage = getattr(completion, "usage", None)
+    if usage is None:
+        return
+    TOKENS.labels(kind, "prompt").inc(usage.prompt_tokens or 0)
+    TOKENS.labels(kind, "completion").inc(usage.completion_tokens or 0)
+    # Attributes of the current span (OpenTelemetry GenAI conventions)
+    span = trace.get_current_span()
+    if span.is_recording():
+        span.set_attribute("gen_ai.usage.input_tokens", usage.prompt_tokens or 0)
+        span.set_attribute(
+            "gen_ai.usage.output_tokens", usage.completion_tokens or 0
+        )
+        if completion.choices:
+            span.set_attribute(
+                "gen_ai.response.finish_reasons",
+                [choice.finish_reason or "" for choice in completion.choices]
+            )
+
+
+def observe_error(component: str, error: Exception) -> None:
+    """Count an exception by its class name."""
+    ERRORS.labels(component, type(error).__name__).inc()
+
+
+def render_metrics() -> bytes:
+    """Return all metrics in the Prometheus text format."""
+    return generate_latest()
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording the duration, status and body receive time
+    of each HTTP request, labelled by route template (/analyses/{analysis_id},
+    not each id).
+
+    Args:
+        app: ASGI application
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        status = 500
+        read = {}
+
+        async def timed_receive():
+            message = await receive()
+            if message["type"] == "http.request":
+                read.setdefault("start", time.perf_counter())
+                if not message.get("more_body", False):
+                    read["seconds"] = time.perf_counter() - read["start"]
+            return message
+
+        async def status_send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, timed_receive, status_send)
+        finally:
+            route = scope.get("route")
+            route = getattr(route, "path", None) or "unmatched"
+            method = scope["method"]
+            HTTP_REQUESTS.labels(method, route, str(status)).inc()
+            HTTP_REQUEST_SECONDS.labels(method, route).observe(
+                time.perf_counter() - start
+            )
+            if "seconds" in read and method in ("POST", "PUT", "PATCH"):
+                UPLOAD_READ_SECONDS.labels(route).observe(read["seconds"])
+
+
+_tracing_configured = False
+_tracing_lock = threading.Lock()
+
+
+def configure_tracing(exporter: Optional[str] = None) -> bool:
+    """
+    Install an OpenTelemetry tracer provider exporting the spans.
+
+    Called once by app.py; safe to call again (later calls do nothing).
+
+    Args:
+        exporter (Optional[str]): One of TRACING_EXPORTERS; if None, the
+                                  PLANT_TRACING environment variable
+
+    Returns:
+        bool: True if spans are exported
+
+    Raises:
+        ImportError: If opentelemetry-sdk (or the OTLP exporter) is not
+                     installed
+        ValueError: If the exporter is unknown
+    """
+    global _tracing_configured
+    exporter = exporter or os.environ.get("PLANT_TRACING", "none")
+    if exporter not in TRACING_EXPORTERS:
+        raise ValueError(
+            f"Unknown tracing exporter {exporter!r}, expected one of "
+            f"{', '.join(TRACING_EXPORTERS)}"
+        )
+    if exporter == "none":
+        return False
+    with _tracing_lock:
+        if _tracing_configured:
+            return True
+        try:
+            from opentelemetry.sdk.resources import Resource
+            from opentelemetry.sdk.trace import TracerProvider
+            from opentelemetry.sdk.trace.export import (
+                BatchSpanProcessor, ConsoleSpanExporter
+            )
+        except ImportError:
+            raise ImportError(
+                "Xuất span cần opentelemetry-sdk: pip install opentelemetry-sdk"
+            )
+
+        if exporter == "otlp":
+            try:
+                from opentelemetry.exporter.otlp.proto.http.trace_exporter \
+                    import OTLPSpanExporter
+            except ImportError:
+                raise ImportError(
+                    "PLANT_TRACING=otlp cần opentelemetry-exporter-otlp-proto-http"
+                )
+            span_exporter = OTLPSpanExporter()
+        elif exporter == "file":
+            path = os.environ.get("PLANT_TRACING_FILE", ".cache/spans.jsonl")
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            span_exporter = ConsoleSpanExporter(
+                out=open(path, "a", encoding="utf-8"),
+                formatter=lambda span: span.to_json(indent=None) + "\n"
+            )
+        else:
+            span_exporter = ConsoleSpanExporter()
+
+        provider = TracerProvider(resource=Resource.create({
+            "service.name": os.environ.get(
+                "OTEL_SERVICE_NAME", "plant-disease-api"
+            )
+        }))
+        provider.add_span_processor(BatchSpanProcessor(span_exporter))
+        trace.set_tracer_provider(provider)
+        _tracing_configured = True
+        logger.info(f"Bật xuất span OpenTelemetry ({exporter})")
+        return True
+
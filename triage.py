@@ -0,0 +1,348 @@
+"""
+Local Image Triage for Plant Disease Detection
+==============================================
+
+This module screens uploads with cheap local checks before the vision
+model is called. Images that are not images at all, are too small, too
+dark, overexposed, featureless, blurry or contain no plant-coloured pixels
+are answered immediately with an "invalid_image" result that asks for a
+better photo, instead of spending a full model call on the prompt's image
+validation step. Everything else is escalated to the model.
+
+Checks run on a thumbnail of at most 256 pixels (JPEG draft decoding), so
+triage costs a few milliseconds:
+
+    too_small      shortest edge below min_edge pixels
+    too_dark       mean luminance below dark_below
+    overexposed    mean luminance above bright_above
+    low_contrast   luminance standard deviation below min_contrast
+    blurry         variance of the Laplacian below min_sharpness
+    no_vegetation  share of green/yellow/brown saturated pixels below
+                   min_vegetation
+
+Optionally, a small local classifier (see backends.py) answers images it
+is confident are healthy.
+
+Configuration (environment variables used by get_default_triage):
+    PLANT_TRIAGE: "1" (default) to screen uploads, "0" to send every upload
+                  to the model
+    PLANT_TRIAGE_MODEL: ONNX classifier answering confidently healthy
+                        images, unset to disable
+    PLANT_TRIAGE_HEALTHY_CONFIDENCE: Min classifier confidence (0-100) to
+                                     answer an image as healthy (default: 90)
+"""
+
+import io
+import logging
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+from PIL import Image, ImageChops, ImageFilter, ImageStat
+
+from backends import AnalysisBackend, OnnxClassifierBackend
+
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_SIZE = 256
+
+# Laplacian kernel; the offset keeps negative responses in range
+_LAPLACIAN = ImageFilter.Kernel(
+    (3, 3), [0, 1, 0, 1, -4, 1, 0, 1, 0], scale=1, offset=128
+)
+
+# Problem shown to the user and advice, per triage reason
+_MESSAGES = {
+    "not_image": (
+        "Tệp tải lên không phải là hình ảnh hợp lệ",
+        "Vui lòng tải lên ảnh JPEG, PNG hoặc WebP của bộ phận cây",
+    ),
+    "too_small": (
+        "Ảnh quá nhỏ để nhận diện triệu chứng",
+        "Vui lòng chụp ảnh cận cảnh với độ phân giải cao hơn",
+    ),
+    "too_dark": (
+        "Ảnh quá tối, không thấy rõ bộ phận cây",
+        "Vui lòng chụp lại ở nơi đủ ánh sáng",
+    ),
+    "overexposed": (
+        "Ảnh bị cháy sáng, mất chi tiết",
+        "Vui lòng tránh ánh nắng chiếu trực tiếp vào ống kính khi chụp",
+    ),
+    "low_contrast": (
+        "Ảnh gần như chỉ có một màu, không có chi tiết",
+        "Vui lòng chụp rõ bộ phận cây (lá, rễ, thân) cần phân tích",
+    ),
+    "blurry": (
+        "Ảnh bị mờ hoặc nhòe, không thấy rõ chi tiết",
+        "Vui lòng giữ máy chắc tay và lấy nét vào vùng bị bệnh rồi chụp lại",
+    ),
+    "no_vegetation": (
+        "Hình ảnh này không chứa bộ phận cây hoặc thực vật",
+        "Vui lòng tải lên hình ảnh bộ phận cây (lá, rễ, thân) để phân tích bệnh",
+    ),
+}
+
+
+def invalid_image_result(reason: str) -> Dict:
+    """
+    Build the "invalid_image" result for a triage reason.
+
+    Args:
+        reason (str): Key of the failed check
+
+    Returns:
+        Dict: DiseaseAnalysisResult fields, with the reason in "triage"
+    """
+    problem, advice = _MESSAGES[reason]
+    return {
+        "disease_detected": False,
+        "disease_name": None,
+        "disease_type": "invalid_image",
+        "severity": "none",
+        "confidence": 90.0,
+        "symptoms": [problem],
+        "possible_causes": [
+            "Hình ảnh không đạt yêu cầu để phân tích bệnh cây"
+        ],
+        "treatment": [advice],
+        "triage": reason,
+    }
+
+
+class ImageTriage:
+    """
+    Screen images locally and decide which ones need the vision model.
+
+    Args:
+        min_edge (int): Min shortest edge in pixels
+        dark_below (float): Min mean luminance (0-255)
+        bright_above (float): Max mean luminance (0-255)
+        min_contrast (float): Min luminance standard deviation
+        min_sharpness (float): Min variance of the Laplacian
+        min_vegetation (float): Min share (0-1) of plant-coloured pixels
+        classifier (Optional[AnalysisBackend]): Local classifier answering
+                                                confidently healthy images
+        healthy_confidence (float): Min classifier confidence (0-100)
+
+    Example:
+        >>> triage = ImageTriage()
+        >>> result = triage.check(image_bytes)
+        >>> if result is None:
+        ...     result = call_vision_model(image_bytes)
+    """
+
+    def __init__(
+        self,
+        min_edge: int = 64,
+        dark_below: float = 25,
+        bright_above: float = 245,
+        min_contrast: float = 5,
+        min_sharpness: float = 15,
+        min_vegetation: float = 0.05,
+        classifier: Optional[AnalysisBackend] = None,
+        healthy_confidence: float = 90
+    ):
+        self.min_edge = min_edge
+        self.dark_below = dark_below
+        self.bright_above = bright_above
+        self.min_contrast = min_contrast
+        self.min_sharpness = min_sharpness
+        self.min_vegetation = min_vegetation
+        self.classifier = classifier
+        self.healthy_confidence = healthy_confidence
+        self._lock = threading.Lock()
+        self.checked = 0
+        self.escalated = 0
+        self.short_circuited: Dict[str, int] = {}
+        self.triage_seconds = 0.0
+        self.upstream_seconds: Optional[float] = None  # moving average
+        self.latency_saved_seconds = 0.0
+
+    def measure(self, image_bytes: bytes) -> Dict[str, float]:
+        """
+        Compute the image quality scores used by the checks.
+
+        Args:
+            image_bytes (bytes): Encoded image
+
+        Returns:
+            Dict[str, float]: width, height, brightness, contrast, sharpness
+                              and vegetation scores
+
+        Raises:
+            OSError: If the data is not a decodable image
+        """
+        with Image.open(io.BytesIO(image_bytes)) as image:
+            width, height = image.size
+            image.draft("RGB", (THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+            image = image.convert("RGB")
+        image.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+
+        gray = image.convert("L")
+        luminance = ImageStat.Stat(gray)
+        # PIL leaves border pixels unfiltered; exclude them
+        edges = gray.filter(_LAPLACIAN)
+        edges = edges.crop((1, 1, edges.width - 1, edges.height - 1))
+
+        # Green, yellow and brown hues (about 14-170 degrees), saturated and
+        # not too dark: leaves, stems, roots and soil, but not sky, paper
+        # or screens
+        hue, saturation, value = image.convert("HSV").split()
+        vegetation = ImageChops.multiply(
+            ImageChops.multiply(
+                hue.point(lambda h: 255 if 10 <= h <= 120 else 0),
+                saturation.point(lambda s: 255 if s >= 40 else 0)
+            ),
+            value.point(lambda v: 255 if v >= 30 else 0)
+        )
+        return {
+            "width": width,
+            "height": height,
+            "brightness": luminance.mean[0],
+            "contrast": luminance.stddev[0],
+            "sharpness": ImageStat.Stat(edges).var[0] if edges.width > 0 else 0.0,
+            "vegetation": ImageStat.Stat(vegetation).mean[0] / 255,
+        }
+
+    def _reason(self, scores: Dict[str, float]) -> Optional[str]:
+        """Return the first failed check, None if the image passes."""
+        if min(scores["width"], scores["height"]) < self.min_edge:
+            return "too_small"
+        if scores["brightness"] < self.dark_below:
+            return "too_dark"
+        if scores["brightness"] > self.bright_above:
+            return "overexposed"
+        if scores["contrast"] < self.min_contrast:
+            return "low_contrast"
+        if scores["sharpness"] < self.min_sharpness:
+            return "blurry"
+        if scores["vegetation"] < self.min_vegetation:
+            return "no_vegetation"
+        return None
+
+    def check(self, image_bytes: bytes) -> Optional[Dict]:
+        """
+        Triage an image.
+
+        Args:
+            image_bytes (bytes): Encoded image
+
+        Returns:
+            Optional[Dict]: DiseaseAnalysisResult fields (with the reason in
+                            "triage") if the image can be answered locally,
+                            None if it must be escalated to the model
+        """
+        start = time.perf_counter()
+        result = None
+        try:
+            reason = self._reason(self.measure(image_bytes))
+        except (OSError, ValueError, Image.DecompressionBombError):
+            reason = "not_image"
+        if reason is not None:
+            result = invalid_image_result(reason)
+        elif self.classifier is not None:
+            try:
+                fields = self.classifier.analyze_image(image_bytes)
+            except Exception as e:
+                # A failed pre-filter must not block the model
+                logger.warning(
+                    f"Bộ phân loại sàng lọc lỗi, chuyển lên mô hình: {e}"
+                )
+                self._record(None, time.perf_counter() - start)
+                return None
+            if (not fields["disease_detected"]
+                    and fields["confidence"] >= self.healthy_confidence):
+                reason = "classifier_healthy"
+                result = {**fields, "triage": reason}
+        self._record(reason, time.perf_counter() - start)
+        return result
+
+    def _record(self, reason: Optional[str], seconds: float) -> None:
+        with self._lock:
+            self.checked += 1
+            self.triage_seconds += seconds
+            if reason is None:
+                self.escalated += 1
+                return
+            self.short_circuited[reason] = (
+                self.short_circuited.get(reason, 0) + 1
+            )
+            if self.upstream_seconds is not None:
+                self.latency_saved_seconds += max(
+                    0.0, self.upstream_seconds - seconds
+                )
+
+    def record_upstream(self, seconds: float) -> None:
+        """
+        Record the latency of an escalated analysis.
+
+        The moving average estimates the latency saved by each image
+        answered locally.
+        """
+        with self._lock:
+            if self.upstream_seconds is None:
+                self.upstream_seconds = seconds
+            else:
+                self.upstream_seconds += 0.2 * (seconds - self.upstream_seconds)
+
+    def stats(self) -> Dict:
+        """
+        Return escalation rate, short-circuits per reason and latency saved.
+
+        Returns:
+            Dict: Counters, mean triage time and the estimated model latency
+                  saved by answering images locally
+        """
+        with self._lock:
+            return {
+                "checked": self.checked,
+                "escalated": self.escalated,
+                "escalation_rate": (
+                    round(self.escalated / self.checked, 4)
+                    if self.checked else 0.0
+                ),
+                "short_circuited": dict(self.short_circuited),
+                "mean_triage_ms": (
+                    round(self.triage_seconds / self.checked * 1e3, 2)
+                    if self.checked else 0.0
+                ),
+                "mean_upstream_ms": (
+                    round(self.upstream_seconds * 1e3, 1)
+                    if self.upstream_seconds is not None else None
+                ),
+                "latency_saved_seconds": round(self.latency_saved_seconds, 3),
+            }
+
+
+_default_triage: Optional[ImageTriage] = None
+_default_triage_lock = threading.Lock()
+
+
+def get_default_triage() -> Optional[ImageTriage]:
+    """
+    Get the process-wide triage configured from environment variables.
+
+    Returns:
+        Optional[ImageTriage]: Shared triage, or None if PLANT_TRIAGE is "0"
+    """
+    global _default_triage
+    if os.environ.get("PLANT_TRIAGE", "1") == "0":
+        return None
+    if _default_triage is None:
+        with _default_triage_lock:
+            if _default_triage is None:
+                model_path = os.environ.get("PLANT_TRIAGE_MODEL")
+                _default_triage = ImageTriage(
+                    classifier=(
+                        OnnxClassifierBackend(model_path) if model_path
+                        else None
+                    ),
+                    healthy_confidence=float(os.environ.get(
+                        "PLANT_TRIAGE_HEALTHY_CONFIDENCE", 90
+                    )),
+                )
+                logger.info("Bật sàng lọc ảnh cục bộ trước khi gọi mô hình")
+    return _default_triage
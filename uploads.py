@@ -0,0 +1,307 @@
+"""
+Upload Validation for the Plant Disease Detection API
+=====================================================
+
+Uploads are validated while the request streams in, before any image is
+decoded, so a few large or malicious uploads cannot exhaust the memory of
+a worker:
+
+    1. BodySizeLimitMiddleware counts the request body as it arrives and
+       answers 413 as soon as it exceeds the limit of the route (right away
+       if Content-Length already does), before the rest is read
+    2. The multipart parser keeps each file in memory up to
+       PLANT_UPLOAD_SPOOL_BYTES and spills the rest to a temporary file
+    3. validate_upload checks the size of each file and sniffs its format
+       from the magic bytes, whatever its name or Content-Type claims
+    4. prepare_image (preprocess.py) refuses to decode images whose bitmap
+       would exceed PLANT_IMAGE_MAX_PIXELS (decompression bombs)
+
+Zip archives sent to the batch endpoints are read from the spooled file;
+entries are checked against their declared uncompressed size before they
+are extracted.
+
+Configuration (environment variables, read at import):
+    PLANT_UPLOAD_MAX_BYTES: Max size of one image (default: 20 MB)
+    PLANT_REQUEST_MAX_BYTES: Max request body, and max total size of the
+                             images extracted from zip archives, for the
+                             other routes (default: 200 MB)
+    PLANT_UPLOAD_SPOOL_BYTES: Bytes of an uploaded file kept in memory
+                              before spilling to a temporary file
+                              (default: 1 MB)
+"""
+
+import logging
+import os
+import zipfile
+from typing import BinaryIO, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException, UploadFile
+from fastapi.responses import JSONResponse
+from starlette.formparsers import MultiPartParser
+
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+UPLOAD_MAX_BYTES = int(os.environ.get("PLANT_UPLOAD_MAX_BYTES", 20 * MB))
+REQUEST_MAX_BYTES = int(os.environ.get("PLANT_REQUEST_MAX_BYTES", 200 * MB))
+UPLOAD_SPOOL_BYTES = int(os.environ.get("PLANT_UPLOAD_SPOOL_BYTES", MB))
+
+# Room for the multipart boundaries and part headers around a file
+MULTIPART_OVERHEAD = 64 * 1024
+
+IMAGE_FORMATS = ("JPEG", "PNG", "WEBP")
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+
+# Leading bytes identifying each accepted format
+_SIGNATURES = (
+    (b"\xff\xd8\xff", "JPEG"),
+    (b"\x89PNG\r\n\x1a\n", "PNG"),
+    (b"GIF87a", "GIF"),
+    (b"GIF89a", "GIF"),
+    (b"PK\x03\x04", "ZIP"),
+    (b"PK\x05\x06", "ZIP"),  # empty archive
+)
+SNIFF_BYTES = 16
+
+MultiPartParser.spool_max_size = UPLOAD_SPOOL_BYTES
+
+
+class UploadRejected(ValueError):
+    """
+    Raised when an upload is refused before it is decoded.
+
+    Attributes:
+        status_code (int): HTTP status to answer with (400, 413 or 415)
+    """
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def sniff_format(head: bytes) -> Optional[str]:
+    """
+    Identify a file format from its first bytes.
+
+    Args:
+        head (bytes): At least the first SNIFF_BYTES bytes of the file
+
+    Returns:
+        Optional[str]: "JPEG", "PNG", "WEBP", "GIF" or "ZIP", None if unknown
+    """
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "WEBP"
+    for signature, name in _SIGNATURES:
+        if head.startswith(signature):
+            return name
+    return None
+
+
+async def sniff_upload(upload: UploadFile) -> Optional[str]:
+    """Sniff the format of an uploaded file and rewind it."""
+    head = await upload.read(SNIFF_BYTES)
+    await upload.seek(0)
+    return sniff_format(head)
+
+
+def upload_size(upload: UploadFile) -> int:
+    """Return the size in bytes of an uploaded file."""
+    if upload.size is not None:
+        return upload.size
+    position = upload.file.tell()
+    upload.file.seek(0, os.SEEK_END)
+    size = upload.file.tell()
+    upload.file.seek(position)
+    return size
+
+
+def check_upload_size(upload: UploadFile, max_bytes: int = UPLOAD_MAX_BYTES) -> int:
+    """
+    Check that an uploaded file is neither empty nor larger than max_bytes.
+
+    Returns:
+        int: Size of the file in bytes
+
+    Raises:
+        UploadRejected: 400 if the file is empty, 413 if it is too large
+    """
+    size = upload_size(upload)
+    if size == 0:
+        raise UploadRejected("Tệp hình ảnh rỗng")
+    if size > max_bytes:
+        raise UploadRejected(
+            f"Tệp {upload.filename} quá lớn: {size} bytes "
+            f"(tối đa {max_bytes} bytes)", 413
+        )
+    return size
+
+
+async def validate_upload(
+    upload: UploadFile,
+    max_bytes: int = UPLOAD_MAX_BYTES,
+    formats: Tuple[str, ...] = IMAGE_FORMATS
+) -> str:
+    """
+    Check the size and the actual format of an uploaded image.
+
+    Only the first bytes are read; the file is rewound so it can be passed
+    to prepare_image without copying it into memory.
+
+    Args:
+        upload (UploadFile): Uploaded file
+        max_bytes (int): Max size in bytes
+        formats (Tuple[str, ...]): Accepted formats
+
+    Returns:
+        str: Format sniffed from the magic bytes
+
+    Raises:
+        UploadRejected: 400 if empty, 413 if too large, 415 if the content
+                        is not one of the accepted formats
+    """
+    check_upload_size(upload, max_bytes)
+    image_format = await sniff_upload(upload)
+    if image_format not in formats:
+        raise UploadRejected(
+            f"Định dạng tệp {upload.filename} không được hỗ trợ, "
+            f"chỉ chấp nhận {', '.join(formats)}", 415
+        )
+    return image_format
+
+
+def extract_zip_images(
+    file: BinaryIO,
+    name: str,
+    max_images: int,
+    max_bytes: int = UPLOAD_MAX_BYTES,
+    max_total_bytes: int = REQUEST_MAX_BYTES
+) -> List[Tuple[str, bytes]]:
+    """
+    Extract the images of a zip archive.
+
+    Sizes are checked against the central directory before anything is
+    decompressed; the zip reader never returns more than the declared size
+    of an entry.
+
+    Args:
+        file (BinaryIO): Seekable archive file
+        name (str): Archive name, prefixed to the entry names
+        max_images (int): Stop after this many images
+        max_bytes (int): Max uncompressed size of one image
+        max_total_bytes (int): Max uncompressed size of all images
+
+    Returns:
+        List[Tuple[str, bytes]]: (name, data) of each image entry
+
+    Raises:
+        UploadRejected: 400 if the archive is corrupt, 413 if an image or
+                        all images together are too large once extracted
+    """
+    try:
+        archive = zipfile.ZipFile(file)
+    except zipfile.BadZipFile as e:
+        raise UploadRejected(f"Tệp zip {name} bị lỗi: {str(e)}")
+    with archive:
+        entries = [
+            info for info in archive.infolist()
+            if not info.is_dir()
+            and info.filename.lower().endswith(IMAGE_EXTENSIONS)
+        ][:max_images]
+        for info in entries:
+            if info.file_size > max_bytes:
+                raise UploadRejected(
+                    f"Ảnh {name}/{info.filename} quá lớn sau khi giải nén: "
+                    f"{info.file_size} bytes (tối đa {max_bytes} bytes)", 413
+                )
+        total = sum(info.file_size for info in entries)
+        if total > max_total_bytes:
+            raise UploadRejected(
+                f"Tệp zip {name} quá lớn sau khi giải nén: {total} bytes "
+                f"(tối đa {max_total_bytes} bytes)", 413
+            )
+        try:
+            return [
+                (f"{name}/{info.filename}", archive.read(info))
+                for info in entries
+            ]
+        except (zipfile.BadZipFile, EOFError) as e:
+            raise UploadRejected(f"Tệp zip {name} bị lỗi: {str(e)}")
+
+
+class RequestTooLarge(HTTPException):
+    """Raised while reading a request body that exceeds its limit."""
+
+    def __init__(self, max_bytes: int):
+        super().__init__(
+            status_code=413,
+            detail=f"Yêu cầu quá lớn (tối đa {max_bytes} bytes)"
+        )
+
+
+class BodySizeLimitMiddleware:
+    """
+    ASGI middleware bounding the request body while it is received.
+
+    Requests announcing a larger Content-Length are answered 413 without
+    reading the body. Otherwise the body chunks are counted as the
+    application reads them, and RequestTooLarge is raised from the first
+    chunk over the limit, which stops the multipart parser before it
+    spools the rest.
+
+    Args:
+        app: ASGI application
+        max_bytes (int): Default limit in bytes, 0 for no limit
+        limits (Optional[Dict[str, int]]): Limit per request path
+
+    Example:
+        >>> app.add_middleware(
+        ...     BodySizeLimitMiddleware, max_bytes=REQUEST_MAX_BYTES,
+        ...     limits={"/upload": UPLOAD_MAX_BYTES + MULTIPART_OVERHEAD}
+        ... )
+    """
+
+    def __init__(self, app, max_bytes: int = REQUEST_MAX_BYTES,
+                 limits: Optional[Dict[str, int]] = None):
+        self.app = app
+        self.max_bytes = max_bytes
+        self.limits = limits or {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        max_bytes = self.limits.get(scope["path"], self.max_bytes)
+        if max_bytes <= 0:
+            await self.app(scope, receive, send)
+            return
+
+        length = dict(scope["headers"]).get(b"content-length", b"")
+        if length.isdigit() and int(length) > max_bytes:
+            logger.warning(
+                f"Từ chối yêu cầu {scope['path']}: Content-Length "
+                f"{int(length)} > {max_bytes} bytes"
+            )
+            response = JSONResponse(
+                {"detail": RequestTooLarge(max_bytes).detail},
+                status_code=413, headers={"Connection": "close"}
+            )
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > max_bytes:
+                    logger.warning(
+                        f"Từ chối yêu cầu {scope['path']}: thân yêu cầu "
+                        f"vượt quá {max_bytes} bytes"
+                    )
+                    raise RequestTooLarge(max_bytes)
+            return message
+
+        await self.app(scope, limited_receive, send)
@@ -12,22 +12,29 @@ import base64
 from pathlib import Path
 
 try:
-    from core import PlantDiseaseDetector
+    from core import get_detector
+    from preprocess import prepare_image
 except ImportError as e:
     print(f'{{"error": "Could not import PlantDiseaseDetector: {str(e)}"}}')
     sys.exit(1)
 
 
-def test_with_base64_data(base64_image_string: str):
+def test_with_base64_data(
+    base64_image_string: str,
+    mime_type: str = "image/jpeg"
+):
     """
     Test disease detection with base64 image data
 
     Args:
         base64_image_string (str): Base64 encoded image data
+        mime_type (str): MIME type of the encoded image
     """
     try:
-        detector = PlantDiseaseDetector()
-        result = detector.analyze_plant_image_base64(base64_image_string)
+        detector = get_detector()
+        result = detector.analyze_plant_image_base64(
+            base64_image_string, mime_type=mime_type
+        )
         print(json.dumps(result, indent=2))
         return result
     except Exception as e:
@@ -37,7 +44,7 @@ def test_with_base64_data(base64_image_string: str):
 
 def convert_image_to_base64_and_test(image_bytes: bytes):
     """
-    Convert image bytes to base64 and test it
+    Downscale and re-encode image bytes, convert to base64 and test it
 
     Args:
         image_bytes (bytes): Image data in bytes
@@ -47,9 +54,10 @@ def convert_image_to_base64_and_test(image_bytes: bytes):
             print('{"error": "No image bytes provided"}')
             return None
 
-        base64_string = base64.b64encode(image_bytes).decode('utf-8')
+        prepared = prepare_image(image_bytes)
+        base64_string = base64.b64encode(prepared.data).decode('utf-8')
         print(f"Converted image to base64 ({len(base64_string)} characters)")
-        return test_with_base64_data(base64_string)
+        return test_with_base64_data(base64_string, prepared.mime_type)
     except Exception as e:
         print(f'{{"error": "{str(e)}"}}')
         return None
\ No newline at end of file